@@ -21,10 +21,9 @@ def enter_if_accessible(function, feature, perm=None, method=None):
         Check accessible
         """
         accessible = False
-        cache_key = request.session.session_key + "accessibility_filter"
         employee = getattr(request.user, "employee_get")
         if employee:
-            accessible = check_is_accessible(feature, cache_key, employee)
+            accessible = check_is_accessible(feature, employee)
         has_perm = True
         if perm:
             has_perm = request.user.has_perm(perm)
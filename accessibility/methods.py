@@ -1,47 +1,119 @@
 """
 accessibility/methods.py
+
+The accessibility of an employee is resolved for all the features at once, in
+one query, into a bitmap whose n-th bit tells whether the employee can access
+the n-th feature. The bitmaps are kept in the shared cache under the
+accessibility version, bumped whenever a default accessibility or its employees
+change, and in the request for the other checks of the same request.
 """
 
+import hashlib
+import time
+
 from django.core.cache import cache
+from django.db.models import Exists, OuterRef
 
 from accessibility.accessibility import ACCESSBILITY_FEATURE
-from accessibility.filters import AccessibilityFilter
 from accessibility.models import DefaultAccessibility
 from horilla.horilla_middlewares import _thread_locals
 
+ACCESSIBILITY_VERSION_KEY = "accessibility_version"
+
 
-def check_is_accessible(feature, cache_key, employee):
+def get_accessibility_version():
     """
-    Method to check the employee is accessible for the feature or not
+    Version of the accessibility bitmaps
     """
-    if not employee:
-        return False
+    version = cache.get(ACCESSIBILITY_VERSION_KEY)
+    if version is None:
+        # a new version never matches the version of an evicted key
+        cache.add(ACCESSIBILITY_VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(ACCESSIBILITY_VERSION_KEY)
+    return version
 
-    accessibility = DefaultAccessibility.objects.filter(
-        feature=feature, is_enabled=True
-    ).first()
 
-    if accessibility and accessibility.exclude_all:
-        return False
-    if not feature or not accessibility:
-        return True
+def bump_accessibility_version():
+    try:
+        cache.incr(ACCESSIBILITY_VERSION_KEY)
+    except ValueError:
+        cache.set(ACCESSIBILITY_VERSION_KEY, time.time_ns(), timeout=None)
+    request = getattr(_thread_locals, "request", None)
+    if request is not None:
+        request.accessibility_bitmaps = {}
 
-    data: dict = cache.get(cache_key, default={})
-    if data and data.get(feature) is not None:
-        return data.get(feature)
 
-    employees = accessibility.employees.all()
-    accessible = employee in employees
-    return accessible
+def accessibility_features(feature=None):
+    """
+    Features of the bitmaps, the registered ones followed by the feature when it
+    is not registered
+    """
+    features = tuple(dict.fromkeys(name for name, _display in ACCESSBILITY_FEATURE))
+    if feature and feature not in features:
+        features += (feature,)
+    return features
 
 
-def update_employee_accessibility_cache(cache_key, employee):
+def build_accessibility_bitmap(employee_id, features):
     """
-    Cache for get all the queryset
+    Bitmap of the features accessible to the employee. The first enabled default
+    accessibility of a feature decides: no one accesses a feature excluding all,
+    only its employees access the others and everyone accesses a feature without
+    any.
     """
-    feature_accessible = {}
-    for accessibility, _display in ACCESSBILITY_FEATURE:
-        feature_accessible[accessibility] = check_is_accessible(
-            accessibility, cache_key, employee
+    through = DefaultAccessibility.employees.through
+    decided = {}
+    for feature, exclude_all, listed in (
+        DefaultAccessibility.objects.filter(feature__in=features, is_enabled=True)
+        .annotate(
+            listed=Exists(
+                through.objects.filter(
+                    defaultaccessibility_id=OuterRef("pk"), employee_id=employee_id
+                )
+            )
         )
-    cache.set(cache_key, feature_accessible)
+        .order_by("pk")
+        .values_list("feature", "exclude_all", "listed")
+    ):
+        decided.setdefault(feature, listed and not exclude_all)
+    bitmap = 0
+    for bit, feature in enumerate(features):
+        if decided.get(feature, True):
+            bitmap |= 1 << bit
+    return bitmap
+
+
+def get_accessibility_bitmap(employee, features):
+    """
+    Bitmap of the features accessible to the employee, from the request, the
+    shared cache or the database
+    """
+    request = getattr(_thread_locals, "request", None)
+    bitmaps = getattr(request, "accessibility_bitmaps", None)
+    if request is not None and bitmaps is None:
+        bitmaps = request.accessibility_bitmaps = {}
+    key = (employee.pk, features)
+    if bitmaps is not None and key in bitmaps:
+        return bitmaps[key]
+    digest = hashlib.sha1("\n".join(features).encode()).hexdigest()[:12]
+    cache_key = f"accessibility_{get_accessibility_version()}_{employee.pk}_{digest}"
+    bitmap = cache.get(cache_key)
+    if bitmap is None:
+        bitmap = build_accessibility_bitmap(employee.pk, features)
+        cache.set(cache_key, bitmap)
+    if bitmaps is not None:
+        bitmaps[key] = bitmap
+    return bitmap
+
+
+def check_is_accessible(feature, employee):
+    """
+    Method to check the employee is accessible for the feature or not
+    """
+    if not employee:
+        return False
+    if not feature:
+        return True
+    features = accessibility_features(feature)
+    bitmap = get_accessibility_bitmap(employee, features)
+    return bool(bitmap >> features.index(feature) & 1)
@@ -0,0 +1,64 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from attendance.methods.auto_punch_out import auto_punch_out_scheduler
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the auto punch-out scheduler. It sleeps until the next shift "
+        "auto punch-out deadline and clocks out all affected attendances at once."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Process the deadlines that are already due and exit",
+        )
+        parser.add_argument(
+            "--refresh-interval",
+            type=int,
+            default=300,
+            help="Seconds between rebuilds of the deadline heap (default: 300)",
+        )
+
+    def handle(self, *args, **options):
+        refresh_interval = options["refresh_interval"]
+        queued = auto_punch_out_scheduler.rebuild()
+        self.stdout.write(f"Queued {queued} auto punch-out deadlines.")
+
+        if options["once"]:
+            self.report(auto_punch_out_scheduler.run_due())
+            return
+
+        last_refresh = time.monotonic()
+        try:
+            while True:
+                run = auto_punch_out_scheduler.run_due()
+                if run.due_slots:
+                    self.report(run)
+
+                if time.monotonic() - last_refresh >= refresh_interval:
+                    auto_punch_out_scheduler.rebuild()
+                    last_refresh = time.monotonic()
+
+                sleep_for = refresh_interval - (time.monotonic() - last_refresh)
+                deadline = auto_punch_out_scheduler.next_deadline()
+                if deadline is not None:
+                    sleep_for = min(
+                        sleep_for, (deadline - timezone.now()).total_seconds()
+                    )
+                time.sleep(max(sleep_for, 1))
+        except KeyboardInterrupt:
+            metrics = auto_punch_out_scheduler.metrics()
+            self.stdout.write(
+                f"Stopped after {metrics['total_runs']} runs, "
+                f"{metrics['total_processed']} attendances clocked out."
+            )
+
+    def report(self, run):
+        style = self.style.SUCCESS if not run.failed else self.style.WARNING
+        self.stdout.write(style(str(run)))
@@ -0,0 +1,63 @@
+import calendar
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from attendance.methods.work_records import (
+    materialize_changed_work_records,
+    materialize_work_records,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Derive the work records from the attendances, the approved leave "
+        "requests and the shift schedules and write the ones that changed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--month", help="Month to materialize, as YYYY-MM (default: this month)"
+        )
+        parser.add_argument("--start", type=date.fromisoformat, help="First day")
+        parser.add_argument("--end", type=date.fromisoformat, help="Last day")
+        parser.add_argument(
+            "--employee",
+            type=int,
+            action="append",
+            dest="employees",
+            help="Id of an employee to materialize, can be repeated",
+        )
+        parser.add_argument(
+            "--changed",
+            action="store_true",
+            help="Run the scheduled job: the rows changed since its watermark",
+        )
+
+    def handle(self, *args, **options):
+        if options["changed"]:
+            totals = materialize_changed_work_records()
+        else:
+            start_date, end_date = options["start"], options["end"]
+            if start_date is None:
+                today = date.today()
+                try:
+                    year, month = map(
+                        int,
+                        (options["month"] or f"{today.year}-{today.month}").split("-"),
+                    )
+                    start_date = date(year, month, 1)
+                except ValueError:
+                    raise CommandError("The month must be given as YYYY-MM")
+                end_date = end_date or date(
+                    year, month, calendar.monthrange(year, month)[1]
+                )
+            totals = materialize_work_records(
+                start_date, end_date or start_date, options["employees"]
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{totals['created']} work records created, {totals['updated']} "
+                f"updated, {totals['deleted']} deleted."
+            )
+        )
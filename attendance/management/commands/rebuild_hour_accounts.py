@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from attendance.methods.hour_account import rebuild_hour_accounts
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the hour accounts from the attendances: the overtime as the "
+        "sum of the approved overtime of the month and the worked and pending "
+        "hours from the validated attendances."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--year", type=int, help="Rebuild the year only")
+        parser.add_argument(
+            "--month", type=int, choices=range(1, 13), help="Rebuild the month only"
+        )
+        parser.add_argument(
+            "--employee",
+            type=int,
+            action="append",
+            dest="employees",
+            help="Id of an employee to rebuild, can be repeated",
+        )
+
+    def handle(self, *args, **options):
+        rebuilt = rebuild_hour_accounts(
+            employee_ids=options["employees"],
+            year=options["year"],
+            month=options["month"],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rebuilt} hour accounts."))
@@ -0,0 +1,275 @@
+"""
+auto_punch_out.py
+
+Due-time scheduler for the automatic check out feature. Instead of scanning every
+auto punch-out shift schedule on each HTTP request, the upcoming deadlines are
+kept in a min-heap keyed by (shift, day, attendance date) and the engine only
+wakes up when the earliest of them is due.
+"""
+
+import heapq
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from attendance.methods.utils import Request
+
+logger = logging.getLogger(__name__)
+
+
+class AutoPunchOutRun:
+    """
+    Metrics collected for a single auto punch-out pass
+    """
+
+    def __init__(self):
+        self.started_at = timezone.now()
+        self.due_slots = 0
+        self.processed = 0
+        self.failed = 0
+        self.duration = 0.0
+
+    def as_dict(self):
+        return {
+            "started_at": self.started_at.isoformat(),
+            "due_slots": self.due_slots,
+            "processed": self.processed,
+            "failed": self.failed,
+            "duration": round(self.duration, 3),
+        }
+
+    def __str__(self):
+        return (
+            f"auto punch-out: {self.processed} processed, {self.failed} failed "
+            f"across {self.due_slots} due shift slots in {self.duration:.3f}s"
+        )
+
+
+class AutoPunchOutScheduler:
+    """
+    Keeps a min-heap of upcoming auto punch-out deadlines and clocks out every
+    open attendance of a deadline in one batched pass once it is due.
+
+    Heap entries are ``(deadline, shift_id, day_id, attendance_date)`` tuples, the
+    deadline being the aware datetime computed from the shift schedule's
+    ``auto_punch_out_time``.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._heap = []
+        self._queued = set()
+        self._schedules = {}
+        self.last_run = None
+        self.total_processed = 0
+        self.total_runs = 0
+        self.on_deadline_change = None
+
+    def load_schedules(self):
+        """
+        Cache the auto punch-out enabled shift schedules keyed by (shift, day)
+        """
+        from base.models import EmployeeShiftSchedule
+
+        schedules = EmployeeShiftSchedule.objects.filter(
+            is_auto_punch_out_enabled=True,
+            auto_punch_out_time__isnull=False,
+        ).values("shift_id", "day_id", "auto_punch_out_time", "is_night_shift")
+        with self._lock:
+            self._schedules = {
+                (schedule["shift_id"], schedule["day_id"]): schedule
+                for schedule in schedules
+            }
+        return self._schedules
+
+    def deadline_for(self, shift_id, day_id, attendance_date):
+        """
+        Return the aware auto punch-out datetime of the slot, or None when the
+        shift schedule has no automatic check out.
+        """
+        schedule = self._schedules.get((shift_id, day_id))
+        if not schedule or not attendance_date:
+            return None
+        date = attendance_date
+        if schedule["is_night_shift"]:
+            date += timedelta(days=1)
+        return timezone.make_aware(
+            datetime.combine(date, schedule["auto_punch_out_time"])
+        )
+
+    def push(self, shift_id, day_id, attendance_date, notify=False):
+        """
+        Queue the deadline of a (shift, day, date) slot if it is not queued yet.
+        With ``notify`` the ``on_deadline_change`` hook is called when the slot
+        becomes the earliest deadline, so the caller can re-arm its wake up.
+        """
+        deadline = self.deadline_for(shift_id, day_id, attendance_date)
+        if deadline is None:
+            return None
+        key = (shift_id, day_id, attendance_date)
+        with self._lock:
+            if key in self._queued:
+                return deadline
+            self._queued.add(key)
+            heapq.heappush(self._heap, (deadline, shift_id, day_id, attendance_date))
+            is_earliest = self._heap[0][0] == deadline
+        if notify and is_earliest and self.on_deadline_change:
+            self.on_deadline_change(deadline)
+        return deadline
+
+    def rebuild(self):
+        """
+        Rebuild the heap from the currently open attendances with a single query
+        """
+        from attendance.models import Attendance
+
+        self.load_schedules()
+        with self._lock:
+            self._heap = []
+            self._queued = set()
+        if not self._schedules:
+            return 0
+        shift_ids = {shift_id for shift_id, _day_id in self._schedules}
+        slots = (
+            Attendance.objects.entire()
+            .filter(
+                attendance_clock_out=None,
+                attendance_clock_out_date=None,
+                shift_id__in=shift_ids,
+            )
+            .values_list("shift_id", "attendance_day_id", "attendance_date")
+            .order_by()
+            .distinct()
+        )
+        for shift_id, day_id, attendance_date in slots:
+            self.push(shift_id, day_id, attendance_date)
+        return len(self._heap)
+
+    def reload(self):
+        """
+        Rebuild the heap and notify the ``on_deadline_change`` hook, used when
+        the auto punch-out configuration of a shift schedule changes.
+        """
+        self.rebuild()
+        if self.on_deadline_change:
+            self.on_deadline_change(self.next_deadline())
+
+    def next_deadline(self):
+        """
+        Return the earliest queued deadline, or None when nothing is queued
+        """
+        with self._lock:
+            return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now=None):
+        """
+        Pop and return every queued slot whose deadline has passed
+        """
+        now = now or timezone.now()
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] < now:
+                deadline, shift_id, day_id, attendance_date = heapq.heappop(self._heap)
+                self._queued.discard((shift_id, day_id, attendance_date))
+                due.append((deadline, shift_id, day_id, attendance_date))
+        return due
+
+    def due_attendances(self, due):
+        """
+        Fetch the open attendances of all due slots in one query, only keeping
+        those that still have an open attendance activity.
+        """
+        from attendance.models import Attendance, AttendanceActivity
+
+        slot_filter = None
+        for _deadline, shift_id, day_id, attendance_date in due:
+            condition = Q(
+                shift_id=shift_id,
+                attendance_day_id=day_id,
+                attendance_date=attendance_date,
+            )
+            slot_filter = condition if slot_filter is None else slot_filter | condition
+
+        open_activity = AttendanceActivity.objects.entire().filter(
+            employee_id=OuterRef("employee_id"),
+            attendance_date=OuterRef("attendance_date"),
+            shift_day=OuterRef("attendance_day"),
+            clock_out_date=None,
+            clock_out=None,
+        )
+        return (
+            Attendance.objects.entire()
+            .filter(slot_filter)
+            .filter(
+                attendance_clock_out=None,
+                attendance_clock_out_date=None,
+            )
+            .filter(Exists(open_activity))
+            .select_related("employee_id__employee_user_id")
+        )
+
+    def run_due(self, now=None):
+        """
+        Clock out every attendance whose auto punch-out deadline has passed and
+        return the metrics of the pass.
+        """
+        from attendance.views.clock_in_out import clock_out
+
+        run = AutoPunchOutRun()
+        started = time.monotonic()
+        due = self.pop_due(now)
+        run.due_slots = len(due)
+        if due:
+            deadlines = {
+                (shift_id, day_id, attendance_date): deadline
+                for deadline, shift_id, day_id, attendance_date in due
+            }
+            for attendance in self.due_attendances(due):
+                deadline = deadlines[
+                    (
+                        attendance.shift_id_id,
+                        attendance.attendance_day_id,
+                        attendance.attendance_date,
+                    )
+                ]
+                local_deadline = timezone.localtime(deadline)
+                try:
+                    clock_out(
+                        Request(
+                            user=attendance.employee_id.employee_user_id,
+                            date=local_deadline.date(),
+                            time=local_deadline.time(),
+                            datetime=deadline,
+                        )
+                    )
+                    run.processed += 1
+                except Exception as e:
+                    run.failed += 1
+                    logger.error(f"Auto punch-out failed for {attendance}: {e}")
+        run.duration = time.monotonic() - started
+        with self._lock:
+            self.last_run = run
+            self.total_runs += 1
+            self.total_processed += run.processed
+        if run.due_slots:
+            logger.info(str(run))
+        return run
+
+    def metrics(self):
+        """
+        Aggregated metrics of the scheduler since it was started
+        """
+        return {
+            "queued": len(self._heap),
+            "next_deadline": self.next_deadline(),
+            "total_runs": self.total_runs,
+            "total_processed": self.total_processed,
+            "last_run": self.last_run.as_dict() if self.last_run else None,
+        }
+
+
+auto_punch_out_scheduler = AutoPunchOutScheduler()
@@ -0,0 +1,323 @@
+"""
+hour_account.py
+
+Monthly hour account ledger of the employees. The overtime of an hour account
+is the sum of the approved overtime of the attendances of its month, and it is
+kept up to date by adding the signed change of an attendance with an F()
+expression, so concurrent saves of the same month never lose an update. The
+worked and pending hours are recounted from the validated attendances while
+the account row is locked by that update. rebuild_hour_accounts recomputes the
+accounts from the attendances.
+
+The lookups every attendance save needs, the shift days and the validation
+condition, are kept in process level caches, dropped when the rows change and
+refreshed every ATTENDANCE_SETTINGS_CACHE_SECONDS.
+"""
+
+import threading
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import ExtractMonth, ExtractYear
+
+from attendance.methods.utils import format_time, strtime_seconds
+from base.models import EmployeeShiftDay
+
+MONTH_NAMES = [
+    "january",
+    "february",
+    "march",
+    "april",
+    "may",
+    "june",
+    "july",
+    "august",
+    "september",
+    "october",
+    "november",
+    "december",
+]
+
+_settings_cache = {}
+_settings_cache_lock = threading.Lock()
+
+
+def cached_setting(name, loader):
+    """
+    Value of the setting, loaded once per ATTENDANCE_SETTINGS_CACHE_SECONDS
+    """
+    now = time.monotonic()
+    cached = _settings_cache.get(name)
+    if cached is not None and cached[0] > now:
+        return cached[1]
+    value = loader()
+    with _settings_cache_lock:
+        _settings_cache[name] = (
+            now + settings.ATTENDANCE_SETTINGS_CACHE_SECONDS,
+            value,
+        )
+    return value
+
+
+def clear_attendance_settings_cache(*names):
+    """
+    Drop the cached settings, all of them when no name is given
+    """
+    with _settings_cache_lock:
+        if not names:
+            _settings_cache.clear()
+        for name in names:
+            _settings_cache.pop(name, None)
+
+
+def shift_day_id(day_date):
+    """
+    Id of the EmployeeShiftDay of the weekday of the date
+    """
+    days = cached_setting(
+        "shift_days",
+        lambda: dict(EmployeeShiftDay.objects.values_list("day", "id")),
+    )
+    return days.get(day_date.strftime("%A").lower())
+
+
+def get_validation_condition():
+    from attendance.models import AttendanceValidationCondition
+
+    return cached_setting(
+        "validation_condition", AttendanceValidationCondition.objects.first
+    )
+
+
+def month_key(employee_id, day_date):
+    return (employee_id, day_date.year, day_date.month)
+
+
+def month_range(year, month):
+    start = date(year, month, 1)
+    end = (start + timedelta(days=31)).replace(day=1) - timedelta(days=1)
+    return start, end
+
+
+def get_hour_account_ids(keys):
+    """
+    {(employee id, year, month): hour account id}, creating the missing accounts
+    """
+    from attendance.models import AttendanceOverTime
+
+    keys = set(keys)
+    if not keys:
+        return {}
+
+    def load():
+        accounts = Q()
+        for employee_id, year, month in keys:
+            accounts |= Q(
+                employee_id=employee_id, year=str(year), month=MONTH_NAMES[month - 1]
+            )
+        return {
+            (employee_id, int(year), MONTH_NAMES.index(month) + 1): account_id
+            for account_id, employee_id, year, month in AttendanceOverTime.objects.entire()
+            .filter(accounts)
+            .values_list("pk", "employee_id", "year", "month")
+        }
+
+    ids = load()
+    missing = keys - set(ids)
+    if missing:
+        AttendanceOverTime.objects.bulk_create(
+            [
+                AttendanceOverTime(
+                    employee_id_id=employee_id,
+                    month=MONTH_NAMES[month - 1],
+                    month_sequence=month - 1,
+                    year=str(year),
+                )
+                for employee_id, year, month in missing
+            ],
+            ignore_conflicts=True,
+        )
+        ids = load()
+    return ids
+
+
+def count_month_hours(keys):
+    """
+    {(employee id, year, month): (worked seconds, minimum hour seconds)} of the
+    validated attendances of the months, leaving out the days of approved leave
+    requests. The worked seconds of a day count up to its minimum hour.
+    """
+    from attendance.models import Attendance
+
+    hours = {key: [0, 0] for key in keys}
+    if not keys:
+        return hours
+    employee_ids = {key[0] for key in keys}
+    months = {(key[1], key[2]) for key in keys}
+    start = min(month_range(*month)[0] for month in months)
+    end = max(month_range(*month)[1] for month in months)
+
+    leaves = defaultdict(list)
+    if apps.is_installed("leave"):
+        LeaveRequest = apps.get_model("leave", "LeaveRequest")
+        for leave in (
+            LeaveRequest.objects.entire()
+            .filter(
+                employee_id__in=employee_ids,
+                start_date__lte=end,
+                end_date__gte=start,
+                status="approved",
+            )
+            .values("employee_id", "start_date", "end_date")
+        ):
+            leaves[leave["employee_id"]].append(
+                (leave["start_date"], leave["end_date"])
+            )
+
+    for attendance in (
+        Attendance.objects.entire()
+        .filter(
+            employee_id__in=employee_ids,
+            attendance_date__range=(start, end),
+            attendance_validated=True,
+        )
+        .values("employee_id", "attendance_date", "minimum_hour", "at_work_second")
+    ):
+        key = month_key(attendance["employee_id"], attendance["attendance_date"])
+        if key not in hours or any(
+            leave_start <= attendance["attendance_date"] <= leave_end
+            for leave_start, leave_end in leaves[attendance["employee_id"]]
+        ):
+            continue
+        required_work_second = strtime_seconds(attendance["minimum_hour"])
+        hours[key][0] += min(required_work_second, attendance["at_work_second"] or 0)
+        hours[key][1] += required_work_second
+    return hours
+
+
+def write_month_hours(account_ids, overtime_seconds=None):
+    """
+    Recount the worked and pending hours of the accounts and format their
+    overtime, from overtime_seconds or from the stored overtime seconds
+    """
+    from attendance.models import AttendanceOverTime
+
+    if overtime_seconds is None:
+        overtime_seconds = dict(
+            AttendanceOverTime.objects.entire()
+            .filter(pk__in=account_ids.values())
+            .values_list("pk", "overtime_second")
+        )
+    hours = count_month_hours(list(account_ids))
+    accounts = []
+    for key, account_id in account_ids.items():
+        worked, minimum = hours[key]
+        overtime_second = overtime_seconds.get(account_id) or 0
+        accounts.append(
+            AttendanceOverTime(
+                pk=account_id,
+                worked_hours=format_time(worked),
+                pending_hours=format_time(minimum - worked),
+                hour_account_second=worked,
+                hour_pending_second=minimum - worked,
+                overtime=format_time(overtime_second),
+                overtime_second=overtime_second,
+                month_sequence=key[2] - 1,
+            )
+        )
+    AttendanceOverTime.objects.bulk_update(
+        accounts,
+        [
+            "worked_hours",
+            "pending_hours",
+            "hour_account_second",
+            "hour_pending_second",
+            "overtime",
+            "overtime_second",
+            "month_sequence",
+        ],
+        batch_size=500,
+    )
+
+
+def update_hour_accounts(overtime_deltas):
+    """
+    Add the {(employee id, year, month): approved overtime seconds delta} to the
+    hour accounts and recount their worked and pending hours
+    """
+    from attendance.models import AttendanceOverTime
+
+    if not overtime_deltas:
+        return
+    with transaction.atomic():
+        account_ids = get_hour_account_ids(sorted(overtime_deltas))
+        # the update locks the accounts until the transaction ends
+        AttendanceOverTime.objects.entire().filter(pk__in=account_ids.values()).update(
+            overtime_second=F("overtime_second")
+            + Case(
+                *[
+                    When(pk=account_ids[key], then=Value(delta))
+                    for key, delta in overtime_deltas.items()
+                ],
+                default=Value(0),
+                output_field=IntegerField(),
+            )
+        )
+        write_month_hours(account_ids)
+
+
+def rebuild_hour_accounts(employee_ids=None, year=None, month=None):
+    """
+    Recompute the hour accounts from the attendances, the overtime as the sum
+    of their approved overtime. Returns the number of accounts rebuilt.
+    """
+    from attendance.models import Attendance, AttendanceOverTime
+
+    attendances = Attendance.objects.entire().filter(employee_id__isnull=False)
+    accounts = AttendanceOverTime.objects.entire().all()
+    if employee_ids:
+        attendances = attendances.filter(employee_id__in=employee_ids)
+        accounts = accounts.filter(employee_id__in=employee_ids)
+    if year:
+        attendances = attendances.filter(attendance_date__year=year)
+        accounts = accounts.filter(year=str(year))
+    if month:
+        attendances = attendances.filter(attendance_date__month=month)
+        accounts = accounts.filter(month_sequence=month - 1)
+
+    with transaction.atomic():
+        existing = {
+            (
+                account["employee_id"],
+                int(account["year"]),
+                account["month_sequence"] + 1,
+            ): account["pk"]
+            for account in accounts.select_for_update().values(
+                "pk", "employee_id", "year", "month_sequence"
+            )
+            if account["year"] and account["year"].isdigit()
+        }
+        overtime = {
+            (row["employee_id"], row["year"], row["month"]): row["overtime"] or 0
+            for row in attendances.annotate(
+                year=ExtractYear("attendance_date"),
+                month=ExtractMonth("attendance_date"),
+            )
+            .values("employee_id", "year", "month")
+            .annotate(overtime=Sum("approved_overtime_second"))
+            .order_by()
+        }
+        account_ids = dict(existing)
+        account_ids.update(
+            get_hour_account_ids([key for key in overtime if key not in existing])
+        )
+        overtime_seconds = {
+            account_id: overtime.get(key, 0) for key, account_id in account_ids.items()
+        }
+        write_month_hours(account_ids, overtime_seconds)
+    return len(account_ids)
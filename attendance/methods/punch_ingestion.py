@@ -0,0 +1,671 @@
+"""
+punch_ingestion.py
+
+Batched ingestion of the biometric device punches. Instead of replaying every
+punch through the clock-in and clock-out views, with their dozens of queries
+and writes each, the punches are deduplicated, grouped per employee, replayed
+in memory with the same rules and written with bulk operations in one
+transaction per batch of employees.
+"""
+
+import logging
+from collections import defaultdict, namedtuple
+from datetime import time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import OuterRef, Q, Subquery
+from simple_history.utils import bulk_create_with_history, bulk_update_with_history
+
+from attendance.methods.hour_account import month_key, update_hour_accounts
+from attendance.methods.utils import (
+    Request,
+    activity_datetime,
+    format_time,
+    overtime_calculation,
+    strtime_seconds,
+)
+from attendance.methods.work_records import materialize_employee_days
+from attendance.models import (
+    Attendance,
+    AttendanceActivity,
+    AttendanceLateComeEarlyOut,
+    AttendanceValidationCondition,
+    GraceTime,
+)
+from attendance.signals import queue_auto_punch_out
+from base.context_processors import enable_late_come_early_out_tracking
+from base.models import EmployeeShiftDay, EmployeeShiftSchedule
+from base.working_calendar import is_non_working
+from employee.models import Employee
+from horilla.horilla_middlewares import _thread_locals
+
+logger = logging.getLogger(__name__)
+
+MID_DAY_SECONDS = strtime_seconds("12:00")
+
+# direction is "in", "out", "alternate" (in unless the last activity of the
+# punch date is still open) or "toggle" (out while any activity is open)
+Punch = namedtuple(
+    "Punch", ["device_id", "user_id", "employee_id", "datetime", "direction"]
+)
+
+ATTENDANCE_BULK_FIELDS = [
+    "attendance_day",
+    "attendance_clock_out",
+    "attendance_clock_out_date",
+    "attendance_worked_hour",
+    "attendance_overtime",
+    "attendance_overtime_approve",
+    "attendance_validated",
+    "at_work_second",
+    "overtime_second",
+    "approved_overtime_second",
+    "minimum_hour",
+    "is_holiday",
+    "is_validate_request",
+    "is_validate_request_approved",
+    "modified_by",
+]
+ACTIVITY_BULK_FIELDS = ["clock_out", "clock_out_date", "out_datetime", "modified_by"]
+
+
+def time_seconds(value):
+    return value.hour * 3600 + value.minute * 60
+
+
+def date_key(value):
+    return (value is not None, value.toordinal() if value else 0)
+
+
+def datetime_key(value):
+    return (value is not None, value.timestamp() if value else 0)
+
+
+class PunchBatch:
+    """
+    The attendance state of a batch of employees, loaded once, updated in
+    memory by the punches and written back with bulk operations.
+    """
+
+    def __init__(self, employee_punches):
+        self.employee_punches = employee_punches
+        self.sequence = 0
+        self.dirty = {}
+        self.deleted_records = []
+        request = getattr(_thread_locals, "request", None)
+        user = getattr(request, "user", None)
+        self.user = user if user is not None and user.is_authenticated else None
+        self.load()
+
+    def order_key(self, instance):
+        """
+        Key ordering the rows like their ids, the new rows after the stored ones
+        """
+        if instance.pk:
+            return (0, instance.pk)
+        return (1, instance._punch_sequence)
+
+    def add(self, instance):
+        self.sequence += 1
+        instance._punch_sequence = self.sequence
+        self.touch(instance)
+
+    def touch(self, instance):
+        self.dirty[id(instance)] = instance
+
+    def load(self):
+        employee_ids = list(self.employee_punches)
+        dates = set()
+        for punches in self.employee_punches.values():
+            for punch in punches:
+                punch_date = punch.datetime.date()
+                dates.update((punch_date, punch_date - timedelta(days=1)))
+
+        self.employees = (
+            Employee.objects.entire()
+            .select_related(
+                "employee_user_id",
+                "employee_work_info__shift_id__grace_time_id",
+                "employee_work_info__work_type_id",
+            )
+            .in_bulk(employee_ids)
+        )
+        self.days = {day.day: day for day in EmployeeShiftDay.objects.all()}
+        self.days_by_id = {day.pk: day for day in self.days.values()}
+        self.schedules = {}
+        for schedule in EmployeeShiftSchedule.objects.all():
+            self.schedules.setdefault((schedule.day_id, schedule.shift_id_id), schedule)
+        self.tracking = enable_late_come_early_out_tracking(None).get("tracking")
+        self.default_grace = GraceTime.objects.filter(
+            is_default=True, is_active=True
+        ).first()
+        self.condition = AttendanceValidationCondition.objects.first()
+
+        self.activities = defaultdict(list)
+        activities = list(
+            AttendanceActivity.objects.filter(employee_id__in=employee_ids)
+            .filter(Q(clock_out__isnull=True) | Q(attendance_date__in=dates))
+            .order_by("id")
+        )
+        open_dates = defaultdict(set)
+        for activity in activities:
+            if activity.attendance_date not in dates:
+                open_dates[activity.employee_id_id].add(activity.attendance_date)
+        if open_dates:
+            open_days = Q()
+            for employee_id, attendance_dates in open_dates.items():
+                open_days |= Q(
+                    employee_id=employee_id, attendance_date__in=attendance_dates
+                )
+            activities += AttendanceActivity.objects.filter(open_days).exclude(
+                pk__in=[activity.pk for activity in activities]
+            )
+        self.recorded = set()
+        for activity in activities:
+            self.activities[activity.employee_id_id].append(activity)
+            self.recorded.add((activity.employee_id_id, activity.in_datetime))
+            self.recorded.add((activity.employee_id_id, activity.out_datetime))
+
+        employee_attendances = Attendance.objects.filter(
+            employee_id=OuterRef("employee_id")
+        )
+        self.attendances = defaultdict(list)
+        for attendance in Attendance.objects.filter(
+            Q(attendance_date__in=dates)
+            | Q(pk=Subquery(employee_attendances.order_by("-id").values("pk")[:1]))
+            | Q(
+                pk=Subquery(
+                    employee_attendances.order_by("-attendance_date", "-id").values(
+                        "pk"
+                    )[:1]
+                )
+            ),
+            employee_id__in=employee_ids,
+        ).order_by("id"):
+            attendance._punch_saved_approve = attendance.attendance_overtime_approve
+            attendance._punch_saved_overtime = attendance.approved_overtime_second
+            self.attendances[attendance.employee_id_id].append(attendance)
+
+        self.records = defaultdict(list)
+        for record in AttendanceLateComeEarlyOut.objects.filter(
+            attendance_id__in=[
+                attendance.pk
+                for attendances in self.attendances.values()
+                for attendance in attendances
+            ]
+        ).order_by("id"):
+            self.records[(record.attendance_id_id, record.type)].append(record)
+
+        # {(employee id, year, month): approved overtime seconds delta}
+        self.overtime_deltas = defaultdict(int)
+
+        # {employee id: days} of the saved attendances
+        self.work_record_days = defaultdict(set)
+
+    def shift_day(self, day_date):
+        return self.days[day_date.strftime("%A").lower()]
+
+    def schedule(self, day, shift):
+        """
+        (minimum hour, start seconds, end seconds) of the shift on the day
+        """
+        schedule = self.schedules.get(
+            (day.pk if day else None, shift.pk if shift else None)
+        )
+        if schedule is None:
+            return "00:00", 0, 0
+        return (
+            schedule.minimum_working_hour,
+            strtime_seconds(schedule.start_time.strftime("%H:%M")),
+            strtime_seconds(schedule.end_time.strftime("%H:%M")),
+        )
+
+    def grace_seconds(self, shift, allowed_field):
+        """
+        Grace allowance of the shift, or of the default grace time
+        """
+        grace_time = shift.grace_time_id if shift else None
+        if grace_time:
+            if grace_time.is_active and getattr(grace_time, allowed_field):
+                return grace_time.allowed_time_in_secs
+            return 0
+        if self.default_grace and getattr(self.default_grace, allowed_field):
+            return self.default_grace.allowed_time_in_secs
+        return 0
+
+    def record_key(self, attendance, record_type):
+        return (attendance.pk or id(attendance), record_type)
+
+    def create_record(self, attendance, record_type):
+        """
+        Late come or early out record of the attendance, unless it exists
+        """
+        key = self.record_key(attendance, record_type)
+        if not self.records[key]:
+            record = AttendanceLateComeEarlyOut(
+                type=record_type,
+                attendance_id=attendance,
+                employee_id=attendance.employee_id,
+            )
+            self.add(record)
+            self.records[key].append(record)
+
+    def save_attendance(self, attendance):
+        """
+        Apply the bookkeeping of Attendance.save to the attendance and queue
+        the change of its approved overtime for the hour account
+        """
+        attendance.update_attendance_overtime()
+        attendance.attendance_day = self.shift_day(attendance.attendance_date)
+        if is_non_working(attendance.attendance_date):
+            attendance.minimum_hour = "00:00"
+            attendance.is_holiday = True
+        attendance.apply_overtime_conditions(self.condition)
+        previously_approved = getattr(attendance, "_punch_saved_approve", False)
+
+        employee = attendance.employee_id
+        approved = attendance.attendance_overtime_approve
+        if approved and previously_approved is False:
+            attendance.approved_overtime_second = attendance.overtime_second
+        elif not approved:
+            attendance.approved_overtime_second = 0
+        saved_overtime = getattr(attendance, "_punch_saved_overtime", 0)
+        self.overtime_deltas[month_key(employee.pk, attendance.attendance_date)] += (
+            attendance.approved_overtime_second - saved_overtime
+        )
+        attendance._punch_saved_approve = approved
+        attendance._punch_saved_overtime = attendance.approved_overtime_second
+        self.touch(attendance)
+
+        self.work_record_days[employee.pk].add(attendance.attendance_date)
+
+    def is_recorded(self, punch):
+        return (punch.employee_id, punch.datetime) in self.recorded
+
+    def direction(self, punch):
+        activities = self.activities[punch.employee_id]
+        if punch.direction == "alternate":
+            punch_date = punch.datetime.date()
+            last_activity = max(
+                (
+                    activity
+                    for activity in activities
+                    if activity.attendance_date == punch_date
+                ),
+                key=lambda activity: (
+                    datetime_key(activity.in_datetime),
+                    datetime_key(activity.out_datetime),
+                ),
+                default=None,
+            )
+            if not last_activity or last_activity.clock_out:
+                return "in"
+            return "out"
+        if punch.direction == "toggle":
+            if any(activity.clock_out is None for activity in activities):
+                return "out"
+            return "in"
+        return punch.direction
+
+    def apply(self, punch):
+        """
+        Replay the punch like the clock-in or clock-out views. Returns whether
+        the punch was applied.
+        """
+        employee = self.employees.get(punch.employee_id)
+        user = employee.employee_user_id if employee else None
+        if user is None or not user.is_active or not employee.is_active:
+            return False
+        work_info = getattr(employee, "employee_work_info", None)
+        if work_info is None or self.is_recorded(punch):
+            return False
+        direction = self.direction(punch)
+        if direction == "in":
+            self.clock_in(employee, work_info, punch.datetime)
+        elif direction == "out":
+            self.clock_out(employee, work_info, punch.datetime)
+        else:
+            return False
+        return True
+
+    def clock_in(self, employee, work_info, in_datetime):
+        shift = work_info.shift_id
+        date_today = in_datetime.date()
+        now = time(in_datetime.hour, in_datetime.minute)
+        attendance_date = date_today
+        day = self.shift_day(date_today)
+        minimum_hour, start_time_sec, end_time_sec = self.schedule(day, shift)
+        if start_time_sec > end_time_sec and MID_DAY_SECONDS > time_seconds(now):
+            # night shift, the morning punches belong to yesterday
+            attendance_date = date_today - timedelta(days=1)
+            day = self.shift_day(attendance_date)
+            minimum_hour, start_time_sec, end_time_sec = self.schedule(day, shift)
+
+        activities = self.activities[employee.pk]
+        activity = min(
+            (
+                activity
+                for activity in activities
+                if activity.attendance_date == attendance_date
+                and activity.clock_in_date == date_today
+                and activity.shift_day_id == day.pk
+                and activity.clock_out is None
+            ),
+            key=lambda activity: (activity.clock_in, self.order_key(activity)),
+            default=None,
+        )
+        if activity:
+            activity.clock_out = in_datetime.time()
+            activity.clock_out_date = date_today
+            self.touch(activity)
+        activity = AttendanceActivity(
+            employee_id=employee,
+            attendance_date=attendance_date,
+            clock_in_date=date_today,
+            shift_day=day,
+            clock_in=in_datetime.time(),
+            in_datetime=in_datetime,
+        )
+        self.add(activity)
+        activities.append(activity)
+        self.recorded.add((employee.pk, in_datetime))
+
+        attendances = self.attendances[employee.pk]
+        attendance = next(
+            (
+                attendance
+                for attendance in attendances
+                if attendance.attendance_date == attendance_date
+            ),
+            None,
+        )
+        if attendance is None:
+            attendance = Attendance(
+                employee_id=employee,
+                shift_id=shift,
+                work_type_id=work_info.work_type_id,
+                attendance_date=attendance_date,
+                attendance_day=day,
+                attendance_clock_in=now,
+                attendance_clock_in_date=date_today,
+                minimum_hour=minimum_hour,
+            )
+            self.add(attendance)
+            attendances.append(attendance)
+            self.save_attendance(attendance)
+            self.late_come(attendance, start_time_sec, end_time_sec, shift)
+        else:
+            attendance.attendance_clock_out = None
+            attendance.attendance_clock_out_date = None
+            self.save_attendance(attendance)
+            early_outs = self.records[self.record_key(attendance, "early_out")]
+            if early_outs:
+                record = early_outs.pop(0)
+                if record.pk:
+                    self.deleted_records.append(record.pk)
+                else:
+                    self.dirty.pop(id(record))
+
+    def late_come(self, attendance, start_time, end_time, shift):
+        if not self.tracking:
+            return
+        now_sec = time_seconds(attendance.attendance_clock_in)
+        now_sec -= self.grace_seconds(shift, "allowed_clock_in")
+        if start_time > end_time:
+            if now_sec < MID_DAY_SECONDS or now_sec > start_time:
+                self.create_record(attendance, "late_come")
+        elif start_time < now_sec:
+            self.create_record(attendance, "late_come")
+
+    def clock_out(self, employee, work_info, out_datetime):
+        shift = work_info.shift_id
+        date_today = out_datetime.date()
+        now = time(out_datetime.hour, out_datetime.minute)
+        day = self.shift_day(date_today)
+        attendances = self.attendances[employee.pk]
+        attendance = max(attendances, key=self.order_key, default=None)
+        if attendance is not None:
+            if not attendance.attendance_day_id:
+                attendance.attendance_day = self.shift_day(attendance.attendance_date)
+                self.touch(attendance)
+            day = self.days_by_id.get(attendance.attendance_day_id)
+        minimum_hour, start_time_sec, end_time_sec = self.schedule(day, shift)
+
+        activities = self.activities[employee.pk]
+        activity = max(
+            (activity for activity in activities if activity.clock_out is None),
+            key=lambda activity: (
+                date_key(activity.attendance_date),
+                self.order_key(activity),
+            ),
+            default=None,
+        )
+        if activity is None:
+            logger.error(
+                "No attendance clock in activity found that needs clocking out."
+            )
+            return
+        activity.clock_out = out_datetime.time()
+        activity.clock_out_date = date_today
+        activity.out_datetime = out_datetime
+        self.touch(activity)
+        self.recorded.add((employee.pk, out_datetime))
+
+        duration = 0
+        for day_activity in activities:
+            if day_activity.attendance_date != activity.attendance_date:
+                continue
+            in_time, out_time = activity_datetime(day_activity)
+            difference = out_time - in_time
+            duration += difference.days * 24 * 3600 + difference.seconds
+        attendance = max(
+            attendances,
+            key=lambda attendance: (
+                attendance.attendance_date,
+                self.order_key(attendance),
+            ),
+        )
+        attendance.attendance_clock_out = now
+        attendance.attendance_clock_out_date = date_today
+        attendance.attendance_worked_hour = format_time(duration)
+        attendance.attendance_overtime = overtime_calculation(attendance)
+        condition_for_at_work = strtime_seconds(
+            self.condition.validation_at_work
+            if self.condition and self.condition.validation_at_work
+            else "09:00"
+        )
+        attendance.attendance_validated = condition_for_at_work >= strtime_seconds(
+            attendance.attendance_worked_hour
+        )
+        self.save_attendance(attendance)
+
+        if self.records[self.record_key(attendance, "early_out")]:
+            return
+        schedule = self.schedules.get(
+            (attendance.attendance_day_id, attendance.shift_id_id)
+        )
+        next_date = attendance.attendance_date + timedelta(days=1)
+        if schedule and schedule.is_night_shift:
+            if attendance.attendance_date == date_today or (
+                MID_DAY_SECONDS >= time_seconds(now) and date_today == next_date
+            ):
+                self.early_out(attendance, start_time_sec, end_time_sec, shift)
+        elif attendance.attendance_date == date_today:
+            self.early_out(attendance, start_time_sec, end_time_sec, shift)
+
+    def early_out(self, attendance, start_time, end_time, shift):
+        if not self.tracking:
+            return
+        now_sec = time_seconds(attendance.attendance_clock_out)
+        now_sec += self.grace_seconds(shift, "allowed_clock_out")
+        if start_time > end_time:
+            if now_sec >= MID_DAY_SECONDS or now_sec < end_time:
+                self.create_record(attendance, "early_out")
+        elif end_time > now_sec:
+            self.create_record(attendance, "early_out")
+
+    def run(self):
+        """
+        Replay the punches of every employee, in time order. Returns the
+        number of punches applied. A punch failing halfway leaves the batch
+        state partly changed, so the error is raised for the caller to discard
+        the batch.
+        """
+        applied = 0
+        for punches in self.employee_punches.values():
+            for punch in punches:
+                applied += self.apply(punch)
+        return applied
+
+    def stamp(self, instances):
+        """
+        Set the created_by and modified_by fields like HorillaModel.save
+        """
+        if self.user is None:
+            return
+        for instance in instances:
+            if not instance.pk:
+                instance.created_by = self.user
+            instance.modified_by = self.user
+
+    def changed(self, model):
+        instances = [
+            instance for instance in self.dirty.values() if isinstance(instance, model)
+        ]
+        self.stamp(instances)
+        return (
+            [instance for instance in instances if not instance.pk],
+            [instance for instance in instances if instance.pk],
+        )
+
+    def write(self):
+        """
+        Write the replayed state with bulk operations
+        """
+        new_attendances, attendances = self.changed(Attendance)
+        if new_attendances:
+            bulk_create_with_history(
+                new_attendances, Attendance, batch_size=500, default_user=self.user
+            )
+        if attendances:
+            bulk_update_with_history(
+                attendances,
+                Attendance,
+                ATTENDANCE_BULK_FIELDS,
+                batch_size=500,
+                default_user=self.user,
+            )
+
+        new_activities, activities = self.changed(AttendanceActivity)
+        AttendanceActivity.objects.bulk_create(new_activities, batch_size=500)
+        AttendanceActivity.objects.bulk_update(
+            activities, ACTIVITY_BULK_FIELDS, batch_size=500
+        )
+
+        if self.deleted_records:
+            AttendanceLateComeEarlyOut.objects.filter(
+                pk__in=self.deleted_records
+            ).delete()
+        new_records, _records = self.changed(AttendanceLateComeEarlyOut)
+        AttendanceLateComeEarlyOut.objects.bulk_create(new_records, batch_size=500)
+
+        self.write_hour_accounts()
+        self.write_work_records()
+        for attendance in new_attendances + attendances:
+            queue_auto_punch_out(Attendance, attendance)
+
+    def write_hour_accounts(self):
+        """
+        Add the approved overtime changes of the batch to the hour accounts and
+        recount the worked and pending hours of their months, like
+        Attendance.save
+        """
+        update_hour_accounts(self.overtime_deltas)
+
+    def write_work_records(self):
+        """
+        Materialize the work records of the saved attendances, like the
+        attendance post_save signal
+        """
+        materialize_employee_days(self.work_record_days)
+
+
+def replay_punches(punches):
+    """
+    Replay the punches one by one through the clock-in and clock-out views
+    """
+    from attendance.views.clock_in_out import clock_in, clock_out
+
+    applied = 0
+    employees = Employee.objects.entire().select_related("employee_user_id")
+    for punch in punches:
+        employee = employees.filter(pk=punch.employee_id).first()
+        request_data = Request(
+            user=employee.employee_user_id if employee else None,
+            date=punch.datetime.date(),
+            time=punch.datetime.time(),
+            datetime=punch.datetime,
+        )
+        try:
+            batch = PunchBatch({punch.employee_id: [punch]})
+            if batch.is_recorded(punch):
+                continue
+            if batch.direction(punch) == "in":
+                clock_in(request_data)
+            else:
+                clock_out(request_data)
+            applied += 1
+        except Exception as error:
+            logger.error(
+                f"Punch processing error for employee {punch.employee_id}",
+                exc_info=error,
+            )
+    return applied
+
+
+def ingest_punches(punches, batch_size=None):
+    """
+    Apply the biometric punches to the attendances. The punches are
+    deduplicated on (device, user, datetime) and replayed per employee in time
+    order, with the result of replaying them one by one through the clock-in
+    and clock-out views. The employees are processed in batches of about
+    BIOMETRIC_PUNCH_BATCH_SIZE punches, each written in one transaction. When
+    replaying or writing a batch fails its punches are replayed one by one.
+
+    Returns the number of punches applied.
+    """
+    batch_size = batch_size or settings.BIOMETRIC_PUNCH_BATCH_SIZE
+    unique_punches = {}
+    for punch in punches:
+        unique_punches.setdefault(
+            (punch.device_id, punch.user_id, punch.datetime), punch
+        )
+    employee_punches = defaultdict(list)
+    for punch in sorted(unique_punches.values(), key=lambda punch: punch.datetime):
+        employee_punches[punch.employee_id].append(punch)
+
+    batches, batch, count = [], {}, 0
+    for employee_id, punches in employee_punches.items():
+        batch[employee_id] = punches
+        count += len(punches)
+        if count >= batch_size:
+            batches.append(batch)
+            batch, count = {}, 0
+    if batch:
+        batches.append(batch)
+
+    applied = 0
+    for batch in batches:
+        try:
+            with transaction.atomic():
+                punch_batch = PunchBatch(batch)
+                batch_applied = punch_batch.run()
+                punch_batch.write()
+            applied += batch_applied
+        except Exception as error:
+            logger.error("Ingesting a batch of punches failed", exc_info=error)
+            applied += replay_punches(
+                [punch for punches in batch.values() for punch in punches]
+            )
+    return applied
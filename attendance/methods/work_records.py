@@ -0,0 +1,469 @@
+"""
+work_records.py
+
+Materialization of the work records. The work record of an employee day is
+derived from the attendance of the day and the approved leave request covering
+it, and for the days up to today without either, from the shift schedule of the
+employee, which gives a draft record. The records of a date range are derived
+with a handful of set based queries and only the rows whose derived fields
+differ are written, with bulk operations.
+
+The attendance and leave request signals materialize the days they change. The
+scheduled job materializes the attendances and leave requests created since its
+watermark, which the bulk imports write without the signals, and the draft
+records of the days since its last run.
+
+month_work_record_types reads the record types of a month for the export, a
+chunk of employees at a time.
+"""
+
+from collections import defaultdict
+from datetime import date, timedelta
+from itertools import islice
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+from attendance.methods.utils import strtime_seconds
+
+WORK_RECORDS_WATERMARK_KEY = "work_records_watermark"
+
+
+def work_record_fields():
+    """
+    Fields of the work record derived from the attendance and leave data
+    """
+    fields = [
+        "work_record_type",
+        "message",
+        "at_work",
+        "min_hour",
+        "at_work_second",
+        "min_hour_second",
+        "is_attendance_record",
+        "attendance_id",
+        "is_leave_record",
+        "shift_id",
+        "day_percentage",
+    ]
+    if apps.is_installed("leave"):
+        fields.append("leave_request_id")
+    return fields
+
+
+def set_attendance_work_record(work_record, instance):
+    """
+    Set the fields of the work record of the day from the attendance
+    """
+    min_hour_second = strtime_seconds(instance.minimum_hour)
+    at_work_second = strtime_seconds(instance.attendance_worked_hour)
+
+    if not instance.attendance_validated:
+        status, message = "CONF", _("Validate the attendance")
+    elif at_work_second >= min_hour_second:
+        status, message = "FDP", _("Present")
+    elif at_work_second >= min_hour_second / 2:
+        status, message = "HDP", _("Incomplete minimum hour")
+    else:
+        status, message = "ABS", _("Incomplete half minimum hour")
+
+    work_record.employee_id_id = instance.employee_id_id
+    work_record.date = instance.attendance_date
+    work_record.at_work = instance.attendance_worked_hour
+    work_record.min_hour = instance.minimum_hour
+    work_record.min_hour_second = min_hour_second
+    work_record.at_work_second = at_work_second
+    work_record.work_record_type = status
+    work_record.message = message
+    work_record.is_attendance_record = True
+    work_record.attendance_id = instance
+    work_record.shift_id_id = instance.shift_id_id
+
+    if instance.attendance_validated:
+        work_record.day_percentage = (
+            1.00 if at_work_second > min_hour_second / 2 else 0.50
+        )
+
+    if work_record.is_leave_record:
+        message = (
+            _("Half day leave") if status == "HDP" else _("An approved leave exists")
+        )
+
+    if not instance.attendance_clock_out:
+        status, message = "FDP", _("Currently working")
+
+    work_record.work_record_type = status
+    work_record.message = message
+
+
+def set_leave_work_record(work_record, leave_request, day):
+    """
+    Set the fields of the work record of the day from the approved leave request
+    """
+    half_day = (
+        leave_request.start_date == day
+        and leave_request.start_date_breakdown == "first_half"
+        or leave_request.end_date == day
+        and leave_request.end_date_breakdown == "second_half"
+    )
+    work_record.employee_id_id = leave_request.employee_id_id
+    work_record.date = day
+    work_record.is_leave_record = True
+    work_record.leave_request_id = leave_request
+    work_record.day_percentage = 0.50 if half_day else 0.00
+    work_record.work_record_type = "CONF" if half_day else "ABS"
+    work_record.message = (
+        _("Half day Attendance need to validate") if half_day else "Leave"
+    )
+
+
+def date_range(start_date, end_date):
+    return [
+        start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)
+    ]
+
+
+def load_attendances(start_date, end_date, employee_ids):
+    from attendance.models import Attendance
+
+    attendances = Attendance.objects.entire().filter(
+        attendance_date__range=(start_date, end_date)
+    )
+    if employee_ids is not None:
+        attendances = attendances.filter(employee_id__in=employee_ids)
+    return {
+        (attendance.employee_id_id, attendance.attendance_date): attendance
+        for attendance in attendances.only(
+            "employee_id",
+            "attendance_date",
+            "attendance_worked_hour",
+            "minimum_hour",
+            "attendance_validated",
+            "attendance_clock_out",
+            "shift_id",
+        )
+    }
+
+
+def load_leaves(start_date, end_date, employee_ids):
+    """
+    {(employee id, date): approved leave request}, the latest request of a day
+    """
+    if not apps.is_installed("leave"):
+        return {}
+    LeaveRequest = apps.get_model("leave", "LeaveRequest")
+    leave_requests = LeaveRequest.objects.entire().filter(
+        Q(end_date__gte=start_date)
+        | Q(end_date__isnull=True, start_date__gte=start_date),
+        start_date__lte=end_date,
+        status="approved",
+    )
+    if employee_ids is not None:
+        leave_requests = leave_requests.filter(employee_id__in=employee_ids)
+    leaves = {}
+    for leave_request in leave_requests.order_by("id").only(
+        "employee_id",
+        "start_date",
+        "end_date",
+        "start_date_breakdown",
+        "end_date_breakdown",
+    ):
+        leave_start = max(leave_request.start_date, start_date)
+        leave_end = min(leave_request.end_date or leave_request.start_date, end_date)
+        for day in date_range(leave_start, leave_end):
+            leaves[(leave_request.employee_id_id, day)] = leave_request
+    return leaves
+
+
+def load_scheduled_days(employee_ids):
+    """
+    {employee id: (shift id, joining date, weekdays of the shift schedule)} of
+    the active employees with a shift
+    """
+    from base.models import EmployeeShiftSchedule
+    from employee.models import EmployeeWorkInformation
+
+    weekdays = defaultdict(set)
+    for shift_id, day in EmployeeShiftSchedule.objects.entire().values_list(
+        "shift_id", "day__day"
+    ):
+        weekdays[shift_id].add(day)
+    work_info = EmployeeWorkInformation.objects.entire().filter(
+        employee_id__is_active=True, shift_id__isnull=False
+    )
+    if employee_ids is not None:
+        work_info = work_info.filter(employee_id__in=employee_ids)
+    return {
+        employee_id: (shift_id, date_joining, weekdays[shift_id])
+        for employee_id, shift_id, date_joining in work_info.values_list(
+            "employee_id", "shift_id", "date_joining"
+        )
+    }
+
+
+def materialize_work_records(
+    start_date, end_date=None, employee_ids=None, employee_days=None
+):
+    """
+    Derive the work records of the employees, of every employee when
+    employee_ids is None, from start_date to end_date and write the ones that
+    changed, only the (employee id, date) pairs of employee_days when given.
+    The records without attendance or leave which are not attendance or leave
+    records are left as they are. Returns the numbers of records created,
+    updated and deleted.
+    """
+    from attendance.models import WorkRecords
+
+    end_date = end_date or start_date
+    if employee_ids is not None:
+        employee_ids = set(employee_ids)
+    today = date.today()
+    fields = work_record_fields()
+    attnames = [WorkRecords._meta.get_field(field).attname for field in fields]
+
+    attendances = load_attendances(start_date, end_date, employee_ids)
+    leaves = load_leaves(start_date, end_date, employee_ids)
+    work_records = {}
+    deleted = []
+    records = WorkRecords.objects.entire().filter(date__range=(start_date, end_date))
+    if employee_ids is not None:
+        records = records.filter(employee_id__in=employee_ids)
+    for work_record in records.order_by("id"):
+        key = (work_record.employee_id_id, work_record.date)
+        if employee_days is not None and key not in employee_days:
+            continue
+        if key in work_records:
+            deleted.append(work_record.pk)
+        else:
+            work_records[key] = work_record
+
+    keys = set(attendances) | set(leaves)
+    for key, work_record in work_records.items():
+        if work_record.is_attendance_record or work_record.is_leave_record:
+            keys.add(key)
+    # the days up to today without attendance or leave are drafts when the
+    # shift of the employee is scheduled on them
+    drafts = {}
+    days = date_range(start_date, min(end_date, today)) if start_date <= today else []
+    candidates = employee_days
+    if candidates is None and employee_ids is not None:
+        candidates = {
+            (employee_id, day) for employee_id in employee_ids for day in days
+        }
+    if days and (
+        candidates is None
+        or any(
+            key[1] <= today and key not in attendances and key not in leaves
+            for key in candidates
+        )
+    ):
+        for employee_id, (shift_id, date_joining, weekdays) in load_scheduled_days(
+            employee_ids
+        ).items():
+            for day in days:
+                if day.strftime("%A").lower() in weekdays and (
+                    date_joining is None or day >= date_joining
+                ):
+                    drafts[(employee_id, day)] = shift_id
+        keys.update(drafts)
+    if employee_days is not None:
+        keys &= employee_days
+
+    created, updated = [], []
+    for key in keys:
+        existing = work_records.get(key)
+        attendance = attendances.get(key)
+        leave_request = leaves.get(key)
+        derived = WorkRecords(employee_id_id=key[0], date=key[1])
+        if attendance is None and leave_request is None:
+            if existing is not None and not (
+                existing.is_attendance_record or existing.is_leave_record
+            ):
+                # a draft record, left as it is
+                continue
+            if key not in drafts:
+                deleted.append(existing.pk)
+                continue
+            derived.work_record_type = "DFT"
+            derived.message = ""
+            derived.shift_id_id = drafts[key]
+        else:
+            if leave_request is not None:
+                set_leave_work_record(derived, leave_request, key[1])
+                # the shift of a leave day is kept as it is
+                derived.shift_id_id = existing.shift_id_id if existing else None
+            if attendance is not None:
+                set_attendance_work_record(derived, attendance)
+
+        if existing is None:
+            created.append(derived)
+            continue
+        changed = False
+        for attname in attnames:
+            value = getattr(derived, attname)
+            if getattr(existing, attname) != value:
+                setattr(existing, attname, value)
+                changed = True
+        if changed:
+            updated.append(existing)
+
+    now = timezone.now()
+    for work_record in created + updated:
+        work_record.last_update = now
+    with transaction.atomic():
+        if deleted:
+            WorkRecords.objects.entire().filter(pk__in=deleted).delete()
+        WorkRecords.objects.bulk_create(created, batch_size=500)
+        WorkRecords.objects.bulk_update(
+            updated, fields + ["last_update"], batch_size=500
+        )
+    return {"created": len(created), "updated": len(updated), "deleted": len(deleted)}
+
+
+def materialize_work_record(employee_id, day):
+    """
+    Materialize the work record of an employee day
+    """
+    return materialize_work_records(day, day, [employee_id])
+
+
+def materialize_employee_days(employee_days):
+    """
+    Materialize the work records of the {employee id: days}, one pass per month
+    """
+    totals = {"created": 0, "updated": 0, "deleted": 0}
+    months = defaultdict(lambda: defaultdict(set))
+    for employee_id, days in employee_days.items():
+        for day in days:
+            months[(day.year, day.month)][employee_id].add(day)
+    for month_days in months.values():
+        result = materialize_work_records(
+            min(min(days) for days in month_days.values()),
+            max(max(days) for days in month_days.values()),
+            month_days,
+            {
+                (employee_id, day)
+                for employee_id, days in month_days.items()
+                for day in days
+            },
+        )
+        for name, count in result.items():
+            totals[name] += count
+    return totals
+
+
+def materialize_changed_work_records(today=None):
+    """
+    Materialize the work records of the attendances and approved leave requests
+    created since the watermark and of the days from the last run to today.
+    Without a watermark, the last WORK_RECORDS_CATCH_UP_DAYS days are
+    materialized. Returns the numbers of records created, updated and deleted.
+    """
+    from attendance.models import Attendance
+
+    today = today or date.today()
+    watermark = cache.get(WORK_RECORDS_WATERMARK_KEY)
+    # read the new watermark first, the rows created meanwhile go to the next run
+    new_watermark = {
+        "attendance": Attendance.objects.entire().aggregate(last=Max("id"))["last"]
+        or 0,
+        "leave": 0,
+        "date": today,
+    }
+    if apps.is_installed("leave"):
+        LeaveRequest = apps.get_model("leave", "LeaveRequest")
+        new_watermark["leave"] = (
+            LeaveRequest.objects.entire().aggregate(last=Max("id"))["last"] or 0
+        )
+
+    totals = {"created": 0, "updated": 0, "deleted": 0}
+
+    def add(result):
+        for name, count in result.items():
+            totals[name] += count
+
+    if watermark is None:
+        add(
+            materialize_work_records(
+                today - timedelta(days=settings.WORK_RECORDS_CATCH_UP_DAYS), today
+            )
+        )
+        cache.set(WORK_RECORDS_WATERMARK_KEY, new_watermark, timeout=None)
+        return totals
+
+    # the attendances and leave requests written without the signals
+    employee_days = defaultdict(set)
+    for employee_id, attendance_date in (
+        Attendance.objects.entire()
+        .filter(
+            id__gt=watermark["attendance"],
+            id__lte=new_watermark["attendance"],
+            employee_id__isnull=False,
+        )
+        .values_list("employee_id", "attendance_date")
+    ):
+        employee_days[employee_id].add(attendance_date)
+    if apps.is_installed("leave"):
+        for employee_id, start_date, end_date in (
+            LeaveRequest.objects.entire()
+            .filter(
+                id__gt=watermark["leave"],
+                id__lte=new_watermark["leave"],
+                status="approved",
+            )
+            .values_list("employee_id", "start_date", "end_date")
+        ):
+            employee_days[employee_id].update(
+                date_range(start_date, end_date or start_date)
+            )
+    add(materialize_employee_days(employee_days))
+
+    # the drafts of the days since the last run, today included for the
+    # employees given a shift meanwhile
+    add(
+        materialize_work_records(
+            max(
+                watermark["date"],
+                today - timedelta(days=settings.WORK_RECORDS_CATCH_UP_DAYS),
+            ),
+            today,
+        )
+    )
+    cache.set(WORK_RECORDS_WATERMARK_KEY, new_watermark, timeout=None)
+    return totals
+
+
+def month_work_record_types(employees, month_dates, leave_dates, chunk_size=500):
+    """
+    (employee, work record types of the month dates) of the employees, loading
+    the records of chunk_size employees at a time. Past working days without a
+    record are DFT, the other days without a record and the drafts of the
+    non working and future days are empty.
+    """
+    from attendance.models import WorkRecords
+
+    today = date.today()
+    employees = employees.iterator(chunk_size=chunk_size)
+    while chunk := list(islice(employees, chunk_size)):
+        record_types = defaultdict(dict)
+        for employee_id, day, record_type in WorkRecords.objects.filter(
+            employee_id__in=[employee.pk for employee in chunk],
+            date__range=(month_dates[0], min(month_dates[-1], today)),
+        ).values_list("employee_id", "date", "work_record_type"):
+            record_types[employee_id][day] = record_type
+        for employee in chunk:
+            types = record_types[employee.pk]
+            row = []
+            for day in month_dates:
+                record_type = types.get(day, "")
+                if day < today and day not in leave_dates:
+                    record_type = record_type or "DFT"
+                elif record_type == "DFT":
+                    record_type = ""
+                row.append(record_type)
+            yield employee, row
@@ -8,12 +8,12 @@ This module is used to register models for recruitment app
 import contextlib
 import datetime as dt
 import json
+from collections import defaultdict
 from datetime import date, datetime, timedelta
 
 from django.apps import apps
 from django.core.exceptions import ValidationError
-from django.db import models
-from django.db.models import Q
+from django.db import models, transaction
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
@@ -28,8 +28,8 @@ from attendance.methods.utils import (
     validate_time_in_minutes,
 )
 from base.horilla_company_manager import HorillaCompanyManager
-from base.methods import is_company_leave, is_holiday
 from base.models import Company, EmployeeShift, EmployeeShiftDay, WorkType
+from base.working_calendar import is_non_working
 from employee.models import Employee
 from horilla.methods import get_horilla_model_class
 from horilla.models import HorillaModel, upload_path
@@ -345,7 +345,7 @@ class Attendance(HorillaModel):
         """
         Set minimum_hour to 00:00 if the attendance date falls on a holiday or company leave.
         """
-        if is_holiday(self.attendance_date) or is_company_leave(self.attendance_date):
+        if is_non_working(self.attendance_date):
             self.minimum_hour = "00:00"
             self.is_holiday = True
 
@@ -366,7 +366,14 @@ class Attendance(HorillaModel):
         self.overtime_second = strtime_seconds(self.attendance_overtime)
 
     def handle_overtime_conditions(self):
-        condition = AttendanceValidationCondition.objects.first()
+        from attendance.methods.hour_account import get_validation_condition
+
+        self.apply_overtime_conditions(get_validation_condition())
+
+    def apply_overtime_conditions(self, condition):
+        """
+        Apply the overtime cutoff and auto-approval of the validation condition
+        """
         if self.is_validate_request:
             self.is_validate_request_approved = self.attendance_validated = False
 
@@ -385,48 +392,65 @@ class Attendance(HorillaModel):
                 self.attendance_overtime_approve = True
 
     def save(self, *args, **kwargs):
-        self.update_attendance_overtime()
-        self.attendance_day = EmployeeShiftDay.objects.get(
-            day=self.attendance_date.strftime("%A").lower()
+        from attendance.methods.hour_account import (
+            month_key,
+            shift_day_id,
+            update_hour_accounts,
         )
-        prev_attendance_approved = False
+
+        self.update_attendance_overtime()
+        self.attendance_day_id = shift_day_id(self.attendance_date)
         self.adjust_minimum_hour()
 
         # Handle overtime cutoff and auto-approval
         self.handle_overtime_conditions()
 
-        if self.pk is not None:
-            # Get the previous values of the boolean field
-            prev_state = Attendance.objects.get(pk=self.pk)
-            prev_attendance_approved = prev_state.attendance_overtime_approve
-
-        # super().save(*args, **kwargs)  #commend this line, it take too much time to complete
-        employee_ot = self.employee_id.employee_overtime.filter(
-            month=self.attendance_date.strftime("%B").lower(),
-            year=self.attendance_date.year,
-        ).first()
-        if employee_ot:
-            # Update if exists
-            self.update_ot(employee_ot)
-        else:
-            # Create and update in one call
-            employee_ot = self.create_ot()
-            self.update_ot(employee_ot)
-        approved = self.attendance_overtime_approve
-        attendance_account = self.employee_id.employee_overtime.filter(
-            month=self.attendance_date.strftime("%B").lower(),
-            year=self.attendance_date.year,
-        ).first()
-        total_ot_seconds = attendance_account.overtime_second
-        if approved and prev_attendance_approved is False:
-            self.approved_overtime_second = self.overtime_second
-            total_ot_seconds = total_ot_seconds + self.approved_overtime_second
-        elif not approved:
-            total_ot_seconds = total_ot_seconds - self.approved_overtime_second
-            self.approved_overtime_second = 0
-        attendance_account.overtime = format_time(total_ot_seconds)
-        attendance_account.save()
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            previous = None
+            if self.pk is not None:
+                previous = (
+                    Attendance.objects.entire()
+                    .select_for_update()
+                    .filter(pk=self.pk)
+                    .values(
+                        "employee_id",
+                        "attendance_date",
+                        "attendance_overtime_approve",
+                        "approved_overtime_second",
+                    )
+                    .first()
+                )
+            prev_attendance_approved = (
+                previous["attendance_overtime_approve"] if previous else False
+            )
+            if self.attendance_overtime_approve and not prev_attendance_approved:
+                self.approved_overtime_second = self.overtime_second
+            elif not self.attendance_overtime_approve:
+                self.approved_overtime_second = 0
+            # the post_save signal materializes the work record of the day the
+            # attendance moved from too
+            self._moved_from = None
+            if previous and (previous["employee_id"], previous["attendance_date"]) != (
+                self.employee_id_id,
+                self.attendance_date,
+            ):
+                self._moved_from = (
+                    previous["employee_id"],
+                    previous["attendance_date"],
+                )
+            super().save(*args, **kwargs)
+
+            # the hour account overtime is the sum of the approved overtime of
+            # the month, add the change of this attendance to it
+            overtime_deltas = defaultdict(int)
+            if previous and previous["employee_id"] and previous["attendance_date"]:
+                overtime_deltas[
+                    month_key(previous["employee_id"], previous["attendance_date"])
+                ] -= previous["approved_overtime_second"]
+            overtime_deltas[
+                month_key(self.employee_id_id, self.attendance_date)
+            ] += self.approved_overtime_second
+            update_hour_accounts(overtime_deltas)
 
     def serialize(self):
         """
@@ -454,97 +478,47 @@ class Attendance(HorillaModel):
         return serialized_data
 
     def delete(self, *args, **kwargs):
+        from attendance.methods.hour_account import month_key, update_hour_accounts
+
         # Custom delete logic
         # Perform additional operations before deleting the object
         with contextlib.suppress(Exception):
             AttendanceActivity.objects.filter(
                 attendance_date=self.attendance_date, employee_id=self.employee_id
             ).delete()
-            employee_ot = self.employee_id.employee_overtime.filter(
-                month=self.attendance_date.strftime("%B").lower(),
-                year=self.attendance_date.strftime("%Y"),
+        with transaction.atomic():
+            approved_overtime_second = (
+                Attendance.objects.entire()
+                .select_for_update()
+                .filter(pk=self.pk)
+                .values_list("approved_overtime_second", flat=True)
+                .first()
             )
-        if employee_ot.exists():
-            self.update_ot(employee_ot.first())
-        # Call the superclass delete() method to delete the object
-        super().delete(*args, **kwargs)
-
-        # Perform additional operations after deleting the object
-
-    def create_ot(self):
-        """
-        Create a new Hour Account instance if it doesn't exist for a specific month and year.
-        Returns:
-            AttendanceOverTime: The created or fetched AttendanceOverTime instance.
-        """
-        # Create or fetch the AttendanceOverTime instance
-        employee_ot, created = AttendanceOverTime.objects.get_or_create(
-            employee_id=self.employee_id,
-            month=self.attendance_date.strftime("%B").lower(),
-            year=self.attendance_date.year,
-        )
-
-        # Update only if the fields are available
-        if self.attendance_overtime_approve:
-            employee_ot.overtime = self.attendance_overtime
-
-        if self.attendance_validated:
-            employee_ot.hour_account = self.attendance_worked_hour
-
-        employee_ot.save()
-        return employee_ot
+            # Call the superclass delete() method to delete the object
+            result = super().delete(*args, **kwargs)
+            if self.employee_id_id:
+                update_hour_accounts(
+                    {
+                        month_key(self.employee_id_id, self.attendance_date): -(
+                            approved_overtime_second or 0
+                        )
+                    }
+                )
+        return result
 
-    def update_ot(self, employee_ot):
+    def update_ot(self, employee_ot=None):
         """
-        Update the hour account for the given employee.
+        Recount the hour account of the attendance month from its attendances
 
         Args:
-            employee_ot (obj): AttendanceOverTime instance
+            employee_ot (obj): AttendanceOverTime instance, refreshed after the
+            update when given
         """
-        if apps.is_installed("leave"):
-            approved_leave_requests = self.employee_id.leaverequest_set.filter(
-                start_date__lte=self.attendance_date,
-                end_date__gte=self.attendance_date,
-                status="approved",
-            )
-        else:
-            approved_leave_requests = []
-
-        # Create exclude condition using Q objects
-        exclude_condition = Q()
-        if approved_leave_requests:
-            # Combine multiple conditions for the exclude clause
-            for leave in approved_leave_requests:
-                exclude_condition |= Q(
-                    attendance_date__range=(leave.start_date, leave.end_date)
-                )
-
-        # Filter month attendances in a single query
-        month_attendances = (
-            Attendance.objects.filter(
-                employee_id=self.employee_id,
-                attendance_date__month=self.attendance_date.month,
-                attendance_date__year=self.attendance_date.year,
-                attendance_validated=True,
-            )
-            .exclude(exclude_condition)
-            .values("minimum_hour", "at_work_second")
-        )
-
-        # Calculate hour balance and hours pending in a single loop
-        hour_balance = 0
-        minimum_hour_second = 0
-        for attendance in month_attendances:
-            required_work_second = strtime_seconds(attendance["minimum_hour"])
-            at_work_second = min(required_work_second, attendance["at_work_second"])
-            hour_balance += at_work_second
-            minimum_hour_second += required_work_second
-
-        hours_pending = minimum_hour_second - hour_balance
-        employee_ot.worked_hours = format_time(hour_balance)
-        employee_ot.pending_hours = format_time(hours_pending)
-        employee_ot.save()
+        from attendance.methods.hour_account import month_key, update_hour_accounts
 
+        update_hour_accounts({month_key(self.employee_id_id, self.attendance_date): 0})
+        if employee_ot is not None and employee_ot.pk:
+            employee_ot.refresh_from_db()
         return employee_ot
 
     def clean(self, *args, **kwargs):
@@ -736,7 +710,10 @@ class AttendanceOverTime(HorillaModel):
         """
         return MONTH_MAPPING[self.month]
 
-    def save(self, *args, **kwargs):
+    def update_seconds(self):
+        """
+        Set the seconds fields and the month sequence from the hour fields
+        """
         self.hour_account_second = strtime_seconds(self.worked_hours)
         self.hour_pending_second = strtime_seconds(self.pending_hours)
         self.overtime_second = strtime_seconds(self.overtime)
@@ -756,6 +733,9 @@ class AttendanceOverTime(HorillaModel):
             "december",
         ]
         self.month_sequence = months.index(month_name)
+
+    def save(self, *args, **kwargs):
+        self.update_seconds()
         super().save(*args, **kwargs)
 
 
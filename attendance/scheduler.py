@@ -1,56 +1,69 @@
 import datetime
-import sys
 
 import pytz
 from apscheduler.schedulers.background import BackgroundScheduler
 from django.conf import settings
 
+from attendance.methods.auto_punch_out import auto_punch_out_scheduler
 from base.backends import logger
+from horilla.horilla_settings import schedulers_enabled
 
 
 def create_work_record():
-    from attendance.models import WorkRecords
-    from employee.models import Employee
+    """
+    Materialize the work records changed since the last run and the draft
+    records of today
+    """
+    from attendance.methods.work_records import materialize_changed_work_records
+
+    try:
+        totals = materialize_changed_work_records()
+        logger.info(
+            "Work records materialized: %(created)s created, %(updated)s updated, "
+            "%(deleted)s deleted",
+            totals,
+        )
+    except Exception as e:
+        logger.error(f"Failed to materialize the work records: {e}")
+
+
+def auto_punch_out():
+    """
+    Clock out the attendances whose auto punch-out deadline has passed and
+    re-arm the wake up job for the next deadline.
+    """
+    auto_punch_out_scheduler.run_due()
+    schedule_next_auto_punch_out()
+
 
-    date = datetime.datetime.today()
-    work_records = WorkRecords.objects.filter(date=date).values_list(
-        "employee_id", flat=True
+def refresh_auto_punch_out():
+    """
+    Rebuild the auto punch-out deadlines from the open attendances
+    """
+    auto_punch_out_scheduler.rebuild()
+    auto_punch_out()
+
+
+def schedule_next_auto_punch_out(*args, **kwargs):
+    """
+    Schedule a one-off wake up at the earliest queued auto punch-out deadline
+    """
+    deadline = auto_punch_out_scheduler.next_deadline()
+    if deadline is None:
+        if scheduler.get_job("auto_punch_out"):
+            scheduler.remove_job("auto_punch_out")
+        return
+    scheduler.add_job(
+        auto_punch_out,
+        "date",
+        run_date=deadline,
+        id="auto_punch_out",
+        replace_existing=True,
+        misfire_grace_time=3600 * 3,
     )
-    employees = Employee.objects.exclude(id__in=work_records)
-    records_to_create = []
-
-    for employee in employees:
-        try:
-            shift_schedule = employee.get_shift_schedule()
-            if shift_schedule is None:
-                continue
-
-            shift = employee.get_shift()
-            record = WorkRecords(
-                employee_id=employee,
-                date=date,
-                work_record_type="DFT",
-                shift_id=shift,
-                message="",
-            )
-            records_to_create.append(record)
-        except Exception as e:
-            logger.error(f"Error preparing work record for {employee}: {e}")
-
-    if records_to_create:
-        try:
-            WorkRecords.objects.bulk_create(records_to_create)
-            print(f"Created {len(records_to_create)} work records for {date}.")
-        except Exception as e:
-            logger.error(f"Failed to bulk create work records: {e}")
-    else:
-        print(f"No new work records to create for {date}.")
-
-
-if not any(
-    cmd in sys.argv
-    for cmd in ["makemigrations", "migrate", "compilemessages", "flush", "shell"]
-):
+
+
+if schedulers_enabled():
     """
     Initializes and starts background tasks using APScheduler when the server is running.
     """
@@ -69,4 +82,15 @@ if not any(
         replace_existing=True,
     )
 
+    if settings.AUTO_PUNCH_OUT_IN_PROCESS:
+        scheduler.add_job(
+            refresh_auto_punch_out,
+            "interval",
+            minutes=30,
+            next_run_time=datetime.datetime.now(),
+            id="refresh_auto_punch_out",
+            replace_existing=True,
+        )
+        auto_punch_out_scheduler.on_deadline_change = schedule_next_auto_punch_out
+
     scheduler.start()
@@ -12,6 +12,11 @@ from base.templatetags.basefilters import is_reportingmanager
 
 MENU = _("Attendance")
 IMG_SRC = "images/ui/attendances.svg"
+# models the accessibility of the menu depends on
+MENU_DEPENDENCIES = [
+    "base.TrackLateComeEarlyOut",
+    "employee.EmployeeWorkInformation",
+]
 
 
 SUBMENUS = [
@@ -1,17 +1,31 @@
 # attendance/signals.py
 
-from datetime import datetime, timedelta
+from datetime import datetime
 
 from django.apps import apps
-from django.db.models.signals import post_migrate, post_save, pre_delete
+from django.db.models.signals import post_delete, post_migrate, post_save
 from django.dispatch import receiver
-from django.utils.translation import gettext_lazy as _
 
-from attendance.methods.utils import strtime_seconds
-from attendance.models import Attendance, AttendanceGeneralSetting, WorkRecords
-from base.models import Company, PenaltyAccounts
-from employee.models import Employee
+from attendance.methods.auto_punch_out import auto_punch_out_scheduler
+from attendance.methods.hour_account import clear_attendance_settings_cache
+from attendance.methods.work_records import (
+    materialize_work_record,
+    materialize_work_records,
+)
+from attendance.models import (
+    Attendance,
+    AttendanceGeneralSetting,
+    AttendanceValidationCondition,
+    WorkRecords,
+)
+from base.models import (
+    Company,
+    EmployeeShiftDay,
+    EmployeeShiftSchedule,
+    PenaltyAccounts,
+)
 from horilla.methods import get_horilla_model_class
+from horilla.signals import post_bulk_update
 
 
 @receiver(post_save, sender=Attendance)
@@ -19,67 +33,72 @@ def attendance_post_save(sender, instance, **kwargs):
     """
     Handle post-save actions for Attendance model.
     """
-    min_hour_second = strtime_seconds(instance.minimum_hour)
-    at_work_second = strtime_seconds(instance.attendance_worked_hour)
-
-    if not instance.attendance_validated:
-        status, message = "CONF", _("Validate the attendance")
-    elif at_work_second >= min_hour_second:
-        status, message = "FDP", _("Present")
-    elif at_work_second >= min_hour_second / 2:
-        status, message = "HDP", _("Incomplete minimum hour")
-    else:
-        status, message = "ABS", _("Incomplete half minimum hour")
-    try:
-        work_record, created = WorkRecords.objects.get_or_create(
-            date=instance.attendance_date,
-            employee_id=instance.employee_id,
-        )
-    except WorkRecords.MultipleObjectsReturned:
-        work_records = WorkRecords.objects.filter(
-            date=instance.attendance_date,
-            employee_id=instance.employee_id,
-        )
-        work_record = work_records.first()
-        work_records.exclude(id=work_record.id).delete()
-    except Exception as e:
-        print(e)
-
-    work_record.employee_id = instance.employee_id
-    work_record.date = instance.attendance_date
-    work_record.at_work = instance.attendance_worked_hour
-    work_record.min_hour = instance.minimum_hour
-    work_record.min_hour_second = min_hour_second
-    work_record.at_work_second = at_work_second
-    work_record.work_record_type = status
-    work_record.message = message
-    work_record.is_attendance_record = True
-    work_record.attendance_id = instance
-    work_record.shift_id = instance.shift_id
-
-    if instance.attendance_validated:
-        work_record.day_percentage = (
-            1.00 if at_work_second > min_hour_second / 2 else 0.50
+    materialize_work_record(instance.employee_id_id, instance.attendance_date)
+    moved_from = getattr(instance, "_moved_from", None)
+    if moved_from and moved_from[0]:
+        materialize_work_record(*moved_from)
+
+
+@receiver(post_bulk_update, sender=Attendance)
+def attendance_post_bulk_update(sender, queryset, *args, **kwargs):
+    """
+    Materialize the work records of the attendances changed by a queryset update
+    """
+    employee_days = list(queryset.values_list("employee_id", "attendance_date"))
+    if employee_days:
+        materialize_work_records(
+            min(day for _employee_id, day in employee_days),
+            max(day for _employee_id, day in employee_days),
+            {employee_id for employee_id, _day in employee_days},
         )
 
-    if work_record.is_leave_record:
-        message = (
-            _("Half day leave") if status == "HDP" else _("An approved leave exists")
+
+@receiver(post_save, sender=Attendance)
+def queue_auto_punch_out(sender, instance, **kwargs):
+    """
+    Queue the auto punch-out deadline of an attendance that is still open
+    """
+    if auto_punch_out_scheduler.on_deadline_change and not (
+        instance.attendance_clock_out or instance.attendance_clock_out_date
+    ):
+        auto_punch_out_scheduler.push(
+            instance.shift_id_id,
+            instance.attendance_day_id,
+            instance.attendance_date,
+            notify=True,
         )
 
-    if not instance.attendance_clock_out:
-        status, message = "FDP", _("Currently working")
 
-    work_record.work_record_type = status
-    work_record.message = message
-    work_record.save()
+@receiver(post_save, sender=EmployeeShiftSchedule)
+@receiver(post_delete, sender=EmployeeShiftSchedule)
+def reload_auto_punch_out(sender, instance, **kwargs):
+    """
+    Reload the auto punch-out deadlines when a shift schedule changes
+    """
+    if auto_punch_out_scheduler.on_deadline_change:
+        auto_punch_out_scheduler.reload()
+
+
+@receiver(post_save, sender=AttendanceValidationCondition)
+@receiver(post_delete, sender=AttendanceValidationCondition)
+def clear_validation_condition_cache(sender, instance, **kwargs):
+    clear_attendance_settings_cache("validation_condition")
+
+
+@receiver(post_save, sender=EmployeeShiftDay)
+@receiver(post_delete, sender=EmployeeShiftDay)
+def clear_shift_days_cache(sender, instance, **kwargs):
+    clear_attendance_settings_cache("shift_days")
 
 
-@receiver(pre_delete, sender=Attendance)
+@receiver(post_delete, sender=Attendance)
 def handle_attendance_deletion(sender, instance, **kwargs):
-    for workrecord in instance.workrecords_set.all():
-        if not workrecord.leave_request_id:
-            workrecord.delete()
+    """
+    Materialize the work record of the day of the deleted attendance, which
+    drops it or makes it the leave or draft record of the day
+    """
+    if instance.employee_id_id:
+        materialize_work_record(instance.employee_id_id, instance.attendance_date)
 
 
 # @receiver(post_migrate)
@@ -175,45 +194,6 @@ def create_missing_work_records(sender, **kwargs):
     if sender.label not in ["attendance"]:
         return
 
-    employees = Employee.objects.all()
-    work_records = WorkRecords.objects.all()
-
-    if work_records.exists():
-        st_date = work_records.earliest("date").date
-
-        for employee in employees:
-            try:
-                start_date = employee.employee_work_info.date_joining or st_date
-                end_date = datetime.today().date()
-
-                existing_dates = set(
-                    WorkRecords.objects.filter(employee_id=employee.id).values_list(
-                        "date", flat=True
-                    )
-                )
-
-                all_dates = {
-                    start_date + timedelta(days=i)
-                    for i in range((end_date - start_date).days)
-                }
-                missing_dates = all_dates - existing_dates
-
-                work_records_to_create = [
-                    WorkRecords(
-                        employee_id=employee,
-                        date=missing_date,
-                        work_record_type="DFT",
-                        shift_id=employee.employee_work_info.shift_id,
-                    )
-                    for missing_date in missing_dates
-                ]
-
-                if work_records_to_create:
-                    WorkRecords.objects.bulk_create(
-                        work_records_to_create, batch_size=500, ignore_conflicts=True
-                    )
-
-            except Exception as e:
-                print(
-                    f"Error creating missing work records for employee {employee}: {e}"
-                )
+    first_record = WorkRecords.objects.entire().order_by("date").first()
+    if first_record is not None and first_record.date:
+        materialize_work_records(first_record.date, datetime.today().date())
@@ -1,3 +1,300 @@
-from django.test import TestCase
+"""
+attendance/tests.py
+"""
 
-# Create your tests here.
+import random
+import threading
+import time
+from datetime import date, datetime
+from datetime import time as day_time
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from attendance.methods.hour_account import (
+    clear_attendance_settings_cache,
+    rebuild_hour_accounts,
+)
+from attendance.methods.punch_ingestion import Punch, ingest_punches, replay_punches
+from attendance.methods.utils import format_time
+from attendance.models import (
+    Attendance,
+    AttendanceActivity,
+    AttendanceLateComeEarlyOut,
+    AttendanceOverTime,
+)
+from base.models import DAY, EmployeeShift, EmployeeShiftDay, EmployeeShiftSchedule
+from employee.models import Employee, EmployeeWorkInformation
+
+
+class HourAccountLedgerTest(TransactionTestCase):
+    """
+    The overtime of an hour account is the sum of the approved overtime of the
+    attendances of its month, even when they are approved concurrently
+    """
+
+    threads = 6
+    attendances_per_thread = 4
+
+    def setUp(self):
+        clear_attendance_settings_cache()
+        EmployeeShiftDay.objects.bulk_create(
+            [EmployeeShiftDay(day=day) for day, _label in DAY]
+        )
+        user = User.objects.create(username="ledger")
+        self.employee = Employee.objects.create(
+            employee_first_name="Ledger",
+            email="ledger@example.com",
+            employee_user_id=user,
+        )
+        self.attendance_ids = []
+        for day in range(self.threads * self.attendances_per_thread):
+            attendance_date = date(2024, 5, 1) + timedelta(days=day)
+            attendance = Attendance(
+                employee_id=self.employee,
+                attendance_date=attendance_date,
+                attendance_clock_in_date=attendance_date,
+                attendance_clock_out_date=attendance_date,
+                attendance_worked_hour="11:00",
+                minimum_hour="08:00",
+                attendance_validated=True,
+            )
+            attendance.save()
+            self.attendance_ids.append(attendance.pk)
+
+    def approve(self, attendance_ids, barrier, errors):
+        try:
+            barrier.wait()
+            for attendance_id in attendance_ids:
+                while True:
+                    try:
+                        attendance = Attendance.objects.entire().get(pk=attendance_id)
+                        attendance.attendance_overtime_approve = True
+                        attendance.save()
+                        break
+                    except OperationalError as error:
+                        # SQLite refuses a concurrent writer instead of waiting
+                        if "locked" not in str(error):
+                            raise
+                        time.sleep(random.random() / 100)
+        except Exception as error:
+            errors.append(error)
+        finally:
+            connection.close()
+
+    def account(self):
+        return AttendanceOverTime.objects.entire().get(
+            employee_id=self.employee, month="may", year="2024"
+        )
+
+    def test_concurrent_approvals_lose_no_update(self):
+        self.assertEqual(self.account().overtime_second, 0)
+        barrier = threading.Barrier(self.threads)
+        errors = []
+        threads = [
+            threading.Thread(
+                target=self.approve,
+                args=(self.attendance_ids[index :: self.threads], barrier, errors),
+            )
+            for index in range(self.threads)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+        approved = Attendance.objects.entire().filter(pk__in=self.attendance_ids)
+        self.assertTrue(
+            all(approved.values_list("attendance_overtime_approve", flat=True))
+        )
+        approved_overtime = sum(
+            approved.values_list("approved_overtime_second", flat=True)
+        )
+        self.assertEqual(approved_overtime, len(self.attendance_ids) * 3 * 60 * 60)
+        account = self.account()
+        self.assertEqual(account.overtime_second, approved_overtime)
+
+        fields = [
+            "overtime_second",
+            "overtime",
+            "hour_account_second",
+            "hour_pending_second",
+            "worked_hours",
+            "pending_hours",
+        ]
+        accounts = AttendanceOverTime.objects.entire().filter(pk=account.pk)
+        before = accounts.values(*fields).get()
+        rebuild_hour_accounts(employee_ids=[self.employee.pk])
+        self.assertEqual(accounts.values(*fields).get(), before)
+
+
+class PunchIngestionTest(TestCase):
+    """
+    Ingesting the biometric punches in batches gives the attendances of
+    replaying them one by one through the clock-in and clock-out views
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        clear_attendance_settings_cache()
+        days = EmployeeShiftDay.objects.bulk_create(
+            [EmployeeShiftDay(day=day) for day, _label in DAY]
+        )
+        day_shift, night_shift = EmployeeShift.objects.bulk_create(
+            [EmployeeShift(employee_shift="Day"), EmployeeShift(employee_shift="Night")]
+        )
+        for day in days:
+            EmployeeShiftSchedule.objects.create(
+                day=day,
+                shift_id=day_shift,
+                minimum_working_hour="08:00",
+                start_time=day_time(9),
+                end_time=day_time(18),
+            )
+            EmployeeShiftSchedule.objects.create(
+                day=day,
+                shift_id=night_shift,
+                minimum_working_hour="08:00",
+                start_time=day_time(22),
+                end_time=day_time(6),
+            )
+        # the batch and the one by one replay each get their own employees
+        cls.employees = {}
+        for path in ("batch", "replay"):
+            cls.employees[path] = []
+            for index, shift in enumerate((day_shift, night_shift, day_shift)):
+                user = User.objects.create(username=f"{path}{index}")
+                employee = Employee.objects.create(
+                    employee_first_name=f"{path} {index}",
+                    email=f"{path}{index}@example.com",
+                    employee_user_id=user,
+                )
+                EmployeeWorkInformation.objects.filter(employee_id=employee).update(
+                    shift_id=shift
+                )
+                cls.employees[path].append(employee)
+
+    def punches(self, path):
+        def at(day, hour, minute=0):
+            return timezone.make_aware(datetime(2024, 5, day, hour, minute))
+
+        day, night, other = (employee.pk for employee in self.employees[path])
+        return [
+            # late in, a break and an early out, a punch read by two devices
+            Punch(1, "d", day, at(6, 9, 30), "alternate"),
+            Punch(1, "d", day, at(6, 12), "alternate"),
+            Punch(2, "d", day, at(6, 12), "alternate"),
+            Punch(1, "d", day, at(6, 13), "alternate"),
+            Punch(1, "d", day, at(6, 17), "alternate"),
+            Punch(1, "d", day, at(7, 8, 55), "in"),
+            Punch(1, "d", day, at(7, 19, 10), "out"),
+            # night shifts clocked out after midnight
+            Punch(1, "n", night, at(6, 22, 10), "toggle"),
+            Punch(1, "n", night, at(7, 5), "toggle"),
+            Punch(1, "n", night, at(7, 21, 50), "toggle"),
+            Punch(1, "n", night, at(8, 7), "toggle"),
+            # an out without an open activity, then an in left open
+            Punch(1, "o", other, at(6, 10), "out"),
+            Punch(1, "o", other, at(6, 11), "in"),
+        ]
+
+    def state(self, path):
+        """
+        The attendance rows of the employees, keyed by their position
+        """
+        positions = {
+            employee.pk: position
+            for position, employee in enumerate(self.employees[path])
+        }
+        employee_ids = list(positions)
+        attendances = Attendance.objects.entire().filter(employee_id__in=employee_ids)
+        activities = AttendanceActivity.objects.entire().filter(
+            employee_id__in=employee_ids
+        )
+        records = AttendanceLateComeEarlyOut.objects.entire().filter(
+            employee_id__in=employee_ids
+        )
+        accounts = AttendanceOverTime.objects.entire().filter(
+            employee_id__in=employee_ids
+        )
+
+        def rows(queryset, *fields):
+            return sorted(
+                (positions[row.pop("employee_id")],) + tuple(row.values())
+                for row in queryset.values("employee_id", *fields)
+            )
+
+        return {
+            "attendances": rows(
+                attendances,
+                "attendance_date",
+                "attendance_day",
+                "shift_id",
+                "attendance_clock_in",
+                "attendance_clock_in_date",
+                "attendance_clock_out",
+                "attendance_clock_out_date",
+                "attendance_worked_hour",
+                "minimum_hour",
+                "attendance_overtime",
+                "attendance_validated",
+                "at_work_second",
+                "overtime_second",
+                "approved_overtime_second",
+                "is_holiday",
+            ),
+            "activities": rows(
+                activities,
+                "attendance_date",
+                "shift_day",
+                "clock_in_date",
+                "clock_in",
+                "clock_out_date",
+                "clock_out",
+                "in_datetime",
+                "out_datetime",
+            ),
+            "records": rows(records, "attendance_id__attendance_date", "type"),
+            "accounts": rows(
+                accounts,
+                "month",
+                "year",
+                "worked_hours",
+                "pending_hours",
+                "overtime",
+            ),
+        }
+
+    def test_batch_matches_one_by_one_replay(self):
+        ingest_punches(self.punches("batch"), batch_size=4)
+        replay_punches(self.punches("replay"))
+        batch = self.state("batch")
+        self.assertTrue(batch["attendances"])
+        self.assertTrue(batch["records"])
+        self.assertEqual(batch, self.state("replay"))
+
+        # the punches read again from the devices, over the stored state
+        ingest_punches(self.punches("batch"))
+        replay_punches(self.punches("replay"))
+        self.assertEqual(self.state("batch"), self.state("replay"))
+
+    def test_failing_punch_falls_back_to_one_by_one_replay(self):
+        calls = []
+
+        def fail_second_call(seconds):
+            # the last clock out of the first day fails after closing its
+            # activity
+            calls.append(seconds)
+            if len(calls) == 2:
+                raise ValueError("clock out failed")
+            return format_time(seconds)
+
+        with patch("attendance.methods.punch_ingestion.format_time", fail_second_call):
+            ingest_punches(self.punches("batch"))
+        replay_punches(self.punches("replay"))
+        self.assertEqual(self.state("batch"), self.state("replay"))
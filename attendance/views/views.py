@@ -22,20 +22,26 @@ logger = logging.getLogger(__name__)
 
 import calendar
 import contextlib
-import io
 import json
-from collections import defaultdict
+import tempfile
 from datetime import date, datetime, timedelta
 from urllib.parse import parse_qs
 
 import pandas as pd
+import xlsxwriter
+from django.apps import apps
 from django.contrib import messages
 from django.core.paginator import Paginator
 from django.core.validators import validate_ipv46_address
 from django.db import transaction
-from django.db.models import ProtectedError
+from django.db.models import Case, ProtectedError, Q, Value, When
 from django.forms import ValidationError
-from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse
+from django.http import (
+    FileResponse,
+    HttpResponse,
+    HttpResponseBadRequest,
+    JsonResponse,
+)
 from django.shortcuts import redirect, render
 from django.template.loader import render_to_string
 from django.urls import reverse
@@ -72,7 +78,6 @@ from attendance.forms import (
 from attendance.methods.utils import (
     Request,
     attendance_day_checking,
-    format_time,
     is_reportingmanger,
     monthly_leave_days,
     paginator_qry,
@@ -82,6 +87,7 @@ from attendance.methods.utils import (
     sort_activity_dicts,
     strtime_seconds,
 )
+from attendance.methods.work_records import month_work_record_types
 from attendance.models import (
     Attendance,
     AttendanceActivity,
@@ -463,38 +469,23 @@ def attendance_delete(request, obj_id):
     """
     try:
         attendance = Attendance.objects.get(id=obj_id)
-        month = attendance.attendance_date
-        month = month.strftime("%B").lower()
-        overtime = attendance.employee_id.employee_overtime.filter(month=month).last()
-        if overtime is not None:
-            if attendance.attendance_overtime_approve:
-                # Subtract overtime of this attendance
-                total_overtime = strtime_seconds(overtime.overtime)
-                attendance_overtime_seconds = strtime_seconds(
-                    attendance.attendance_overtime
-                )
-                if total_overtime > attendance_overtime_seconds:
-                    total_overtime = total_overtime - attendance_overtime_seconds
-                else:
-                    total_overtime = attendance_overtime_seconds - total_overtime
-                overtime.overtime = format_time(total_overtime)
-                overtime.save()
-            try:
-                attendance.delete()
-                messages.success(request, _("Attendance deleted."))
-            except ProtectedError as e:
-                model_verbose_names_set = set()
-                for obj in e.protected_objects:
-                    model_verbose_names_set.add(__(obj._meta.verbose_name.capitalize()))
-                model_names_str = ", ".join(model_verbose_names_set)
-                messages.error(
-                    request,
-                    _(
-                        ("An attendance entry for {} already exists.").format(
-                            model_names_str
-                        )
-                    ),
-                )
+        # deleting the attendance takes its approved overtime off the hour account
+        try:
+            attendance.delete()
+            messages.success(request, _("Attendance deleted."))
+        except ProtectedError as e:
+            model_verbose_names_set = set()
+            for obj in e.protected_objects:
+                model_verbose_names_set.add(__(obj._meta.verbose_name.capitalize()))
+            model_names_str = ", ".join(model_verbose_names_set)
+            messages.error(
+                request,
+                _(
+                    ("An attendance entry for {} already exists.").format(
+                        model_names_str
+                    )
+                ),
+            )
     except (Attendance.DoesNotExist, OverflowError):
         messages.error(request, _("Attendance Does not exists.."))
     return HorillaRedirect(request)
@@ -511,27 +502,12 @@ def attendance_bulk_delete(request):
     error_messages = []
     ids = request.POST.getlist("ids", "[]")
     attendances = Attendance.objects.filter(id__in=ids)
-    employee_ids = attendances.values_list("employee_id", flat=True)
-    overtimes = AttendanceOverTime.objects.filter(
-        employee_id__in=employee_ids
-    ).in_bulk()
 
     with transaction.atomic():
         for attendance in attendances:
             try:
-                month = attendance.attendance_date.strftime("%B").lower()
-                overtime = overtimes.get(attendance.employee_id.id)
-
-                if overtime and attendance.attendance_overtime_approve:
-                    # Calculate the new overtime
-                    total_overtime = strtime_seconds(overtime.overtime)
-                    attendance_overtime_seconds = strtime_seconds(
-                        attendance.attendance_overtime
-                    )
-                    total_overtime = abs(total_overtime - attendance_overtime_seconds)
-                    overtime.overtime = format_time(total_overtime)
-                    overtime.save()
-
+                # deleting the attendance takes its approved overtime off the
+                # hour account
                 attendance.delete()
                 success_count += 1
 
@@ -2284,32 +2260,44 @@ def work_records_change_month(request):
     except ValueError:
         year, month = date.today().year, date.today().month
 
-    employees = [request.user.employee_get] + list(employees)
-
     month_dates = [
-        datetime(year, month, day).date()
-        for week in calendar.monthcalendar(year, month)
-        for day in week
-        if day
+        date(year, month, day)
+        for day in range(1, calendar.monthrange(year, month)[1] + 1)
     ]
 
-    work_records = WorkRecords.objects.filter(
-        date__in=month_dates, employee_id__in=employees
-    ).select_related("employee_id", "shift_id", "attendance_id")
-
-    work_records_dict = {(wr.employee_id.id, wr.date): wr for wr in work_records}
-
-    data = {
-        employee: [
-            work_records_dict.get((employee.id, current_date))
-            for current_date in month_dates
-        ]
-        for employee in employees
-    }
-
-    paginator = Paginator(list(data.items()), get_pagination())
+    # the row of the user comes first, then the filtered employees
+    own_employee = request.user.employee_get
+    own_id = own_employee.pk if own_employee else None
+    employees = (
+        Employee.objects.entire()
+        .filter(Q(pk__in=employees.values("pk")) | Q(pk=own_id))
+        .order_by(
+            Case(When(pk=own_id, then=Value(0)), default=Value(1)),
+            "employee_first_name",
+            "pk",
+        )
+    )
+    paginator = Paginator(employees, get_pagination())
     page = paginator.get_page(request.GET.get("page"))
 
+    work_records = WorkRecords.objects.filter(
+        employee_id__in=[employee.pk for employee in page],
+        date__range=(month_dates[0], month_dates[-1]),
+    )
+    if apps.is_installed("leave"):
+        work_records = work_records.select_related("leave_request_id__leave_type_id")
+    work_records_dict = {(wr.employee_id_id, wr.date): wr for wr in work_records}
+    page.object_list = [
+        (
+            employee,
+            [
+                work_records_dict.get((employee.pk, current_date))
+                for current_date in month_dates
+            ],
+        )
+        for employee in page
+    ]
+
     context = {
         "current_month_dates_list": month_dates,
         "leave_dates": monthly_leave_days(month, year),
@@ -2332,76 +2320,54 @@ def work_record_export(request):
         return HttpResponseBadRequest("Invalid month or year parameter.")
 
     employees = EmployeeFilter(request.GET).qs
-    records = WorkRecords.objects.filter(date__month=month, date__year=year)
     num_days = calendar.monthrange(year, month)[1]
     all_date_objects = [date(year, month, day) for day in range(1, num_days + 1)]
     leave_dates = set(monthly_leave_days(month, year))
 
-    record_lookup = defaultdict(lambda: "ABS")
-    for record in records:
-        if record.date <= date.today():
-            record_key = (record.employee_id, record.date)
-            record_lookup[record_key] = record.work_record_type
-
     date_format = request.user.employee_get.get_date_format()
     format_string = HORILLA_DATE_FORMATS.get(date_format)
-    formatted_dates = [day.strftime(format_string) for day in all_date_objects]
-    data_rows = []
-
-    for employee in employees:
-        row_data = {"Employee": employee}
-        for day, formatted_day in zip(all_date_objects, formatted_dates):
-            if not day in leave_dates and day < date.today():
-                row_data[formatted_day] = record_lookup.get((employee, day), "DFT")
-            else:
-                data = record_lookup.get((employee, day), "")
-                row_data[formatted_day] = data if data != "DFT" else ""
-        data_rows.append(row_data)
-
-    columns = ["Employee"] + formatted_dates
-    df = pd.DataFrame(data_rows, columns=columns)
-
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-        df.to_excel(writer, index=False, sheet_name="Sheet1")
-        workbook = writer.book
-        worksheet = writer.sheets["Sheet1"]
-
-        formats = {
-            "ABS": workbook.add_format(
-                {"bg_color": "#808080", "font_color": "#ffffff"}
-            ),
-            "FDP": workbook.add_format(
-                {"bg_color": "#38c338", "font_color": "#ffffff"}
-            ),
-            "HDP": workbook.add_format(
-                {"bg_color": "#dfdf52", "font_color": "#000000"}
-            ),
-            "CONF": workbook.add_format(
-                {"bg_color": "#ed4c4c", "font_color": "#ffffff"}
-            ),
-            "DFT": workbook.add_format(
-                {"bg_color": "#a8b1ff", "font_color": "#ffffff"}
-            ),
-        }
-
-        for row_idx, row in enumerate(df.itertuples(index=False), start=1):
-            for col_idx, cell_value in enumerate(row[1:], start=1):
-                if cell_value in formats:
-                    worksheet.write(row_idx, col_idx, cell_value, formats[cell_value])
+    header = ["Employee"] + [day.strftime(format_string) for day in all_date_objects]
+
+    # the rows are flushed one by one into a temporary file
+    output = tempfile.TemporaryFile()
+    workbook = xlsxwriter.Workbook(output, {"constant_memory": True})
+    worksheet = workbook.add_worksheet("Sheet1")
+    header_format = workbook.add_format(
+        {"bold": True, "border": 1, "align": "center", "valign": "top"}
+    )
+    formats = {
+        "ABS": workbook.add_format({"bg_color": "#808080", "font_color": "#ffffff"}),
+        "FDP": workbook.add_format({"bg_color": "#38c338", "font_color": "#ffffff"}),
+        "HDP": workbook.add_format({"bg_color": "#dfdf52", "font_color": "#000000"}),
+        "CONF": workbook.add_format({"bg_color": "#ed4c4c", "font_color": "#ffffff"}),
+        "DFT": workbook.add_format({"bg_color": "#a8b1ff", "font_color": "#ffffff"}),
+    }
+    worksheet.write_row(0, 0, header, header_format)
+    widths = [len(title) for title in header]
+
+    rows = month_work_record_types(employees, all_date_objects, leave_dates)
+    for row_idx, (employee, record_types) in enumerate(rows, start=1):
+        employee_name = str(employee)
+        worksheet.write_string(row_idx, 0, employee_name)
+        widths[0] = max(widths[0], len(employee_name))
+        for col_idx, record_type in enumerate(record_types, start=1):
+            if record_type:
+                worksheet.write_string(
+                    row_idx, col_idx, record_type, formats.get(record_type)
+                )
+                widths[col_idx] = max(widths[col_idx], len(record_type))
 
-        for col_idx, col in enumerate(df.columns):
-            max_len = max(df[col].astype(str).map(len).max(), len(col))
-            worksheet.set_column(col_idx, col_idx, max_len)
+    for col_idx, width in enumerate(widths):
+        worksheet.set_column(col_idx, col_idx, width)
 
+    workbook.close()
     output.seek(0)
-
-    response = HttpResponse(
-        output.read(),
+    return FileResponse(
+        output,
+        as_attachment=True,
+        filename="work_record_export.xlsx",
         content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
     )
-    response["Content-Disposition"] = 'attachment; filename="work_record_export.xlsx"'
-    return response
 
 
 @login_required
@@ -11,12 +11,58 @@ from django.core.cache import cache
 from django.core.mail import EmailMessage
 from django.core.mail.backends.smtp import EmailBackend
 
-from base.models import DynamicEmailConfiguration, EmailLog
+from base.models import Company, DynamicEmailConfiguration, EmailLog
 from horilla import settings
 from horilla.horilla_middlewares import _thread_locals
 
 logger = logging.getLogger(__name__)
 
+CONFIGURATION_NOT_CACHED = object()
+CONFIGURATION_CACHE_TIMEOUT = 60 * 5
+
+
+def get_email_configuration(company):
+    """
+    Return the mail server configuration of the company, falling back to the
+    primary one. The id of the configuration found is cached for a few minutes
+    and dropped when a configuration is saved or deleted. The configuration
+    itself is not cached, as it holds the mail server password.
+    """
+    key = f"dynamic_email_configuration_{company.pk if company else None}"
+    configuration_id = cache.get(key, CONFIGURATION_NOT_CACHED)
+    if configuration_id is not CONFIGURATION_NOT_CACHED:
+        if configuration_id is None:
+            return None
+        configuration = DynamicEmailConfiguration.objects.filter(
+            pk=configuration_id
+        ).first()
+        if configuration is not None:
+            return configuration
+    configuration = DynamicEmailConfiguration.objects.filter(company_id=company).first()
+    if configuration is None:
+        configuration = DynamicEmailConfiguration.objects.filter(
+            is_primary=True
+        ).first()
+    cache.set(
+        key,
+        configuration.pk if configuration else None,
+        timeout=CONFIGURATION_CACHE_TIMEOUT,
+    )
+    return configuration
+
+
+def clear_email_configuration_cache():
+    """
+    Drop the cached mail server configurations of all the companies
+    """
+    cache.delete_many(
+        [
+            f"dynamic_email_configuration_{pk}"
+            for pk in Company.objects.values_list("pk", flat=True)
+        ]
+        + ["dynamic_email_configuration_None"]
+    )
+
 
 class DefaultHorillaMailBackend(EmailBackend):
     def __init__(
@@ -31,9 +77,10 @@ class DefaultHorillaMailBackend(EmailBackend):
         timeout=None,
         ssl_keyfile=None,
         ssl_certfile=None,
+        configuration=None,
         **kwargs,
     ):
-        self.configuration = self.get_dynamic_email_config()
+        self.configuration = configuration or self.get_dynamic_email_config()
         ssl_keyfile = (
             getattr(self.configuration, "ssl_keyfile", None)
             if self.configuration
@@ -65,13 +112,7 @@ class DefaultHorillaMailBackend(EmailBackend):
         company = None
         if request and not request.user.is_anonymous:
             company = request.user.employee_get.get_company()
-        configuration = DynamicEmailConfiguration.objects.filter(
-            company_id=company
-        ).first()
-        if configuration is None:
-            configuration = DynamicEmailConfiguration.objects.filter(
-                is_primary=True
-            ).first()
+        configuration = get_email_configuration(company)
         if configuration:
             display_email_name = (
                 f"{configuration.display_name} <{configuration.from_email}>"
@@ -196,7 +237,17 @@ if EMAIL_BACKEND and EMAIL_BACKEND != default:
 
 class ConfiguredEmailBackend(BACKEND_CLASS):
 
+    def __init__(self, *args, outbox_delivery=False, **kwargs):
+        self.outbox_delivery = outbox_delivery
+        super().__init__(*args, **kwargs)
+
     def send_messages(self, email_messages):
+        if getattr(settings, "MAIL_OUTBOX_ENABLED", False) and not self.outbox_delivery:
+            from base.mail_outbox import enqueue_messages
+
+            return enqueue_messages(
+                email_messages, getattr(self, "configuration", None)
+            )
         response = super(BACKEND_CLASS, self).send_messages(email_messages)
         for message in email_messages:
             email_log = EmailLog(
@@ -5,8 +5,11 @@ horilla_company_manager.py
 import logging
 from typing import Coroutine, Sequence
 
+from django.core.exceptions import FieldDoesNotExist, FieldError
 from django.db import models
+from django.db.models.constants import LOOKUP_SEP
 from django.db.models.query import QuerySet
+from django.db.models.sql.query import Query
 
 from horilla.horilla_middlewares import _thread_locals
 from horilla.signals import post_bulk_update, pre_bulk_update
@@ -30,6 +33,45 @@ def update(self, *args, **kwargs):
 setattr(QuerySet, "update", update)
 
 
+def resolve_company_path(model, path):
+    """
+    Resolve the lookup ``path`` from ``model`` into the joins it goes through,
+    or None when a part of the path is not a field.
+    """
+    try:
+        path_infos, _field, _targets, _names = Query(model).names_to_path(
+            path.split(LOOKUP_SEP), model._meta, fail_on_missing=True
+        )
+    except FieldError:
+        return None
+    return path_infos
+
+
+def company_path_may_duplicate(model, path):
+    """
+    Check whether filtering ``model`` through the lookup ``path`` can return the
+    same row more than once, that is when the join crosses a many-to-many or a
+    reverse foreign key relation. Returns None when the path does not resolve.
+    """
+    path_infos = resolve_company_path(model, path)
+    if path_infos is None:
+        return None
+    return any(path_info.m2m for path_info in path_infos)
+
+
+def prepare_company_managers():
+    """
+    Resolve the company scoping of every model using HorillaCompanyManager once
+    all the models are loaded.
+    """
+    from django.apps import apps
+
+    for model in apps.get_models():
+        for manager in model._meta.managers:
+            if isinstance(manager, HorillaCompanyManager):
+                manager.prepare_company_scoping()
+
+
 class HorillaCompanyManager(models.Manager):
     """
     HorillaCompanyManager
@@ -42,6 +84,32 @@ class HorillaCompanyManager(models.Manager):
             "employee_id",
             "requested_employee_id",
         ]
+        self.company_filter_distinct = None
+        self.active_filters = None
+
+    def prepare_company_scoping(self):
+        """
+        Decide once per model whether the company filter needs ``distinct()``
+        and which related ``is_active`` filters ``all()`` has to apply.
+        """
+        model = self.model
+        try:
+            model._meta.get_field("company_id")
+            company_path = "company_id"
+        except FieldDoesNotExist:
+            company_path = self.related_company_field
+        self.company_filter_distinct = bool(
+            company_path and company_path_may_duplicate(model, company_path)
+        )
+        if model._meta.model_name == "employee":
+            self.active_filters = {}
+        else:
+            self.active_filters = {
+                f"{field.name}__is_active": True
+                for field in model._meta.fields
+                if isinstance(field, models.ForeignKey)
+                and field.name in self.check_fields
+            }
 
     def get_queryset(self):
         """
@@ -50,23 +118,17 @@ class HorillaCompanyManager(models.Manager):
 
         queryset = super().get_queryset()
         request = getattr(_thread_locals, "request", None)
-        selected_company = None
-        if request is not None:
-            selected_company = request.session.get("selected_company")
-        try:
-            queryset = (
-                queryset.filter(self.model.company_filter)
-                if selected_company != "all" and selected_company
-                else queryset
-            )
-        except Exception as e:
-            logger.error(e)
-        try:
-            has_duplicates = queryset.count() != queryset.distinct().count()
-            if has_duplicates:
-                queryset = queryset.distinct()
-        except:
-            pass
+        company_context = getattr(request, "company_context", None)
+        if company_context is None:
+            return queryset
+        company_filter = company_context.filter_for(self.model)
+        if company_filter is None:
+            return queryset
+        queryset = queryset.filter(company_filter)
+        if self.company_filter_distinct is None:
+            self.prepare_company_scoping()
+        if self.company_filter_distinct:
+            queryset = queryset.distinct()
         return queryset
 
     def all(self):
@@ -76,25 +138,14 @@ class HorillaCompanyManager(models.Manager):
         queryset = []
         try:
             queryset = self.get_queryset()
-            if queryset.exists():
-                try:
-                    model_name = queryset.model._meta.model_name
-                    if model_name == "employee":
-                        request = getattr(_thread_locals, "request", None)
-                        if not getattr(request, "is_filtering", None):
-                            queryset = queryset.filter(is_active=True)
-                    else:
-                        for field in queryset.model._meta.fields:
-                            if isinstance(field, models.ForeignKey):
-                                if field.name in self.check_fields:
-                                    related_model_is_active_filter = {
-                                        f"{field.name}__is_active": True
-                                    }
-                                    queryset = queryset.filter(
-                                        **related_model_is_active_filter
-                                    )
-                except:
-                    pass
+            if self.active_filters is None:
+                self.prepare_company_scoping()
+            if queryset.model._meta.model_name == "employee":
+                request = getattr(_thread_locals, "request", None)
+                if not getattr(request, "is_filtering", None):
+                    queryset = queryset.filter(is_active=True)
+            elif self.active_filters:
+                queryset = queryset.filter(**self.active_filters)
         except:
             pass
         return queryset
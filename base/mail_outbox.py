@@ -0,0 +1,283 @@
+"""
+mail_outbox.py
+
+Durable outbox of the outgoing mails. Sending a mail through the configured
+backend stores it in the MailOutbox table, and the outbox worker delivers the
+due mails in batches over one connection per mail server, retrying the failed
+ones with an exponential backoff. The delivered and failed mails are kept for
+MAIL_OUTBOX_RETENTION_DAYS.
+"""
+
+import hashlib
+import logging
+import pickle
+import threading
+import uuid
+from datetime import timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def message_dedupe_key(message, configuration_id):
+    """
+    Hash of everything that makes two mails identical for the recipients
+    """
+    digest = hashlib.sha256()
+    parts = [
+        str(configuration_id),
+        str(message.from_email),
+        *sorted(message.recipients()),
+        str(message.subject),
+        str(message.body),
+    ]
+    parts += [
+        str(content) for content, _mimetype in getattr(message, "alternatives", [])
+    ]
+    for attachment in message.attachments:
+        if isinstance(attachment, tuple):
+            filename, content, _mimetype = attachment
+            if isinstance(content, str):
+                content = content.encode()
+            parts += [str(filename), hashlib.sha256(content).hexdigest()]
+        else:
+            parts.append(hashlib.sha256(attachment.as_bytes()).hexdigest())
+    for part in parts:
+        digest.update(part.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def enqueue_messages(email_messages, configuration=None):
+    """
+    Store the mails in the outbox. A mail identical to one queued within the
+    last MAIL_OUTBOX_DEDUPE_SECONDS is skipped. Returns the number of mails
+    accepted, so it can stand for the result of send_messages.
+    """
+    from base.models import MailOutbox
+
+    configuration_id = configuration.pk if configuration else None
+    since = timezone.now() - timedelta(seconds=settings.MAIL_OUTBOX_DEDUPE_SECONDS)
+    mails = {}
+    for message in email_messages:
+        if not message.recipients():
+            continue
+        key = message_dedupe_key(message, configuration_id)
+        if key in mails:
+            continue
+        message.connection = None
+        mails[key] = MailOutbox(
+            configuration_id=configuration_id,
+            subject=str(message.subject)[:255],
+            from_email=message.from_email,
+            to=message.recipients(),
+            message=pickle.dumps(message),
+            dedupe_key=key,
+        )
+    duplicates = set(
+        MailOutbox.objects.filter(
+            dedupe_key__in=mails.keys(),
+            created_at__gte=since,
+        )
+        .exclude(status="failed")
+        .values_list("dedupe_key", flat=True)
+    )
+    MailOutbox.objects.bulk_create(
+        [mail for key, mail in mails.items() if key not in duplicates]
+    )
+    transaction.on_commit(wake_mail_outbox)
+    return len(mails)
+
+
+def outbox_backend(configuration):
+    """
+    Return the backend delivering the mails of the mail server configuration
+    """
+    from base.backends import (
+        BACKEND_CLASS,
+        ConfiguredEmailBackend,
+        DefaultHorillaMailBackend,
+    )
+
+    if issubclass(BACKEND_CLASS, DefaultHorillaMailBackend):
+        return ConfiguredEmailBackend(configuration=configuration, outbox_delivery=True)
+    return ConfiguredEmailBackend(outbox_delivery=True)
+
+
+def retry_or_fail(mail, error):
+    """
+    Schedule the next attempt of a mail, or mark it as failed once it has been
+    attempted MAIL_OUTBOX_MAX_ATTEMPTS times.
+    """
+    from base.models import EmailLog, MailOutbox
+
+    attempts = mail.attempts + 1
+    update = {
+        "attempts": attempts,
+        "claim": None,
+        "locked_at": None,
+        "error": str(error),
+    }
+    if attempts >= settings.MAIL_OUTBOX_MAX_ATTEMPTS:
+        update["status"] = "failed"
+        EmailLog.objects.create(
+            subject=mail.subject,
+            from_email=mail.from_email,
+            to=mail.to,
+            body=mail.get_message().body,
+            status="failed",
+        )
+        logger.error(f"Mail {mail.pk} failed after {attempts} attempts: {error}")
+    else:
+        update["status"] = "queued"
+        update["next_attempt_at"] = timezone.now() + timedelta(
+            seconds=settings.MAIL_OUTBOX_RETRY_SECONDS * 2 ** (attempts - 1)
+        )
+    MailOutbox.objects.filter(pk=mail.pk).update(**update)
+
+
+def send_outbox_group(mails):
+    """
+    Send the mails of one mail server over a single connection. Returns the
+    ids of the mails the server accepted.
+    """
+    backend = outbox_backend(mails[0].configuration)
+    try:
+        backend.open()
+    except Exception as error:
+        for mail in mails:
+            retry_or_fail(mail, error)
+        return []
+
+    sent_ids = []
+    try:
+        for mail in mails:
+            try:
+                sent = backend.send_messages([mail.get_message()])
+            except Exception as error:
+                retry_or_fail(mail, error)
+                # the connection may be broken, the next mail opens a new one
+                backend.close()
+                continue
+            if sent:
+                sent_ids.append(mail.pk)
+            else:
+                retry_or_fail(mail, "The mail server did not accept the mail")
+    finally:
+        backend.close()
+    return sent_ids
+
+
+def deliver_mail_outbox(batch_size=None):
+    """
+    Claim a batch of due mails and deliver it. The mails claimed by a worker
+    that stopped for more than MAIL_OUTBOX_STALE_SECONDS are claimed again.
+    Returns the number of mails claimed.
+    """
+    from base.models import MailOutbox
+
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.MAIL_OUTBOX_STALE_SECONDS)
+    due = Q(status="queued", next_attempt_at__lte=now) | Q(
+        status="sending", locked_at__lt=stale
+    )
+    ids = list(
+        MailOutbox.objects.filter(due)
+        .order_by("next_attempt_at", "pk")
+        .values_list("pk", flat=True)[: batch_size or settings.MAIL_OUTBOX_BATCH_SIZE]
+    )
+    claim = uuid.uuid4().hex
+    claimed = MailOutbox.objects.filter(due, pk__in=ids).update(
+        status="sending", claim=claim, locked_at=now
+    )
+    if not claimed:
+        return 0
+
+    mails = (
+        MailOutbox.objects.filter(claim=claim)
+        .select_related("configuration")
+        .order_by("configuration_id", "pk")
+    )
+    for _configuration_id, group in groupby(
+        mails, key=lambda mail: mail.configuration_id
+    ):
+        sent_ids = send_outbox_group(list(group))
+        # the pickled message, with its attachments, is not needed once sent
+        MailOutbox.objects.filter(pk__in=sent_ids).update(
+            status="sent",
+            sent_at=timezone.now(),
+            claim=None,
+            error=None,
+            message=b"",
+        )
+    return claimed
+
+
+def prune_mail_outbox():
+    """
+    Delete the sent and the failed mails older than MAIL_OUTBOX_RETENTION_DAYS.
+    Returns the number of mails deleted.
+    """
+    from base.models import MailOutbox
+
+    before = timezone.now() - timedelta(days=settings.MAIL_OUTBOX_RETENTION_DAYS)
+    deleted, _rows = MailOutbox.objects.filter(
+        Q(status="sent", sent_at__lt=before) | Q(status="failed", created_at__lt=before)
+    ).delete()
+    return deleted
+
+
+class MailOutboxWorker(threading.Thread):
+    """
+    Deliver the outbox in the background. It wakes up every
+    MAIL_OUTBOX_INTERVAL seconds, or as soon as a mail is queued.
+    """
+
+    def __init__(self):
+        threading.Thread.__init__(self, daemon=True, name="mail-outbox")
+        self.wake_event = threading.Event()
+
+    def wake(self):
+        self.wake_event.set()
+
+    def run(self) -> None:
+        super().run()
+        while True:
+            try:
+                while deliver_mail_outbox():
+                    pass
+            except Exception as e:
+                logger.exception(e)
+            finally:
+                close_old_connections()
+            self.wake_event.wait(timeout=settings.MAIL_OUTBOX_INTERVAL)
+            self.wake_event.clear()
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def start_mail_outbox_worker():
+    """
+    Start the in process outbox worker once per process
+    """
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = MailOutboxWorker()
+            _worker.start()
+    return _worker
+
+
+def wake_mail_outbox():
+    """
+    Wake the in process outbox worker up to deliver the mails just queued
+    """
+    if settings.MAIL_OUTBOX_IN_PROCESS:
+        start_mail_outbox_worker().wake()
@@ -0,0 +1,74 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+from horilla.horilla_context_processors import (
+    LAZY_CONTEXT_PROCESSORS,
+    get_context_processor_timings,
+    reset_context_processor_timings,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Render pages as a user and report, per lazy context processor, how "
+        "often it was computed or read from the cache and the time it took."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("username", help="User the pages are rendered as")
+        parser.add_argument(
+            "--url",
+            action="append",
+            dest="urls",
+            help="Page to render, can be repeated (default: the home page)",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=10,
+            help="Times every page is rendered",
+        )
+        parser.add_argument(
+            "--htmx",
+            action="store_true",
+            help="Send the requests as HTMX requests",
+        )
+        parser.add_argument("--host", default="localhost", help="Host header")
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options["username"]).first()
+        if user is None:
+            raise CommandError(f"User {options['username']} does not exist")
+        client = Client(HTTP_HOST=options["host"])
+        client.force_login(user)
+        headers = {"HTTP_HX_REQUEST": "true"} if options["htmx"] else {}
+        reset_context_processor_timings()
+        for url in options["urls"] or ["/"]:
+            started = time.perf_counter()
+            for _ in range(options["repeat"]):
+                response = client.get(url, **headers)
+            elapsed = (time.perf_counter() - started) * 1000 / options["repeat"]
+            self.stdout.write(
+                f"{url}: {response.status_code}, {elapsed:.1f} ms per request"
+            )
+
+        timings = get_context_processor_timings()
+        self.stdout.write(f"\n{timings['renders']} renders")
+        self.stdout.write(
+            f"{'context processor':<65}{'computed':>10}{'cached':>8}"
+            f"{'avg ms':>9}{'total ms':>10}"
+        )
+        reported = set()
+        for timing in timings["processors"]:
+            reported.add(timing["path"])
+            self.stdout.write(
+                f"{timing['path']:<65}{timing['computed']:>10}"
+                f"{timing['cache_hits']:>8}{timing['average_ms']:>9}"
+                f"{timing['total_ms']:>10}"
+            )
+        for path in LAZY_CONTEXT_PROCESSORS:
+            if path not in reported:
+                self.stdout.write(f"{path:<65}{'not referenced':>37}")
@@ -0,0 +1,55 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from base.mail_outbox import deliver_mail_outbox
+
+
+class Command(BaseCommand):
+    help = (
+        "Deliver the mail outbox. The due mails are sent in batches over one "
+        "connection per mail server and the failed ones are retried with backoff."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Deliver the mails that are already due and exit",
+        )
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=settings.MAIL_OUTBOX_INTERVAL,
+            help="Seconds between two polls of an empty outbox",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.MAIL_OUTBOX_BATCH_SIZE,
+            help="Mails claimed per batch",
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        try:
+            while True:
+                started = time.monotonic()
+                delivered = 0
+                while claimed := deliver_mail_outbox(options["batch_size"]):
+                    delivered += claimed
+                close_old_connections()
+                if delivered:
+                    total += delivered
+                    elapsed = time.monotonic() - started
+                    self.stdout.write(
+                        f"Processed {delivered} mails in {elapsed:.2f}s "
+                        f"({delivered / elapsed:.1f} mails/s)"
+                    )
+                if options["once"]:
+                    return
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            self.stdout.write(f"Stopped after processing {total} mails.")
@@ -22,6 +22,12 @@ from django.template.loader import render_to_string
 from django.utils.translation import gettext as _
 
 from base.models import Company, CompanyLeaves, DynamicPagination, Holidays
+from base.working_calendar import (
+    calendar_week,
+    holiday_days,
+    non_working_days,
+    year_calendar,
+)
 from employee.models import Employee, EmployeeWorkInformation
 from horilla.horilla_apps import NESTED_SUBORDINATE_VISIBILITY
 from horilla.horilla_middlewares import _thread_locals
@@ -897,12 +903,19 @@ def is_holiday(date):
     Returns:
         Holidays or bool: The Holidays object if the date is a holiday, otherwise False.
     """
-    # Get holidays that either match the exact date range or are recurring
-    holiday = Holidays.objects.filter(
+    if date not in year_calendar(date.year).holidays:
+        return False
+    holidays = Holidays.objects.filter(
         Q(start_date__lte=date, end_date__gte=date)
-        | Q(recurring=True, start_date__month=date.month, start_date__day=date.day)
-    ).first()
-    return holiday if holiday else False
+        | Q(start_date=date, end_date__isnull=True)
+        | Q(recurring=True)
+    )
+    for holiday in holidays:
+        if date in holiday_days(
+            [(holiday.start_date, holiday.end_date, holiday.recurring)], date.year
+        ):
+            return holiday
+    return False
 
 
 def is_company_leave(input_date):
@@ -913,26 +926,12 @@ def is_company_leave(input_date):
     Returns:
         CompanyLeaves or bool: The CompanyLeaves object if the date is a company leave, otherwise False.
     """
-    # Calculate the week number within the month (0-4) and weekday (0 for Monday to 6 for Sunday)
-    first_day_of_month = input_date.replace(day=1)
-    adjusted_day = (
-        input_date.day + first_day_of_month.weekday()
-    )  # Adjust day based on first day of the month
-    # Calculate the week number (0-based)
-    date_week_no = (adjusted_day - 1) // 7
-    # Get weekday (0 for Monday to 6 for Sunday)
-    date_week_day = input_date.weekday()
-
-    # Query for company leaves that match the week number and weekday
+    if input_date not in year_calendar(input_date.year).company_leaves:
+        return False
     company_leave = CompanyLeaves.objects.filter(
-        Q(
-            based_on_week=None, based_on_week_day=date_week_day
-        )  # Match week-independent leaves
-        | Q(
-            based_on_week=date_week_no, based_on_week_day=date_week_day
-        )  # Match specific week and weekday
+        Q(based_on_week=None) | Q(based_on_week=calendar_week(input_date)),
+        based_on_week_day=input_date.weekday(),
     ).first()
-
     return company_leave if company_leave else False
 
 
@@ -964,61 +963,16 @@ def get_date_range(start_date, end_date):
 
 def get_holiday_dates(range_start: date, range_end: date) -> list:
     """
-    :return: this functions returns a list of all holiday dates.
+    :return: this functions returns a list of the holiday dates of the range.
     """
-    pay_range_dates = get_date_range(start_date=range_start, end_date=range_end)
-    query = Q()
-    for check_date in pay_range_dates:
-        query |= Q(start_date__lte=check_date, end_date__gte=check_date)
-    holidays = Holidays.objects.filter(query)
-    holiday_dates = set([])
-    for holiday in holidays:
-        holiday_dates = holiday_dates | (
-            set(
-                get_date_range(start_date=holiday.start_date, end_date=holiday.end_date)
-            )
-        )
-    return list(set(holiday_dates))
+    return non_working_days(range_start, range_end, company_leaves=False)
 
 
 def get_company_leave_dates(year):
     """
-    :return: This function returns a list of all company leave dates
+    :return: This function returns a list of all company leave dates of the year
     """
-    company_leaves = CompanyLeaves.objects.all()
-    company_leave_dates = []
-    for company_leave in company_leaves:
-        based_on_week = company_leave.based_on_week
-        based_on_week_day = company_leave.based_on_week_day
-        for month in range(1, 13):
-            if based_on_week is not None:
-                # Set Sunday as the first day of the week
-                calendar.setfirstweekday(6)
-                month_calendar = calendar.monthcalendar(year, month)
-                weeks = month_calendar[int(based_on_week)]
-                weekdays_in_weeks = [day for day in weeks if day != 0]
-                for day in weekdays_in_weeks:
-                    leave_date = datetime.strptime(
-                        f"{year}-{month:02}-{day:02}", "%Y-%m-%d"
-                    ).date()
-                    if (
-                        leave_date.weekday() == int(based_on_week_day)
-                        and leave_date not in company_leave_dates
-                    ):
-                        company_leave_dates.append(leave_date)
-            else:
-                # Set Monday as the first day of the week
-                calendar.setfirstweekday(0)
-                month_calendar = calendar.monthcalendar(year, month)
-                for week in month_calendar:
-                    if week[int(based_on_week_day)] != 0:
-                        leave_date = datetime.strptime(
-                            f"{year}-{month:02}-{week[int(based_on_week_day)]:02}",
-                            "%Y-%m-%d",
-                        ).date()
-                        if leave_date not in company_leave_dates:
-                            company_leave_dates.append(leave_date)
-    return company_leave_dates
+    return sorted(year_calendar(year).company_leaves)
 
 
 def get_working_days(start_date, end_date):
@@ -1030,31 +984,13 @@ def get_working_days(start_date, end_date):
         end_date (_type_): the end date till the date needed
     """
 
-    holiday_dates = get_holiday_dates(start_date, end_date)
-
-    # appending company/holiday leaves
-    # Note: Duplicate entry may exist
-    company_leave_dates = (
-        list(
-            set(
-                get_company_leave_dates(start_date.year)
-                + get_company_leave_dates(end_date.year)
-            )
-        )
-        + holiday_dates
-    )
-
-    date_range = get_date_range(start_date, end_date)
+    # the company/holiday leave dates between the start and end date
+    company_leave_dates = non_working_days(start_date, end_date)
+    leave_dates = set(company_leave_dates)
 
-    # making unique list of company/holiday leave dates then filtering
-    # the leave dates only between the start and end date
-    company_leave_dates = [
-        date
-        for date in list(set(company_leave_dates))
-        if start_date <= date <= end_date
+    working_days_between_ranges = [
+        date for date in get_date_range(start_date, end_date) if date not in leave_dates
     ]
-
-    working_days_between_ranges = list(set(date_range) - set(company_leave_dates))
     total_working_days = len(working_days_between_ranges)
 
     return {
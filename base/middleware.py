@@ -2,17 +2,18 @@
 middleware.py
 """
 
+import logging
+
 from django.apps import apps
 from django.contrib import messages
 from django.contrib.auth import logout
-from django.core.cache import cache
 from django.db.models import Q
 from django.shortcuts import redirect
 from django.utils.translation import gettext_lazy as _
 
 from base.backends import ConfiguredEmailBackend
 from base.context_processors import AllCompany
-from base.horilla_company_manager import HorillaCompanyManager
+from base.horilla_company_manager import HorillaCompanyManager, resolve_company_path
 from base.models import Company, ShiftRequest, WorkTypeRequest
 from employee.models import (
     DisciplinaryAction,
@@ -25,7 +26,75 @@ from horilla.horilla_settings import APPS
 from horilla.methods import get_horilla_model_class
 from horilla_documents.models import DocumentRequest
 
-CACHE_KEY = "horilla_company_models_cache_key"
+logger = logging.getLogger(__name__)
+
+COMPANY_MODELS = [
+    Employee,
+    ShiftRequest,
+    WorkTypeRequest,
+    DocumentRequest,
+    DisciplinaryAction,
+    EmployeeBankDetails,
+    EmployeeWorkInformation,
+]
+
+COMPANY_APP_MODELS = {
+    "recruitment": ["recruitment", "candidate"],
+    "leave": [
+        "leaverequest",
+        "restrictleave",
+        "availableleave",
+        "leaveallocationrequest",
+        "compensatoryleaverequest",
+    ],
+    "asset": ["assetassignment", "assetrequest"],
+    "attendance": [
+        "attendance",
+        "attendanceactivity",
+        "attendanceovertime",
+        "workrecords",
+    ],
+    "payroll": [
+        "contract",
+        "loanaccount",
+        "payslip",
+        "reimbursement",
+    ],
+    "helpdesk": ["ticket"],
+    "offboarding": ["offboarding"],
+    "pms": ["employeeobjective"],
+}
+
+
+class CompanyContext:
+    """
+    Request scoped company context, resolved once per request by the
+    CompanyMiddleware. It carries the selected company and builds the company
+    filter of a model from the templates compiled at startup.
+    """
+
+    def __init__(self, company_id, templates):
+        self.company_id = company_id
+        self.templates = templates
+        self._filters = {}
+
+    def filter_for(self, model):
+        """
+        Return the company filter Q of the model, or None when the model is not
+        company scoped or all companies are selected.
+        """
+        if self.company_id is None:
+            return None
+        if model not in self._filters:
+            template = self.templates.get(model)
+            company_filter = None
+            if template:
+                lookup, include_null = template
+                company_filter = Q(**{lookup: self.company_id})
+                if include_null:
+                    company_filter |= Q(**{f"{lookup}__isnull": True})
+            self._filters[model] = company_filter
+        return self._filters[model]
 
 
 class CompanyMiddleware:
@@ -35,6 +104,7 @@ class CompanyMiddleware:
 
     def __init__(self, get_response):
         self.get_response = get_response
+        self.company_filter_templates = self._compile_company_filters()
 
     def _get_company_id(self, request):
         """
@@ -43,14 +113,12 @@ class CompanyMiddleware:
         if getattr(request, "user", False) and not request.user.is_anonymous:
             try:
                 if com_id := request.session.get("selected_company", None):
-                    return (
-                        Company.objects.filter(id=com_id).first()
-                        if com_id != "all"
-                        else None
-                    )
+                    return com_id if com_id != "all" else None
                 else:
                     return getattr(
-                        request.user.employee_get.employee_work_info, "company_id", None
+                        request.user.employee_get.employee_work_info,
+                        "company_id_id",
+                        None,
                     )
             except AttributeError:
                 pass
@@ -58,7 +126,10 @@ class CompanyMiddleware:
 
     def _set_company_session(self, request, company_id):
         """
-        Set the company session data based on the company ID.
+        Set the company session data based on the company ID and return the
+        id of the resolved company, None meaning all companies.
+        The session is only written and the company only fetched when the
+        selection changed.
         """
         try:
             user = request.user.employee_get
@@ -68,26 +139,41 @@ class CompanyMiddleware:
                 request,
                 _("An employee related to this user's credentials does not exist."),
             )
-            return redirect("login")
+            return None
         user_company_id = getattr(
-            getattr(user, "employee_work_info", None), "company_id", None
+            getattr(user, "employee_work_info", None), "company_id_id", None
         )
-        if company_id and request.session.get("selected_company") != "all":
-            if company_id == "all":
-                text = "All companies"
-            elif company_id == user_company_id:
-                text = "My Company"
-            else:
-                text = "Other Company"
-
-            request.session["selected_company"] = str(company_id.id)
-            request.session["selected_company_instance"] = {
-                "company": company_id.company,
-                "icon": company_id.icon.url,
-                "text": text,
-                "id": company_id.id,
-            }
-        else:
+        selected_company = request.session.get("selected_company")
+        company_instance = request.session.get("selected_company_instance") or {}
+        if company_id and selected_company != "all":
+            text = (
+                "My Company"
+                if str(company_id) == str(user_company_id)
+                else "Other Company"
+            )
+            if (
+                selected_company == str(company_id)
+                and str(company_instance.get("id")) == str(company_id)
+                and company_instance.get("text") == text
+            ):
+                return company_instance["id"]
+
+            company = Company.objects.filter(id=company_id).first()
+            if company:
+                request.session["selected_company"] = str(company.id)
+                request.session["selected_company_instance"] = {
+                    "company": company.company,
+                    "icon": company.icon.url,
+                    "text": text,
+                    "id": company.id,
+                }
+                return company.id
+
+        if (
+            selected_company != "all"
+            or "selected_company_instance" not in request.session
+            or company_instance.get("id") is not None
+        ):
             request.session["selected_company"] = "all"
             all_company = AllCompany()
             request.session["selected_company_instance"] = {
@@ -96,100 +182,61 @@ class CompanyMiddleware:
                 "text": all_company.text,
                 "id": all_company.id,
             }
+        return None
 
-    def _add_company_filter(self, model, company_id):
+    def _get_company_models(self):
         """
-        Add company filter to the model if applicable.
+        Retrieve the list of models that are company-specific.
         """
-        is_company_model = model in self._get_company_models()
-        company_field = getattr(model, "company_id", None)
-        is_horilla_manager = isinstance(model.objects, HorillaCompanyManager)
-        related_company_field = getattr(model.objects, "related_company_field", None)
-
-        if is_company_model:
-            if company_field:
-                model.add_to_class("company_filter", Q(company_id=company_id))
-            elif is_horilla_manager and related_company_field:
-                model.add_to_class(
-                    "company_filter", Q(**{related_company_field: company_id})
-                )
-        else:
-            if company_field:
-                model.add_to_class(
-                    "company_filter",
-                    Q(company_id=company_id) | Q(company_id__isnull=True),
-                )
-            elif is_horilla_manager and related_company_field:
-                model.add_to_class(
-                    "company_filter",
-                    Q(**{related_company_field: company_id})
-                    | Q(**{f"{related_company_field}__isnull": True}),
+        company_models = list(COMPANY_MODELS)
+        for app_label, models in COMPANY_APP_MODELS.items():
+            if apps.is_installed(app_label):
+                company_models.extend(
+                    [get_horilla_model_class(app_label, model) for model in models]
                 )
+        return company_models
 
-    def _get_company_models(self):
+    def _compile_company_filters(self):
         """
-        Retrieve the list of models that are company-specific.
+        Precompute the company filter template of every model in APPS as a
+        (lookup, include_null) pair. Company specific models only match their
+        company while shared models also match rows without a company. Models
+        whose lookup does not resolve are left unscoped.
         """
-        company_models = cache.get(CACHE_KEY)
-
-        if company_models is None:
-            company_models = [
-                Employee,
-                ShiftRequest,
-                WorkTypeRequest,
-                DocumentRequest,
-                DisciplinaryAction,
-                EmployeeBankDetails,
-                EmployeeWorkInformation,
-            ]
-
-            app_model_mappings = {
-                "recruitment": ["recruitment", "candidate"],
-                "leave": [
-                    "leaverequest",
-                    "restrictleave",
-                    "availableleave",
-                    "leaveallocationrequest",
-                    "compensatoryleaverequest",
-                ],
-                "asset": ["assetassignment", "assetrequest"],
-                "attendance": [
-                    "attendance",
-                    "attendanceactivity",
-                    "attendanceovertime",
-                    "workrecords",
-                ],
-                "payroll": [
-                    "contract",
-                    "loanaccount",
-                    "payslip",
-                    "reimbursement",
-                ],
-                "helpdesk": ["ticket"],
-                "offboarding": ["offboarding"],
-                "pms": ["employeeobjective"],
-            }
-
-            for app_label, models in app_model_mappings.items():
-                if apps.is_installed(app_label):
-                    company_models.extend(
-                        [get_horilla_model_class(app_label, model) for model in models]
-                    )
-
-            cache.set(CACHE_KEY, company_models)
-
-        return company_models
+        company_models = set(self._get_company_models())
+        templates = {}
+        for model in apps.get_models():
+            if model._meta.app_label not in APPS:
+                continue
+            related_company_field = getattr(
+                model.objects, "related_company_field", None
+            )
+            if getattr(model, "company_id", None):
+                lookup = "company_id"
+            elif (
+                isinstance(model.objects, HorillaCompanyManager)
+                and related_company_field
+            ):
+                lookup = related_company_field
+            else:
+                continue
+            if resolve_company_path(model, lookup) is None:
+                logger.warning(
+                    "%s is not company scoped, its company lookup %s does not resolve",
+                    model._meta.label,
+                    lookup,
+                )
+                continue
+            templates[model] = (lookup, model not in company_models)
+        return templates
 
     def __call__(self, request):
         if getattr(request, "user", False) and not request.user.is_anonymous:
             company_id = self._get_company_id(request)
-            self._set_company_session(request, company_id)
-
-            app_models = [
-                model for model in apps.get_models() if model._meta.app_label in APPS
-            ]
-            for model in app_models:
-                self._add_company_filter(model, company_id)
+            company_id = self._set_company_session(request, company_id)
+            request.company_context = CompanyContext(
+                company_id, self.company_filter_templates
+            )
 
         response = self.get_response(request)
         return response
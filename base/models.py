@@ -5,6 +5,7 @@ This module is used to register django models
 """
 
 import ipaddress
+import pickle
 from datetime import date, datetime, timedelta
 from typing import Iterable
 
@@ -1615,6 +1616,48 @@ class EmailLog(models.Model):
     )
 
 
+class MailOutbox(models.Model):
+    """
+    Outgoing mail kept in the database until the outbox worker delivers it
+    """
+
+    statuses = [
+        ("queued", "Queued"),
+        ("sending", "Sending"),
+        ("sent", "Sent"),
+        ("failed", "Failed"),
+    ]
+    configuration = models.ForeignKey(
+        DynamicEmailConfiguration, on_delete=models.SET_NULL, null=True, blank=True
+    )
+    subject = models.CharField(max_length=255)
+    from_email = models.CharField(max_length=255, null=True)
+    to = models.JSONField(default=list)
+    message = models.BinaryField()
+    dedupe_key = models.CharField(max_length=64, db_index=True)
+    status = models.CharField(max_length=7, choices=statuses, default="queued")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=django.utils.timezone.now)
+    claim = models.CharField(max_length=32, null=True, db_index=True)
+    locked_at = models.DateTimeField(null=True)
+    sent_at = models.DateTimeField(null=True)
+    error = models.TextField(null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    objects = models.Manager()
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "next_attempt_at"])]
+
+    def __str__(self) -> str:
+        return f"{self.subject} ({self.get_status_display()})"
+
+    def get_message(self):
+        """
+        Return the EmailMessage to deliver
+        """
+        return pickle.loads(self.message)
+
+
 class DriverViewed(models.Model):
     """
     Model to store driver viewed status
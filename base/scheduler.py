@@ -1,10 +1,12 @@
 import calendar
-import sys
 from datetime import date, datetime, timedelta
 
 from apscheduler.schedulers.background import BackgroundScheduler
+from django.conf import settings
 from django.urls import reverse
 
+from base.mail_outbox import prune_mail_outbox, start_mail_outbox_worker
+from horilla.horilla_settings import schedulers_enabled
 from notifications.signals import notify
 
 
@@ -435,10 +437,7 @@ def recurring_holiday():
         recurring_holiday.save()
 
 
-if not any(
-    cmd in sys.argv
-    for cmd in ["makemigrations", "migrate", "compilemessages", "flush", "shell"]
-):
+if schedulers_enabled():
     scheduler = BackgroundScheduler()
 
     # Add jobs with next_run_time set to the end of the previous job
@@ -498,4 +497,13 @@ if not any(
         pass
 
     scheduler.add_job(recurring_holiday, "interval", hours=4)
+    if settings.MAIL_OUTBOX_IN_PROCESS:
+        # delivers the mails left in the outbox when the server stopped
+        scheduler.add_job(
+            start_mail_outbox_worker,
+            "date",
+            run_date=datetime.now() + timedelta(seconds=30),
+            id="start_mail_outbox_worker",
+        )
+    scheduler.add_job(prune_mail_outbox, "interval", hours=24)
     scheduler.start()
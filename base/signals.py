@@ -8,13 +8,20 @@ from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.signals import user_login_failed
 from django.db.models import Max, Q
-from django.db.models.signals import m2m_changed, post_migrate, post_save
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save
 from django.dispatch import receiver
 from django.http import Http404
 from django.shortcuts import redirect, render
 
-from base.models import Announcement, PenaltyAccounts
+from base.models import (
+    Announcement,
+    CompanyLeaves,
+    DynamicEmailConfiguration,
+    Holidays,
+    PenaltyAccounts,
+)
 from horilla.methods import get_horilla_model_class
+from horilla.signals import post_bulk_update
 
 
 @receiver(post_save, sender=PenaltyAccounts)
@@ -91,6 +98,64 @@ def clean_work_records(sender, **kwargs):
         )
 
 
+@receiver(post_save, sender=DynamicEmailConfiguration)
+@receiver(post_delete, sender=DynamicEmailConfiguration)
+def email_configuration_changed(sender, instance, **kwargs):
+    """
+    Drop the cached mail server lookups when a configuration changes
+    """
+    from base.backends import clear_email_configuration_cache
+
+    clear_email_configuration_cache()
+
+
+@receiver(post_save, sender=Holidays)
+@receiver(post_delete, sender=Holidays)
+@receiver(post_bulk_update, sender=Holidays)
+@receiver(post_save, sender=CompanyLeaves)
+@receiver(post_delete, sender=CompanyLeaves)
+@receiver(post_bulk_update, sender=CompanyLeaves)
+def working_calendar_changed(sender, **kwargs):
+    """
+    Expire the cached working calendars when a holiday or a company leave
+    changes
+    """
+    from base.working_calendar import bump_calendar_version
+
+    bump_calendar_version()
+
+
+@receiver(post_save)
+@receiver(post_delete)
+@receiver(m2m_changed)
+def sidebar_dependency_changed(sender, instance, **kwargs):
+    """
+    Expire the cached sidebar menus when a model their accessibility depends on
+    changes
+    """
+    from horilla.config import bump_sidebar_version, get_sidebar_dependencies
+
+    if kwargs.get("raw") or kwargs.get("action", "post_").startswith("pre_"):
+        return
+    labels = {instance._meta.label_lower}
+    if kwargs.get("model") is not None:
+        labels.add(kwargs["model"]._meta.label_lower)
+    if labels.isdisjoint(get_sidebar_dependencies()):
+        return
+    bump_sidebar_version()
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def context_dependency_changed(sender, **kwargs):
+    """
+    Drop the shared context processor outputs depending on the model
+    """
+    from horilla.horilla_context_processors import expire_lazy_context_processors
+
+    expire_lazy_context_processors(sender)
+
+
 @receiver(m2m_changed, sender=Announcement.employees.through)
 def filtered_employees(sender, instance, action, **kwargs):
     """
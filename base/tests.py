@@ -1,3 +1,77 @@
-from django.test import TestCase
+"""
+base/tests.py
+"""
 
-# Create your tests here.
+from datetime import timedelta
+from unittest import mock
+
+from django.core.mail import EmailMessage
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+
+from base.mail_outbox import deliver_mail_outbox, enqueue_messages, prune_mail_outbox
+from base.middleware import CompanyContext, CompanyMiddleware
+from base.models import Company, MailOutbox
+from horilla.horilla_middlewares import _thread_locals
+
+
+class CompanyMiddlewareTest(TestCase):
+    """
+    The company filters compiled by the middleware resolve on their models
+    """
+
+    def test_company_filters_query_every_model(self):
+        company = Company.objects.create(
+            company="Company", hq=True, address="-", country="-", state="-", city="-"
+        )
+        templates = CompanyMiddleware(lambda request: None).company_filter_templates
+        request = RequestFactory().get("/")
+        request.company_context = CompanyContext(company.pk, templates)
+        _thread_locals.request = request
+        try:
+            for model in templates:
+                with self.subTest(model=model._meta.label):
+                    list(model.objects.get_queryset()[:1])
+        finally:
+            del _thread_locals.request
+
+
+class MailOutboxTest(TestCase):
+    """
+    The outbox keeps the messages only until they are delivered, and the
+    delivered and failed mails only for the retention period
+    """
+
+    def queue(self, subject):
+        message = EmailMessage(subject, "Body", "from@example.com", ["to@example.com"])
+        message.attach("payslip.pdf", b"%PDF", "application/pdf")
+        enqueue_messages([message])
+        return MailOutbox.objects.get(subject=subject)
+
+    def test_sent_mail_drops_its_message(self):
+        mail = self.queue("Payslip")
+        with mock.patch("base.mail_outbox.send_outbox_group", return_value=[mail.pk]):
+            deliver_mail_outbox()
+        mail.refresh_from_db()
+        self.assertEqual(mail.status, "sent")
+        self.assertEqual(bytes(mail.message), b"")
+
+    @override_settings(MAIL_OUTBOX_RETENTION_DAYS=30)
+    def test_prune_deletes_the_old_sent_and_failed_mails(self):
+        old = timezone.now() - timedelta(days=31)
+        recent = timezone.now() - timedelta(days=29)
+        mails = {
+            (status, age): self.queue(f"{status} {age}")
+            for status in ("queued", "sent", "failed")
+            for age in ("old", "recent")
+        }
+        for (status, age), mail in mails.items():
+            at = old if age == "old" else recent
+            MailOutbox.objects.filter(pk=mail.pk).update(
+                status=status, sent_at=at, created_at=at
+            )
+        self.assertEqual(prune_mail_outbox(), 2)
+        self.assertEqual(
+            set(MailOutbox.objects.values_list("subject", flat=True)),
+            {"queued old", "queued recent", "sent recent", "failed recent"},
+        )
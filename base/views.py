@@ -151,6 +151,7 @@ from base.models import (
     WorkTypeRequest,
     WorkTypeRequestComment,
 )
+from base.working_calendar import bump_calendar_version
 from employee.filters import EmployeeFilter
 from employee.forms import ActiontypeForm, EmployeeGeneralSettingPrefixForm
 from employee.models import (
@@ -1555,7 +1556,8 @@ def mail_server_test_email(request):
             # Plain text content (fallback for email clients that do not support HTML)
             text_content = strip_tags(html_content)
 
-            email_backend = ConfiguredEmailBackend()
+            # the test mail is sent right away to report the server response
+            email_backend = ConfiguredEmailBackend(outbox_delivery=True)
             emailconfig = DynamicEmailConfiguration.objects.filter(
                 id=instance_id
             ).first()
@@ -7016,6 +7018,7 @@ def csv_holiday_import(file):
 
     if holiday_list:
         Holidays.objects.bulk_create(holiday_list)
+        bump_calendar_version()
 
     if os.path.exists(holiday_file):
         os.remove(holiday_file)
@@ -7089,6 +7092,7 @@ def excel_holiday_import(file):
 
     if valid_holidays:
         Holidays.objects.bulk_create(valid_holidays)
+        bump_calendar_version()
 
     return error_list, len(holiday_dicts)
 
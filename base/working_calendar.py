@@ -0,0 +1,231 @@
+"""
+working_calendar.py
+
+Calendar of the non working days, the holidays and the company leaves. The days
+of a year are computed once per company from the Holidays and CompanyLeaves
+rows and kept as frozensets in the process and in the shared cache, under a
+version bumped whenever one of those rows changes. Checking a date is a set
+lookup and listing the days of a range walks the range only.
+
+The calendar of a company holds its own rows and the rows without a company.
+The calendar without a company, when all the companies are selected or outside
+a request, holds every row, as the company managers of these models do.
+
+A company leave without a week falls on every matching weekday. A company leave
+of a week falls on the matching weekday of that row of the month calendar with
+the weeks starting on Sunday. A recurring holiday repeats its days every year.
+"""
+
+import calendar
+import threading
+import time
+from datetime import timedelta
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+from horilla.horilla_middlewares import _thread_locals
+
+CALENDAR_VERSION_KEY = "working_calendar_version"
+CALENDAR_CACHE_TIMEOUT = 24 * 60 * 60
+
+# {(company id, year): (version, YearCalendar)}
+_calendars = {}
+_calendars_lock = threading.Lock()
+# (checked until, version) of the shared version
+_local_version = [0, None]
+
+
+class YearCalendar(NamedTuple):
+    holidays: frozenset
+    company_leaves: frozenset
+    non_working: frozenset
+
+
+def get_calendar_version():
+    """
+    Version of the calendars, the shared one is read at most once per
+    WORKING_CALENDAR_CACHE_SECONDS
+    """
+    now = time.monotonic()
+    checked_until, version = _local_version
+    if version is not None and checked_until > now:
+        return version
+    version = cache.get(CALENDAR_VERSION_KEY)
+    if version is None:
+        # a new version never matches the version of an evicted key
+        cache.add(CALENDAR_VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(CALENDAR_VERSION_KEY)
+    _local_version[:] = [now + settings.WORKING_CALENDAR_CACHE_SECONDS, version]
+    return version
+
+
+def bump_calendar_version():
+    try:
+        cache.incr(CALENDAR_VERSION_KEY)
+    except ValueError:
+        cache.set(CALENDAR_VERSION_KEY, time.time_ns(), timeout=None)
+    _local_version[:] = [0, None]
+    with _calendars_lock:
+        _calendars.clear()
+
+
+def selected_company_id():
+    """
+    Id of the company selected in the request, None for all the companies
+    """
+    request = getattr(_thread_locals, "request", None)
+    company_context = getattr(request, "company_context", None)
+    company_id = getattr(company_context, "company_id", None)
+    return str(company_id) if company_id is not None else None
+
+
+def company_rows(model, company_id):
+    queryset = model.objects.entire()
+    if company_id is not None:
+        queryset = queryset.filter(
+            Q(company_id=company_id) | Q(company_id__isnull=True)
+        )
+    return queryset
+
+
+def holiday_days(holidays, year):
+    """
+    Days of the year of the holidays, given as (start, end, recurring) tuples
+    """
+    days = set()
+    for start_date, end_date, recurring in holidays:
+        length = ((end_date or start_date) - start_date).days
+        starts = [start_date]
+        if recurring:
+            starts = []
+            # a span repeated from the previous year may end in this one
+            for start_year in (year - 1, year):
+                try:
+                    starts.append(start_date.replace(year=start_year))
+                except ValueError:
+                    # the 29th of February of a year that is not leap
+                    pass
+        for start in starts:
+            for offset in range(length + 1):
+                day = start + timedelta(offset)
+                if day.year == year:
+                    days.add(day)
+                elif day.year > year:
+                    break
+    return days
+
+
+def calendar_week(day):
+    """
+    Row of the date in the month calendar with the weeks starting on Sunday
+    """
+    first_weekday = (day.replace(day=1).weekday() + 1) % 7
+    return (day.day + first_weekday - 1) // 7
+
+
+def company_leave_days(company_leaves, year):
+    """
+    Days of the year of the company leaves, given as (week, weekday) tuples
+    """
+    days = set()
+    weeks_calendar = calendar.Calendar(firstweekday=6)
+    for based_on_week, based_on_week_day in company_leaves:
+        weekday = int(based_on_week_day)
+        for month in range(1, 13):
+            weeks = weeks_calendar.monthdatescalendar(year, month)
+            if based_on_week is not None:
+                weeks = weeks[int(based_on_week) : int(based_on_week) + 1]
+            days.update(
+                day
+                for week in weeks
+                for day in week
+                if day.month == month and day.weekday() == weekday
+            )
+    return days
+
+
+def build_year_calendar(year, company_id):
+    from base.models import CompanyLeaves, Holidays
+
+    holidays = frozenset(
+        holiday_days(
+            company_rows(Holidays, company_id)
+            .filter(
+                Q(recurring=True)
+                | Q(start_date__year__lte=year, end_date__year__gte=year)
+                | Q(start_date__year=year, end_date__isnull=True)
+            )
+            .values_list("start_date", "end_date", "recurring"),
+            year,
+        )
+    )
+    company_leaves = frozenset(
+        company_leave_days(
+            company_rows(CompanyLeaves, company_id).values_list(
+                "based_on_week", "based_on_week_day"
+            ),
+            year,
+        )
+    )
+    return YearCalendar(holidays, company_leaves, holidays | company_leaves)
+
+
+def year_calendar(year, company_id=None):
+    """
+    YearCalendar of the company, by default of the company selected in the
+    request
+    """
+    if company_id is None:
+        company_id = selected_company_id()
+    else:
+        company_id = str(company_id)
+    version = get_calendar_version()
+    key = (company_id, year)
+    cached = _calendars.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    cache_key = f"working_calendar_{version}_{company_id}_{year}"
+    year_days = cache.get(cache_key)
+    if year_days is None:
+        year_days = build_year_calendar(year, company_id)
+        cache.set(cache_key, year_days, timeout=CALENDAR_CACHE_TIMEOUT)
+    with _calendars_lock:
+        _calendars[key] = (version, year_days)
+    return year_days
+
+
+def is_non_working(day, company_id=None):
+    """
+    Whether the date is a holiday or a company leave
+    """
+    return day in year_calendar(day.year, company_id).non_working
+
+
+def non_working_days(
+    start_date, end_date, company_id=None, holidays=True, company_leaves=True
+):
+    """
+    Holidays and company leaves from start_date to end_date, in date order
+    """
+    if holidays and company_leaves:
+        field = "non_working"
+    elif holidays:
+        field = "holidays"
+    elif company_leaves:
+        field = "company_leaves"
+    else:
+        return []
+    days = []
+    year, year_days = None, None
+    day = start_date
+    while day <= end_date:
+        if day.year != year:
+            year = day.year
+            year_days = getattr(year_calendar(year, company_id), field)
+        if day in year_days:
+            days.append(day)
+        day += timedelta(1)
+    return days
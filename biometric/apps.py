@@ -3,6 +3,7 @@ Django application configuration for the biometric app.
 """
 
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class BiometricConfig(AppConfig):
@@ -21,7 +22,7 @@ class BiometricConfig(AppConfig):
     def ready(self):
         from django.urls import include, path
 
-        from horilla.horilla_settings import APPS
+        from horilla.horilla_settings import APPS, schedulers_enabled
         from horilla.urls import urlpatterns
 
         APPS.append("biometric")
@@ -31,4 +32,9 @@ class BiometricConfig(AppConfig):
 
         from biometric import sidebar
 
+        if settings.BIOMETRIC_POLLER_IN_PROCESS and schedulers_enabled():
+            from biometric.poller import start_device_poller
+
+            start_device_poller()
+
         super().ready()
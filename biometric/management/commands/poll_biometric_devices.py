@@ -0,0 +1,35 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from biometric.poller import DevicePoller
+
+
+class Command(BaseCommand):
+    help = (
+        "Poll the scheduled biometric devices and the COSEC devices in live "
+        "capture mode. The due devices are fetched concurrently and a failing "
+        "device is retried with backoff."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Poll every device once and exit",
+        )
+
+    def handle(self, *args, **options):
+        poller = DevicePoller()
+        try:
+            if options["once"]:
+                asyncio.run(poller.poll_once())
+            else:
+                asyncio.run(poller.run())
+        except KeyboardInterrupt:
+            pass
+        for device_id, metrics in poller.metrics().items():
+            self.stdout.write(
+                f"{device_id}: {metrics['polls']} polls, {metrics['punches']} "
+                f"punches, {metrics['errors']} errors, lag {metrics['lag_seconds']}s"
+            )
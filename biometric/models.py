@@ -230,6 +230,26 @@ class BiometricDevices(HorillaModel):
         if required_fields:
             raise ValidationError(required_fields)
 
+    def get_poll_stats_display(self):
+        """
+        Punches per poll, error rate and lag of the device poller
+        """
+        from biometric.poller import get_device_poll_stats
+
+        stats = get_device_poll_stats(self.pk)
+        if not stats["polls"]:
+            return _("Not polled yet")
+        stats["lag"] = (
+            f"{stats['lag_seconds']}s" if stats["lag_seconds"] is not None else "-"
+        )
+        return (
+            _(
+                "%(punches_per_poll)s punches per poll, %(error_rate)s error rate, "
+                "%(lag)s since the last successful poll"
+            )
+            % stats
+        )
+
     class Meta:
         """
         Meta class to add additional options
@@ -0,0 +1,334 @@
+"""
+poller.py
+
+Central poller of the biometric devices. One asyncio loop per process keeps the
+due time of every scheduled device, and of the COSEC devices in live capture
+mode, and fetches the due ones through a bounded pool of worker threads,
+instead of a BackgroundScheduler thread per scheduled device and a polling
+thread per live COSEC device. A failing device is retried with an exponential
+backoff, a lease in the cache keeps two processes sharing the cache from
+polling the same device, and the polls, punches, errors and the time of the
+last successful poll of every device are counted in the cache.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.db.models import Q
+
+logger = logging.getLogger(__name__)
+
+# name of the function of biometric.views fetching the new logs of a device type
+LOG_FETCHERS = {
+    "zk": "zk_biometric_attendance_logs",
+    "anviz": "anviz_biometric_attendance_logs",
+    "cosec": "cosec_biometric_attendance_logs",
+    "dahua": "dahua_biometric_attendance_logs",
+    "etimeoffice": "etimeoffice_biometric_attendance_logs",
+}
+
+
+class DevicePollError(Exception):
+    """
+    The device could not be polled
+    """
+
+
+def poll_device(device_id):
+    """
+    Fetch the new logs of the device from its stored fetch cursor and ingest
+    them. Returns the number of punches fetched.
+    """
+    from biometric import views
+    from biometric.models import BiometricDevices
+
+    device = BiometricDevices.objects.filter(pk=device_id).first()
+    if device is None or not (
+        device.is_scheduler or (device.is_live and device.machine_type == "cosec")
+    ):
+        return 0
+    fetcher = LOG_FETCHERS.get(device.machine_type)
+    if fetcher is None:
+        return 0
+    result = getattr(views, fetcher)(device)
+    if device.machine_type == "zk":
+        result, error = result
+        if error:
+            raise DevicePollError(error)
+    if result is None or result == "error":
+        raise DevicePollError(f"{device.name} did not return the attendance logs")
+    return result
+
+
+def stats_key(device_id, name):
+    return f"biometric_poll_{device_id}_{name}"
+
+
+STAT_NAMES = ("polls", "errors", "punches")
+
+
+def record_poll_stats(device_id, punches, failed):
+    """
+    Add the poll to the counters of the device
+    """
+    amounts = (1, int(failed), punches)
+    for name, amount in zip(STAT_NAMES, amounts):
+        if not amount:
+            continue
+        key = stats_key(device_id, name)
+        try:
+            cache.incr(key, amount)
+        except ValueError:
+            if not cache.add(key, amount, timeout=None):
+                cache.incr(key, amount)
+    if not failed:
+        cache.set(stats_key(device_id, "last_success"), time.time(), timeout=None)
+
+
+def get_device_poll_stats(device_id):
+    """
+    Return the poll counters of the device with the punches per poll, the error
+    rate and the lag, the seconds since the last successful poll
+    """
+    names = STAT_NAMES + ("last_success",)
+    values = cache.get_many([stats_key(device_id, name) for name in names])
+    stats = {name: values.get(stats_key(device_id, name), 0) for name in STAT_NAMES}
+    polls = stats["polls"]
+    stats["punches_per_poll"] = round(stats["punches"] / polls, 1) if polls else 0
+    stats["error_rate"] = round(stats["errors"] / polls, 2) if polls else 0
+    last_success = values.get(stats_key(device_id, "last_success"))
+    stats["lag_seconds"] = int(time.time() - last_success) if last_success else None
+    return stats
+
+
+class DeviceSchedule:
+    """
+    Poll interval, due time and consecutive failures of a device
+    """
+
+    def __init__(self, device_id, interval):
+        self.device_id = device_id
+        self.interval = interval
+        self.due = time.monotonic()
+        self.failures = 0
+        self.running = False
+
+    def backoff(self):
+        """
+        Seconds until the next poll, doubled on every consecutive failure
+        """
+        if not self.failures:
+            return self.interval
+        return min(
+            self.interval * 2**self.failures, settings.BIOMETRIC_POLL_MAX_BACKOFF
+        )
+
+
+def load_device_schedules():
+    """
+    {device id: poll interval in seconds} of the scheduled devices and of the
+    COSEC devices in live capture mode
+    """
+    from biometric.models import BiometricDevices
+    from biometric.views import str_time_seconds
+
+    schedules = {}
+    for device in BiometricDevices.objects.filter(
+        Q(is_scheduler=True) | Q(is_live=True, machine_type="cosec")
+    ):
+        if device.is_live and device.machine_type == "cosec":
+            schedules[device.pk] = settings.BIOMETRIC_LIVE_POLL_SECONDS
+        elif device.scheduler_duration:
+            interval = str_time_seconds(device.scheduler_duration)
+            if interval > 0:
+                schedules[device.pk] = interval
+    return schedules
+
+
+class DevicePoller:
+    """
+    Poll the due devices, at most BIOMETRIC_POLL_CONCURRENCY at a time. The
+    device list is reloaded every BIOMETRIC_POLLER_RELOAD_SECONDS, or as soon
+    as the poller is woken up.
+    """
+
+    def __init__(self):
+        self.schedules = {}
+        self.executor = ThreadPoolExecutor(
+            max_workers=settings.BIOMETRIC_POLL_CONCURRENCY,
+            thread_name_prefix="biometric-poll",
+        )
+        self.loop = None
+        self.wake_event = None
+        self.reload_requested = False
+        self.reload_at = 0
+        self.lease_owner = f"{os.getpid()}-{id(self)}"
+
+    def run_job(self, function, *args):
+        try:
+            return function(*args)
+        finally:
+            close_old_connections()
+
+    async def reload(self):
+        loaded = await self.loop.run_in_executor(
+            self.executor, self.run_job, load_device_schedules
+        )
+        for device_id, interval in loaded.items():
+            schedule = self.schedules.get(device_id)
+            if schedule is None:
+                self.schedules[device_id] = DeviceSchedule(device_id, interval)
+            elif schedule.interval != interval:
+                schedule.interval = interval
+                schedule.due = min(schedule.due, time.monotonic() + interval)
+        for device_id in set(self.schedules) - set(loaded):
+            del self.schedules[device_id]
+        self.reload_at = time.monotonic() + settings.BIOMETRIC_POLLER_RELOAD_SECONDS
+
+    async def poll(self, schedule, semaphore):
+        async with semaphore:
+            lease_key = f"biometric_poll_lease_{schedule.device_id}"
+            if not cache.add(
+                lease_key,
+                self.lease_owner,
+                timeout=settings.BIOMETRIC_POLL_LEASE_SECONDS,
+            ):
+                # another process is polling the device
+                schedule.due = time.monotonic() + schedule.interval
+                schedule.running = False
+                return
+            punches, failed = 0, False
+            try:
+                punches = await self.loop.run_in_executor(
+                    self.executor, self.run_job, poll_device, schedule.device_id
+                )
+                schedule.failures = 0
+            except Exception as error:
+                failed = True
+                schedule.failures += 1
+                logger.error(
+                    f"Polling the biometric device {schedule.device_id} failed",
+                    exc_info=error,
+                )
+            finally:
+                if cache.get(lease_key) == self.lease_owner:
+                    cache.delete(lease_key)
+            record_poll_stats(
+                schedule.device_id,
+                punches if isinstance(punches, int) else 0,
+                failed,
+            )
+            schedule.due = time.monotonic() + schedule.backoff()
+            schedule.running = False
+            if self.wake_event is not None:
+                self.wake_event.set()
+
+    async def poll_once(self):
+        """
+        Poll every device once
+        """
+        self.loop = asyncio.get_running_loop()
+        await self.reload()
+        semaphore = asyncio.Semaphore(settings.BIOMETRIC_POLL_CONCURRENCY)
+        await asyncio.gather(
+            *(self.poll(schedule, semaphore) for schedule in self.schedules.values())
+        )
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.wake_event = asyncio.Event()
+        semaphore = asyncio.Semaphore(settings.BIOMETRIC_POLL_CONCURRENCY)
+        tasks = set()
+        while True:
+            self.wake_event.clear()
+            if self.reload_requested or time.monotonic() >= self.reload_at:
+                self.reload_requested = False
+                try:
+                    await self.reload()
+                except Exception as error:
+                    logger.error("Loading the biometric devices failed", exc_info=error)
+                    self.reload_at = (
+                        time.monotonic() + settings.BIOMETRIC_POLLER_RELOAD_SECONDS
+                    )
+
+            now = time.monotonic()
+            for schedule in self.schedules.values():
+                if schedule.due <= now and not schedule.running:
+                    schedule.running = True
+                    task = asyncio.create_task(self.poll(schedule, semaphore))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+
+            next_due = min(
+                (
+                    schedule.due
+                    for schedule in self.schedules.values()
+                    if not schedule.running
+                ),
+                default=self.reload_at,
+            )
+            timeout = max(min(next_due, self.reload_at) - time.monotonic(), 0.5)
+            try:
+                await asyncio.wait_for(self.wake_event.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def wake(self):
+        """
+        Reload the device list, from any thread
+        """
+        self.reload_requested = True
+        if self.loop is not None and self.wake_event is not None:
+            self.loop.call_soon_threadsafe(self.wake_event.set)
+
+    def metrics(self):
+        """
+        The devices the poller knows of, with their interval, backoff state and
+        counters
+        """
+        return {
+            device_id: {
+                "interval": schedule.interval,
+                "failures": schedule.failures,
+                "due_in": max(int(schedule.due - time.monotonic()), 0),
+                **get_device_poll_stats(device_id),
+            }
+            for device_id, schedule in self.schedules.items()
+        }
+
+
+_poller = None
+_poller_lock = threading.Lock()
+
+
+def start_device_poller():
+    """
+    Start the in process device poller once per process
+    """
+    global _poller
+    with _poller_lock:
+        if _poller is None:
+            _poller = DevicePoller()
+            threading.Thread(
+                target=asyncio.run,
+                args=(_poller.run(),),
+                daemon=True,
+                name="biometric-poller",
+            ).start()
+    return _poller
+
+
+def wake_device_poller():
+    """
+    Make the in process poller pick the schedule and live mode changes up now.
+    The pollers of the other processes pick them up on their next reload.
+    """
+    if _poller is not None:
+        _poller.wake()
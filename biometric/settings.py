@@ -1,12 +1,14 @@
 """
 This module extends the Django settings related to templates to include a
 custom context processor for biometric functionality.
-It imports the `TEMPLATES` setting from `horilla.settings` and appends a
-custom context processor path to it.
+It registers the lazy context processor telling whether the biometric system
+is installed.
 """
 
-from horilla.settings import TEMPLATES
+from horilla.horilla_context_processors import lazy_context_processor
 
-TEMPLATES[0]["OPTIONS"]["context_processors"].append(
+lazy_context_processor(
     "biometric.context_processors.biometric_is_installed",
+    ["is_installed"],
+    depends_on=["base.BiometricAttendance"],
 )
@@ -5,7 +5,7 @@ Biometric App sidebar configuration
 from django.urls import reverse_lazy
 from django.utils.translation import gettext_lazy as trans
 
-from attendance.sidebar import SUBMENUS
+from attendance.sidebar import MENU_DEPENDENCIES, SUBMENUS
 from base.context_processors import biometric_app_exists
 from biometric.context_processors import biometric_is_installed
 
@@ -16,6 +16,7 @@ biometric_submenu = {
 }
 
 SUBMENUS.insert(1, biometric_submenu)
+MENU_DEPENDENCIES.append("base.BiometricAttendance")
 
 
 def biometric_device_accessibility(request, submenu, user_perms, *args, **kwargs):
@@ -13,7 +13,6 @@ from threading import Event, Thread
 from urllib.parse import parse_qs, unquote
 
 import pytz
-from apscheduler.schedulers.background import BackgroundScheduler
 from django.contrib import messages
 from django.http import HttpResponse, JsonResponse
 from django.shortcuts import redirect, render
@@ -24,8 +23,8 @@ from django.utils.translation import gettext_lazy as _
 from zk import ZK
 from zk import exception as zk_exception
 
+from attendance.methods.punch_ingestion import Punch, ingest_punches
 from attendance.methods.utils import Request
-from attendance.models import AttendanceActivity
 from attendance.views.clock_in_out import clock_in, clock_out
 from base.methods import get_key_instances, get_pagination
 from employee.models import Employee, EmployeeWorkInformation
@@ -36,7 +35,6 @@ from horilla.decorators import (
     permission_required,
 )
 from horilla.filters import HorillaPaginator
-from horilla.horilla_settings import BIO_DEVICE_THREADS
 from horilla.http.response import HorillaRedirect
 from horilla.settings import TIME_ZONE
 
@@ -55,6 +53,7 @@ from .forms import (
     MapBioUsers,
 )
 from .models import BiometricDevices, BiometricEmployees, COSECAttendanceArguments
+from .poller import wake_device_poller
 
 logger = logging.getLogger(__name__)
 
@@ -223,116 +222,6 @@ class ZKBioAttendance(Thread):
         self.conn.end_live_capture = True
 
 
-class COSECBioAttendanceThread(Thread):
-    """
-    A thread class that handles the real-time retrieval and processing of
-    biometric attendance data from a COSEC biometric device.
-
-    Attributes:
-        device_id (int): The ID of the biometric device to interact with.
-        _stop_event (threading.Event): An event to signal when to stop the thread.
-
-    Methods:
-        run():
-            Continuously fetches attendance data from the COSEC device, processes
-            it, and updates the last fetched sequence and rollover count.
-
-        stop():
-            Signals the thread to stop by setting the _stop_event.
-    """
-
-    def __init__(self, device_id):
-        super().__init__()
-        self.device_id = device_id
-        self._stop_event = Event()
-
-    def run(self):
-        try:
-            device = BiometricDevices.objects.get(id=self.device_id)
-            if not device.is_live:
-                return
-
-            device_args = COSECAttendanceArguments.objects.filter(
-                device_id=device
-            ).first()
-            last_fetch_roll_ovr_count = (
-                int(device_args.last_fetch_roll_ovr_count) if device_args else 0
-            )
-            last_fetch_seq_number = (
-                int(device_args.last_fetch_seq_number) if device_args else 1
-            )
-
-            cosec = COSECBiometric(
-                device.machine_ip,
-                device.port,
-                device.bio_username,
-                device.bio_password,
-                timeout=10,
-            )
-            while not self._stop_event.is_set():
-                attendances = cosec.get_attendance_events(
-                    last_fetch_roll_ovr_count, int(last_fetch_seq_number) + 1
-                )
-                if not isinstance(attendances, list):
-                    self._stop_event.wait(5)
-                    continue
-
-                for attendance in attendances:
-                    ref_user_id = attendance["detail-1"]
-                    employee = BiometricEmployees.objects.filter(
-                        ref_user_id=ref_user_id
-                    ).first()
-                    if not employee:
-                        continue
-
-                    date_str = attendance["date"]
-                    time_str = attendance["time"]
-                    attendance_date = datetime.strptime(date_str, "%d/%m/%Y").date()
-                    attendance_time = datetime.strptime(time_str, "%H:%M:%S").time()
-                    attendance_datetime = datetime.combine(
-                        attendance_date, attendance_time
-                    )
-                    punch_code = attendance["detail-2"]
-
-                    request_data = Request(
-                        user=employee.employee_id.employee_user_id,
-                        date=attendance_date,
-                        time=attendance_time,
-                        datetime=django_timezone.make_aware(attendance_datetime),
-                    )
-                    try:
-                        if punch_code in ["1", "3", "5", "7", "9", "0"]:
-                            clock_in(request_data)
-                        elif punch_code in ["2", "4", "6", "8", "10"]:
-                            clock_out(request_data)
-                    except Exception as error:
-                        logger.error("Error processing attendance: ", error)
-
-                if attendances:
-                    last_attendance = attendances[-1]
-                    last_fetch_seq_number = last_attendance["seq-No"]
-                    last_fetch_roll_ovr_count = last_attendance["roll-over-count"]
-                    COSECAttendanceArguments.objects.update_or_create(
-                        device_id=device,
-                        defaults={
-                            "last_fetch_roll_ovr_count": last_fetch_roll_ovr_count,
-                            "last_fetch_seq_number": last_fetch_seq_number,
-                        },
-                    )
-                # Sleep to prevent overwhelming the device with requests
-                self._stop_event.wait(2)
-
-        except Exception as error:
-            device = BiometricDevices.objects.get(id=self.device_id)
-            device.is_live = False
-            device.save()
-            logger.error("Error in COSECBioAttendanceThread: ", error)
-
-    def stop(self):
-        """Set the stop event to signal the thread to stop gracefully."""
-        self._stop_event.set()
-
-
 @login_required
 @install_required
 @permission_required("biometric.view_biometricdevices")
@@ -430,13 +319,7 @@ def biometric_device_schedule(request, device_id):
                     device.is_scheduler = True
                     device.is_live = False
                     device.save()
-                    scheduler = BackgroundScheduler()
-                    scheduler.add_job(
-                        lambda: zk_biometric_attendance_scheduler(device.id),
-                        "interval",
-                        seconds=str_time_seconds(device.scheduler_duration),
-                    )
-                    scheduler.start()
+                    wake_device_poller()
                     return HorillaRedirect(request)
                 except Exception as error:
                     logger.error("An error comes in biometric_device_schedule ", error)
@@ -460,56 +343,28 @@ def biometric_device_schedule(request, device_id):
                 device.is_scheduler = True
                 device.scheduler_duration = duration
                 device.save()
-                scheduler = BackgroundScheduler()
-                scheduler.add_job(
-                    lambda: anviz_biometric_attendance_scheduler(device.id),
-                    "interval",
-                    seconds=str_time_seconds(device.scheduler_duration),
-                )
-                scheduler.start()
+                wake_device_poller()
                 return HorillaRedirect(request)
             elif device.machine_type == "dahua":
                 device.is_scheduler = True
                 device.is_live = False
                 device.scheduler_duration = duration
                 device.save()
-                scheduler = BackgroundScheduler()
-                scheduler.add_job(
-                    lambda: dahua_biometric_attendance_scheduler(device.id),
-                    "interval",
-                    seconds=str_time_seconds(device.scheduler_duration),
-                )
-                scheduler.start()
+                wake_device_poller()
                 return HorillaRedirect(request)
             elif device.machine_type == "cosec":
                 device.is_scheduler = True
                 device.is_live = False
                 device.scheduler_duration = duration
                 device.save()
-                scheduler = BackgroundScheduler()
-                existing_thread = BIO_DEVICE_THREADS.get(device.id)
-                if existing_thread:
-                    existing_thread.stop()
-                    del BIO_DEVICE_THREADS[device.id]
-                scheduler.add_job(
-                    lambda: cosec_biometric_attendance_scheduler(device.id),
-                    "interval",
-                    seconds=str_time_seconds(device.scheduler_duration),
-                )
-                scheduler.start()
+                wake_device_poller()
                 return HorillaRedirect(request)
             elif device.machine_type == "etimeoffice":
                 device.is_scheduler = True
                 device.is_live = False
                 device.scheduler_duration = duration
                 device.save()
-                scheduler = BackgroundScheduler()
-                scheduler.add_job(
-                    lambda: etimeoffice_biometric_attendance_scheduler(device.id),
-                    "interval",
-                    seconds=str_time_seconds(device.scheduler_duration),
-                )
-                scheduler.start()
+                wake_device_poller()
                 return HorillaRedirect(request)
             else:
                 return HorillaRedirect(request)
@@ -543,6 +398,7 @@ def biometric_device_unschedule(request, device_id):
     device = BiometricDevices.objects.get(id=device_id)
     device.is_scheduler = False
     device.save()
+    wake_device_poller()
     messages.success(request, _("Biometric device unscheduled successfully"))
     return redirect(f"/biometric/view-biometric-devices/?{previous_data}")
 
@@ -2078,9 +1934,7 @@ def biometric_device_live(request):
                     device.is_live = True
                     device.is_scheduler = False
                     device.save()
-                    thread = COSECBioAttendanceThread(device.id)
-                    thread.start()
-                    BIO_DEVICE_THREADS[device.id] = thread
+                    wake_device_poller()
                 else:
                     raise TimeoutError
             else:
@@ -2125,10 +1979,7 @@ def biometric_device_live(request):
         device.is_live = False
         device.save()
         if device.machine_type == "cosec":
-            existing_thread = BIO_DEVICE_THREADS.get(device.id)
-            if existing_thread:
-                existing_thread.stop()
-                del BIO_DEVICE_THREADS[device.id]
+            wake_device_poller()
 
         script = """
            <script>
@@ -2147,6 +1998,44 @@ def biometric_device_live(request):
     return HttpResponse(script)
 
 
+COSEC_PUNCH_DIRECTIONS = {
+    **dict.fromkeys(["1", "3", "5", "7", "9", "0"], "in"),
+    **dict.fromkeys(["2", "4", "6", "8", "10"], "out"),
+}
+
+
+def cosec_punches(device, attendances):
+    """
+    Punches of the COSEC attendance events of the users mapped to employees
+    """
+    employees = {}
+    for employee in BiometricEmployees.objects.filter(
+        ref_user_id__in={attendance["detail-1"] for attendance in attendances}
+    ):
+        employees.setdefault(str(employee.ref_user_id), employee)
+
+    punches = []
+    for attendance in attendances:
+        ref_user_id = attendance["detail-1"]
+        employee = employees.get(str(ref_user_id))
+        direction = COSEC_PUNCH_DIRECTIONS.get(attendance["detail-2"])
+        if not employee or not direction:
+            continue
+        attendance_datetime = datetime.strptime(
+            f"{attendance['date']} {attendance['time']}", "%d/%m/%Y %H:%M:%S"
+        )
+        punches.append(
+            Punch(
+                device_id=device.id,
+                user_id=ref_user_id,
+                employee_id=employee.employee_id_id,
+                datetime=django_timezone.make_aware(attendance_datetime),
+                direction=direction,
+            )
+        )
+    return punches
+
+
 def zk_biometric_attendance_logs(device_or_devices):
     """
     Retrieve and process attendance logs from one or more ZKTeco biometric devices.
@@ -2232,44 +2121,31 @@ def zk_biometric_attendance_logs(device_or_devices):
     # Sort all filtered attendances by time
     combined_attendances.sort(key=lambda a: a.timestamp)
 
+    punches = []
     for attendance in combined_attendances:
-        user_id = attendance.user_id
-        punch_code = attendance.punch
-        date_time = django_timezone.make_aware(attendance.timestamp)
-        date = date_time.date()
-        time = date_time.time()
-        device_id = attendance.device.id
-        bio_id = bio_id_map.get((device_id, user_id))
-        if bio_id:
-            request_data = Request(
-                user=bio_id.employee_id.employee_user_id,
-                date=date,
-                time=time,
-                datetime=date_time,
+        bio_id = bio_id_map.get((attendance.device.id, attendance.user_id))
+        if not bio_id:
+            continue
+        if attendance.punch in {0, 3, 4}:
+            direction = "in"
+        elif attendance.punch in {1, 2, 5}:
+            direction = "out"
+        else:
+            continue
+        punches.append(
+            Punch(
+                device_id=attendance.device.id,
+                user_id=attendance.user_id,
+                employee_id=bio_id.employee_id_id,
+                datetime=django_timezone.make_aware(attendance.timestamp),
+                direction=direction,
             )
-            try:
-                if punch_code in {0, 3, 4}:
-                    clock_in(request_data)
-                elif punch_code in {1, 2, 5}:
-                    clock_out(request_data)
-            except Exception:
-                logger.error(
-                    f"[Device: {attendance.device.name}] Punch processing error",
-                    exc_info=True,
-                )
+        )
+    ingest_punches(punches)
 
     return len(combined_attendances), "; ".join(errors) if errors else None
 
 
-def zk_biometric_attendance_scheduler(device_id):
-    """
-    Scheduler function used for attendance logs
-    """
-    device = BiometricDevices.find(device_id)
-    if device and device.is_scheduler:
-        zk_biometric_attendance_logs(device)
-
-
 def anviz_biometric_attendance_logs(device):
     """
     Retrieves attendance records from an Anviz biometric device
@@ -2301,89 +2177,48 @@ def anviz_biometric_attendance_logs(device):
     device.last_fetch_time = current_utc_time.time()
     device.save(update_fields=["last_fetch_date", "last_fetch_time"])
 
-    processed_count = 0
+    records = attendance_records.get("list", [])
+    employees = {}
+    for employee in Employee.objects.filter(
+        badge_id__in={attendance["employee"]["workno"] for attendance in records}
+    ):
+        employees.setdefault(employee.badge_id, employee)
 
-    for attendance in attendance_records.get("list", []):
+    punches = []
+    for attendance in records:
         badge_id = attendance["employee"]["workno"]
-        punch_code = attendance["checktype"]
-
-        date_time_utc = datetime.strptime(
-            attendance["checktime"], "%Y-%m-%dT%H:%M:%S%z"
-        )
-        date_time_obj = date_time_utc.astimezone(django_timezone.get_current_timezone())
-
-        employee = Employee.objects.filter(badge_id=badge_id).first()
+        employee = employees.get(badge_id)
         if not employee:
             continue
 
-        request_data = Request(
-            user=employee.employee_user_id,
-            date=date_time_obj.date(),
-            time=date_time_obj.time(),
-            datetime=date_time_obj,
-        )
-
-        try:
-            # --------------------------------------------------
-            # SYSTEM DIRECTION (auto based on punch code)
-            # --------------------------------------------------
-            if device.device_direction == "system":
-                if punch_code in {0, 128}:
-                    clock_in(request_data)
-                else:
-                    clock_out(request_data)
-
-            # --------------------------------------------------
-            # FORCE IN DEVICE
-            # --------------------------------------------------
-            elif device.device_direction == "in":
-                clock_in(request_data)
-
-            # --------------------------------------------------
-            # FORCE OUT DEVICE
-            # --------------------------------------------------
-            elif device.device_direction == "out":
-                clock_out(request_data)
-
-            # --------------------------------------------------
-            # ALTERNATE IN / OUT DEVICE
-            # --------------------------------------------------
-            elif device.device_direction == "alternate":
-                last_activity = (
-                    AttendanceActivity.objects.filter(
-                        employee_id=employee,
-                        attendance_date=date_time_obj.date(),
-                    )
-                    .order_by("-in_datetime", "-out_datetime")
-                    .first()
-                )
-
-                # If no record or last record has clock_out → IN
-                if not last_activity or last_activity.clock_out:
-                    clock_in(request_data)
-                else:
-                    clock_out(request_data)
-
-            processed_count += 1
+        # system: the punch code sets the direction, alternate: in unless the
+        # last activity of the day is still open
+        if device.device_direction == "system":
+            direction = "in" if attendance["checktype"] in {0, 128} else "out"
+        elif device.device_direction in {"in", "out", "alternate"}:
+            direction = device.device_direction
+        else:
+            continue
 
-        except Exception as error:
-            logger.error(
-                f"Attendance sync failed for employee {employee.id}",
-                exc_info=error,
+        date_time_utc = datetime.strptime(
+            attendance["checktime"], "%Y-%m-%dT%H:%M:%S%z"
+        )
+        punches.append(
+            Punch(
+                device_id=device.id,
+                user_id=badge_id,
+                employee_id=employee.id,
+                datetime=date_time_utc.astimezone(
+                    django_timezone.get_current_timezone()
+                ),
+                direction=direction,
             )
+        )
+    processed_count = ingest_punches(punches)
 
     return processed_count
 
 
-def anviz_biometric_attendance_scheduler(device_id):
-    """
-    Schedules the attendance log retrieval for an Anviz biometric device.
-    """
-    device = BiometricDevices.find(device_id)
-    if device and device.is_scheduler:
-        anviz_biometric_attendance_logs(device)
-
-
 def cosec_biometric_attendance_logs(device):
     """
     Retrieves and processes attendance logs from a COSEC biometric device.
@@ -2408,35 +2243,7 @@ def cosec_biometric_attendance_logs(device):
     if not isinstance(attendances, list):
         return
 
-    for attendance in attendances:
-        ref_user_id = attendance["detail-1"]
-        employee = BiometricEmployees.objects.filter(ref_user_id=ref_user_id).first()
-        if not employee:
-            continue
-
-        date_str = attendance["date"]
-        time_str = attendance["time"]
-        attendance_date = datetime.strptime(date_str, "%d/%m/%Y").date()
-        attendance_time = datetime.strptime(time_str, "%H:%M:%S").time()
-        attendance_datetime = datetime.combine(attendance_date, attendance_time)
-        punch_code = attendance["detail-2"]
-
-        request_data = Request(
-            user=employee.employee_id.employee_user_id,
-            date=attendance_date,
-            time=attendance_time,
-            datetime=django_timezone.make_aware(attendance_datetime),
-        )
-
-        try:
-            if punch_code in ["1", "3", "5", "7", "9", "0"]:
-                clock_in(request_data)
-            elif punch_code in ["2", "4", "6", "8", "10"]:
-                clock_out(request_data)
-            else:
-                pass
-        except Exception as error:
-            logger.error("Error processing attendance: ", error)
+    ingest_punches(cosec_punches(device, attendances))
 
     if attendances:
         last_attendance = attendances[-1]
@@ -2450,21 +2257,6 @@ def cosec_biometric_attendance_logs(device):
     return len(attendances)
 
 
-def cosec_biometric_attendance_scheduler(device_id):
-    """
-    Retrieve and process attendance events from a COSEC biometric device.
-
-    This function fetches attendance events from the specified COSEC biometric device
-    and processes them to record clock-in and clock-out events for employees.
-
-    Args:
-        device_id (uuid): The ID of the COSEC biometric device.
-    """
-    device = BiometricDevices.find(device_id)
-    if device and device.is_scheduler:
-        cosec_biometric_attendance_logs(device)
-
-
 def dahua_biometric_attendance_logs(device):
     """
     Retrieves logs from a Dahua biometric device and marks attendance in Horilla.
@@ -2492,41 +2284,32 @@ def dahua_biometric_attendance_logs(device):
     logs = dahua.get_control_card_rec(start_time=begin_time)
 
     if logs.get("status_code") == 200:
-        for log in logs.get("records", []):
+        records = logs.get("records", [])
+        employees = {}
+        for employee in BiometricEmployees.objects.filter(
+            user_id__in={log.get("user_id") for log in records}, device_id=device
+        ):
+            employees.setdefault(employee.user_id, employee)
+
+        user_tz = pytz.timezone(TIME_ZONE)
+        punches = []
+        for log in records:
             user_id = log.get("user_id")
-            if not user_id:
-                continue
-
-            employee = BiometricEmployees.objects.filter(
-                user_id=user_id, device_id=device
-            ).first()
+            employee = employees.get(user_id) if user_id else None
             if not employee:
                 continue
 
-            attendance_datetime = log.get("create_time")
-            user_tz = pytz.timezone(TIME_ZONE)
-            attendance_datetime = attendance_datetime.astimezone(user_tz)
-
-            last_none_activity = (
-                AttendanceActivity.objects.filter(
-                    employee_id=employee.employee_id,
-                    clock_out=None,
+            # out while the employee has an open activity, otherwise in
+            punches.append(
+                Punch(
+                    device_id=device.id,
+                    user_id=user_id,
+                    employee_id=employee.employee_id_id,
+                    datetime=log.get("create_time").astimezone(user_tz),
+                    direction="toggle",
                 )
-                .order_by("in_datetime")
-                .last()
-            )
-
-            request_data = Request(
-                user=employee.employee_id.employee_user_id,
-                date=attendance_datetime.date(),
-                time=attendance_datetime.time(),
-                datetime=attendance_datetime,
             )
-
-            if last_none_activity:
-                clock_out(request_data)
-            else:
-                clock_in(request_data)
+        ingest_punches(punches)
 
         if logs.get("records"):
             last_log = logs["records"][-1]
@@ -2538,15 +2321,6 @@ def dahua_biometric_attendance_logs(device):
         return "error"
 
 
-def dahua_biometric_attendance_scheduler(device_id):
-    """
-    Schedules the attendance log retrieval for a Dahua biometric device.
-    """
-    device = BiometricDevices.find(device_id)
-    if device and device.is_scheduler:
-        dahua_biometric_attendance_logs(device)
-
-
 def etimeoffice_biometric_attendance_logs(device):
     """
     Retrieves and processes attendance logs from an eTimeOffice biometric device.
@@ -2578,34 +2352,23 @@ def etimeoffice_biometric_attendance_logs(device):
         emp.user_id: emp for emp in BiometricEmployees.objects.filter(device_id=device)
     }
 
+    punches = []
     for log in reversed(punch_data):
         user_id = log.get("Empcode")
         if not user_id or user_id not in employee_map:
             continue
 
-        employee = employee_map[user_id]
-        attendance_datetime = log["PunchDate"].astimezone(user_tz)
-
-        request_data = Request(
-            user=employee.employee_id.employee_user_id,
-            date=attendance_datetime.date(),
-            time=attendance_datetime.time(),
-            datetime=attendance_datetime,
-        )
-
-        last_none_activity = (
-            AttendanceActivity.objects.filter(
-                employee_id=employee.employee_id,
-                clock_out=None,
+        # out while the employee has an open activity, otherwise in
+        punches.append(
+            Punch(
+                device_id=device.id,
+                user_id=user_id,
+                employee_id=employee_map[user_id].employee_id_id,
+                datetime=log["PunchDate"].astimezone(user_tz),
+                direction="toggle",
             )
-            .order_by("in_datetime")
-            .last()
         )
-
-        if last_none_activity:
-            clock_out(request_data)
-        else:
-            clock_in(request_data)
+    ingest_punches(punches)
 
     last_log = punch_data[0]
     device.last_fetch_date, device.last_fetch_time = (
@@ -2617,64 +2380,7 @@ def etimeoffice_biometric_attendance_logs(device):
     return len(punch_data)
 
 
-def etimeoffice_biometric_attendance_scheduler(device_id):
-    """
-    Schedules the attendance log retrieval for an eTimeOffice biometric device.
-    """
-    device = BiometricDevices.find(device_id)
-    if device and device.is_scheduler:
-        etimeoffice_biometric_attendance_logs(device)
-
-
 try:
-    devices = BiometricDevices.objects.all().update(is_live=False)
-    for device in BiometricDevices.objects.filter(is_scheduler=True):
-        if device:
-            if str_time_seconds(device.scheduler_duration) > 0:
-                if device.machine_type == "anviz":
-                    scheduler = BackgroundScheduler()
-                    scheduler.add_job(
-                        lambda: anviz_biometric_attendance_scheduler(device.id),
-                        "interval",
-                        seconds=str_time_seconds(device.scheduler_duration),
-                    )
-                    scheduler.start()
-                elif device.machine_type == "zk":
-                    scheduler = BackgroundScheduler()
-                    scheduler.add_job(
-                        lambda: zk_biometric_attendance_scheduler(device.id),
-                        "interval",
-                        seconds=str_time_seconds(device.scheduler_duration),
-                        id=f"biometric_{device.id}",
-                    )
-                    scheduler.start()
-                elif device.machine_type == "dahua":
-                    scheduler = BackgroundScheduler()
-                    scheduler.add_job(
-                        lambda: dahua_biometric_attendance_scheduler(device.id),
-                        "interval",
-                        seconds=str_time_seconds(device.scheduler_duration),
-                    )
-                    scheduler.start()
-
-                elif device.machine_type == "cosec":
-                    scheduler = BackgroundScheduler()
-                    scheduler.add_job(
-                        lambda: cosec_biometric_attendance_scheduler(device.id),
-                        "interval",
-                        seconds=str_time_seconds(device.scheduler_duration),
-                    )
-                    scheduler.start()
-
-                elif device.machine_type == "etimeoffice":
-                    scheduler = BackgroundScheduler()
-                    scheduler.add_job(
-                        lambda: etimeoffice_biometric_attendance_scheduler(device.id),
-                        "interval",
-                        seconds=str_time_seconds(device.scheduler_duration),
-                    )
-                    scheduler.start()
-                else:
-                    pass
-except:
+    BiometricDevices.objects.all().update(is_live=False)
+except Exception:
     pass
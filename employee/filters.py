@@ -176,8 +176,7 @@ class EmployeeFilter(HorillaFilterSet):
         request = getattr(_thread_locals, "request", None)
         if request:
             employee = getattr(request.user, "employee_get", None)
-            cache_key = request.session.session_key + "accessibility_filter"
-            accessible = check_is_accessible("employee_view", cache_key, employee)
+            accessible = check_is_accessible("employee_view", employee)
             if not accessible and employee.reporting_manager.exists():
                 queryset = filtersubordinatesemployeemodel(
                     request=request, queryset=queryset, perm="employee.view_employee"
@@ -14,6 +14,8 @@ from django.contrib.auth.models import Permission, User
 from django.core.exceptions import ValidationError
 from django.core.files.storage import default_storage
 from django.db import models
+from django.db.models import Value
+from django.db.models.functions import Coalesce, Concat
 from django.db.models.query import QuerySet
 from django.db.models.signals import post_save
 from django.dispatch import receiver
@@ -115,6 +117,14 @@ class Employee(models.Model):
     objects = HorillaCompanyManager(
         related_company_field="employee_work_info__company_id"
     )
+    # Database expressions of the method backed list view sort keys
+    sortby_annotations = {
+        "get_full_name": lambda prefix: Concat(
+            f"{prefix}employee_first_name",
+            Value(" "),
+            Coalesce(f"{prefix}employee_last_name", Value("")),
+        ),
+    }
 
     def clean_fields(self, exclude=None):
         errors = {}
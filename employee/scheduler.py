@@ -1,9 +1,10 @@
 import datetime
-import sys
 from datetime import timedelta
 
 from apscheduler.schedulers.background import BackgroundScheduler
 
+from horilla.horilla_settings import schedulers_enabled
+
 
 def update_experience():
     from employee.models import EmployeeWorkInformation
@@ -132,10 +133,7 @@ def block_unblock_disciplinary():
     return
 
 
-if not any(
-    cmd in sys.argv
-    for cmd in ["makemigrations", "migrate", "compilemessages", "flush", "shell"]
-):
+if schedulers_enabled():
     """
     Initializes and starts background tasks using APScheduler when the server is running.
     """
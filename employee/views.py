@@ -25,7 +25,6 @@ from django.apps import apps
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.models import User
-from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist
 from django.db import models
 from django.db.models import F, ProtectedError
@@ -42,8 +41,6 @@ from django.utils.translation import gettext_lazy as _
 from django.views.decorators.http import require_http_methods
 
 from accessibility.decorators import enter_if_accessible
-from accessibility.methods import update_employee_accessibility_cache
-from accessibility.middlewares import ACCESSIBILITY_CACHE_USER_KEYS
 from accessibility.models import DefaultAccessibility
 from base.forms import ModelForm
 from base.methods import (
@@ -300,18 +297,11 @@ def profile_edit_access(request, emp_id):
         employees = Employee.objects.filter(id=emp_id)
 
         if employee := employees.first():
-            if employee in accessibility.employees.all():
+            if accessibility.employees.filter(pk=employee.pk).exists():
                 accessibility.employees.remove(employee)
             else:
                 accessibility.employees.add(employee)
 
-            user_cache_key = ACCESSIBILITY_CACHE_USER_KEYS.get(
-                employees.first().employee_user_id.id, None
-            )
-            if user_cache_key:
-                cache.delete(user_cache_key[-1])
-                update_employee_accessibility_cache(user_cache_key[-1], employee)
-
     return HorillaRedirect(request)
 
 
@@ -4,12 +4,18 @@ horilla/config.py
 Horilla app configurations
 """
 
+import hashlib
 import importlib
 import logging
+import threading
+import time
+from collections import OrderedDict
 
 from django.apps import apps
 from django.conf import settings
 from django.contrib.auth.context_processors import PermWrapper
+from django.core.cache import cache
+from django.utils.translation import get_language
 
 from horilla.horilla_apps import SIDEBARS
 
@@ -27,62 +33,135 @@ def import_method(accessibility):
     return accessibility_method
 
 
-ALL_MENUS = {}
+# Built menus of the recent users, least recently used first
+SIDEBAR_CACHE = OrderedDict()
+_sidebar_cache_lock = threading.Lock()
+SIDEBAR_VERSION_KEY = "sidebar_menu_version"
+
+
+def get_sidebar_version():
+    """
+    Version of the menus, it changes whenever a model listed in the
+    MENU_DEPENDENCIES of an app sidebar is saved or deleted
+    """
+    version = cache.get(SIDEBAR_VERSION_KEY)
+    if version is None:
+        # a new version never matches the version of an evicted key
+        cache.add(SIDEBAR_VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(SIDEBAR_VERSION_KEY)
+    return version
+
+
+def bump_sidebar_version():
+    try:
+        cache.incr(SIDEBAR_VERSION_KEY)
+    except ValueError:
+        cache.set(SIDEBAR_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def get_sidebar_modules():
+    modules = []
+    for app in get_apps_in_base_dir():
+        if apps.is_installed(app):
+            try:
+                modules.append((app, importlib.import_module(app + ".sidebar")))
+            except Exception as e:
+                logger.error(e)
+    return modules
+
+
+_sidebar_dependencies = None
+
+
+def get_sidebar_dependencies():
+    """
+    Lower case labels of the models the accessibility of the menus depend on.
+    The labels are kept once every installed sidebar imports, a sidebar
+    reversing a url not loaded yet fails to import and is tried again on the
+    next call.
+    """
+    global _sidebar_dependencies
+    if _sidebar_dependencies is not None:
+        return _sidebar_dependencies
+    modules = get_sidebar_modules()
+    dependencies = {
+        label.lower()
+        for _app, sidebar in modules
+        for label in getattr(sidebar, "MENU_DEPENDENCIES", [])
+    }
+    if len(modules) == len(
+        [app for app in get_apps_in_base_dir() if apps.is_installed(app)]
+    ):
+        _sidebar_dependencies = dependencies
+    return dependencies
+
+
+def sidebar_cache_key(request):
+    """
+    The menu of a user changes with their permissions, the selected company,
+    the language and the menu version. The accessibility methods also check
+    the relations of the user, such as being a reporting manager, so the menus
+    are not shared between users.
+    """
+    user = request.user
+    permissions = "\n".join(sorted(user.get_all_permissions()))
+    return (
+        user.pk,
+        user.is_superuser,
+        hashlib.sha1(permissions.encode()).hexdigest(),
+        str(request.session.get("selected_company")),
+        get_language(),
+        get_sidebar_version(),
+    )
 
 
 def sidebar(request):
-
-    base_dir_apps = get_apps_in_base_dir()
-
-    if not request.user.is_anonymous:
-        request.MENUS = []
-        MENUS = request.MENUS
-
-        for app in base_dir_apps:
-            if apps.is_installed(app):
-                try:
-                    sidebar = importlib.import_module(app + ".sidebar")
-
-                except Exception as e:
-                    logger.error(e)
-                    continue
-
-                if sidebar:
-                    accessibility = None
-                    if getattr(sidebar, "ACCESSIBILITY", None):
-                        accessibility = import_method(sidebar.ACCESSIBILITY)
-
-                    if not accessibility or accessibility(
-                        request,
-                        sidebar.MENU,
-                        PermWrapper(request.user),
-                    ):
-                        MENU = {}
-                        MENU["menu"] = sidebar.MENU
-                        MENU["app"] = app
-                        MENU["img_src"] = sidebar.IMG_SRC
-                        MENU["submenu"] = []
-                        MENUS.append(MENU)
-                        for submenu in sidebar.SUBMENUS:
-
-                            accessibility = None
-
-                            if submenu.get("accessibility"):
-                                accessibility = import_method(submenu["accessibility"])
-                            redirect: str = submenu["redirect"]
-                            redirect = redirect.split("?")
-                            submenu["redirect"] = redirect[0]
-
-                            if not accessibility or accessibility(
-                                request,
-                                submenu,
-                                PermWrapper(request.user),
-                            ):
-                                MENU["submenu"].append(submenu)
-        ALL_MENUS[request.session.session_key] = MENUS
+    """
+    Build the menus and the submenus accessible to the user
+    """
+    menus = []
+    user_perms = PermWrapper(request.user)
+    for app, sidebar in get_sidebar_modules():
+        accessibility = None
+        if getattr(sidebar, "ACCESSIBILITY", None):
+            accessibility = import_method(sidebar.ACCESSIBILITY)
+
+        if accessibility and not accessibility(request, sidebar.MENU, user_perms):
+            continue
+        menu = {
+            "menu": sidebar.MENU,
+            "app": app,
+            "img_src": sidebar.IMG_SRC,
+            "submenu": [],
+        }
+        menus.append(menu)
+        for submenu in sidebar.SUBMENUS:
+            accessibility = None
+            if submenu.get("accessibility"):
+                accessibility = import_method(submenu["accessibility"])
+            # the accessibility methods may change the redirect of their copy
+            submenu = dict(submenu)
+            submenu["redirect"] = str(submenu["redirect"]).split("?")[0]
+
+            if not accessibility or accessibility(request, submenu, user_perms):
+                menu["submenu"].append(submenu)
+    return menus
 
 
 def get_MENUS(request):
-    ALL_MENUS[request.session.session_key] = []
-    sidebar(request)
-    return {"sidebar": ALL_MENUS.get(request.session.session_key)}
+    if request.user.is_anonymous:
+        return {"sidebar": []}
+    key = sidebar_cache_key(request)
+    now = time.monotonic()
+    with _sidebar_cache_lock:
+        cached = SIDEBAR_CACHE.get(key)
+        if cached and cached[0] > now:
+            SIDEBAR_CACHE.move_to_end(key)
+            return {"sidebar": cached[1]}
+    menus = sidebar(request)
+    with _sidebar_cache_lock:
+        SIDEBAR_CACHE[key] = (now + settings.SIDEBAR_MENU_CACHE_TIMEOUT, menus)
+        SIDEBAR_CACHE.move_to_end(key)
+        while len(SIDEBAR_CACHE) > settings.SIDEBAR_MENU_CACHE_SIZE:
+            SIDEBAR_CACHE.popitem(last=False)
+    return {"sidebar": menus}
@@ -6,6 +6,7 @@ import uuid
 
 import django_filters
 from django import forms
+from django.core.exceptions import FieldDoesNotExist
 from django.core.paginator import Page, Paginator
 from django.db import models
 from django.utils.translation import gettext_lazy as _
@@ -19,6 +20,11 @@ FILTER_FOR_DBFIELD_DEFAULTS[models.ForeignKey][
     "filter_class"
 ] = django_filters.ModelMultipleChoiceFilter
 
+# Rows per chunk when a search has to compare computed attributes in Python
+SEARCH_CHUNK_SIZE = 2000
+# Fields whose string form in Python differs from the database value
+PYTHON_SEARCH_FIELDS = (models.BooleanField, models.JSONField, models.FileField)
+
 
 def filter_by_name(queryset, name, value):
     """
@@ -45,6 +51,84 @@ def filter_by_name(queryset, name, value):
     return queryset
 
 
+def compile_search_field(model, search_field):
+    """
+    Resolve a ``__`` separated search field path against the model fields.
+
+    Returns a tuple (lookup, prefix, model, attribute, many):
+        lookup: the ORM ``__icontains`` lookup when the path ends at a concrete
+            field, else None.
+        prefix: the relation path leading to the model that holds the
+            computed attribute.
+        model: the model at the end of the relation path.
+        attribute: the remaining computed attribute path, empty when the
+            string form of the instance is searched.
+        many: whether the path crosses a multi valued relation.
+    """
+    parts = search_field.split("__")
+    prefix = []
+    many = False
+    for index, part in enumerate(parts):
+        try:
+            field = model._meta.get_field(part)
+        except FieldDoesNotExist:
+            return None, prefix, model, "__".join(parts[index:]), many
+        if field.is_relation:
+            if field.related_model is None:
+                return None, prefix, model, "__".join(parts[index:]), many
+            many = many or field.many_to_many or field.one_to_many
+            prefix.append(part)
+            model = field.related_model
+        elif isinstance(field, PYTHON_SEARCH_FIELDS) or index < len(parts) - 1:
+            return None, prefix, model, "__".join(parts[index:]), many
+        else:
+            return f"{search_field}__icontains", prefix, model, "", many
+    return None, prefix, model, "", many
+
+
+def python_search(queryset, attribute, search):
+    """
+    Return the primary keys of the queryset rows whose attribute (or string
+    form) contains the search, reading the rows in chunks.
+    """
+    ids = []
+    for instance in queryset.iterator(chunk_size=SEARCH_CHUNK_SIZE):
+        value = getattribute(instance, attribute) if attribute else instance
+        if search in str(value).lower():
+            ids.append(instance.pk)
+    return ids
+
+
+def search_queryset(queryset, search_field, search):
+    """
+    Filter the queryset rows whose search field contains the search.
+
+    Concrete fields are searched with ``__icontains`` in the database (an
+    ILIKE on PostgreSQL, served by a pg_trgm GIN index when one exists).
+    Computed attributes and string forms of related objects are compared in
+    Python, on the distinct related rows referenced by the queryset rather
+    than on every row of the queryset.
+    """
+    search = search.lower()
+    lookup, prefix, model, attribute, many = compile_search_field(
+        queryset.model, search_field
+    )
+    if lookup:
+        condition = models.Q(**{lookup: search})
+    elif prefix:
+        path = "__".join(prefix)
+        related = model._base_manager.filter(pk__in=queryset.order_by().values(path))
+        condition = models.Q(
+            **{f"{path}__in": python_search(related, attribute, search)}
+        )
+    else:
+        return queryset.filter(pk__in=python_search(queryset, attribute, search))
+
+    if many:
+        return queryset.filter(pk__in=queryset.filter(condition).values("pk"))
+    return queryset.filter(condition)
+
+
 class FilterSet(django_filters.FilterSet):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -184,9 +268,4 @@ class HorillaFilterSet(FilterSet):
         if not search_field:
             search_field = self.filters[name].field_name
 
-        def _icontains(instance):
-            result = str(getattribute(instance, search_field)).lower()
-            return instance.pk if search in result else None
-
-        ids = list(filter(None, map(_icontains, queryset)))
-        return queryset.filter(id__in=ids)
+        return search_queryset(queryset, search_field, search)
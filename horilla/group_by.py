@@ -1,8 +1,13 @@
-from django.core.paginator import Paginator
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db.models import Count, F, OrderBy, Q, Window
 from django.db.models.fields.related_descriptors import ForwardManyToOneDescriptor
+from django.db.models.functions import RowNumber
 
 from horilla.horilla_middlewares import _thread_locals
 
+# rows shown per page inside a group
+GROUP_RECORDS_PER_PAGE = 10
+
 
 def record_queryset_paginator(request, queryset, page_name, records_per_page=10):
     """
@@ -20,43 +25,105 @@ def record_queryset_paginator(request, queryset, page_name, records_per_page=10)
     return paginator.get_page(page)
 
 
-def generate_groups(request, groupers, queryset, page_name, group_field, is_fk_field):
+class GroupPaginator(Paginator):
     """
-    groups generating method
+    Paginator of the rows of a group whose count is already known from the
+    grouping query, its pages are filled by group_rows.
     """
-    groups = []
-    if is_fk_field:
-        for grouper in groupers:
-            group_queryset = queryset.filter(**{group_field: grouper.id})
-            # to avoid zero records groupings
-            if group_queryset.count():
-                group_info = {
-                    "grouper": grouper,
-                    "list": record_queryset_paginator(
-                        request,
-                        group_queryset,
-                        f"dynamic_page_{page_name}{grouper.id}",
-                    ),
-                    "dynamic_name": f"dynamic_page_{page_name}{grouper.id}",
-                }
-                groups.append(group_info)
+
+    def __init__(self, count, per_page):
+        super().__init__([], per_page)
+        self.count = count
+
+    def get_page_number(self, number):
+        """
+        Return the page number get_page would show for the number
+        """
+        try:
+            return self.validate_number(number)
+        except PageNotAnInteger:
+            return 1
+        except EmptyPage:
+            return self.num_pages
+
+
+def group_ordering(queryset):
+    """
+    Ordering of the rows inside a group: the queryset ordering, or the latest
+    records first like record_queryset_paginator, with the pk as tiebreaker.
+    """
+    model = queryset.model
+    if queryset.query.order_by:
+        ordering = queryset.query.order_by
+    elif queryset.query.default_ordering and model._meta.ordering:
+        ordering = model._meta.ordering
+    elif hasattr(model, "created_at"):
+        ordering = ["-created_at"]
     else:
-        for grouper in groupers:
-            group_queryset = queryset.filter(**{group_field: grouper})
-            # to avoid zero records groupings
-            if group_queryset.count():
-                group = {
-                    "grouper": grouper,
-                    "list": record_queryset_paginator(
-                        request,
-                        group_queryset,
-                        f"dynamic_page_{page_name}{grouper}".replace(" ", "_"),
-                    ),
-                    "dynamic_name": f"dynamic_page_{page_name}{grouper}".replace(
-                        " ", "_"
-                    ),
-                }
-                groups.append(group)
+        ordering = ["-id"]
+
+    expressions = []
+    for field in ordering:
+        if isinstance(field, str):
+            if field == "?":
+                continue
+            if field.startswith("-"):
+                expressions.append(F(field[1:]).desc())
+            else:
+                expressions.append(F(field.lstrip("+")).asc())
+        elif isinstance(field, OrderBy):
+            expressions.append(field)
+        elif hasattr(field, "resolve_expression"):
+            expressions.append(field.asc())
+    expressions.append(F("pk").asc())
+    return expressions
+
+
+def group_counts(queryset, group_field):
+    """
+    Return the {group key: row count} of the queryset with one GROUP BY query
+    """
+    return dict(
+        queryset.order_by()
+        .values_list(group_field)
+        .annotate(group_count=Count("pk", distinct=queryset.query.distinct))
+    )
+
+
+def group_rows(queryset, group_field, slices):
+    """
+    Fetch the rows of several groups with one query. The rows are numbered
+    inside their group with ROW_NUMBER() OVER (PARTITION BY the group field)
+    and only the (start, end) slice of every group in ``slices`` is selected.
+    Returns the {group key: rows} of the slices.
+    """
+    keys = [key for key in slices if key is not None]
+    in_groups = Q(_group_key__in=keys)
+    rows_filter = Q()
+    for key, (start, end) in slices.items():
+        if key is None:
+            in_groups |= Q(_group_key__isnull=True)
+            group = Q(_group_key__isnull=True)
+        else:
+            group = Q(_group_key=key)
+        rows_filter |= group & Q(_group_row__gt=start, _group_row__lte=end)
+
+    rows = (
+        queryset.annotate(
+            _group_key=F(group_field),
+            _group_row=Window(
+                RowNumber(),
+                partition_by=F(group_field),
+                order_by=group_ordering(queryset),
+            ),
+        )
+        .filter(in_groups)
+        .filter(rows_filter)
+        .order_by("_group_row")
+    )
+    groups = {key: [] for key in slices}
+    for row in rows:
+        groups[row._group_key].append(row)
     return groups
 
 
@@ -64,7 +131,11 @@ def group_by_queryset(
     queryset, group_field, page=None, page_name="page", records_per_page=10
 ):
     """
-    This method is used to make group-by and split groups by nested pagination
+    This method is used to make group-by and split groups by nested pagination.
+
+    The group keys and their row counts come from one GROUP BY query, and only
+    the groups of the requested page are materialized: their groupers and the
+    current page of rows of each of them, fetched with one windowed query.
     """
     from base.methods import get_pagination
 
@@ -78,7 +149,6 @@ def group_by_queryset(
         getattr(model, group_field, None), ForwardManyToOneDescriptor
     )
     model_copy = model
-    field_obj = None
 
     # getting request from the thread locals
     request = getattr(_thread_locals, "request", None)
@@ -86,42 +156,56 @@ def group_by_queryset(
         for field in fields_split:
             field_obj = model_copy._meta.get_field(field)
             model_copy = field_obj.related_model
-        if model_copy:
-            groupers = model_copy.objects.all()
-            groups = generate_groups(
-                request,
-                groupers,
-                queryset,
-                page_name,
-                group_field,
-                is_fk_field=True,
-            )
-        else:
-            groupers = [
-                item
-                for index, item in enumerate(
-                    queryset.values_list(group_field, flat=True)
-                )
-                if item not in queryset.values_list(group_field, flat=True)[:index]
-            ]
-            groups = generate_groups(
-                request, groupers, queryset, page_name, group_field, is_fk_field=False
-            )
+        grouper_model = model_copy
+        is_fk_field = bool(model_copy)
+    else:
+        # getting related model
+        grouper_model = queryset.model._meta.get_field(group_field).related_model
 
+    counts = group_counts(queryset, group_field)
+    if grouper_model:
+        # the groups follow the ordering of the related model, and the groups
+        # of the records not visible through its manager are left out
+        keys = list(
+            grouper_model.objects.filter(
+                pk__in=[key for key in counts if key is not None]
+            ).values_list("pk", flat=True)
+        )
     else:
         # making unique | not using set(groupers) due to ordering issue
-        groupers = [
-            item
-            for index, item in enumerate(queryset.values_list(group_field, flat=True))
-            if item not in queryset.values_list(group_field, flat=True)[:index]
-        ]
-        # getting related queryset
-        related_model = queryset.model._meta.get_field(group_field).related_model
-        if related_model:
-            groupers = related_model.objects.filter(id__in=groupers)
-        groups = generate_groups(
-            request, groupers, queryset, page_name, group_field, is_fk_field=False
+        keys = list(dict.fromkeys(queryset.values_list(group_field, flat=True)))
+
+    groups = Paginator(keys, records_per_page).get_page(page)
+    page_keys = list(groups.object_list)
+    groupers = {key: key for key in page_keys}
+    if grouper_model:
+        groupers = grouper_model.objects.in_bulk(page_keys)
+
+    paginators = {}
+    slices = {}
+    for key in page_keys:
+        if is_fk_field:
+            dynamic_name = f"dynamic_page_{page_name}{key}"
+        else:
+            dynamic_name = f"dynamic_page_{page_name}{groupers.get(key)}".replace(
+                " ", "_"
+            )
+        paginator = GroupPaginator(counts.get(key, 0), GROUP_RECORDS_PER_PAGE)
+        number = paginator.get_page_number(
+            request.GET.get(dynamic_name) if request else None
         )
+        paginators[key] = (dynamic_name, paginator, number)
+        start = (number - 1) * paginator.per_page
+        slices[key] = (start, start + paginator.per_page)
 
-    groups = Paginator(groups, records_per_page)
-    return groups.get_page(page)
+    rows = group_rows(queryset, group_field, slices) if slices else {}
+    groups.object_list = [
+        {
+            "grouper": groupers[key],
+            "list": Page(rows[key], number, paginator),
+            "dynamic_name": dynamic_name,
+        }
+        for key, (dynamic_name, paginator, number) in paginators.items()
+        if key in groupers
+    ]
+    return groups
@@ -29,6 +29,7 @@ AUDITLOG_INCLUDE_ALL_MODELS = True
 AUDITLOG_EXCLUDE_TRACKING_MODELS = (
     # "<app_name>",
     # "<app_name>.<model>"
+    "base.MailOutbox",
 )
 
 setattr(settings, "AUDITLOG_INCLUDE_ALL_MODELS", AUDITLOG_INCLUDE_ALL_MODELS)
@@ -2,44 +2,248 @@
 horilla_context_process.py
 
 This module is used to register context processors without effecting the horilla/settings.py module
+
+The context processors registered with lazy_context_processor are computed only
+when a rendered template references one of their keys, at most once per
+request. Their keys reach the templates as callables, which the template engine
+calls on lookup.
 """
 
+import logging
+import threading
+import time
+from functools import partial
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+
 from horilla.settings import TEMPLATES
 
+logger = logging.getLogger(__name__)
+
+LAZY_CONTEXT_PROCESSORS = {}
+
+# {path: [computed, cache hits, seconds spent computing]}
+CONTEXT_PROCESSOR_TIMINGS = {}
+_timings_lock = threading.Lock()
+_lazy_context_renders = 0
+
+
+class LazyContextProcessor:
+    """
+    Context processor computed the first time a template references one of its
+    keys. When depends_on lists the models its output depends on, the output
+    does not depend on the request and is shared through the cache until one
+    of those models changes. The output of a company_scoped processor, reading
+    models of a company manager, is shared per selected company.
+    """
+
+    def __init__(self, path, keys, depends_on=None, company_scoped=False):
+        self.path = path
+        self.keys = keys
+        self.depends_on = depends_on
+        self.company_scoped = company_scoped
+        if depends_on is not None:
+            self.depends_on = [label.lower() for label in depends_on]
+        self.function = None
+
+    def load(self):
+        # the processor modules may register url patterns on import
+        if self.function is None:
+            self.function = import_string(self.path)
+
+    def cache_key(self, company_id=None):
+        if self.company_scoped:
+            return f"context_processor_{self.path}_{company_id}"
+        return f"context_processor_{self.path}"
+
+    def request_cache_key(self, request):
+        company_context = getattr(request, "company_context", None)
+        company_id = getattr(company_context, "company_id", None)
+        return self.cache_key(str(company_id) if company_id is not None else None)
+
+    def compute(self, request):
+        start = time.perf_counter()
+        context = self.function(request)
+        elapsed = time.perf_counter() - start
+        record_context_processor_timing(self.path, elapsed)
+        logger.debug("Context processor %s took %.2f ms", self.path, elapsed * 1000)
+        return context
+
+    def resolve(self, request):
+        resolved = getattr(request, "_lazy_context", None)
+        if resolved is None:
+            resolved = request._lazy_context = {}
+        if self.path not in resolved:
+            context = None
+            if self.depends_on is not None:
+                cache_key = self.request_cache_key(request)
+                context = cache.get(cache_key)
+                if context is not None:
+                    record_context_processor_timing(self.path, cached=True)
+            if context is None:
+                context = self.compute(request)
+                if self.depends_on is not None:
+                    cache.set(
+                        cache_key,
+                        context,
+                        timeout=settings.CONTEXT_PROCESSOR_CACHE_TIMEOUT,
+                    )
+            resolved[self.path] = context
+        return resolved[self.path]
+
+    def value(self, request, key):
+        return self.resolve(request).get(key)
+
+
+def lazy_context_processor(path, keys, depends_on=None, company_scoped=False):
+    """
+    Register the context processor at path, providing the context keys
+    """
+    LAZY_CONTEXT_PROCESSORS[path] = LazyContextProcessor(
+        path, keys, depends_on, company_scoped
+    )
+
+
+def lazy_context(request):
+    """
+    Context processor giving the keys of the lazy context processors
+    """
+    global _lazy_context_renders
+    _lazy_context_renders += 1
+    context = {}
+    for processor in LAZY_CONTEXT_PROCESSORS.values():
+        processor.load()
+        for key in processor.keys:
+            context[key] = partial(processor.value, request, key)
+    return context
+
+
+def expire_lazy_context_processors(model):
+    """
+    Drop the shared outputs depending on the model
+    """
+    label = model._meta.label_lower
+    processors = [
+        processor
+        for processor in LAZY_CONTEXT_PROCESSORS.values()
+        if processor.depends_on is not None and label in processor.depends_on
+    ]
+    keys = [processor.cache_key() for processor in processors]
+    if any(processor.company_scoped for processor in processors):
+        company_ids = [
+            str(company_id)
+            for company_id in apps.get_model("base", "Company").objects.values_list(
+                "pk", flat=True
+            )
+        ]
+        keys.extend(
+            processor.cache_key(company_id)
+            for processor in processors
+            if processor.company_scoped
+            for company_id in company_ids
+        )
+    if keys:
+        cache.delete_many(keys)
+
+
+def record_context_processor_timing(path, seconds=0, cached=False):
+    with _timings_lock:
+        timing = CONTEXT_PROCESSOR_TIMINGS.setdefault(path, [0, 0, 0])
+        if cached:
+            timing[1] += 1
+        else:
+            timing[0] += 1
+            timing[2] += seconds
+
+
+def get_context_processor_timings():
+    """
+    Renders with the lazy context, and the times each lazy context processor
+    was computed or read from the cache and the time spent computing it
+    """
+    with _timings_lock:
+        processors = [
+            {
+                "path": path,
+                "computed": timing[0],
+                "cache_hits": timing[1],
+                "total_ms": round(timing[2] * 1000, 2),
+                "average_ms": (
+                    round(timing[2] * 1000 / timing[0], 2) if timing[0] else 0
+                ),
+            }
+            for path, timing in CONTEXT_PROCESSOR_TIMINGS.items()
+        ]
+    processors.sort(key=lambda timing: timing["total_ms"], reverse=True)
+    return {"renders": _lazy_context_renders, "processors": processors}
+
+
+def reset_context_processor_timings():
+    global _lazy_context_renders
+    with _timings_lock:
+        CONTEXT_PROCESSOR_TIMINGS.clear()
+        _lazy_context_renders = 0
+
+
 TEMPLATES[0]["OPTIONS"]["context_processors"].append(
-    "horilla.config.get_MENUS",
+    "horilla.horilla_context_processors.lazy_context",
 )
-TEMPLATES[0]["OPTIONS"]["context_processors"].append(
+
+lazy_context_processor("horilla.config.get_MENUS", ["sidebar"])
+lazy_context_processor(
     "base.context_processors.get_companies",
+    ["all_companies", "company_selected"],
 )
-TEMPLATES[0]["OPTIONS"]["context_processors"].append(
+lazy_context_processor(
     "base.context_processors.white_labelling_company",
+    ["white_label_company_name", "white_label_company"],
 )
-TEMPLATES[0]["OPTIONS"]["context_processors"].append(
+lazy_context_processor(
     "base.context_processors.resignation_request_enabled",
+    ["enabled_resignation_request"],
+    depends_on=["offboarding.OffboardingGeneralSetting"],
 )
-TEMPLATES[0]["OPTIONS"]["context_processors"].append(
+lazy_context_processor(
     "base.context_processors.timerunner_enabled",
+    ["enabled_timerunner"],
+    depends_on=["attendance.AttendanceGeneralSetting"],
+    company_scoped=True,
 )
-TEMPLATES[0]["OPTIONS"]["context_processors"].append(
+lazy_context_processor(
     "base.context_processors.intial_notice_period",
+    ["get_initial_notice_period"],
+    depends_on=["payroll.PayrollGeneralSetting"],
 )
-TEMPLATES[0]["OPTIONS"]["context_processors"].append(
+lazy_context_processor(
     "base.context_processors.check_candidate_self_tracking",
+    ["check_candidate_self_tracking"],
+    depends_on=["recruitment.RecruitmentGeneralSetting"],
 )
-TEMPLATES[0]["OPTIONS"]["context_processors"].append(
+lazy_context_processor(
     "base.context_processors.check_candidate_self_tracking_rating",
+    ["check_candidate_self_tracking_rating"],
+    depends_on=["recruitment.RecruitmentGeneralSetting"],
 )
-
-TEMPLATES[0]["OPTIONS"]["context_processors"].append(
+lazy_context_processor(
     "base.context_processors.get_initial_prefix",
+    ["get_initial_prefix", "prefix_instance_id"],
+    depends_on=["employee.EmployeeGeneralSetting"],
+    company_scoped=True,
 )
-TEMPLATES[0]["OPTIONS"]["context_processors"].append(
+lazy_context_processor(
     "base.context_processors.biometric_app_exists",
+    ["biometric_app_exists"],
+    depends_on=[],
 )
-TEMPLATES[0]["OPTIONS"]["context_processors"].append(
+lazy_context_processor(
     "base.context_processors.enable_late_come_early_out_tracking",
+    ["tracking", "late_come_early_out_tracking"],
+    depends_on=["base.TrackLateComeEarlyOut"],
 )
+# computed on every render, it also registers the profile edit accessibility
 TEMPLATES[0]["OPTIONS"]["context_processors"].append(
     "base.context_processors.enable_profile_edit",
 )
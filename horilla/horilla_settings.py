@@ -1,3 +1,5 @@
+import sys
+
 from django.core.files.storage import FileSystemStorage
 
 from horilla import settings
@@ -38,6 +40,30 @@ HORILLA_TIME_FORMATS = {
 
 BIO_DEVICE_THREADS = {}
 
+# Commands that run without the in-process background schedulers: the
+# maintenance commands, the test runner and the dedicated background workers.
+SCHEDULER_EXCLUDED_COMMANDS = [
+    "makemigrations",
+    "migrate",
+    "compilemessages",
+    "flush",
+    "shell",
+    "test",
+    "auto_punch_out",
+    "materialize_work_records",
+    "rebuild_hour_accounts",
+    "send_mail_outbox",
+    "poll_biometric_devices",
+    "process_payslip_runs",
+]
+
+
+def schedulers_enabled():
+    """
+    Whether this process starts the in-process background schedulers
+    """
+    return not any(cmd in sys.argv for cmd in SCHEDULER_EXCLUDED_COMMANDS)
+
 DYNAMIC_URL_PATTERNS = []
 
 FILE_STORAGE = FileSystemStorage(location="csv_tmp/")
@@ -205,6 +205,96 @@ LOGIN_URL = "/login"
 
 SIMPLE_HISTORY_REVERT_DISABLED = True
 
+# Run the auto punch-out scheduler inside the web processes. Disable it when the
+# dedicated `python manage.py auto_punch_out` worker is deployed.
+AUTO_PUNCH_OUT_IN_PROCESS = env.bool("AUTO_PUNCH_OUT_IN_PROCESS", default=True)
+
+# Bulk payslip runs are processed by a thread of the web process, computing the
+# chunks one after the other. Disable PAYSLIP_RUN_IN_PROCESS when the dedicated
+# `python manage.py process_payslip_runs` worker is deployed, it computes the
+# chunks on a pool of PAYSLIP_RUN_WORKERS processes. Employees committed per
+# chunk, and seconds without a heartbeat after which a queued or running run is
+# considered interrupted and resumed.
+PAYSLIP_RUN_IN_PROCESS = env.bool("PAYSLIP_RUN_IN_PROCESS", default=True)
+PAYSLIP_RUN_WORKERS = env.int("PAYSLIP_RUN_WORKERS", default=2)
+PAYSLIP_RUN_CHUNK_SIZE = env.int("PAYSLIP_RUN_CHUNK_SIZE", default=50)
+PAYSLIP_RUN_STALE_SECONDS = env.int("PAYSLIP_RUN_STALE_SECONDS", default=600)
+
+# Payslip PDF rendering: concurrent wkhtmltopdf processes and seconds a rendered
+# PDF is cached.
+PDF_RENDER_WORKERS = env.int("PDF_RENDER_WORKERS", default=4)
+PDF_RENDER_CACHE_TIMEOUT = env.int("PDF_RENDER_CACHE_TIMEOUT", default=60 * 60 * 24)
+
+# Outgoing mail is queued in the database outbox and delivered in batches over
+# one connection per mail server. Disable MAIL_OUTBOX_IN_PROCESS when the
+# dedicated `python manage.py send_mail_outbox` worker is deployed.
+MAIL_OUTBOX_ENABLED = env.bool("MAIL_OUTBOX_ENABLED", default=True)
+MAIL_OUTBOX_IN_PROCESS = env.bool("MAIL_OUTBOX_IN_PROCESS", default=True)
+MAIL_OUTBOX_BATCH_SIZE = env.int("MAIL_OUTBOX_BATCH_SIZE", default=100)
+MAIL_OUTBOX_INTERVAL = env.int("MAIL_OUTBOX_INTERVAL", default=10)
+MAIL_OUTBOX_MAX_ATTEMPTS = env.int("MAIL_OUTBOX_MAX_ATTEMPTS", default=5)
+MAIL_OUTBOX_RETRY_SECONDS = env.int("MAIL_OUTBOX_RETRY_SECONDS", default=60)
+MAIL_OUTBOX_DEDUPE_SECONDS = env.int("MAIL_OUTBOX_DEDUPE_SECONDS", default=600)
+MAIL_OUTBOX_STALE_SECONDS = env.int("MAIL_OUTBOX_STALE_SECONDS", default=300)
+MAIL_OUTBOX_RETENTION_DAYS = env.int("MAIL_OUTBOX_RETENTION_DAYS", default=30)
+
+# Mail automations: worker threads processing the triggered automations, and
+# events queued before they run in the request that triggered them.
+AUTOMATION_WORKERS = env.int("AUTOMATION_WORKERS", default=2)
+AUTOMATION_QUEUE_SIZE = env.int("AUTOMATION_QUEUE_SIZE", default=1000)
+
+# Biometric punches replayed in memory and written in one transaction per batch.
+BIOMETRIC_PUNCH_BATCH_SIZE = env.int("BIOMETRIC_PUNCH_BATCH_SIZE", default=500)
+
+# Biometric device poller: devices fetched at once, most seconds between the
+# retries of a failing device, poll interval of the COSEC devices in live capture
+# mode, seconds between reloads of the device list and seconds a device is leased
+# to the process polling it. The leases only keep the processes from polling the
+# same device at once when they share a CACHE_URL, so the poller runs inside the
+# web processes by default only with a shared cache. Otherwise deploy the
+# dedicated `python manage.py poll_biometric_devices` worker.
+BIOMETRIC_POLLER_IN_PROCESS = env.bool(
+    "BIOMETRIC_POLLER_IN_PROCESS",
+    default=env("CACHE_URL", default="locmemcache://").split(":")[0]
+    not in ("locmemcache", "dummycache"),
+)
+BIOMETRIC_POLL_CONCURRENCY = env.int("BIOMETRIC_POLL_CONCURRENCY", default=8)
+BIOMETRIC_POLL_MAX_BACKOFF = env.int("BIOMETRIC_POLL_MAX_BACKOFF", default=3600)
+BIOMETRIC_LIVE_POLL_SECONDS = env.int("BIOMETRIC_LIVE_POLL_SECONDS", default=2)
+BIOMETRIC_POLLER_RELOAD_SECONDS = env.int("BIOMETRIC_POLLER_RELOAD_SECONDS", default=60)
+BIOMETRIC_POLL_LEASE_SECONDS = env.int("BIOMETRIC_POLL_LEASE_SECONDS", default=600)
+
+# Sidebar menus built per user and kept in a per process LRU: menus kept and
+# seconds a menu is reused before it is built again.
+SIDEBAR_MENU_CACHE_SIZE = env.int("SIDEBAR_MENU_CACHE_SIZE", default=1000)
+SIDEBAR_MENU_CACHE_TIMEOUT = env.int("SIDEBAR_MENU_CACHE_TIMEOUT", default=300)
+
+# Seconds the context processors depending only on the configuration share their
+# output between the requests. Saving the configuration drops it earlier.
+CONTEXT_PROCESSOR_CACHE_TIMEOUT = env.int(
+    "CONTEXT_PROCESSOR_CACHE_TIMEOUT", default=300
+)
+
+# Seconds each process reuses the shift days, the attendance validation condition
+# and the holidays read by every attendance save. Saving them drops it earlier in
+# the saving process only.
+ATTENDANCE_SETTINGS_CACHE_SECONDS = env.int(
+    "ATTENDANCE_SETTINGS_CACHE_SECONDS", default=60
+)
+
+# Days back the scheduled work record job materializes when it has no watermark,
+# after a restart with a per process cache, and the oldest draft day it fills.
+WORK_RECORDS_CATCH_UP_DAYS = env.int("WORK_RECORDS_CATCH_UP_DAYS", default=7)
+
+# Seconds each process reuses its holiday and company leave calendars before
+# checking the shared calendar version. Saving them expires it at once in the
+# saving process, and in the others when the cache is shared.
+WORKING_CALENDAR_CACHE_SECONDS = env.int("WORKING_CALENDAR_CACHE_SECONDS", default=5)
+
+# Shared cache of the processes (e.g. redis://127.0.0.1:6379/1). The per process
+# default keeps room for the per user counters, such as the unread notifications.
+CACHES = {"default": env.cache("CACHE_URL", default="locmemcache://?max_entries=10000")}
+
 
 DJANGO_NOTIFICATIONS_CONFIG = {
     "USE_JSONFIELD": True,
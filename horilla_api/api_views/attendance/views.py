@@ -298,33 +298,12 @@ class AttendanceView(APIView):
     @method_decorator(permission_required("attendance.delete_attendance"))
     def delete(self, request, pk):
         attendance = Attendance.objects.get(id=pk)
-        month = attendance.attendance_date
-        month = month.strftime("%B").lower()
-        overtime = attendance.employee_id.employee_overtime.filter(month=month).last()
-        if overtime is not None:
-            if attendance.attendance_overtime_approve:
-                # Subtract overtime of this attendance
-                total_overtime = strtime_seconds(overtime.overtime)
-                attendance_overtime_seconds = strtime_seconds(
-                    attendance.attendance_overtime
-                )
-                if total_overtime > attendance_overtime_seconds:
-                    total_overtime = total_overtime - attendance_overtime_seconds
-                else:
-                    total_overtime = attendance_overtime_seconds - total_overtime
-                overtime.overtime = format_time(total_overtime)
-                overtime.save()
-            try:
-                attendance.delete()
-                return Response({"status", "deleted"}, status=200)
-            except Exception as error:
-                return Response({"error:", f"{error}"}, status=400)
-        else:
-            try:
-                attendance.delete()
-                return Response({"status", "deleted"}, status=200)
-            except Exception as error:
-                return Response({"error:", f"{error}"}, status=400)
+        # deleting the attendance takes its approved overtime off the hour account
+        try:
+            attendance.delete()
+            return Response({"status", "deleted"}, status=200)
+        except Exception as error:
+            return Response({"error:", f"{error}"}, status=400)
 
 
 class ValidateAttendanceView(APIView):
@@ -4,8 +4,9 @@ horilla_audit/settings.py
 This module is used to write settings contents related to payroll app
 """
 
-from horilla.settings import TEMPLATES
+from horilla.horilla_context_processors import lazy_context_processor
 
-TEMPLATES[0]["OPTIONS"]["context_processors"].append(
+lazy_context_processor(
     "horilla_audit.context_processors.history_form",
+    ["history_form"],
 )
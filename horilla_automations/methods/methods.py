@@ -4,6 +4,7 @@ horilla_automations/methods/methods.py
 """
 
 import operator
+from functools import reduce
 
 from django.core.exceptions import FieldDoesNotExist
 from django.db import models as django_models
@@ -216,6 +217,144 @@ def evaluate_condition(value1, operator_str, value2):
     return op_func(value1, value2)
 
 
+def compile_conditions(condition_querystring):
+    """
+    Parse the condition query string of an automation once into a list of
+    (attribute, operator, value, logic) tuples, where logic joins the condition
+    to the previous ones.
+    """
+    conditions = []
+    query_strings = split_query_string(
+        (condition_querystring or "").replace("automation_multiple_", "")
+    )
+    for condition in query_strings:
+        if condition.getlist("condition"):
+            attr, operator_str, value = condition.getlist("condition")[:3]
+            if value == "on":
+                value = True
+            elif value == "off":
+                value = False
+            conditions.append((attr, operator_str, value, condition.get("logic")))
+    return conditions
+
+
+def evaluate_conditions(conditions, instance, previous_instance):
+    """
+    Evaluate the compiled conditions against the instance. Returns whether the
+    automation is applicable, and the values of the condition attributes on
+    the instance and on the previous instance.
+    """
+    from horilla_views.templatetags.generic_template_filters import getattribute
+
+    applicable = False
+    and_exists = False
+    false_exists = False
+    instance_values = []
+    previous_instance_values = []
+    for attr, operator_str, value, logic in conditions:
+        instance_value = getattribute(instance, attr)
+        previous_instance_value = getattribute(previous_instance, attr)
+        # The send mail method only trigger when actually any changes
+        # b/w the previous, current instance's `attr` field's values and
+        # if applicable for the automation
+        if getattr(instance_value, "pk", None) and isinstance(
+            instance_value, django_models.Model
+        ):
+            instance_value = str(getattr(instance_value, "pk", None))
+            previous_instance_value = str(getattr(previous_instance_value, "pk", None))
+        elif isinstance(instance_value, django_models.QuerySet):
+            instance_value = list(instance_value.values_list("pk", flat=True))
+            previous_instance_value = list(
+                previous_instance_value.values_list("pk", flat=True)
+            )
+
+        instance_values.append(instance_value)
+        previous_instance_values.append(previous_instance_value)
+
+        if not logic:
+            applicable = evaluate_condition(instance_value, operator_str, value)
+        if logic:
+            applicable = operator_map[logic](
+                applicable,
+                evaluate_condition(instance_value, operator_str, value),
+            )
+        if not applicable:
+            false_exists = True
+        if logic == "and":
+            and_exists = True
+        if false_exists and and_exists:
+            applicable = False
+            break
+    return applicable, instance_values, previous_instance_values
+
+
+def condition_lookup(model_class, attr, value):
+    """
+    Return the filter selecting the rows whose `attr` equals the value exactly
+    when the condition evaluated on the instance does, or None when the
+    comparison of the instance value with the value is not a database lookup
+    (method attributes, many to many, numbers or dates compared to text).
+    """
+    opts = model_class._meta
+    parts = attr.split("__")
+    for index, part in enumerate(parts):
+        try:
+            field = opts.get_field(part)
+        except FieldDoesNotExist:
+            return None
+        if index == len(parts) - 1:
+            break
+        if not (field.one_to_one or (field.concrete and field.many_to_one)):
+            return None
+        opts = field.related_model._meta
+
+    if field.concrete and (field.many_to_one or field.one_to_one):
+        # the instance compares the related pk as text
+        try:
+            pk = field.target_field.to_python(value)
+        except Exception:
+            return None
+        if not isinstance(value, str) or str(pk) != value:
+            return None
+    elif isinstance(field, django_models.BooleanField):
+        if not isinstance(value, bool):
+            return None
+    elif isinstance(field, (django_models.CharField, django_models.TextField)):
+        # an empty relation gives "" on the instance but no row in the database
+        if not isinstance(value, str) or (value == "" and len(parts) > 1):
+            return None
+    else:
+        return None
+    return django_models.Q(**{attr: value})
+
+
+def conditions_q(model_class, conditions):
+    """
+    Compile the conditions into one ORM filter with the same result as
+    evaluate_conditions: without an "and" any condition matches, otherwise the
+    first condition and every condition joined by "and" must match. Returns
+    None when a condition cannot be compiled.
+    """
+    if not conditions:
+        return None
+    lookups = []
+    for index, (attr, operator_str, value, logic) in enumerate(conditions):
+        # only the first condition comes without a logic
+        if logic not in (("and", "or") if index else (None, "")):
+            return None
+        lookup = condition_lookup(model_class, attr, value)
+        if lookup is None or operator_str not in ("==", "!="):
+            return None
+        lookups.append((~lookup if operator_str == "!=" else lookup, logic))
+
+    if not any(logic == "and" for _lookup, logic in lookups[1:]):
+        return reduce(operator.or_, [lookup for lookup, _logic in lookups])
+    return reduce(
+        operator.and_,
+        [lookups[0][0]] + [lookup for lookup, logic in lookups[1:] if logic == "and"],
+    )
+
+
 def get_related_field_model(model: Employee, field_path):
     parts = field_path.split("__")
     for part in parts:
@@ -74,6 +74,11 @@ class MailAutomation(HorillaModel):
     condition_querystring = models.TextField(null=True, editable=False)
 
     condition = models.TextField()
+    # counters of the instances the conditions were evaluated on, the ones
+    # that triggered the automation and the processing time
+    evaluation_count = models.PositiveBigIntegerField(default=0, editable=False)
+    match_count = models.PositiveBigIntegerField(default=0, editable=False)
+    processing_us = models.PositiveBigIntegerField(default=0, editable=False)
 
     xss_exempt_fields = [
         "condition_html",
@@ -140,6 +145,22 @@ class MailAutomation(HorillaModel):
         """
         return reverse("update-automation", kwargs={"pk": self.pk})
 
+    def get_stats_display(self):
+        """
+        Evaluations, matches and average processing time of the automation
+        """
+        evaluations = self.evaluation_count
+        return _trans(
+            "%(evaluations)s evaluations, %(matches)s matches, "
+            "%(average_latency_ms)s ms on average"
+        ) % {
+            "evaluations": evaluations,
+            "matches": self.match_count,
+            "average_latency_ms": (
+                round(self.processing_us / evaluations / 1000, 2) if evaluations else 0
+            ),
+        }
+
     def trigger_display(self):
         """"""
         return self.get_trigger_display()
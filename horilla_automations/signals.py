@@ -5,20 +5,20 @@ horilla_automation/signals.py
 
 import copy
 import logging
-import threading
 import time
 import types
 
 from bs4 import BeautifulSoup
 from django import template
 from django.core.mail import EmailMessage
-from django.db import models
+from django.db import models, transaction
 from django.db.models.query import QuerySet
 from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 
 from horilla.horilla_middlewares import _thread_locals
 from horilla.signals import post_bulk_update, pre_bulk_update
+from horilla_automations.worker import enqueue_automation, record_automation_stats
 from notifications.signals import notify
 
 logger = logging.getLogger(__name__)
@@ -45,7 +45,11 @@ def start_automation():
     Automation signals
     """
     from base.models import HorillaMailTemplate
-    from horilla_automations.methods.methods import get_model_class, split_query_string
+    from horilla_automations.methods.methods import (
+        compile_conditions,
+        conditions_q,
+        get_model_class,
+    )
     from horilla_automations.models import MailAutomation
 
     @receiver(post_delete, sender=MailAutomation)
@@ -77,36 +81,32 @@ def start_automation():
 
     REFRESH_METHODS["clear_connection"] = clear_connection
 
-    def create_post_bulk_update_handler(automation, model_class, query_strings):
+    def create_post_bulk_update_handler(
+        automation, model_class, conditions, condition_q
+    ):
         def post_bulk_update_handler(sender, queryset, *args, **kwargs):
-            def _bulk_update_thread_handler(
-                queryset, previous_queryset_copy, automation
-            ):
-                request = getattr(queryset, "request", None)
-
-                if request:
-                    for index, instance in enumerate(queryset):
-                        previous_instance = previous_queryset_copy[index]
-                        send_automated_mail(
-                            request,
-                            False,
-                            automation,
-                            query_strings,
-                            instance,
-                            previous_instance,
-                        )
+            request = getattr(queryset, "request", None)
+            # a bulk update never creates, only the update automations apply
+            if not request or automation.trigger != "on_update":
+                return
 
             previous_bulk_record = getattr(_thread_locals, "previous_bulk_record", None)
             previous_queryset_copy = []
-            if previous_bulk_record:
-                previous_queryset = previous_bulk_record.get("queryset", None)
+            if previous_bulk_record and previous_bulk_record["queryset"] is queryset:
                 previous_queryset_copy = previous_bulk_record.get("queryset_copy", [])
-
-            bulk_thread = threading.Thread(
-                target=_bulk_update_thread_handler,
-                args=(queryset, previous_queryset_copy, automation),
+            previous_instances = list(previous_queryset_copy)
+
+            transaction.on_commit(
+                lambda: enqueue_automation(
+                    run_bulk_automation,
+                    request,
+                    automation,
+                    model_class,
+                    conditions,
+                    condition_q,
+                    previous_instances,
+                )
             )
-            bulk_thread.start()
 
         func_name = f"{automation.method_title}_post_bulk_signal_handler"
 
@@ -132,24 +132,21 @@ def start_automation():
         clear_connection()
         automations = MailAutomation.objects.filter(is_active=True)
         for automation in automations:
-
-            condition_querystring = automation.condition_querystring.replace(
-                "automation_multiple_", ""
-            )
-
-            query_strings = split_query_string(condition_querystring)
-
             model_path = automation.model
             model_class = get_model_class(model_path)
 
+            # the conditions are compiled once per saved automation
+            conditions = compile_conditions(automation.condition_querystring)
+            condition_q = conditions_q(model_class, conditions)
+
             handler = create_post_bulk_update_handler(
-                automation, model_class, query_strings
+                automation, model_class, conditions, condition_q
             )
             SIGNAL_HANDLERS.append(handler)
 
             post_bulk_update.connect(handler, sender=model_class)
 
-            def create_signal_handler(name, automation, query_strings):
+            def create_signal_handler(name, automation, conditions):
                 def signal_handler(sender, instance, created, **kwargs):
                     """
                     Signal handler for post-save events of the model instances.
@@ -164,14 +161,13 @@ def start_automation():
                         request,
                         created,
                         automation,
-                        query_strings,
+                        conditions,
                         instance,
                         previous_instance,
                     )
-                    thread = threading.Thread(
-                        target=lambda: send_automated_mail(*args),
+                    transaction.on_commit(
+                        lambda: enqueue_automation(run_automation, *args)
                     )
-                    thread.start()
 
                 signal_handler.__name__ = name
                 signal_handler.model_class = model_class
@@ -181,7 +177,7 @@ def start_automation():
             # Create and connect the signal handler
             handler_name = f"{automation.method_title}_signal_handler"
             dynamic_signal_handler = create_signal_handler(
-                handler_name, automation, query_strings
+                handler_name, automation, conditions
             )
             SIGNAL_HANDLERS.append(dynamic_signal_handler)
             post_save.connect(
@@ -193,13 +189,25 @@ def start_automation():
     def create_pre_bulk_update_handler(automation, model_class):
         def pre_bulk_update_handler(sender, queryset, *args, **kwargs):
             request = getattr(_thread_locals, "request", None)
-            if request:
+            if request and automation.trigger == "on_update":
+                update_kwargs = kwargs.get("kwargs")
+                previous_bulk_record = getattr(
+                    _thread_locals, "previous_bulk_record", None
+                )
+                if (
+                    previous_bulk_record
+                    and previous_bulk_record["queryset"] is queryset
+                    and previous_bulk_record["update_kwargs"] is update_kwargs
+                ):
+                    # already copied for another automation of the model
+                    return
                 queryset_copy = queryset.none()
-                if queryset.count():
-                    queryset_copy = QuerySet.from_list(copy.deepcopy(list(queryset)))
+                if previous_records := list(queryset):
+                    queryset_copy = QuerySet.from_list(copy.deepcopy(previous_records))
                 _thread_locals.previous_bulk_record = {
                     "automation": automation,
                     "queryset": queryset,
+                    "update_kwargs": update_kwargs,
                     "queryset_copy": queryset_copy,
                 }
 
@@ -272,78 +280,76 @@ def start_automation():
     start_connection()
 
 
+def run_automation(
+    request, created, automation, conditions, instance, previous_instance
+):
+    """
+    Evaluate the automation on a saved instance and count the evaluation
+    """
+    started = time.monotonic()
+    matched = send_automated_mail(
+        request, created, automation, conditions, instance, previous_instance
+    )
+    record_automation_stats(automation.pk, 1, int(matched), time.monotonic() - started)
+
+
+def run_bulk_automation(
+    request, automation, model_class, conditions, condition_q, previous_instances
+):
+    """
+    Evaluate the automation on the rows of a bulk update. The rows matching
+    the compiled conditions are selected with one query, the others are not
+    loaded at all.
+    """
+    started = time.monotonic()
+    previous = {instance.pk: instance for instance in previous_instances}
+    matches = 0
+    if previous and conditions:
+        instances = model_class._base_manager.filter(pk__in=previous.keys())
+        if condition_q is not None:
+            instances = instances.filter(condition_q)
+        for instance in instances:
+            matches += send_automated_mail(
+                request,
+                False,
+                automation,
+                conditions,
+                instance,
+                previous[instance.pk],
+            )
+    record_automation_stats(
+        automation.pk, len(previous), matches, time.monotonic() - started
+    )
+
+
 def send_automated_mail(
     request,
     created,
     automation,
-    query_strings,
+    conditions,
     instance,
     previous_instance,
 ):
-    from horilla_automations.methods.methods import evaluate_condition, operator_map
-    from horilla_views.templatetags.generic_template_filters import getattribute
-
-    applicable = False
-    and_exists = False
-    false_exists = False
-    instance_values = []
-    previous_instance_values = []
-    for condition in query_strings:
-        if condition.getlist("condition"):
-            attr = condition.getlist("condition")[0]
-            operator = condition.getlist("condition")[1]
-            value = condition.getlist("condition")[2]
-
-            if value == "on":
-                value = True
-            elif value == "off":
-                value = False
-            instance_value = getattribute(instance, attr)
-            previous_instance_value = getattribute(previous_instance, attr)
-            # The send mail method only trigger when actually any changes
-            # b/w the previous, current instance's `attr` field's values and
-            # if applicable for the automation
-            if getattr(instance_value, "pk", None) and isinstance(
-                instance_value, models.Model
-            ):
-                instance_value = str(getattr(instance_value, "pk", None))
-                previous_instance_value = str(
-                    getattr(previous_instance_value, "pk", None)
-                )
-            elif isinstance(instance_value, QuerySet):
-                instance_value = list(instance_value.values_list("pk", flat=True))
-                previous_instance_value = list(
-                    previous_instance_value.values_list("pk", flat=True)
-                )
-
-            instance_values.append(instance_value)
-
-            previous_instance_values.append(previous_instance_value)
-
-            if not condition.get("logic"):
+    """
+    Send the automation mail when the compiled conditions apply to the
+    instance. Returns whether the mail was sent.
+    """
+    from horilla_automations.methods.methods import evaluate_conditions
 
-                applicable = evaluate_condition(instance_value, operator, value)
-            logic = condition.get("logic")
-            if logic:
-                applicable = operator_map[logic](
-                    applicable,
-                    evaluate_condition(instance_value, operator, value),
-                )
-            if not applicable:
-                false_exists = True
-            if logic == "and":
-                and_exists = True
-            if false_exists and and_exists:
-                applicable = False
-                break
+    applicable, instance_values, previous_instance_values = evaluate_conditions(
+        conditions, instance, previous_instance
+    )
     if applicable:
         if created and automation.trigger == "on_create":
             send_mail(request, automation, instance)
+            return True
         elif (automation.trigger == "on_update") and (
             set(previous_instance_values) != set(instance_values)
         ):
 
             send_mail(request, automation, instance)
+            return True
+    return False
 
 
 def send_mail(request, automation, instance):
@@ -503,17 +509,12 @@ def send_mail(request, automation, instance):
                 f"Automation <Notification> {automation.title} is triggered by {request.user.employee_get}"
             )
 
+        # already running on an automation worker
         if automation.delivery_channel != "notification":
-            thread = threading.Thread(
-                target=lambda: _send_mail(email),
-            )
-            thread.start()
+            _send_mail(email)
 
         if automation.delivery_channel != "email":
-            thread = threading.Thread(
-                target=lambda: _send_notification(plain_text),
-            )
-            thread.start()
+            _send_notification(plain_text)
         logger.info(
             f"Automation Triggered | {automation.get_delivery_channel_display()} | {automation}"
         )
@@ -202,6 +202,7 @@ class AutomationDetailedView(views.HorillaDetailedView):
         ("Mail To", "get_mail_to_display"),
         ("Mail Cc", "get_mail_cc_display"),
         ("Trigger", "trigger_display"),
+        ("Statistics", "get_stats_display"),
     ]
     actions = [
         {
@@ -0,0 +1,86 @@
+"""
+horilla_automations/worker.py
+
+Bounded queue of the triggered automations, processed by a small pool of
+worker threads instead of one thread per event, and the per automation
+counters of evaluations, matches and processing time.
+"""
+
+import logging
+import queue
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+_queue = queue.Queue(maxsize=settings.AUTOMATION_QUEUE_SIZE)
+_workers = []
+_workers_lock = threading.Lock()
+
+
+def run_job(function, args):
+    try:
+        function(*args)
+    except Exception as e:
+        logger.exception(e)
+
+
+def automation_worker():
+    """
+    Process the queued automations until the process stops
+    """
+    while True:
+        function, args = _queue.get()
+        try:
+            run_job(function, args)
+        finally:
+            close_old_connections()
+            _queue.task_done()
+
+
+def start_automation_workers():
+    """
+    Start the AUTOMATION_WORKERS worker threads once per process
+    """
+    with _workers_lock:
+        _workers[:] = [worker for worker in _workers if worker.is_alive()]
+        while len(_workers) < settings.AUTOMATION_WORKERS:
+            worker = threading.Thread(
+                target=automation_worker,
+                daemon=True,
+                name=f"mail-automation-{len(_workers)}",
+            )
+            worker.start()
+            _workers.append(worker)
+
+
+def enqueue_automation(function, *args):
+    """
+    Queue the call of the automation function. When the queue is full the
+    function runs in the calling thread, so no event is dropped and the
+    producers are slowed down to the pace of the workers.
+    """
+    start_automation_workers()
+    try:
+        _queue.put_nowait((function, args))
+    except queue.Full:
+        logger.warning("The automation queue is full, running the automation inline")
+        run_job(function, args)
+
+
+def record_automation_stats(automation_id, evaluations, matches, seconds):
+    """
+    Add to the counters of the automation: the instances its conditions were
+    evaluated on, the ones that triggered it and the processing time.
+    """
+    from horilla_automations.models import MailAutomation
+
+    # the base manager updates the row without the bulk update signals
+    MailAutomation._base_manager.filter(pk=automation_id).update(
+        evaluation_count=F("evaluation_count") + evaluations,
+        match_count=F("match_count") + matches,
+        processing_us=F("processing_us") + int(seconds * 1_000_000),
+    )
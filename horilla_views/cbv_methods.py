@@ -2,17 +2,23 @@
 horilla/cbv_methods.py
 """
 
+import csv
 import json
-import types
+import tempfile
+import textwrap
 import uuid
-from io import BytesIO
+from functools import lru_cache
+from itertools import chain
 from typing import Any
 from urllib.parse import urlencode
 from venv import logger
 
+import xlsxwriter
+from bs4 import BeautifulSoup
 from django import forms, template
 from django.contrib import messages
 from django.core.cache import cache as CACHE
+from django.core.exceptions import FieldDoesNotExist
 from django.core.paginator import Paginator
 from django.db import models
 from django.db.models.fields.related import ForeignKey
@@ -20,7 +26,7 @@ from django.db.models.fields.related_descriptors import (
     ForwardManyToOneDescriptor,
     ReverseOneToOneDescriptor,
 )
-from django.http import HttpResponse
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
 from django.middleware.csrf import get_token
 from django.shortcuts import redirect, render
 from django.template import loader
@@ -349,6 +355,50 @@ def getmodelattribute(value: models.Model, attr: str):
     return result
 
 
+def compile_sort_key(model, sort_key):
+    """
+    Compile the sort key into the database expressions to order by, or return
+    None when the key has to be sorted in Python.
+
+    Concrete fields and forward relations are ordered in the database, a
+    relation being ordered by the ordering of the related model. Method backed
+    keys are ordered in the database when the model holding the method
+    declares a ``sortby_annotations`` expression for it, e.g.
+
+        sortby_annotations = {
+            "get_full_name": lambda prefix: Concat(
+                f"{prefix}first_name", Value(" "), f"{prefix}last_name"
+            ),
+        }
+    """
+    parts = sort_key.split("__")
+    current = model
+    for index, part in enumerate(parts):
+        try:
+            field = current._meta.get_field(part)
+        except FieldDoesNotExist:
+            annotation = getattr(current, "sortby_annotations", {}).get(part)
+            if annotation is None or index < len(parts) - 1:
+                return None
+            prefix = "".join(f"{related}__" for related in parts[:index])
+            return [annotation(prefix)]
+        if field.many_to_many or field.one_to_many:
+            return None
+        if field.is_relation:
+            if field.related_model is None:
+                return None
+            current = field.related_model
+
+    if not field.is_relation:
+        return [models.F(sort_key)]
+    ordering = [name for name in current._meta.ordering if isinstance(name, str)]
+    expressions = []
+    for name in ordering or ["pk"]:
+        expression = models.F(f"{sort_key}__{name.lstrip('-')}")
+        expressions.append(expression.desc() if name.startswith("-") else expression)
+    return expressions
+
+
 def sortby(
     query_dict, queryset, key: str, page: str = "page", is_first_sort: bool = False
 ):
@@ -364,24 +414,6 @@ def sortby(
         )
     reverse_object = CACHE.get(request.session.session_key + "cbvsortby")
     reverse = reverse_object.reverse
-    none_ids = []
-    none_queryset = []
-    model = queryset.model
-    model_attr = getmodelattribute(model, sort_key)
-    is_method = (
-        isinstance(model_attr, types.FunctionType)
-        or model_attr not in model._meta.get_fields()
-    )
-    if not is_method:
-        none_queryset = queryset.filter(**{f"{sort_key}__isnull": True})
-        none_ids = list(none_queryset.values_list("id", flat=True))
-        queryset = queryset.exclude(id__in=none_ids)
-
-    def _sortby(object):
-        result = getattribute(object, attr=sort_key)
-        if result is None:
-            none_ids.append(object.pk)
-        return result
 
     order = not reverse
     current_page = query_dict.get(page)
@@ -390,25 +422,72 @@ def sortby(
         if reverse_object.page == current_page and not is_first_sort:
             order = not order
         reverse_object.page = current_page
-    try:
-        queryset = sorted(queryset, key=_sortby, reverse=order)
-    except TypeError:
-        none_queryset = list(queryset.filter(id__in=none_ids))
-        queryset = sorted(queryset.exclude(id__in=none_ids), key=_sortby, reverse=order)
 
-    reverse_object.reverse = order
-    if order:
-        order = "asc"
-        queryset = list(queryset) + list(none_queryset)
+    sort_expressions = compile_sort_key(queryset.model, sort_key)
+    if sort_expressions is not None:
+        queryset = order_queryset(queryset, sort_expressions, descending=order)
     else:
-        queryset = list(none_queryset) + list(queryset)
-        order = "desc"
+        queryset = python_sortby(queryset, sort_key, descending=order)
+
+    reverse_object.reverse = order
+    order = "asc" if order else "desc"
     setattr(request, "sort_order", order)
     setattr(request, "sort_key", sort_key)
     CACHE.set(request.session.session_key + "cbvsortby", reverse_object)
     return queryset
 
 
+def order_queryset(queryset, sort_expressions, descending):
+    """
+    Order the queryset by the sort expressions in the database, with the empty
+    values last when descending and first otherwise. Ties keep the current
+    ordering of the queryset and end with the primary key, so the pages are
+    stable and the paginator only fetches the rows of the requested page.
+    """
+    ordering = []
+    for expression in sort_expressions:
+        if isinstance(expression, models.OrderBy):
+            expression = expression.expression
+            is_descending = not descending
+        else:
+            is_descending = descending
+        if is_descending:
+            ordering.append(expression.desc(nulls_last=True))
+        else:
+            ordering.append(expression.asc(nulls_first=True))
+    current_ordering = list(queryset.query.order_by)
+    if not current_ordering and queryset.query.default_ordering:
+        current_ordering = list(queryset.model._meta.ordering)
+    return queryset.order_by(*ordering, *current_ordering, "pk")
+
+
+def python_sortby(queryset, sort_key, descending):
+    """
+    Sort the method backed keys in Python, the rows without a value are kept
+    last when descending and first otherwise.
+    """
+    none_ids = []
+    none_queryset = []
+
+    def _sortby(object):
+        result = getattribute(object, attr=sort_key)
+        if result is None:
+            none_ids.append(object.pk)
+        return result
+
+    try:
+        queryset = sorted(queryset, key=_sortby, reverse=descending)
+    except TypeError:
+        none_queryset = list(queryset.filter(id__in=none_ids))
+        queryset = sorted(
+            queryset.exclude(id__in=none_ids), key=_sortby, reverse=descending
+        )
+
+    if descending:
+        return list(queryset) + list(none_queryset)
+    return list(none_queryset) + list(queryset)
+
+
 def update_saved_filter_cache(request, cache):
     """
     Method to save filter on cache
@@ -543,136 +622,267 @@ def flatten_dict(d, parent_key=""):
     return dict(items)
 
 
-def export_xlsx(json_data, columns, file_name="quick_export"):
+EXPORT_CHUNK_SIZE = 2000
+
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def export_lookups(model, field_paths):
     """
-    Quick export method
+    Return the select_related and prefetch_related lookups needed by the
+    exported columns, and the columns that do not end on a model field. Only
+    these columns can render markup, like the methods and properties.
     """
-    top_fields = [col[0] for col in columns if len(col) == 2]
+    select_related = set()
+    prefetch_related = set()
+    markup_columns = set()
+    for field_path in field_paths:
+        current_model = model
+        lookup = []
+        many = False
+        for part in field_path.split("__"):
+            try:
+                field = current_model._meta.get_field(part)
+            except FieldDoesNotExist:
+                markup_columns.add(field_path)
+                break
+            if not field.is_relation:
+                break
+            if field.auto_created and field.get_accessor_name() != part:
+                markup_columns.add(field_path)
+                break
+            lookup.append(part)
+            many = many or field.many_to_many or field.one_to_many
+            (prefetch_related if many else select_related).add("__".join(lookup))
+            current_model = field.related_model
+    # the prefetched lookups already cover their select_related prefixes
+    select_related = {
+        lookup
+        for lookup in select_related
+        if not any(path.startswith(f"{lookup}__") for path in prefetch_related)
+    }
+    return select_related, prefetch_related, markup_columns
 
-    nested_fields = [
-        col for col in columns if len(col) == 3 and isinstance(col[2], dict)
-    ]
 
-    # Discover dynamic keys for each nested column
-    dynamic_columns = {}
-    for title, key, mappings in nested_fields:
-        dyn_keys = set()
-        for entry in json_data:
-            try:
-                nested_data = json.loads(entry.get(key, "[]").replace("'", '"'))
-                for item in nested_data:
-                    flat = flatten_dict(item)
-                    dyn_keys.update(flat.keys())
-            except Exception:
-                continue
-        dynamic_columns[key] = {
-            "title": title,
-            "keys": [k for k in mappings if k in dyn_keys],
-            "display_names": mappings,
-        }
+@lru_cache(maxsize=1024)
+def clean_markup(text):
+    """
+    Clean the rendered markup of a cell:
+    - If it's a <select> element, extract the selected option's value.
+    - If it's an <input> or <textarea>, extract its 'value'.
+    - Otherwise, remove the tags and keep the text of the <li> tags on their
+      own lines.
+    """
+    soup = BeautifulSoup(text, "html.parser")
 
-    # Create workbook
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Quick Export"
+    select_tag = soup.find("select")
+    if select_tag:
+        selected_option = select_tag.find("option", selected=True)
+        if selected_option:
+            return selected_option["value"]
+        first_option = select_tag.find("option")
+        return first_option["value"] if first_option else ""
 
-    # Header row
-    header = top_fields[:]
-    for nested_info in dynamic_columns.values():
-        for dyn_key in nested_info["keys"]:
-            display_name = nested_info["display_names"].get(dyn_key, dyn_key)
-            header.append(display_name)
-    ws.append(list(str(title) for title in header))
+    input_tag = soup.find("input")
+    if input_tag:
+        return input_tag.get("value", "")
 
-    # Style definitions
-    header_fill = PatternFill(
-        start_color="FFD700", end_color="FFD700", fill_type="solid"
+    textarea_tag = soup.find("textarea")
+    if textarea_tag:
+        return textarea_tag.text.strip()
+
+    for li in soup.find_all("li"):
+        li.insert_before("\n")
+        li.unwrap()
+    return clean_text(soup.get_text())
+
+
+def clean_text(text):
+    """
+    Remove the blank lines and the spaces around each line
+    """
+    return "\n".join(line.strip() for line in text.splitlines() if line.strip())
+
+
+def export_cell(value, markup=False):
+    """
+    Text of an exported cell, without blank lines and surrounding spaces. The
+    markup is only parsed for the columns that can render it.
+    """
+    text = str(value)
+    if markup and ("<" in text or "&" in text):
+        return clean_markup(text)
+    return clean_text(text)
+
+
+def export_rows(queryset, columns, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield the exported rows of the queryset, the text of each (verbose name,
+    field path) column. The records are streamed in chunks with the relations
+    of the columns loaded along.
+    """
+    field_paths = [column[1] for column in columns]
+    select_related, prefetch_related, markup_columns = export_lookups(
+        queryset.model, field_paths
     )
-    bold_font = Font(bold=True)
-    thin_border = Border(
-        left=Side(style="thin"),
-        right=Side(style="thin"),
-        top=Side(style="thin"),
-        bottom=Side(style="thin"),
+    if select_related:
+        queryset = queryset.select_related(*select_related)
+    if prefetch_related:
+        queryset = queryset.prefetch_related(*prefetch_related)
+    markup = [field_path in markup_columns for field_path in field_paths]
+    for instance in queryset.iterator(chunk_size=chunk_size):
+        yield [
+            export_cell(getattribute(instance, field_path), is_markup)
+            for field_path, is_markup in zip(field_paths, markup)
+        ]
+
+
+class Echo:
+    """
+    Pseudo buffer returning the written value, used to stream the csv rows
+    """
+
+    def write(self, value):
+        return value
+
+
+def export_csv(headers, rows, file_name="quick_export"):
+    """
+    Stream the rows as csv
+    """
+    writer = csv.writer(Echo())
+    response = StreamingHttpResponse(
+        chain([writer.writerow(headers)], (writer.writerow(row) for row in rows)),
+        content_type="text/csv",
     )
+    response["Content-Disposition"] = f'attachment; filename="{file_name}.csv"'
+    return response
 
-    # Apply styles to header
-    for col_idx, title in enumerate(header, 1):
-        cell = ws.cell(row=1, column=col_idx)
-        cell.font = bold_font
-        cell.fill = header_fill
-        cell.border = thin_border
-        cell.alignment = Alignment(horizontal="center", vertical="center")
 
-    row_index = 2
+def export_json(headers, rows, file_name="quick_export"):
+    """
+    Stream the rows as a json list of objects keyed by the headers
+    """
 
-    for entry in json_data:
-        all_nested_records = []
-        max_nested_rows = 1
+    def content():
+        separator = "[\n"
+        for row in rows:
+            yield separator + textwrap.indent(
+                json.dumps(dict(zip(headers, row)), indent=4), "    "
+            )
+            separator = ",\n"
+        yield "[]" if separator == "[\n" else "\n]"
 
-        for key, nested_info in dynamic_columns.items():
-            try:
-                nested_data = json.loads(entry.get(key, "[]").replace("'", '"'))
-                if not isinstance(nested_data, list):
-                    nested_data = []
-            except Exception:
-                nested_data = []
-            all_nested_records.append(nested_data)
-            max_nested_rows = max(max_nested_rows, len(nested_data))
+    response = StreamingHttpResponse(content(), content_type="application/json")
+    response["Content-Disposition"] = f'attachment; filename="{file_name}.json"'
+    return response
+
+
+def nested_cell(value):
+    """
+    List of the records of a nested column cell
+    """
+    try:
+        nested_data = json.loads(str(value).replace("'", '"'))
+    except Exception:
+        return []
+    return nested_data if isinstance(nested_data, list) else []
 
-        for i in range(max_nested_rows):
-            row = []
 
-            # Top fields
-            for tf in top_fields:
-                row.append(entry.get(tf, "") if i == 0 else "")
+def export_xlsx(rows, columns, file_name="quick_export"):
+    """
+    Quick export method. The rows hold the value of each column. A column can be (title, field path), or (title, field path,
+    {key: display name}) when its cells hold a list of records that are
+    written on one line each.
 
-            # Nested fields
-            for idx, (key, nested_info) in enumerate(dynamic_columns.items()):
-                nested_data = all_nested_records[idx]
-                flat_ans = flatten_dict(nested_data[i]) if i < len(nested_data) else {}
-                for dyn_key in nested_info["keys"]:
-                    row.append(flat_ans.get(dyn_key, ""))
+    The workbook is written by XlsxWriter into a temporary file that is
+    streamed to the client. Without nested columns the rows are flushed one by
+    one in constant memory mode.
+    """
+    top_indexes = [index for index, col in enumerate(columns) if len(col) == 2]
+    nested_indexes = [
+        index
+        for index, col in enumerate(columns)
+        if len(col) == 3 and isinstance(col[2], dict)
+    ]
 
-            ws.append(row)
+    # Discover dynamic keys for each nested column
+    dynamic_keys = {}
+    if nested_indexes:
+        rows = list(rows)
+        for index in nested_indexes:
+            dyn_keys = set()
+            for row in rows:
+                for item in nested_cell(row[index]):
+                    if isinstance(item, dict):
+                        dyn_keys.update(flatten_dict(item).keys())
+            dynamic_keys[index] = [key for key in columns[index][2] if key in dyn_keys]
+
+    output = tempfile.TemporaryFile()
+    workbook = xlsxwriter.Workbook(output, {"constant_memory": not nested_indexes})
+    worksheet = workbook.add_worksheet("Quick Export")
+    header_format = workbook.add_format(
+        {
+            "bold": True,
+            "bg_color": "#FFD700",
+            "border": 1,
+            "align": "center",
+            "valign": "vcenter",
+        }
+    )
+    cell_format = workbook.add_format({"border": 1})
+    merged_format = workbook.add_format({"border": 1, "valign": "vcenter"})
 
-            # Apply border to row
-            for col_idx in range(1, len(row) + 1):
-                cell = ws.cell(row=row_index, column=col_idx)
-                cell.border = thin_border
+    # Header row
+    header = [str(columns[index][0]) for index in top_indexes]
+    for index, keys in dynamic_keys.items():
+        header += [str(columns[index][2].get(key, key)) for key in keys]
+    worksheet.write_row(0, 0, header, header_format)
+    widths = [len(title) for title in header]
+
+    row_index = 1
+    for row in rows:
+        top_values = [row[index] for index in top_indexes]
+        nested_records = [
+            [item for item in nested_cell(row[index]) if isinstance(item, dict)]
+            for index in dynamic_keys
+        ]
+        nested_rows = max([1] + [len(records) for records in nested_records])
 
-            row_index += 1
+        for i in range(nested_rows):
+            values = top_values if i == 0 else [""] * len(top_values)
+            for records, keys in zip(nested_records, dynamic_keys.values()):
+                flat = flatten_dict(records[i]) if i < len(records) else {}
+                values = values + [flat.get(key, "") for key in keys]
+            worksheet.write_row(row_index + i, 0, values, cell_format)
+            for col_index, value in enumerate(values):
+                widths[col_index] = max(widths[col_index], len(str(value or "")))
 
         # Merge top fields if needed
-        if max_nested_rows > 1:
-            for col_idx in range(1, len(top_fields) + 1):
-                ws.merge_cells(
-                    start_row=row_index - max_nested_rows,
-                    start_column=col_idx,
-                    end_row=row_index - 1,
-                    end_column=col_idx,
+        if nested_rows > 1:
+            for col_index, value in enumerate(top_values):
+                worksheet.merge_range(
+                    row_index,
+                    col_index,
+                    row_index + nested_rows - 1,
+                    col_index,
+                    value,
+                    merged_format,
                 )
-                top_cell = ws.cell(row=row_index - max_nested_rows, column=col_idx)
-                top_cell.alignment = Alignment(vertical="center")
-                top_cell.border = thin_border  # Re-apply border
+        row_index += nested_rows
 
     # Auto-fit column widths
-    for col in ws.columns:
-        max_len = max(len(str(cell.value or "")) for cell in col)
-        col_letter = get_column_letter(col[0].column)
-        ws.column_dimensions[col_letter].width = min(max_len + 2, 50)
-
-    # Output file
-    output = BytesIO()
-    wb.save(output)
-    output.seek(0)
+    for col_index, width in enumerate(widths):
+        worksheet.set_column(col_index, col_index, min(width + 2, 50))
 
-    response = HttpResponse(
-        output.read(),
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    workbook.close()
+    output.seek(0)
+    return FileResponse(
+        output,
+        as_attachment=True,
+        filename=f"{file_name}.xlsx",
+        content_type=XLSX_CONTENT_TYPE,
     )
-    response["Content-Disposition"] = f'attachment; filename="{file_name}.xlsx"'
-    return response
 
 
 from django.apps import apps
@@ -10,14 +10,13 @@ from typing import Any
 from urllib.parse import parse_qs, urlencode
 
 import pandas as pd
-from bs4 import BeautifulSoup
 from django import forms
 from django.contrib import messages
 from django.core.cache import cache as CACHE
 from django.core.exceptions import FieldDoesNotExist
 from django.core.paginator import Page
 from django.db import transaction
-from django.db.models import CharField, F
+from django.db.models import CharField, F, QuerySet
 from django.db.models.functions import Cast
 from django.http import HttpRequest, HttpResponse, JsonResponse, QueryDict
 from django.shortcuts import render
@@ -37,6 +36,9 @@ from horilla.signals import post_generic_import, pre_generic_import
 from horilla_views import models
 from horilla_views.cbv_methods import (  # update_initial_cache,
     assign_related,
+    export_csv,
+    export_json,
+    export_rows,
     export_xlsx,
     generate_import_excel,
     get_short_uuid,
@@ -1140,8 +1142,10 @@ class HorillaListView(ListView):
 
         ordered_ids = []
         if not self._saved_filters.get("field"):
-            for instance in queryset:
-                ordered_ids.append(instance.pk)
+            if isinstance(queryset, QuerySet):
+                ordered_ids = list(queryset.values_list("id", flat=True))
+            else:
+                ordered_ids = [instance.pk for instance in queryset]
         self.request.session[self.ordered_ids_key] = ordered_ids
         context["queryset"] = paginator_qry(
             queryset, self._saved_filters.get("page"), self.records_per_page
@@ -1233,164 +1237,29 @@ class HorillaListView(ListView):
         """
         Export list view visible columns
         """
-        from import_export import fields, resources
-
         request = getattr(_thread_locals, "request", None)
         ids = eval_validate(request.POST["ids"])
         _columns = eval_validate(request.POST["columns"])
         export_format = request.POST.get("format", "xlsx")
         queryset = self.model.objects.filter(id__in=ids)
 
-        _model = self.model
-
-        class HorillaListViewResorce(resources.ModelResource):
-            """
-            Instant Resource class
-            """
-
-            id = fields.Field(column_name="ID")
-
-            class Meta:
-                """
-                Meta class for additional option
-                """
-
-                model = _model
-                fields = [field[1] for field in _columns]  # 773
-
-            def dehydrate_id(self, instance):
-                """
-                Dehydrate method for id field
-                """
-                return instance.pk
-
-            for field_tuple in _columns:
-                dynamic_fn_str = f"def dehydrate_{field_tuple[1]}(self, instance):return self.remove_extra_spaces(getattribute(instance, '{field_tuple[1]}'),{field_tuple})"
-                exec(dynamic_fn_str)
-                dynamic_fn = locals()[f"dehydrate_{field_tuple[1]}"]
-                locals()[field_tuple[1]] = fields.Field(column_name=field_tuple[0])
-
-            def remove_extra_spaces(self, text, field_tuple):
-                """
-                Clean the text:
-                - If it's a <select> element, extract the selected option's value.
-                - If it's an <input> or <textarea>, extract its 'value'.
-                - Otherwise, remove blank spaces, keep line breaks, and handle <li> tags.
-                """
-                soup = BeautifulSoup(str(text), "html.parser")
-
-                # Handle <select> tag
-                select_tag = soup.find("select")
-                if select_tag:
-                    selected_option = select_tag.find("option", selected=True)
-                    if selected_option:
-                        return selected_option["value"]
-                    else:
-                        first_option = select_tag.find("option")
-                        return first_option["value"] if first_option else ""
-
-                # Handle <input> tag
-                input_tag = soup.find("input")
-                if input_tag:
-                    return input_tag.get("value", "")
-
-                # Handle <textarea> tag
-                textarea_tag = soup.find("textarea")
-                if textarea_tag:
-                    return textarea_tag.text.strip()
-
-                # Default: clean normal text and <li> handling
-                for li in soup.find_all("li"):
-                    li.insert_before("\n")
-                    li.unwrap()
-
-                text = soup.get_text()
-                lines = text.splitlines()
-                non_blank_lines = [line.strip() for line in lines if line.strip()]
-                cleaned_text = "\n".join(non_blank_lines)
-                return cleaned_text
-
-        book_resource = HorillaListViewResorce()
-
-        # Export the data using the resource
-        dataset = book_resource.export(queryset)
-
-        # excel_data = dataset.export("xls")
-
-        # Set the response headers
-        # file_name = self.export_file_name
-        # if not file_name:
-        #     file_name = "quick_export"
-        # response = HttpResponse(excel_data, content_type="application/vnd.ms-excel")
-        # response["Content-Disposition"] = f'attachment; filename="{file_name}.xls"'
-        # return response
-        json_data = json.loads(dataset.export("json"))
-        merged = []
-
-        for item in _columns:
-            # Check if item has exactly 2 elements
-            if len(item) == 2:
-                # Check if there's a matching (type, key) in export_fields (t, k, _)
-                match_found = any(
-                    export_item[0] == item[0] and export_item[1] == item[1]
-                    for export_item in self.export_fields
-                )
-
-                if match_found:
-                    # Find the first matching metadata or use {} as fallback
-                    try:
-                        metadata = next(
-                            (
-                                export_item[2]
-                                for export_item in self.export_fields
-                                if export_item[0] == item[0]
-                                and export_item[1] == item[1]
-                            ),
-                            {},
-                        )
-                    except Exception as e:
-                        merged.append(item)
-                        continue
-
-                    merged.append([*item, metadata])
-                else:
-                    merged.append(item)
-            else:
-                merged.append(item)
-        columns = []
-        for column in merged:
-            if len(column) >= 3 and isinstance(column[2], dict):
-                column = (column[0], column[0], column[2])
-            elif len(column) >= 3:
-                column = (column[0], column[1])
-            columns.append(column)
+        headers = [field[0] for field in _columns]
+        rows = export_rows(queryset, _columns)
 
         if export_format == "json":
-            response = HttpResponse(
-                json.dumps(json_data, indent=4), content_type="application/json"
-            )
-            response["Content-Disposition"] = (
-                f'attachment; filename="{self.export_file_name}.json"'
-            )
-            return response
+            return export_json(headers, rows, file_name=self.export_file_name)
         # CSV
         elif export_format == "csv":
-            csv_data = dataset.export("csv")
-            response = HttpResponse(csv_data, content_type="text/csv")
-            response["Content-Disposition"] = (
-                f'attachment; filename="{self.export_file_name}.csv"'
-            )
-            return response
+            return export_csv(headers, rows, file_name=self.export_file_name)
         elif export_format == "pdf":
 
-            headers = dataset.headers
-            rows = dataset.dict
+            rows = [dict(zip(headers, row)) for row in rows]
 
-            # Render to HTML using a template
+            # Render to HTML using a template, it skips the first (ID) header
             html_string = render_to_string(
                 "generic/export_pdf.html",
                 {
-                    "headers": headers,
+                    "headers": ["ID"] + headers,
                     "rows": rows,
                 },
             )
@@ -1408,7 +1277,26 @@ class HorillaListView(ListView):
                 f'attachment; filename="{self.export_file_name}.pdf"'
             )
             return response
-        return export_xlsx(json_data, columns, file_name=self.export_file_name)
+
+        columns = []
+        for item in _columns:
+            # Nested columns take their {key: display name} mapping from the
+            # matching (title, key, mapping) of export_fields
+            metadata = next(
+                (
+                    export_item[2]
+                    for export_item in self.export_fields
+                    if len(export_item) >= 3
+                    and export_item[0] == item[0]
+                    and export_item[1] == item[1]
+                ),
+                None,
+            )
+            if isinstance(metadata, dict):
+                columns.append((item[0], item[1], metadata))
+            else:
+                columns.append((item[0], item[1]))
+        return export_xlsx(rows, columns, file_name=self.export_file_name)
 
 
 class HorillaSectionView(TemplateView):
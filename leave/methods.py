@@ -1,5 +1,4 @@
-import calendar
-from datetime import date, datetime, timedelta
+from datetime import date, datetime
 
 import pandas as pd
 from django.apps import apps
@@ -29,58 +28,6 @@ def calculate_requested_days(
     return middle_days + start_day_value + end_day_value
 
 
-def holiday_dates_list(holidays):
-    """
-    :return: This function returns a list of all holiday dates.
-    """
-    holiday_dates = []
-    for holiday in holidays:
-        holiday_start_date = holiday.start_date
-        holiday_end_date = holiday.end_date or holiday_start_date
-        holiday_dates.extend(
-            holiday_start_date + timedelta(i)
-            for i in range((holiday_end_date - holiday_start_date).days + 1)
-        )
-    return holiday_dates
-
-
-def company_leave_dates_list(company_leaves, start_date):
-    """
-    :return: This function returns a list of all company leave dates
-    """
-    company_leave_dates = set()
-    year = start_date.year
-    for company_leave in company_leaves:
-        based_on_week = company_leave.based_on_week
-        based_on_week_day = company_leave.based_on_week_day
-
-        for month in range(1, 13):
-            month_calendar = calendar.monthcalendar(year, month)
-
-            if based_on_week is not None:
-                # Set Sunday as the first day of the week
-                calendar.setfirstweekday(6)
-                try:
-                    week_days = [
-                        day for day in month_calendar[int(based_on_week)] if day != 0
-                    ]
-                    for day in week_days:
-                        date = datetime(year, month, day)
-                        if date.weekday() == int(based_on_week_day):
-                            company_leave_dates.add(date.date())
-                except IndexError:
-                    pass
-            else:
-                # Set Monday as the first day of the week
-                calendar.setfirstweekday(0)
-                for week in month_calendar:
-                    if week[int(based_on_week_day)] != 0:
-                        date = datetime(year, month, week[int(based_on_week_day)])
-                        company_leave_dates.add(date.date())
-
-    return list(company_leave_dates)
-
-
 def get_leave_day_attendance(employee, comp_id=None):
     """
     This function returns a queryset of attendance on leave dates
@@ -197,3 +144,154 @@ def parse_excel_date(value):
 
     # If nothing matches, return None (caller should handle error)
     return None
+
+
+CLASH_WORK_INFO = "employee_id__employee_work_info__"
+CLASH_EXCLUDED_STATUS = ["cancelled", "rejected"]
+LEAVE_CLASH_VALUES = {
+    "id": "id",
+    "status": "status",
+    "start_date": "start_date",
+    "end_date": "end_date",
+    "leave_clashes_count": "leave_clashes_count",
+    "work_info_id": f"{CLASH_WORK_INFO}id",
+    "department_id": f"{CLASH_WORK_INFO}department_id",
+    "job_position_id": f"{CLASH_WORK_INFO}job_position_id",
+    "company_id": f"{CLASH_WORK_INFO}company_id",
+}
+
+
+def leave_clash_rows(queryset):
+    """
+    Return the leave requests of the queryset as dicts holding the values the
+    clash count depends on, keyed by the names of LEAVE_CLASH_VALUES.
+    """
+    paths = list(LEAVE_CLASH_VALUES.values())
+    return [
+        dict(zip(LEAVE_CLASH_VALUES, values)) for values in queryset.values_list(*paths)
+    ]
+
+
+def leave_clash_state(employee_id, start_date, end_date):
+    """
+    Return the (department, job position, company, start, end) clash state of a
+    leave request range for the employee, the work info values being None when
+    the employee has no work information.
+    """
+    from employee.models import EmployeeWorkInformation
+
+    work_info = (
+        EmployeeWorkInformation.objects.filter(employee_id=employee_id)
+        .values_list("department_id", "job_position_id", "company_id")
+        .first()
+    ) or (None, None, None)
+    return (*work_info, start_date, end_date)
+
+
+def clashing_leave_requests_filter(state):
+    """
+    Return the Q matching the leave requests that clash with the given state,
+    the same condition LeaveRequest.count_leave_clashes counts.
+    """
+    department_id, job_position_id, company_id, start_date, end_date = state
+    return (
+        (
+            Q(**{f"{CLASH_WORK_INFO}department_id": department_id})
+            | Q(**{f"{CLASH_WORK_INFO}job_position_id": job_position_id})
+        )
+        & Q(**{f"{CLASH_WORK_INFO}company_id": company_id})
+        & Q(start_date__lte=end_date, end_date__gte=start_date)
+    )
+
+
+def compute_leave_clash_counts(rows):
+    """
+    Compute the leave clashes count of the given leave_clash_rows with a single
+    query, by indexing the overlapping leave requests per (company, department)
+    and (company, job position).
+    """
+    from leave.models import LeaveRequest
+
+    counts = {row["id"]: 0 for row in rows}
+    rows = [
+        row
+        for row in rows
+        if row["start_date"]
+        and row["end_date"]
+        and row["work_info_id"] is not None
+        and row["status"] not in CLASH_EXCLUDED_STATUS
+    ]
+    if not rows:
+        return counts
+    pool = leave_clash_rows(
+        LeaveRequest.objects.exclude(status__in=CLASH_EXCLUDED_STATUS).filter(
+            start_date__lte=max(row["end_date"] for row in rows),
+            end_date__gte=min(row["start_date"] for row in rows),
+        )
+    )
+    by_department = {}
+    by_job_position = {}
+    for leave in pool:
+        interval = (leave["id"], leave["start_date"], leave["end_date"])
+        by_department.setdefault(
+            (leave["company_id"], leave["department_id"]), []
+        ).append(interval)
+        by_job_position.setdefault(
+            (leave["company_id"], leave["job_position_id"]), []
+        ).append(interval)
+
+    for row in rows:
+        candidates = by_department.get(
+            (row["company_id"], row["department_id"]), []
+        ) + by_job_position.get((row["company_id"], row["job_position_id"]), [])
+        counts[row["id"]] = len(
+            {
+                leave_id
+                for leave_id, start_date, end_date in candidates
+                if leave_id != row["id"]
+                and start_date <= row["end_date"]
+                and end_date >= row["start_date"]
+            }
+        )
+    return counts
+
+
+def update_leave_clashes(leave_request, previous_states=()):
+    """
+    Recompute the leave clashes count of the leave requests whose range clashes
+    with the current or previous states of the given leave request, and write
+    the changed counts with a single bulk update.
+    """
+    from leave.models import LeaveRequest
+
+    states = list(previous_states)
+    if leave_request.start_date and leave_request.end_date:
+        states.append(
+            leave_clash_state(
+                leave_request.employee_id_id,
+                leave_request.start_date,
+                leave_request.end_date,
+            )
+        )
+    states = [state for state in set(states) if state[3] and state[4]]
+    if not states:
+        return []
+
+    clash_filter = Q()
+    for state in states:
+        clash_filter |= clashing_leave_requests_filter(state)
+    affected = leave_clash_rows(
+        LeaveRequest.objects.exclude(id=leave_request.id)
+        .exclude(status__in=CLASH_EXCLUDED_STATUS)
+        .filter(clash_filter)
+    )
+    counts = compute_leave_clash_counts(affected)
+    leave_requests_to_update = [
+        LeaveRequest(id=row["id"], leave_clashes_count=counts[row["id"]])
+        for row in affected
+        if counts[row["id"]] != row["leave_clashes_count"]
+    ]
+    LeaveRequest.objects.bulk_update(
+        leave_requests_to_update, ["leave_clashes_count"], batch_size=500
+    )
+    return leave_requests_to_update
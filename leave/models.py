@@ -24,6 +24,7 @@ from base.models import (
     MultipleApprovalCondition,
     clear_messages,
 )
+from base.working_calendar import non_working_days
 from employee.models import Employee, EmployeeWorkInformation
 from horilla import horilla_middlewares
 from horilla.models import HorillaModel, upload_path
@@ -31,8 +32,8 @@ from horilla_audit.methods import get_diff
 from horilla_audit.models import HorillaAuditInfo, HorillaAuditLog
 from leave.methods import (
     calculate_requested_days,
-    company_leave_dates_list,
-    holiday_dates_list,
+    leave_clash_state,
+    update_leave_clashes,
 )
 
 logger = logging.getLogger(__name__)
@@ -416,10 +417,13 @@ class AvailableLeave(HorillaModel):
         default=timezone.now, verbose_name=_("Assigned Date")
     )
     reset_date = models.DateField(
-        blank=True, null=True, verbose_name=_("Leave Reset Date")
+        blank=True, null=True, db_index=True, verbose_name=_("Leave Reset Date")
     )
     expired_date = models.DateField(
-        blank=True, null=True, verbose_name=_("CarryForward Expired Date")
+        blank=True,
+        null=True,
+        db_index=True,
+        verbose_name=_("CarryForward Expired Date"),
     )
     objects = HorillaCompanyManager(
         related_company_field="employee_id__employee_work_info__company_id"
@@ -617,10 +621,9 @@ def cal_effective_requested_days(start_date, end_date, leave_type_id, requested_
     holidays and company leave days.
     """
     requested_dates = leave_requested_dates(start_date, end_date)
-    holidays = set(holiday_dates_list(Holidays.objects.all()))
-    company_leave_dates = set(
-        company_leave_dates_list(CompanyLeaves.objects.all(), start_date)
-    )
+    end_date = end_date or start_date
+    holidays = set(non_working_days(start_date, end_date, company_leaves=False))
+    company_leave_dates = set(non_working_days(start_date, end_date, holidays=False))
 
     if (
         leave_type_id.exclude_company_leave == "yes"
@@ -765,67 +768,19 @@ class LeaveRequest(HorillaModel):
 
     def holiday_dates(self):
         """
-        :return: this functions returns a list of all holiday dates.
+        :return: this functions returns a list of the holiday dates of the request.
         """
-        holiday_dates = []
-        holidays = Holidays.objects.all()
-        for holiday in holidays:
-            holiday_start_date = holiday.start_date
-            holiday_end_date = holiday.end_date
-            if holiday_end_date is None:
-                holiday_end_date = holiday_start_date
-            holiday_days = holiday_end_date - holiday_start_date
-            for i in range(holiday_days.days + 1):
-                date = holiday_start_date + timedelta(i)
-                holiday_dates.append(date)
-        return holiday_dates
+        return non_working_days(
+            self.start_date, self.end_date or self.start_date, company_leaves=False
+        )
 
     def company_leave_dates(self):
         """
-        :return: This function returns a list of all company leave dates"""
-        from datetime import date
-
-        company_leaves = CompanyLeaves.objects.all()
-        company_leave_dates = []
-        for company_leave in company_leaves:
-            if self:
-                year = self.start_date.year
-            else:
-                year = date.today().year
-            based_on_week = company_leave.based_on_week
-            based_on_week_day = company_leave.based_on_week_day
-            for month in range(1, 13):
-                if based_on_week != None:
-                    # Set Sunday as the first day of the week
-                    calendar.setfirstweekday(6)
-                    month_calendar = calendar.monthcalendar(year, month)
-                    try:
-                        weeks = month_calendar[int(based_on_week)]
-                        weekdays_in_weeks = [day for day in weeks if day != 0]
-                        for day in weekdays_in_weeks:
-                            date = datetime.strptime(
-                                f"{year}-{month:02}-{day:02}", "%Y-%m-%d"
-                            ).date()
-                            if (
-                                date.weekday() == int(based_on_week_day)
-                                and date not in company_leave_dates
-                            ):
-                                company_leave_dates.append(date)
-                    except IndexError:
-                        pass
-                else:
-                    # Set Monday as the first day of the week
-                    calendar.setfirstweekday(0)
-                    month_calendar = calendar.monthcalendar(year, month)
-                    for week in month_calendar:
-                        if week[int(based_on_week_day)] != 0:
-                            date = datetime.strptime(
-                                f"{year}-{month:02}-{week[int(based_on_week_day)]:02}",
-                                "%Y-%m-%d",
-                            ).date()
-                            if date not in company_leave_dates:
-                                company_leave_dates.append(date)
-        return company_leave_dates
+        :return: This function returns a list of the company leave dates of the request
+        """
+        return non_working_days(
+            self.start_date, self.end_date or self.start_date, holidays=False
+        )
 
     def leaveoverlapping(self):
         """
@@ -873,9 +828,24 @@ class LeaveRequest(HorillaModel):
         else:
             self.leave_clashes_count = self.count_leave_clashes()
 
+        previous_states = []
+        if self.pk:
+            previous = (
+                LeaveRequest.objects.entire()
+                .filter(pk=self.pk)
+                .values_list("employee_id", "start_date", "end_date")
+                .first()
+            )
+            if previous and previous != (
+                self.employee_id_id,
+                self.start_date,
+                self.end_date,
+            ):
+                previous_states.append(leave_clash_state(*previous))
+
         super().save(*args, **kwargs)
 
-        self.update_leave_clashes_count()
+        self.update_leave_clashes_count(previous_states)
         work_info = EmployeeWorkInformation.objects.filter(employee_id=self.employee_id)
         department_id = None
         conditions = None
@@ -1167,21 +1137,13 @@ class LeaveRequest(HorillaModel):
                     _("The {} leave request cannot be deleted !").format(self.status),
                 )
 
-    def update_leave_clashes_count(self):
+    def update_leave_clashes_count(self, previous_states=()):
         """
-        Update the leave clashes count for all leave requests.
+        Update the leave clashes count of the leave requests overlapping the
+        current or previous (employee, start date, end date) states of this
+        leave request.
         """
-        leave_requests_to_update = LeaveRequest.objects.exclude(
-            Q(id=self.id) | Q(status="cancelled") | Q(status="rejected")
-        )
-
-        for leave_request in leave_requests_to_update:
-            leave_request.leave_clashes_count = leave_request.count_leave_clashes()
-
-        # Bulk update leave clashes count for all leave requests
-        LeaveRequest.objects.bulk_update(
-            leave_requests_to_update, ["leave_clashes_count"]
-        )
+        return update_leave_clashes(self, previous_states)
 
     def count_leave_clashes(self):
         """
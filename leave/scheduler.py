@@ -1,59 +1,145 @@
 import calendar
 import datetime as dt
-import sys
+import logging
 from datetime import datetime, timedelta
 
 from apscheduler.schedulers.background import BackgroundScheduler
 from dateutil.relativedelta import relativedelta
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
 
+from horilla.horilla_settings import schedulers_enabled
 
-def leave_reset():
-    from leave.models import LeaveType
+logger = logging.getLogger(__name__)
 
-    today = datetime.now()
-    today_date = today.date()
-    leave_types = LeaveType.objects.filter(reset=True)
-    # Looping through filtered leave types with reset is true
-    for leave_type in leave_types:
-        # Looping through all available leaves
-        available_leaves = leave_type.employee_available_leave.all()
+# Number of past days whose missed resets are applied when the server starts
+LEAVE_RESET_CATCH_UP_DAYS = 7
+AVAILABLE_LEAVE_RESET_FIELDS = [
+    "available_days",
+    "carryforward_days",
+    "total_leave_days",
+    "reset_date",
+    "expired_date",
+]
 
+
+def leave_reset(today=None, catch_up_days=0):
+    """
+    Reset the available leaves whose reset date is today and expire the carry
+    forward days whose expiry date has passed.
+    Only the due AvailableLeave rows are selected and they are written back with
+    a single bulk update. A run is applied at most once per day, a failed run
+    is retried by the next one, and ``catch_up_days`` also applies the resets
+    missed on the previous days.
+    """
+    today_date = today or datetime.now().date()
+    run_key = f"leave_reset_{today_date.isoformat()}_{catch_up_days}"
+    if not cache.add(run_key, True, timeout=60 * 60 * 24):
+        return 0
+
+    try:
+        reset_count, expired_count = reset_available_leaves(
+            today_date, catch_up_days
+        )
+    except Exception:
+        # release the day so that the next run retries the reset
+        cache.delete(run_key)
+        raise
+
+    logger.info(
+        f"Leave reset for {today_date}: {reset_count} available leaves reset, "
+        f"{expired_count} carry forwards expired"
+    )
+    return reset_count + expired_count
+
+
+def reset_available_leaves(today_date, catch_up_days):
+    """
+    Apply the resets and the carry forward expiries due on the days up to
+    today in one transaction. Returns the number of resets and of expiries.
+    """
+    from simple_history.utils import bulk_update_with_history
+
+    from leave.models import AvailableLeave, LeaveType
+
+    reset_from = today_date - timedelta(days=catch_up_days)
+    with transaction.atomic():
+        available_leaves = (
+            AvailableLeave.objects.entire()
+            .select_for_update()
+            .filter(leave_type_id__reset=True)
+            .filter(
+                Q(reset_date__range=(reset_from, today_date))
+                | Q(expired_date__lte=today_date)
+            )
+            .select_related("leave_type_id")
+        )
+        reset_count = expired_count = 0
+        leaves_to_update = []
         for available_leave in available_leaves:
             reset_date = available_leave.reset_date
             expired_date = available_leave.expired_date
-            if reset_date == today_date:
+            if reset_date and reset_from <= reset_date <= today_date:
                 available_leave.update_carryforward()
-                # new_reset_date = available_leave.set_reset_date(assigned_date=today_date,available_leave = available_leave)
                 new_reset_date = available_leave.set_reset_date(
                     assigned_date=today_date, available_leave=available_leave
                 )
+                if new_reset_date <= today_date:
+                    new_reset_date = available_leave.set_reset_date(
+                        assigned_date=today_date + timedelta(days=1),
+                        available_leave=available_leave,
+                    )
                 available_leave.reset_date = new_reset_date
-                available_leave.save()
+                available_leave.pre_save_processing()
+                reset_count += 1
             if expired_date and expired_date <= today_date:
                 new_expired_date = available_leave.set_expired_date(
                     available_leave=available_leave, assigned_date=today_date
                 )
                 available_leave.expired_date = new_expired_date
-                available_leave.save()
+                available_leave.pre_save_processing()
+                expired_count += 1
+            leaves_to_update.append(available_leave)
+
+        bulk_update_with_history(
+            leaves_to_update,
+            AvailableLeave,
+            AVAILABLE_LEAVE_RESET_FIELDS,
+            batch_size=500,
+        )
 
-        if (
-            leave_type.carryforward_expire_date
-            and leave_type.carryforward_expire_date <= today_date
+        for leave_type in LeaveType.objects.filter(
+            reset=True, carryforward_expire_date__lte=today_date
         ):
-            leave_type.carryforward_expire_date = leave_type.set_expired_date(
-                today_date
+            LeaveType.objects.filter(id=leave_type.id).update(
+                carryforward_expire_date=leave_type.set_expired_date(today_date)
             )
-            leave_type.save()
+    return reset_count, expired_count
 
 
-if not any(
-    cmd in sys.argv
-    for cmd in ["makemigrations", "migrate", "compilemessages", "flush", "shell"]
-):
+if schedulers_enabled():
     """
     Initializes and starts background tasks using APScheduler when the server is running.
     """
     scheduler = BackgroundScheduler()
-    scheduler.add_job(leave_reset, "interval", seconds=20)
+    scheduler.add_job(
+        leave_reset,
+        "date",
+        run_date=datetime.now() + timedelta(seconds=30),
+        kwargs={"catch_up_days": LEAVE_RESET_CATCH_UP_DAYS},
+        id="leave_reset_catch_up",
+    )
+    # hourly, so that a failed reset is retried, the runs after the first
+    # successful one of the day return at once
+    scheduler.add_job(
+        leave_reset,
+        "cron",
+        minute=5,
+        misfire_grace_time=3600,
+        kwargs={"catch_up_days": 1},
+        id="leave_reset",
+        replace_existing=True,
+    )
 
     scheduler.start()
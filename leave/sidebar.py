@@ -11,6 +11,12 @@ from leave.templatetags.leavefilters import is_compensatory
 
 MENU = trans("Leave")
 IMG_SRC = "images/ui/leave.svg"
+# models the accessibility of the menu depends on
+MENU_DEPENDENCIES = [
+    "employee.EmployeeWorkInformation",
+    "base.MultipleApprovalManagers",
+    "leave.LeaveGeneralSetting",
+]
 
 SUBMENUS = [
     {
@@ -3,11 +3,9 @@
 import threading
 
 from django.apps import apps
-from django.db.models.signals import post_migrate, post_save, pre_delete, pre_save
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_save
 from django.dispatch import receiver
-from django.utils.translation import gettext_lazy as _
 
-from horilla.methods import get_horilla_model_class
 from leave.models import LeaveRequest
 
 if apps.is_installed("attendance"):
@@ -17,9 +15,6 @@ if apps.is_installed("attendance"):
         """
         Overriding LeaveRequest model save method
         """
-        WorkRecords = get_horilla_model_class(
-            app_label="attendance", model="workrecords"
-        )
         if (
             instance.start_date == instance.end_date
             and instance.end_date_breakdown != instance.start_date_breakdown
@@ -27,65 +22,29 @@ if apps.is_installed("attendance"):
             instance.end_date_breakdown = instance.start_date_breakdown
             super(LeaveRequest, instance).save()
 
-        period_dates = instance.requested_dates()
-        if instance.status == "approved":
-            for date in period_dates:
-                try:
-                    work_entry = (
-                        WorkRecords.objects.filter(
-                            date=date,
-                            employee_id=instance.employee_id,
-                        ).first()
-                        if WorkRecords.objects.filter(
-                            date=date,
-                            employee_id=instance.employee_id,
-                        ).exists()
-                        else WorkRecords()
-                    )
-                    work_entry.employee_id = instance.employee_id
-                    work_entry.is_leave_record = True
-                    work_entry.leave_request_id = instance
-                    work_entry.day_percentage = (
-                        0.50
-                        if instance.start_date == date
-                        and instance.start_date_breakdown == "first_half"
-                        or instance.end_date == date
-                        and instance.end_date_breakdown == "second_half"
-                        else 0.00
-                    )
-                    status = (
-                        "CONF"
-                        if instance.start_date == date
-                        and instance.start_date_breakdown == "first_half"
-                        or instance.end_date == date
-                        and instance.end_date_breakdown == "second_half"
-                        else "ABS"
-                    )
-                    work_entry.work_record_type = status
-                    work_entry.date = date
-                    work_entry.message = (
-                        "Leave"
-                        if status == "ABS"
-                        else _("Half day Attendance need to validate")
-                    )
-                    work_entry.save()
-
-                except Exception as e:
-                    print(e)
-
-        else:
-            for date in period_dates:
-                WorkRecords.objects.filter(
-                    is_leave_record=True,
-                    date=date,
-                    employee_id=instance.employee_id,
-                ).delete()
-
-    @receiver(pre_delete, sender=LeaveRequest)
-    def leaverequest_pre_delete(sender, instance, **kwargs):
+        materialize_leave_work_records(instance)
+
+    @receiver(post_delete, sender=LeaveRequest)
+    def leaverequest_post_delete(sender, instance, **kwargs):
+        materialize_leave_work_records(instance)
+
+    def materialize_leave_work_records(instance):
+        """
+        Materialize the work records of the days of the leave request and of the
+        days it covered before its dates changed
+        """
+        from attendance.methods.work_records import materialize_work_records
         from attendance.models import WorkRecords
 
-        work_records = WorkRecords.objects.filter(leave_request_id=instance).delete()
+        days = set(instance.requested_dates())
+        days.update(
+            WorkRecords.objects.entire()
+            .filter(leave_request_id=instance.pk)
+            .values_list("date", flat=True)
+        )
+        days.discard(None)
+        if days:
+            materialize_work_records(min(days), max(days), [instance.employee_id_id])
 
 
 # @receiver(post_migrate)
@@ -39,6 +39,7 @@ from base.methods import (
     sortby,
 )
 from base.models import CompanyLeaves, Holidays, PenaltyAccounts
+from base.working_calendar import non_working_days
 from employee.models import Employee
 from horilla.decorators import (
     hx_request_required,
@@ -58,9 +59,7 @@ from leave.forms import *
 from leave.methods import (
     attendance_days,
     calculate_requested_days,
-    company_leave_dates_list,
     filter_conditional_leave_request,
-    holiday_dates_list,
     parse_excel_date,
 )
 from leave.models import *
@@ -2198,10 +2197,12 @@ def user_leave_request(request, id):
         )
         requested_dates = leave_requested_dates(start_date, end_date)
         requested_dates = [date.date() for date in requested_dates]
-        holidays = Holidays.objects.all()
-        holiday_dates = holiday_dates_list(holidays)
-        company_leaves = CompanyLeaves.objects.all()
-        company_leave_dates = company_leave_dates_list(company_leaves, start_date)
+        holiday_dates = non_working_days(
+            start_date.date(), end_date.date(), company_leaves=False
+        )
+        company_leave_dates = non_working_days(
+            start_date.date(), end_date.date(), holidays=False
+        )
         if (
             leave_type.exclude_company_leave == "yes"
             and leave_type.exclude_holiday == "yes"
@@ -2375,11 +2376,11 @@ def user_request_update(request, id):
                         start_date, end_date, start_date_breakdown, end_date_breakdown
                     )
                     requested_dates = leave_requested_dates(start_date, end_date)
-                    holidays = Holidays.objects.all()
-                    holiday_dates = holiday_dates_list(holidays)
-                    company_leaves = CompanyLeaves.objects.all()
-                    company_leave_dates = company_leave_dates_list(
-                        company_leaves, start_date
+                    holiday_dates = non_working_days(
+                        start_date, end_date or start_date, company_leaves=False
+                    )
+                    company_leave_dates = non_working_days(
+                        start_date, end_date or start_date, holidays=False
                     )
                     if (
                         leave_type.exclude_company_leave == "yes"
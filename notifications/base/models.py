@@ -1,15 +1,18 @@
 # -*- coding: utf-8 -*-
 # pylint: disable=too-many-lines
+from collections import Counter
 from distutils.version import (  # pylint: disable=no-name-in-module,import-error
     StrictVersion,
 )
+from threading import Thread
 
 from django import get_version
 from django.conf import settings
+from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
 from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ImproperlyConfigured
-from django.db import models
+from django.db import connection, models, transaction
 from django.db.models import JSONField
 from django.db.models.query import QuerySet
 from django.utils import timezone
@@ -18,7 +21,7 @@ from swapper import load_model
 
 from notifications import settings as notifications_settings
 from notifications.signals import notify
-from notifications.utils import id2slug
+from notifications.utils import id2slug, unread_changed
 
 if StrictVersion(get_version()) >= StrictVersion("1.8.0"):
     from django.contrib.contenttypes.fields import GenericForeignKey  # noqa
@@ -33,6 +36,10 @@ def is_soft_delete():
     return notifications_settings.get_config()["SOFT_DELETE"]
 
 
+def counts_as_unread(unread, deleted):
+    return unread and not (deleted and is_soft_delete())
+
+
 def assert_soft_delete():
     if not is_soft_delete():
         # msg = """To use 'deleted' field, please set 'SOFT_DELETE'=True in settings.
@@ -45,6 +52,40 @@ def assert_soft_delete():
 class NotificationQuerySet(models.query.QuerySet):
     """Notification QuerySet"""
 
+    # fields whose bulk update changes the unread notifications count
+    UNREAD_COUNT_FIELDS = {"unread", "deleted", "recipient", "recipient_id"}
+
+    def recipient_ids(self):
+        return set(self.order_by().values_list("recipient_id", flat=True).distinct())
+
+    def update(self, **kwargs):
+        """
+        Update the rows and reset the cached unread count of their recipients
+        """
+        if not self.UNREAD_COUNT_FIELDS.intersection(kwargs):
+            return super().update(**kwargs)
+        recipient_ids = self.recipient_ids()
+        recipient = kwargs.get("recipient", kwargs.get("recipient_id"))
+        if recipient is not None:
+            recipient_ids.add(getattr(recipient, "pk", recipient))
+        updated = super().update(**kwargs)
+        if updated:
+            unread_changed(reset=recipient_ids)
+        return updated
+
+    update.alters_data = True
+
+    def delete(self):
+        """
+        Delete the rows and reset the cached unread count of their recipients
+        """
+        recipient_ids = self.recipient_ids()
+        deleted = super().delete()
+        unread_changed(reset=recipient_ids)
+        return deleted
+
+    delete.alters_data = True
+
     def unsent(self):
         return self.filter(emailed=False)
 
@@ -227,6 +268,37 @@ class AbstractNotification(models.Model):
         # speed up notifications count query
         index_together = ("recipient", "unread")
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if {"unread", "deleted"}.issubset(field_names):
+            instance._loaded_unread = instance.counts_as_unread()
+        return instance
+
+    def counts_as_unread(self):
+        return counts_as_unread(self.unread, self.deleted)
+
+    def save(self, *args, **kwargs):
+        """
+        Save the notification and add the change of its unread state to the
+        cached unread count of the recipient
+        """
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        was_unread = False if adding else getattr(self, "_loaded_unread", None)
+        is_unread = self.counts_as_unread()
+        if was_unread is None:
+            unread_changed(reset=[self.recipient_id])
+        elif was_unread != is_unread:
+            unread_changed({self.recipient_id: 1 if is_unread else -1})
+        self._loaded_unread = is_unread
+
+    def delete(self, *args, **kwargs):
+        deleted = super().delete(*args, **kwargs)
+        if self.counts_as_unread():
+            unread_changed({self.recipient_id: -1})
+        return deleted
+
     def __str__(self):
         ctx = {
             "actor": self.actor,
@@ -270,9 +342,52 @@ class AbstractNotification(models.Model):
             self.save()
 
 
+def create_notifications(recipients, fields, attributes):
+    """
+    Build the notification of every recipient and insert them in batches
+    """
+    Notification = load_model("notifications", "Notification")
+    new_notifications = []
+    for recipient in recipients:
+        newnotify = Notification(recipient=recipient, **fields)
+        for name, value in attributes.items():
+            setattr(newnotify, name, value)
+        new_notifications.append(newnotify)
+
+    created = Notification.objects.bulk_create(
+        new_notifications,
+        batch_size=notifications_settings.get_config()["BULK_BATCH_SIZE"],
+    )
+    unread_changed(
+        Counter(
+            notification.recipient_id
+            for notification in created
+            if notification.counts_as_unread()
+        )
+    )
+    return created
+
+
+def fan_out_group(group_id, fields, attributes):
+    """
+    Create the notifications of the users of a group, run in a background
+    thread for the deferred group notifications.
+    """
+    try:
+        create_notifications(
+            get_user_model().objects.filter(groups__id=group_id), fields, attributes
+        )
+    finally:
+        connection.close()
+
+
 def notify_handler(verb, **kwargs):
     """
     Handler function to create Notification instance upon action signal call.
+    The notifications of all the recipients are inserted with bulk_create.
+    With ``defer=True`` (or the DEFER_GROUP_FANOUT setting) the notifications
+    of a Group recipient are created in a background thread once the current
+    transaction commits, and an empty list is returned.
     """
     # Pull the options out of kwargs
     kwargs.pop("signal", None)
@@ -286,49 +401,55 @@ def notify_handler(verb, **kwargs):
     timestamp = kwargs.pop("timestamp", timezone.now())
     Notification = load_model("notifications", "Notification")
     level = kwargs.pop("level", Notification.LEVELS.info)
+    defer = kwargs.pop(
+        "defer", notifications_settings.get_config()["DEFER_GROUP_FANOUT"]
+    )
+
+    # Resolve the fields shared by all the recipients once
+    fields = {
+        "actor_content_type": ContentType.objects.get_for_model(actor),
+        "actor_object_id": actor.pk,
+        "verb": str(verb),
+        "public": public,
+        "description": description,
+        "timestamp": timestamp,
+        "level": level,
+    }
+
+    # Set optional objects
+    for obj, opt in optional_objs:
+        if obj is not None:
+            fields["%s_object_id" % opt] = obj.pk
+            fields["%s_content_type" % opt] = ContentType.objects.get_for_model(obj)
+
+    attributes = {}
+    if kwargs and EXTRA_DATA:
+        attributes = {
+            "data": kwargs,
+            "verb_ar": kwargs.get("verb_ar", None),
+            "verb_de": kwargs.get("verb_de", None),
+            "verb_es": kwargs.get("verb_es", None),
+            "verb_fr": kwargs.get("verb_fr", None),
+        }
 
     # Check if User or Group
     if isinstance(recipient, Group):
+        if defer:
+            transaction.on_commit(
+                lambda: Thread(
+                    target=fan_out_group,
+                    args=(recipient.pk, fields, attributes),
+                    daemon=True,
+                ).start()
+            )
+            return []
         recipients = recipient.user_set.all()
     elif isinstance(recipient, (QuerySet, list)):
         recipients = recipient
     else:
         recipients = [recipient]
 
-    new_notifications = []
-
-    for recipient in recipients:
-        newnotify = Notification(
-            recipient=recipient,
-            actor_content_type=ContentType.objects.get_for_model(actor),
-            actor_object_id=actor.pk,
-            verb=str(verb),
-            public=public,
-            description=description,
-            timestamp=timestamp,
-            level=level,
-        )
-
-        # Set optional objects
-        for obj, opt in optional_objs:
-            if obj is not None:
-                setattr(newnotify, "%s_object_id" % opt, obj.pk)
-                setattr(
-                    newnotify,
-                    "%s_content_type" % opt,
-                    ContentType.objects.get_for_model(obj),
-                )
-
-        if kwargs and EXTRA_DATA:
-            newnotify.data = kwargs
-            newnotify.verb_ar = newnotify.data.get("verb_ar", None)
-            newnotify.verb_de = newnotify.data.get("verb_de", None)
-            newnotify.verb_es = newnotify.data.get("verb_es", None)
-            newnotify.verb_fr = newnotify.data.get("verb_fr", None)
-        newnotify.save()
-        new_notifications.append(newnotify)
-
-    return new_notifications
+    return create_notifications(recipients, fields, attributes)
 
 
 # connect the signal
@@ -8,6 +8,12 @@ CONFIG_DEFAULTS = {
     "USE_JSONFIELD": False,
     "SOFT_DELETE": False,
     "NUM_TO_FETCH": 10,
+    # Notifications inserted per query when a notification has many recipients
+    "BULK_BATCH_SIZE": 500,
+    # Create the notifications of a Group recipient in a background thread
+    "DEFER_GROUP_FANOUT": False,
+    # Seconds a cached unread notifications count is trusted
+    "UNREAD_COUNT_TIMEOUT": 60,
 }
 
 
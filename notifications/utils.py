@@ -2,6 +2,10 @@
 
 # -*- coding: utf-8 -*-
 import sys
+import time
+
+from django.core.cache import cache
+from django.db import transaction
 
 if sys.version > "3":
     long = int  # pylint: disable=invalid-name
@@ -13,3 +17,111 @@ def slug2id(slug):
 
 def id2slug(notification_id):
     return notification_id + 110909
+
+
+def unread_count_key(user_id):
+    return f"notifications_unread_count_{user_id}"
+
+
+def unread_version_key(user_id):
+    return f"notifications_unread_version_{user_id}"
+
+
+def get_unread_count(user):
+    """
+    Unread notifications count of the user, read from the cache and counted in
+    the database only when it is missing. The cached count expires after
+    UNREAD_COUNT_TIMEOUT seconds, which bounds how long a count can stay wrong
+    when the cache is not shared between the processes.
+    """
+    from notifications.settings import get_config
+
+    key = unread_count_key(user.pk)
+    count = cache.get(key)
+    if count is None:
+        count = user.notifications.unread().count()
+        cache.set(key, count, timeout=get_config()["UNREAD_COUNT_TIMEOUT"])
+    return count
+
+
+def get_unread_version(user_id):
+    """
+    Version of the unread notifications of the user, it changes whenever one
+    of them is created, read, unread or deleted. A change made in another
+    process only reaches a shared cache, so the version also expires with the
+    cached count, after UNREAD_COUNT_TIMEOUT seconds.
+    """
+    from notifications.settings import get_config
+
+    key = unread_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        # the count is recounted under the new version, which never matches
+        # the version of an expired key
+        cache.delete(unread_count_key(user_id))
+        version = time.time_ns()
+        if not cache.add(key, version, timeout=get_config()["UNREAD_COUNT_TIMEOUT"]):
+            version = cache.get(key, version)
+    return version
+
+
+def bump_unread_versions(user_ids):
+    from notifications.settings import get_config
+
+    for user_id in user_ids:
+        try:
+            cache.incr(unread_version_key(user_id))
+        except ValueError:
+            cache.set(
+                unread_version_key(user_id),
+                time.time_ns(),
+                timeout=get_config()["UNREAD_COUNT_TIMEOUT"],
+            )
+
+
+def apply_unread_changes(deltas):
+    """
+    Add the {user id: delta} to the cached unread counts. The counts that are
+    not cached are left to be counted on the next read.
+    """
+    for user_id, delta in deltas.items():
+        if not delta:
+            continue
+        key = unread_count_key(user_id)
+        try:
+            if cache.incr(key, delta) < 0:
+                cache.delete(key)
+        except ValueError:
+            pass
+    bump_unread_versions(deltas.keys())
+
+
+def reset_unread_counts(user_ids):
+    """
+    Drop the cached unread counts of the users, used when rows are changed in
+    bulk and the exact deltas are unknown.
+    """
+    user_ids = set(user_ids)
+    cache.delete_many([unread_count_key(user_id) for user_id in user_ids])
+    bump_unread_versions(user_ids)
+
+
+def unread_changed(deltas=None, reset=()):
+    """
+    Update the cached unread counts once the current transaction commits, so
+    a count read in between is not computed from uncommitted rows.
+    """
+    deltas = dict(deltas or {})
+    reset = set(reset)
+
+    def update():
+        apply_unread_changes(
+            {
+                user_id: delta
+                for user_id, delta in deltas.items()
+                if user_id not in reset
+            }
+        )
+        reset_unread_counts(reset)
+
+    transaction.on_commit(update)
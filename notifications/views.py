@@ -12,14 +12,20 @@ from django.shortcuts import get_object_or_404, redirect
 from django.utils.decorators import method_decorator
 from django.utils.encoding import iri_to_uri
 from django.utils.http import url_has_allowed_host_and_scheme
-from django.views.decorators.cache import never_cache
+from django.views.decorators.cache import cache_control, never_cache
+from django.views.decorators.http import etag
 from django.views.generic import ListView
 from swapper import load_model
 
 from base.models import NotificationSound
 from notifications import settings
 from notifications.settings import get_config
-from notifications.utils import id2slug, slug2id
+from notifications.utils import (
+    get_unread_count,
+    get_unread_version,
+    id2slug,
+    slug2id,
+)
 
 Notification = load_model("notifications", "Notification")
 
@@ -134,7 +140,24 @@ def delete(request, slug=None):
     return redirect("notifications:all")
 
 
-@never_cache
+def unread_notification_etag(request, *args, **kwargs):
+    """
+    ETag of the unread notification endpoints, it only changes when the unread
+    notifications of the user change, so a poll of an idle tab is answered with
+    a 304 without touching the notifications table.
+    """
+    if not request.user.is_authenticated:
+        return None
+    return "{user}-{version}-{query}".format(
+        user=request.user.pk,
+        version=get_unread_version(request.user.pk),
+        query=request.GET.urlencode(),
+    )
+
+
+# The browser keeps the response but revalidates it with the ETag on every poll
+@cache_control(private=True, no_cache=True)
+@etag(unread_notification_etag)
 def live_unread_notification_count(request):
     try:
         user_is_authenticated = request.user.is_authenticated()
@@ -145,12 +168,13 @@ def live_unread_notification_count(request):
         data = {"unread_count": 0}
     else:
         data = {
-            "unread_count": request.user.notifications.unread().count(),
+            "unread_count": get_unread_count(request.user),
         }
     return JsonResponse(data)
 
 
-@never_cache
+@cache_control(private=True, no_cache=True)
+@etag(unread_notification_etag)
 def live_unread_notification_list(request):
     """Return a json with a unread notification list"""
     try:
@@ -189,7 +213,7 @@ def live_unread_notification_list(request):
         if request.GET.get("mark_as_read"):
             notification.mark_as_read()
     data = {
-        "unread_count": request.user.notifications.unread().count(),
+        "unread_count": get_unread_count(request.user),
         "unread_list": unread_list,
     }
     return JsonResponse(data)
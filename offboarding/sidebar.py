@@ -14,6 +14,14 @@ from offboarding.templatetags.offboarding_filter import (
 MENU = _("Offboarding")
 IMG_SRC = "images/ui/exit-outline.svg"
 ACCESSIBILITY = "offboarding.sidebar.offboarding_accessibility"
+# models the accessibility of the menu depends on
+MENU_DEPENDENCIES = [
+    "offboarding.Offboarding",
+    "offboarding.OffboardingStage",
+    "offboarding.OffboardingTask",
+    "offboarding.OffboardingEmployee",
+    "offboarding.OffboardingGeneralSetting",
+]
 
 
 SUBMENUS = [
@@ -13,6 +13,11 @@ from onboarding.templatetags.onboardingfilters import is_taskmanager
 MENU = _("Onboarding")
 ACCESSIBILITY = "onboarding.sidebar.menu_accessibilty"
 IMG_SRC = "images/ui/rocket.svg"
+# models the accessibility of the menu depends on
+MENU_DEPENDENCIES = [
+    "onboarding.OnboardingStage",
+    "onboarding.OnboardingTask",
+]
 
 SUBMENUS = [
     {
@@ -4,10 +4,11 @@ outlook_auth/scheduler.py
 """
 
 import logging
-import sys
 
 from apscheduler.schedulers.background import BackgroundScheduler
 
+from horilla.horilla_settings import schedulers_enabled
+
 logger = logging.getLogger(__name__)
 
 
@@ -28,10 +29,7 @@ def refresh_outlook_auth_token():
             logger.error(e)
 
 
-if not any(
-    cmd in sys.argv
-    for cmd in ["makemigrations", "migrate", "compilemessages", "flush", "shell"]
-):
+if schedulers_enabled():
     scheduler = BackgroundScheduler()
     scheduler.add_job(
         refresh_outlook_auth_token,
@@ -18,7 +18,7 @@ class PayrollConfig(AppConfig):
         ready = super().ready()
         from django.urls import include, path
 
-        from horilla.horilla_settings import APPS
+        from horilla.horilla_settings import APPS, schedulers_enabled
         from horilla.urls import urlpatterns
         from payroll import signals
 
@@ -27,9 +27,10 @@ class PayrollConfig(AppConfig):
             path("payroll/", include("payroll.urls.urls")),
         )
         try:
-            from payroll.scheduler import auto_payslip_generate
+            if schedulers_enabled():
+                from payroll.scheduler import auto_payslip_generate
 
-            auto_payslip_generate()
+                auto_payslip_generate()
         except:
             """
             Migrations are not affected
@@ -0,0 +1,52 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from payroll.threadings.payslip_run import claim_payslip_runs, process_payslip_run
+
+
+class Command(BaseCommand):
+    help = (
+        "Process the bulk payslip runs. The queued and interrupted runs are "
+        "claimed and their chunks computed on a pool of worker processes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Process the runs that are already queued and exit",
+        )
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=10,
+            help="Seconds between two polls for queued runs",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=settings.PAYSLIP_RUN_WORKERS,
+            help="Worker processes computing the chunks of a run",
+        )
+
+    def handle(self, *args, **options):
+        processed = 0
+        try:
+            while True:
+                for run_id in claim_payslip_runs(include_queued=True):
+                    started = time.monotonic()
+                    process_payslip_run(run_id, workers=options["workers"])
+                    processed += 1
+                    self.stdout.write(
+                        f"Processed payslip run {run_id} in "
+                        f"{time.monotonic() - started:.2f}s"
+                    )
+                close_old_connections()
+                if options["once"]:
+                    return
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            self.stdout.write(f"Stopped after processing {processed} payslip runs.")
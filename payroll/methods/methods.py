@@ -13,15 +13,11 @@ from django.core.paginator import Paginator
 from django.db.models import F, Q
 
 # from attendance.models import Attendance
-from base.methods import (
-    get_company_leave_dates,
-    get_date_range,
-    get_holiday_dates,
-    get_pagination,
-    get_working_days,
-)
+from base.methods import get_date_range, get_pagination
 from base.models import CompanyLeaves, Holidays
+from base.working_calendar import is_non_working
 from horilla.methods import get_horilla_model_class
+from payroll.methods.payslip_batch import get_payroll_batch, working_days
 from payroll.models.models import Contract, Deduction, Payslip
 
 
@@ -56,7 +52,10 @@ def get_leaves(employee, start_date, end_date):
         start_date (obj): the start date from the data needed
         end_date (obj): the end date till the date needed
     """
-    if apps.is_installed("leave"):
+    batch = get_payroll_batch(employee, start_date, end_date)
+    if batch is not None:
+        approved_leaves = batch.approved_leaves(employee)
+    elif apps.is_installed("leave"):
         approved_leaves = employee.leaverequest_set.filter(status="approved")
     else:
         approved_leaves = None
@@ -66,9 +65,9 @@ def get_leaves(employee, start_date, end_date):
     unpaid_half = 0
     paid_leave_dates = []
     unpaid_leave_dates = []
-    company_leave_dates = get_working_days(start_date, end_date)["company_leave_dates"]
+    company_leave_dates = working_days(start_date, end_date)["company_leave_dates"]
 
-    if approved_leaves and approved_leaves.exists():
+    if approved_leaves:
         for instance in approved_leaves:
             if instance.leave_type_id.payment == "paid":
                 # if the taken leave is paid
@@ -131,7 +130,7 @@ if apps.is_installed("attendance"):
         present_on = [
             attendance.attendance_date for attendance in attendances_on_period
         ]
-        working_days_between_range = get_working_days(start_date, end_date)[
+        working_days_between_range = working_days(start_date, end_date)[
             "working_days_on"
         ]
         leave_dates = get_leaves(employee, start_date, end_date)["leave_dates"]
@@ -141,16 +140,7 @@ if apps.is_installed("attendance"):
             - set(leave_dates)
         )
         conflict_dates = conflict_dates + [
-            date
-            for date in present_on
-            if date in get_holiday_dates(start_date, end_date)
-            or date
-            in list(
-                set(
-                    get_company_leave_dates(start_date.year)
-                    + get_company_leave_dates(end_date.year)
-                )
-            )
+            date for date in present_on if is_non_working(date)
         ]
 
         return {
@@ -233,42 +223,53 @@ def daily_computation(employee, wage, start_date, end_date):
         start_date (obj): start of the pay period
         end_date (obj): end date of the period
     """
-    working_day_data = get_working_days(start_date, end_date)
+    working_day_data = working_days(start_date, end_date)
     total_working_days = working_day_data["total_working_days"]
 
     leave_data = get_leaves(employee, start_date, end_date)
 
-    contract = employee.contract_set.filter(contract_status="active").first()
     basic_pay = wage * total_working_days
     loss_of_pay = 0
 
-    date_range = get_date_range(start_date, end_date)
-    half_day_leaves_between_period_on_start_date = (
-        employee.leaverequest_set.filter(
-            leave_type_id__payment="unpaid",
-            start_date__in=date_range,
-            status="approved",
+    batch = get_payroll_batch(employee, start_date, end_date)
+    if batch is not None:
+        (
+            half_day_leaves_between_period_on_start_date,
+            half_day_leaves_between_period_on_end_date,
+        ) = batch.unpaid_half_day_leaves(employee, start_date, end_date)
+    else:
+        date_range = get_date_range(start_date, end_date)
+        half_day_leaves_between_period_on_start_date = (
+            employee.leaverequest_set.filter(
+                leave_type_id__payment="unpaid",
+                start_date__in=date_range,
+                status="approved",
+            )
+            .exclude(start_date_breakdown="full_day")
+            .count()
         )
-        .exclude(start_date_breakdown="full_day")
-        .count()
-    )
 
-    half_day_leaves_between_period_on_end_date = (
-        employee.leaverequest_set.filter(
-            leave_type_id__payment="unpaid", end_date__in=date_range, status="approved"
+        half_day_leaves_between_period_on_end_date = (
+            employee.leaverequest_set.filter(
+                leave_type_id__payment="unpaid",
+                end_date__in=date_range,
+                status="approved",
+            )
+            .exclude(end_date_breakdown="full_day")
+            .exclude(start_date=F("end_date"))
+            .count()
         )
-        .exclude(end_date_breakdown="full_day")
-        .exclude(start_date=F("end_date"))
-        .count()
-    )
     unpaid_half_leaves = (
         half_day_leaves_between_period_on_start_date
         + half_day_leaves_between_period_on_end_date
     ) * 0.5
 
-    contract = employee.contract_set.filter(
-        is_active=True, contract_status="active"
-    ).first()
+    if batch is not None:
+        contract = batch.contract(employee, is_active=True)
+    else:
+        contract = employee.contract_set.filter(
+            is_active=True, contract_status="active"
+        ).first()
 
     unpaid_leaves = leave_data["unpaid_leaves"] - unpaid_half_leaves
     if contract.calculate_daily_leave_amount:
@@ -294,9 +295,9 @@ def get_daily_salary(wage, wage_date) -> dict:
     last_day = calendar.monthrange(wage_date.year, wage_date.month)[1]
     end_date = date(wage_date.year, wage_date.month, last_day)
     start_date = date(wage_date.year, wage_date.month, 1)
-    working_days = get_working_days(start_date, end_date)["total_working_days"]
+    total_working_days = working_days(start_date, end_date)["total_working_days"]
     day_wage = (
-        wage / working_days if working_days else 0.0
+        wage / total_working_days if total_working_days else 0.0
     )  # if working_days != 0 else 0 #769
 
     return {
@@ -329,7 +330,7 @@ def months_between_range(wage, start_date, end_date):
         # Calculate the end date for the current month
         current_end_date = current_date + relativedelta(day=days_in_month)
         current_end_date = min(current_end_date, end_date)
-        working_days_on_month = get_working_days(
+        working_days_on_month = working_days(
             current_date.replace(day=1), current_date.replace(day=days_in_month)
         )["total_working_days"]
 
@@ -338,9 +339,9 @@ def months_between_range(wage, start_date, end_date):
             if start_date < date(year=year, month=month, day=1)
             else start_date
         )
-        total_working_days_on_period = get_working_days(
-            month_start_date, current_end_date
-        )["total_working_days"]
+        total_working_days_on_period = working_days(month_start_date, current_end_date)[
+            "total_working_days"
+        ]
 
         month_info = {
             "month": month,
@@ -431,10 +432,14 @@ def monthly_computation(employee, wage, start_date, end_date, *args, **kwargs):
             data["working_days_on_period"] * data["per_day_amount"]
         )
 
-    contract = employee.contract_set.filter(contract_status="active").first()
     loss_of_pay = 0
     date_range = get_date_range(start_date, end_date)
-    if apps.is_installed("leave"):
+    batch = get_payroll_batch(employee, start_date, end_date)
+    if batch is not None:
+        start_date_leaves, end_date_leaves = batch.unpaid_half_day_leaves(
+            employee, start_date, end_date
+        )
+    elif apps.is_installed("leave"):
         start_date_leaves = (
             employee.leaverequest_set.filter(
                 leave_type_id__payment="unpaid",
@@ -467,9 +472,12 @@ def monthly_computation(employee, wage, start_date, end_date, *args, **kwargs):
         + half_day_leaves_between_period_on_end_date
     ) * 0.5
 
-    contract = employee.contract_set.filter(
-        is_active=True, contract_status="active"
-    ).first()
+    if batch is not None:
+        contract = batch.contract(employee, is_active=True)
+    else:
+        contract = employee.contract_set.filter(
+            is_active=True, contract_status="active"
+        ).first()
     unpaid_leaves = abs(leave_data["unpaid_leaves"] - unpaid_half_leaves)
     paid_days = month_data[0]["working_days_on_period"] - unpaid_leaves
     daily_computed_salary = get_daily_salary(wage=wage, wage_date=start_date)[
@@ -502,9 +510,13 @@ def compute_salary_on_period(employee, start_date, end_date, wage=None):
         start_date (obj): start date of the period
         end_date (obj): end date of the period
     """
-    contract = Contract.objects.filter(
-        employee_id=employee, contract_status="active"
-    ).first()
+    batch = get_payroll_batch(employee, start_date, end_date)
+    if batch is not None:
+        contract = batch.contract(employee)
+    else:
+        contract = Contract.objects.filter(
+            employee_id=employee, contract_status="active"
+        ).first()
     if contract is None:
         return contract
 
@@ -541,6 +553,7 @@ def calculate_employer_contribution(data):
     This method is used to calculate the employer contribution
     """
     pay_head_data = data["pay_data"]
+    batch = get_payroll_batch()
     deductions_to_process = [
         pay_head_data.get("pretax_deductions"),
         pay_head_data.get("post_tax_deductions"),
@@ -555,9 +568,11 @@ def calculate_employer_contribution(data):
                     deduction.get("deduction_id")
                     and deduction.get("employer_contribution_rate", 0) > 0
                 ):
-                    object = Deduction.objects.filter(
-                        id=deduction.get("deduction_id")
-                    ).first()
+                    object = batch and batch.deduction(deduction.get("deduction_id"))
+                    if object is None:
+                        object = Deduction.objects.filter(
+                            id=deduction.get("deduction_id")
+                        ).first()
                     if object:
                         amount = pay_head_data.get(object.based_on)
                         employer_contribution_amount = (
@@ -0,0 +1,511 @@
+"""
+payslip_batch.py
+
+Batch payslip engine. The per employee payroll calculation queries contracts,
+allowances, deductions, leaves and attendances again for every employee. A
+PayrollBatch loads all of them for the whole employee set in a fixed number of
+queries, and while it is active the calculation methods read from its maps
+instead of querying the database.
+"""
+
+import json
+import threading
+import time
+from collections import defaultdict
+
+from django.apps import apps
+from django.db.models import Q
+from django.db.models.signals import post_save
+
+from base.methods import get_working_days
+from horilla.methods import get_horilla_model_class
+from payroll.models.models import Allowance, Contract, Deduction, Payslip
+from payroll.models.tax_models import TaxBracket
+
+_batch_locals = threading.local()
+
+PAYSLIP_BULK_FIELDS = [
+    "group_name",
+    "status",
+    "basic_pay",
+    "contract_wage",
+    "gross_pay",
+    "deduction",
+    "net_pay",
+    "pay_head_data",
+    "modified_by",
+]
+
+
+def get_payroll_batch(employee=None, start_date=None, end_date=None):
+    """
+    Return the active payroll batch when it covers the employee and the period,
+    otherwise None so that the caller falls back to its own queries.
+    """
+    batch = getattr(_batch_locals, "batch", None)
+    if batch is None or employee is None:
+        return batch
+    if batch.covers(employee, start_date, end_date):
+        return batch
+    return None
+
+
+def working_days(start_date, end_date):
+    """
+    get_working_days that is computed once per period while a batch is active
+    """
+    batch = get_payroll_batch()
+    if batch is None:
+        return get_working_days(start_date, end_date)
+    return batch.working_days(start_date, end_date)
+
+
+def _employee_id(employee):
+    return getattr(employee, "pk", employee)
+
+
+def _in_period(component, start_date, end_date):
+    """
+    Same as excluding the one time components outside of the period
+    """
+    one_time_date = component.one_time_date
+    return one_time_date is None or start_date <= one_time_date <= end_date
+
+
+class PayrollBatch:
+    """
+    Prefetched payroll data of a set of employees for a pay period.
+
+    Use it as a context manager around the payroll calculation of the employees:
+
+        with PayrollBatch(employees, start_date, end_date):
+            payroll_calculation(employee, start_date, end_date)
+    """
+
+    def __init__(self, employees, start_date, end_date):
+        self.employees = list(employees)
+        self.employee_ids = {employee.pk for employee in self.employees}
+        self.start_date = start_date
+        self.end_date = end_date
+        self._previous = None
+        self._working_days = {}
+        self.load()
+
+    def __enter__(self):
+        self._previous = getattr(_batch_locals, "batch", None)
+        _batch_locals.batch = self
+        return self
+
+    def __exit__(self, *_args):
+        _batch_locals.batch = self._previous
+
+    def covers(self, employee, start_date, end_date):
+        return (
+            _employee_id(employee) in self.employee_ids
+            and self.start_date <= start_date
+            and end_date <= self.end_date
+        )
+
+    def load(self):
+        """
+        Load the payroll data of all the employees of the batch
+        """
+        ids = self.employee_ids
+        period = (self.start_date, self.end_date)
+
+        self.contracts = defaultdict(list)
+        for contract in (
+            Contract.objects.filter(employee_id__in=ids, contract_status="active")
+            .select_related("filing_status")
+            .order_by("pk")
+        ):
+            self.contracts[contract.employee_id_id].append(contract)
+
+        filing_ids = {
+            contract.filing_status_id
+            for contracts in self.contracts.values()
+            for contract in contracts
+            if contract.filing_status_id
+        }
+        self.tax_brackets = defaultdict(list)
+        for bracket in (
+            TaxBracket.objects.filter(filing_status_id__in=filing_ids)
+            .order_by("min_income")
+            .values("filing_status_id", "tax_rate", "min_income", "max_income")
+        ):
+            self.tax_brackets[bracket.pop("filing_status_id")].append(bracket)
+
+        one_time = Q(one_time_date__isnull=True) | Q(one_time_date__range=period)
+        self.allowances = self._load_components(Allowance, one_time)
+        self.deductions = self._load_components(Deduction, one_time)
+        self.deduction_map = {
+            deduction.pk: deduction
+            for deduction, _specific, _excluded in self.deductions
+        }
+
+        self.leaves = defaultdict(list)
+        if apps.is_installed("leave"):
+            LeaveRequest = get_horilla_model_class(
+                app_label="leave", model="leaverequest"
+            )
+            for leave in LeaveRequest.objects.filter(
+                employee_id__in=ids, status="approved"
+            ).select_related("leave_type_id"):
+                self.leaves[leave.employee_id_id].append(leave)
+
+        self.attendances = defaultdict(list)
+        if apps.is_installed("attendance"):
+            Attendance = get_horilla_model_class(
+                app_label="attendance", model="attendance"
+            )
+            for attendance in Attendance.objects.filter(
+                employee_id__in=ids, attendance_date__range=period
+            ).values(
+                "employee_id",
+                "attendance_date",
+                "shift_id",
+                "work_type_id",
+                "attendance_validated",
+                "attendance_overtime_approve",
+                "overtime_second",
+            ):
+                self.attendances[attendance["employee_id"]].append(attendance)
+
+    def _load_components(self, model, one_time):
+        """
+        Return (component, specific employee ids, excluded employee ids) of the
+        allowances or deductions that can apply on the period
+        """
+        components = list(
+            model.objects.filter(one_time).prefetch_related("other_conditions")
+        )
+        component_ids = [component.pk for component in components]
+        field = f"{model._meta.model_name}_id"
+        employees = {}
+        for relation in ("specific_employees", "exclude_employees"):
+            through = getattr(model, relation).through
+            employees[relation] = defaultdict(list)
+            for component_id, employee_id in through.objects.filter(
+                **{f"{field}__in": component_ids}
+            ).values_list(field, "employee_id"):
+                employees[relation][component_id].append(employee_id)
+        return [
+            (
+                component,
+                employees["specific_employees"][component.pk],
+                set(employees["exclude_employees"][component.pk]),
+            )
+            for component in sorted(components, key=lambda component: component.pk)
+        ]
+
+    def working_days(self, start_date, end_date):
+        key = (start_date, end_date)
+        if key not in self._working_days:
+            self._working_days[key] = get_working_days(start_date, end_date)
+        return self._working_days[key]
+
+    def contract(self, employee, is_active=None):
+        """
+        First active contract of the employee, the is_active flag filters the
+        contracts like ``contract_set.filter(is_active=True)``
+        """
+        for contract in self.contracts.get(_employee_id(employee), []):
+            if is_active is None or contract.is_active == is_active:
+                return contract
+        return None
+
+    def filing_tax_brackets(self, filing_status_id):
+        return self.tax_brackets.get(filing_status_id, [])
+
+    def approved_leaves(self, employee):
+        return self.leaves.get(_employee_id(employee), [])
+
+    def unpaid_half_day_leaves(self, employee, start_date, end_date):
+        """
+        Number of unpaid half day leaves on the start and end dates of the period
+        """
+        on_start_date = on_end_date = 0
+        for leave in self.approved_leaves(employee):
+            if leave.leave_type_id.payment != "unpaid":
+                continue
+            if (
+                start_date <= leave.start_date <= end_date
+                and leave.start_date_breakdown != "full_day"
+            ):
+                on_start_date += 1
+            if (
+                leave.end_date
+                and start_date <= leave.end_date <= end_date
+                and leave.end_date_breakdown != "full_day"
+                and leave.start_date != leave.end_date
+            ):
+                on_end_date += 1
+        return on_start_date, on_end_date
+
+    def employee_attendances(self, employee, start_date, end_date, **filters):
+        """
+        Attendance rows of the employee on the period matching the field values
+        """
+        return [
+            attendance
+            for attendance in self.attendances.get(_employee_id(employee), [])
+            if start_date <= attendance["attendance_date"] <= end_date
+            and all(attendance[field] == value for field, value in filters.items())
+        ]
+
+    def employee_allowances(self, employee, start_date, end_date):
+        """
+        Allowances that are specific to the employee, condition based or for
+        all active employees, excluding the employees excluded from them
+        """
+        employee_id = _employee_id(employee)
+        return [
+            allowance
+            for allowance, specific, excluded in self.allowances
+            if _in_period(allowance, start_date, end_date)
+            and (
+                employee_id in specific
+                or (
+                    (allowance.is_condition_based or allowance.include_active_employees)
+                    and employee_id not in excluded
+                )
+            )
+        ]
+
+    def employee_deductions(
+        self, employee, start_date, end_date, is_pretax, is_tax, condition_based=True
+    ):
+        """
+        Deductions of the employee with the given tax flags
+        """
+        employee_id = _employee_id(employee)
+        deductions = []
+        for deduction, specific, excluded in self.deductions:
+            if (
+                deduction.is_pretax != is_pretax
+                or deduction.is_tax != is_tax
+                or deduction.update_compensation is not None
+                or not _in_period(deduction, start_date, end_date)
+            ):
+                continue
+            applies_to_all = (
+                deduction.include_active_employees
+                or (condition_based and deduction.is_condition_based)
+            ) and employee_id not in excluded
+            if applies_to_all or employee_id in specific:
+                deductions.append(deduction)
+        return deductions
+
+    def compensation_deductions(
+        self, employee, compensation_type, start_date, end_date
+    ):
+        """
+        Deductions that update the basic, gross or net pay of the employee
+        """
+        employee_id = _employee_id(employee)
+        return [
+            deduction
+            for deduction, specific, _excluded in self.deductions
+            if deduction.update_compensation == compensation_type
+            and employee_id in specific
+            and _in_period(deduction, start_date, end_date)
+        ]
+
+    def deduction(self, deduction_id):
+        return self.deduction_map.get(deduction_id)
+
+
+def payslip_periods(employees, start_date, end_date, skip_existing=False):
+    """
+    Return the (employee, start date) of the payslips to generate. As in the
+    single payslip flow the start date of an employee moves to their contract
+    start date when the contract started in between the period.
+    """
+    employees = list(employees)
+    employee_ids = [employee.pk for employee in employees]
+    contracts = {}
+    for contract in Contract.objects.filter(
+        employee_id__in=employee_ids, contract_status="active"
+    ).order_by("pk"):
+        contracts.setdefault(contract.employee_id_id, contract)
+    existing = set()
+    if skip_existing:
+        existing = set(
+            Payslip.objects.filter(
+                employee_id__in=employee_ids, end_date=end_date
+            ).values_list("employee_id", "start_date")
+        )
+    periods = []
+    for employee in employees:
+        if (employee.pk, start_date) in existing:
+            continue
+        contract = contracts.get(employee.pk)
+        if contract is None:
+            continue
+        if skip_existing and end_date < contract.contract_start_date:
+            continue
+        periods.append((employee, max(start_date, contract.contract_start_date)))
+    return periods
+
+
+def compute_payslips(periods, end_date, errors=None):
+    """
+    Compute the payslips of the (employee, start date) periods in one batch.
+    When an ``errors`` list is given, the employees whose calculation fails are
+    appended to it as (employee, error, seconds) instead of raising.
+
+    Returns:
+        list: a dict per payslip with the amounts, the pay data, the ids of the
+        installments and the seconds spent on the employee
+    """
+    from payroll.methods.methods import calculate_employer_contribution
+    from payroll.views.component_views import payroll_calculation
+
+    if not periods:
+        return []
+    batch = PayrollBatch(
+        [employee for employee, _start_date in periods],
+        min(start_date for _employee, start_date in periods),
+        end_date,
+    )
+    computed = []
+    with batch:
+        for employee, start_date in periods:
+            started = time.monotonic()
+            try:
+                payslip = payroll_calculation(employee, start_date, end_date)
+                data = {"pay_data": json.loads(payslip["json_data"])}
+                calculate_employer_contribution(data)
+            except Exception as error:
+                if errors is None:
+                    raise
+                errors.append((employee, str(error), time.monotonic() - started))
+                continue
+            computed.append(
+                {
+                    "employee": employee,
+                    "start_date": payslip["start_date"],
+                    "end_date": payslip["end_date"],
+                    "contract_wage": payslip["contract_wage"],
+                    "basic_pay": payslip["basic_pay"],
+                    "gross_pay": payslip["gross_pay"],
+                    "deduction": payslip["total_deductions"],
+                    "net_pay": payslip["net_pay"],
+                    "pay_data": data["pay_data"],
+                    "installment_ids": {
+                        deduction.pk for deduction in payslip["installments"]
+                    },
+                    "duration": time.monotonic() - started,
+                }
+            )
+    return computed
+
+
+def save_payslips(computed, end_date, group_name=None, status="draft", user=None):
+    """
+    Create or update the payslips of the computed data with bulk queries.
+    post_save is then sent for every payslip, so that its receivers such as
+    the automations run as for a saved payslip.
+
+    Returns:
+        list: (employee, payslip instance) of the saved payslips
+    """
+    from simple_history.utils import bulk_create_with_history, bulk_update_with_history
+
+    existing = {}
+    for instance in Payslip.objects.filter(
+        employee_id__in=[data["employee"].pk for data in computed],
+        end_date=end_date,
+    ):
+        existing.setdefault((instance.employee_id_id, instance.start_date), instance)
+
+    to_create = []
+    to_update = []
+    results = []
+    for data in computed:
+        employee = data["employee"]
+        instance = existing.get((employee.pk, data["start_date"]))
+        if instance is None:
+            instance = Payslip(
+                employee_id=employee,
+                start_date=data["start_date"],
+                end_date=data["end_date"],
+                created_by=user,
+            )
+            to_create.append(instance)
+        else:
+            to_update.append(instance)
+        instance.group_name = group_name
+        instance.status = status
+        instance.basic_pay = round(data["basic_pay"], 2)
+        instance.contract_wage = round(data["contract_wage"], 2)
+        instance.gross_pay = round(data["gross_pay"], 2)
+        instance.deduction = round(data["deduction"], 2)
+        instance.net_pay = round(data["net_pay"], 2)
+        instance.pay_head_data = data["pay_data"]
+        if user is not None:
+            instance.modified_by = user
+        results.append((employee, instance, data["installment_ids"]))
+
+    if to_create:
+        bulk_create_with_history(to_create, Payslip, batch_size=500, default_user=user)
+    if to_update:
+        bulk_update_with_history(
+            to_update, Payslip, PAYSLIP_BULK_FIELDS, batch_size=500, default_user=user
+        )
+
+    Installment = Payslip.installment_ids.through
+    Installment.objects.filter(
+        payslip_id__in=[instance.pk for instance in to_update]
+    ).delete()
+    Installment.objects.bulk_create(
+        [
+            Installment(payslip_id=instance.pk, deduction_id=deduction_id)
+            for _employee, instance, installment_ids in results
+            for deduction_id in installment_ids
+        ],
+        batch_size=500,
+    )
+    created = {id(instance) for instance in to_create}
+    for _employee, instance, _installment_ids in results:
+        post_save.send(
+            sender=Payslip,
+            instance=instance,
+            created=id(instance) in created,
+            update_fields=None,
+            raw=False,
+            using=instance._state.db,
+        )
+    return [(employee, instance) for employee, instance, _installment_ids in results]
+
+
+def generate_payslips(
+    employees,
+    start_date,
+    end_date,
+    group_name=None,
+    status="draft",
+    skip_existing=False,
+):
+    """
+    Generate and save the payslips of the employees for the period.
+
+    All the payroll data is prefetched once for the employees and the payslips
+    are written with bulk queries. With ``skip_existing`` the employees that
+    already have a payslip for the period or whose contract has not started
+    yet are skipped, as the automatic payslip generation does.
+
+    Returns:
+        list: (employee, payslip instance) of the generated payslips
+    """
+    from horilla.horilla_middlewares import _thread_locals
+
+    request = getattr(_thread_locals, "request", None)
+    user = getattr(request, "user", None)
+    if user is not None and not user.is_authenticated:
+        user = None
+
+    employees = employees.select_related("employee_work_info", "employee_user_id")
+    periods = payslip_periods(employees, start_date, end_date, skip_existing)
+    computed = compute_payslips(periods, end_date)
+    return save_payslips(computed, end_date, group_name, status, user)
@@ -14,6 +14,7 @@ from django.apps import apps
 from horilla.methods import get_horilla_model_class
 from payroll.methods.deductions import update_compensation_deduction
 from payroll.methods.limits import compute_limit
+from payroll.methods.payslip_batch import get_payroll_batch
 from payroll.models import models
 from payroll.models.models import (
     Allowance,
@@ -281,21 +282,25 @@ def calculate_allowance(**kwargs):
     end_date = kwargs["end_date"]
     basic_pay = kwargs["basic_pay"]
     day_dict = kwargs["day_dict"]
-    specific_allowances = Allowance.objects.filter(specific_employees=employee)
-    conditional_allowances = Allowance.objects.filter(is_condition_based=True).exclude(
-        exclude_employees=employee
-    )
-    active_employees = Allowance.objects.filter(include_active_employees=True).exclude(
-        exclude_employees=employee
-    )
-
-    allowances = specific_allowances | conditional_allowances | active_employees
-
-    allowances = (
-        allowances.exclude(one_time_date__lt=start_date)
-        .exclude(one_time_date__gt=end_date)
-        .distinct()
-    )
+    batch = get_payroll_batch(employee, start_date, end_date)
+    if batch is not None:
+        allowances = batch.employee_allowances(employee, start_date, end_date)
+    else:
+        specific_allowances = Allowance.objects.filter(specific_employees=employee)
+        conditional_allowances = Allowance.objects.filter(
+            is_condition_based=True
+        ).exclude(exclude_employees=employee)
+        active_employees = Allowance.objects.filter(
+            include_active_employees=True
+        ).exclude(exclude_employees=employee)
+
+        allowances = specific_allowances | conditional_allowances | active_employees
+
+        allowances = (
+            allowances.exclude(one_time_date__lt=start_date)
+            .exclude(one_time_date__gt=end_date)
+            .distinct()
+        )
 
     employee_allowances = []
     tax_allowances = []
@@ -305,9 +310,10 @@ def calculate_allowance(**kwargs):
     # Append allowances based on condition, or unconditionally to employee
     for allowance in allowances:
         if allowance.is_condition_based:
-            conditions = list(
-                allowance.other_conditions.values_list("field", "condition", "value")
-            )
+            conditions = [
+                (condition.field, condition.condition, condition.value)
+                for condition in allowance.other_conditions.all()
+            ]
             condition_field = allowance.field
             condition_operator = allowance.condition
             condition_value = allowance.value.lower().replace(" ", "_")
@@ -334,7 +340,18 @@ def calculate_allowance(**kwargs):
                 filter_params = filter_mapping[allowance.based_on]["filter"](
                     employee, allowance, start_date, end_date
                 )
-                if apps.is_installed("attendance"):
+                if batch is not None:
+                    # the prefetched rows are keyed by the attendance field names
+                    conditions = {
+                        field.removesuffix("__id"): value
+                        for field, value in filter_params.items()
+                        if field not in ("employee_id", "attendance_date__range")
+                    }
+                    if batch.employee_attendances(
+                        employee, start_date, end_date, **conditions
+                    ):
+                        employee_allowances.append(allowance)
+                elif apps.is_installed("attendance"):
                     Attendance = get_horilla_model_class(
                         app_label="attendance", model="attendance"
                     )
@@ -443,18 +460,30 @@ def calculate_tax_deduction(*_args, **kwargs):
     employee = kwargs["employee"]
     start_date = kwargs["start_date"]
     end_date = kwargs["end_date"]
-    specific_deductions = models.Deduction.objects.filter(
-        specific_employees=employee, is_pretax=False, is_tax=True
-    )
-    active_employee_deduction = models.Deduction.objects.filter(
-        include_active_employees=True, is_pretax=False, is_tax=True
-    ).exclude(exclude_employees=employee)
-    deductions = specific_deductions | active_employee_deduction
-    deductions = (
-        deductions.exclude(one_time_date__lt=start_date)
-        .exclude(one_time_date__gt=end_date)
-        .exclude(update_compensation__isnull=False)
-    )
+    batch = get_payroll_batch(employee, start_date, end_date)
+    if batch is not None:
+        deductions = batch.employee_deductions(
+            employee,
+            start_date,
+            end_date,
+            is_pretax=False,
+            is_tax=True,
+            condition_based=False,
+        )
+    else:
+        specific_deductions = models.Deduction.objects.filter(
+            specific_employees=employee, is_pretax=False, is_tax=True
+        )
+        active_employee_deduction = models.Deduction.objects.filter(
+            include_active_employees=True, is_pretax=False, is_tax=True
+        ).exclude(exclude_employees=employee)
+        deductions = specific_deductions | active_employee_deduction
+        deductions = (
+            deductions.exclude(one_time_date__lt=start_date)
+            .exclude(one_time_date__gt=end_date)
+            .exclude(update_compensation__isnull=False)
+            .distinct()
+        )
     deductions_amt = []
     serialized_deductions = []
     for deduction in deductions:
@@ -505,24 +534,37 @@ def calculate_pre_tax_deduction(*_args, **kwargs):
     start_date = kwargs["start_date"]
     end_date = kwargs["end_date"]
 
-    specific_deductions = models.Deduction.objects.filter(
-        specific_employees=employee, is_pretax=True, is_tax=False
-    )
-    conditional_deduction = models.Deduction.objects.filter(
-        is_condition_based=True, is_pretax=True, is_tax=False
-    ).exclude(exclude_employees=employee)
-    active_employee_deduction = models.Deduction.objects.filter(
-        include_active_employees=True, is_pretax=True, is_tax=False
-    ).exclude(exclude_employees=employee)
-
-    deductions = specific_deductions | conditional_deduction | active_employee_deduction
-    deductions = (
-        deductions.exclude(one_time_date__lt=start_date)
-        .exclude(one_time_date__gt=end_date)
-        .exclude(update_compensation__isnull=False)
-    )
-    # Installment deductions
-    installments = deductions.filter(is_installment=True)
+    batch = get_payroll_batch(employee, start_date, end_date)
+    if batch is not None:
+        deductions = batch.employee_deductions(
+            employee, start_date, end_date, is_pretax=True, is_tax=False
+        )
+        # Installment deductions
+        installments = {
+            deduction for deduction in deductions if deduction.is_installment
+        }
+    else:
+        specific_deductions = models.Deduction.objects.filter(
+            specific_employees=employee, is_pretax=True, is_tax=False
+        )
+        conditional_deduction = models.Deduction.objects.filter(
+            is_condition_based=True, is_pretax=True, is_tax=False
+        ).exclude(exclude_employees=employee)
+        active_employee_deduction = models.Deduction.objects.filter(
+            include_active_employees=True, is_pretax=True, is_tax=False
+        ).exclude(exclude_employees=employee)
+
+        deductions = (
+            specific_deductions | conditional_deduction | active_employee_deduction
+        )
+        deductions = (
+            deductions.exclude(one_time_date__lt=start_date)
+            .exclude(one_time_date__gt=end_date)
+            .exclude(update_compensation__isnull=False)
+            .distinct()
+        )
+        # Installment deductions
+        installments = deductions.filter(is_installment=True)
 
     pre_tax_deductions = []
     pre_tax_deductions_amt = []
@@ -530,9 +572,10 @@ def calculate_pre_tax_deduction(*_args, **kwargs):
 
     for deduction in deductions:
         if deduction.is_condition_based:
-            conditions = list(
-                deduction.other_conditions.values_list("field", "condition", "value")
-            )
+            conditions = [
+                (condition.field, condition.condition, condition.value)
+                for condition in deduction.other_conditions.all()
+            ]
             condition_field = deduction.field
             condition_operator = deduction.condition
             condition_value = deduction.value.lower().replace(" ", "_")
@@ -613,23 +656,36 @@ def calculate_post_tax_deduction(*_args, **kwargs):
     total_allowance = kwargs["total_allowance"]
     basic_pay = kwargs["basic_pay"]
     day_dict = kwargs["day_dict"]
-    specific_deductions = models.Deduction.objects.filter(
-        specific_employees=employee, is_pretax=False, is_tax=False
-    )
-    conditional_deduction = models.Deduction.objects.filter(
-        is_condition_based=True, is_pretax=False, is_tax=False
-    ).exclude(exclude_employees=employee)
-    active_employee_deduction = models.Deduction.objects.filter(
-        include_active_employees=True, is_pretax=False, is_tax=False
-    ).exclude(exclude_employees=employee)
-    deductions = specific_deductions | conditional_deduction | active_employee_deduction
-    deductions = (
-        deductions.exclude(one_time_date__lt=start_date)
-        .exclude(one_time_date__gt=end_date)
-        .exclude(update_compensation__isnull=False)
-    )
-    # Installment deductions
-    installments = deductions.filter(is_installment=True)
+    batch = get_payroll_batch(employee, start_date, end_date)
+    if batch is not None:
+        deductions = batch.employee_deductions(
+            employee, start_date, end_date, is_pretax=False, is_tax=False
+        )
+        # Installment deductions
+        installments = {
+            deduction for deduction in deductions if deduction.is_installment
+        }
+    else:
+        specific_deductions = models.Deduction.objects.filter(
+            specific_employees=employee, is_pretax=False, is_tax=False
+        )
+        conditional_deduction = models.Deduction.objects.filter(
+            is_condition_based=True, is_pretax=False, is_tax=False
+        ).exclude(exclude_employees=employee)
+        active_employee_deduction = models.Deduction.objects.filter(
+            include_active_employees=True, is_pretax=False, is_tax=False
+        ).exclude(exclude_employees=employee)
+        deductions = (
+            specific_deductions | conditional_deduction | active_employee_deduction
+        )
+        deductions = (
+            deductions.exclude(one_time_date__lt=start_date)
+            .exclude(one_time_date__gt=end_date)
+            .exclude(update_compensation__isnull=False)
+            .distinct()
+        )
+        # Installment deductions
+        installments = deductions.filter(is_installment=True)
 
     post_tax_deductions = []
     post_tax_deductions_amt = []
@@ -883,18 +939,26 @@ def calculate_based_on_attendance(*_args, **kwargs):
     if not apps.is_installed("attendance"):
         return 0
 
-    Attendance = get_horilla_model_class(app_label="attendance", model="attendance")
     employee = kwargs["employee"]
     start_date = kwargs["start_date"]
     end_date = kwargs["end_date"]
     component = kwargs["component"]
     day_dict = kwargs["day_dict"]
 
-    count = Attendance.objects.filter(
-        employee_id=employee,
-        attendance_date__range=(start_date, end_date),
-        attendance_validated=True,
-    ).count()
+    batch = get_payroll_batch(employee, start_date, end_date)
+    if batch is not None:
+        count = len(
+            batch.employee_attendances(
+                employee, start_date, end_date, attendance_validated=True
+            )
+        )
+    else:
+        Attendance = get_horilla_model_class(app_label="attendance", model="attendance")
+        count = Attendance.objects.filter(
+            employee_id=employee,
+            attendance_date__range=(start_date, end_date),
+            attendance_validated=True,
+        ).count()
     amount = count * component.per_attendance_fixed_amount
     amount = compute_limit(component, amount, day_dict)
     return amount
@@ -917,7 +981,6 @@ def calculate_based_on_shift(*_args, **kwargs):
     if not apps.is_installed("attendance"):
         return 0
 
-    Attendance = get_horilla_model_class(app_label="attendance", model="attendance")
     employee = kwargs["employee"]
     start_date = kwargs["start_date"]
     end_date = kwargs["end_date"]
@@ -925,12 +988,25 @@ def calculate_based_on_shift(*_args, **kwargs):
     day_dict = kwargs["day_dict"]
 
     shift_id = component.shift_id.id
-    count = Attendance.objects.filter(
-        employee_id=employee,
-        shift_id=shift_id,
-        attendance_date__range=(start_date, end_date),
-        attendance_validated=True,
-    ).count()
+    batch = get_payroll_batch(employee, start_date, end_date)
+    if batch is not None:
+        count = len(
+            batch.employee_attendances(
+                employee,
+                start_date,
+                end_date,
+                shift_id=shift_id,
+                attendance_validated=True,
+            )
+        )
+    else:
+        Attendance = get_horilla_model_class(app_label="attendance", model="attendance")
+        count = Attendance.objects.filter(
+            employee_id=employee,
+            shift_id=shift_id,
+            attendance_date__range=(start_date, end_date),
+            attendance_validated=True,
+        ).count()
     amount = count * component.shift_per_attendance_amount
 
     amount = compute_limit(component, amount, day_dict)
@@ -954,19 +1030,28 @@ def calculate_based_on_overtime(*_args, **kwargs):
     if not apps.is_installed("attendance"):
         return 0
 
-    Attendance = get_horilla_model_class(app_label="attendance", model="attendance")
     employee = kwargs["employee"]
     start_date = kwargs["start_date"]
     end_date = kwargs["end_date"]
     component = kwargs["component"]
     day_dict = kwargs["day_dict"]
 
-    attendances = Attendance.objects.filter(
-        employee_id=employee,
-        attendance_date__range=(start_date, end_date),
-        attendance_overtime_approve=True,
-    )
-    overtime = sum(attendance.overtime_second for attendance in attendances)
+    batch = get_payroll_batch(employee, start_date, end_date)
+    if batch is not None:
+        overtime = sum(
+            attendance["overtime_second"]
+            for attendance in batch.employee_attendances(
+                employee, start_date, end_date, attendance_overtime_approve=True
+            )
+        )
+    else:
+        Attendance = get_horilla_model_class(app_label="attendance", model="attendance")
+        attendances = Attendance.objects.filter(
+            employee_id=employee,
+            attendance_date__range=(start_date, end_date),
+            attendance_overtime_approve=True,
+        )
+        overtime = sum(attendance.overtime_second for attendance in attendances)
     amount_per_hour = component.amount_per_one_hr
     amount_per_second = amount_per_hour / (60 * 60)
     amount = overtime * amount_per_second
@@ -996,7 +1081,6 @@ def calculate_based_on_work_type(*_args, **kwargs):
     if not apps.is_installed("attendance"):
         return 0
 
-    Attendance = get_horilla_model_class(app_label="attendance", model="attendance")
     employee = kwargs["employee"]
     start_date = kwargs["start_date"]
     end_date = kwargs["end_date"]
@@ -1004,12 +1088,25 @@ def calculate_based_on_work_type(*_args, **kwargs):
     day_dict = kwargs["day_dict"]
 
     work_type_id = component.work_type_id.id
-    count = Attendance.objects.filter(
-        employee_id=employee,
-        work_type_id=work_type_id,
-        attendance_date__range=(start_date, end_date),
-        attendance_validated=True,
-    ).count()
+    batch = get_payroll_batch(employee, start_date, end_date)
+    if batch is not None:
+        count = len(
+            batch.employee_attendances(
+                employee,
+                start_date,
+                end_date,
+                work_type_id=work_type_id,
+                attendance_validated=True,
+            )
+        )
+    else:
+        Attendance = get_horilla_model_class(app_label="attendance", model="attendance")
+        count = Attendance.objects.filter(
+            employee_id=employee,
+            work_type_id=work_type_id,
+            attendance_date__range=(start_date, end_date),
+            attendance_validated=True,
+        ).count()
     amount = count * component.work_type_per_attendance_amount
 
     amount = compute_limit(component, amount, day_dict)
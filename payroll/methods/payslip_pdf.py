@@ -0,0 +1,99 @@
+"""
+payslip_pdf.py
+
+PDF rendering service of the payslips. Every wkhtmltopdf invocation runs on a
+bounded worker pool, and the rendered PDFs are cached by payslip id and the
+hash of their HTML so an unchanged payslip is never rendered twice.
+"""
+
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import pdfkit
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+PDF_OPTIONS = {
+    "page-size": "A4",
+    "margin-top": "10mm",
+    "margin-bottom": "10mm",
+    "margin-left": "10mm",
+    "margin-right": "10mm",
+    "encoding": "UTF-8",
+    "enable-local-file-access": None,  # Required to load local CSS/images
+    "dpi": 300,
+    "zoom": 1.3,
+    "footer-center": "[page]/[topage]",
+}
+
+_render_pool = ThreadPoolExecutor(
+    max_workers=settings.PDF_RENDER_WORKERS, thread_name_prefix="payslip-pdf"
+)
+
+
+def render_cache_key(payslip_id, html):
+    """
+    Cache key of a payslip PDF, it changes whenever the rendered HTML changes
+    """
+    content_hash = hashlib.sha256(html.encode("utf-8")).hexdigest()
+    return f"payslip_pdf_{payslip_id}_{content_hash}"
+
+
+def render_pdf(html, options=None):
+    """
+    Convert the HTML to a PDF on the render pool and return the PDF bytes
+    """
+    return _render_pool.submit(
+        pdfkit.from_string, html, False, options=options or PDF_OPTIONS
+    ).result()
+
+
+def render_payslip_pdf(payslip_id, html):
+    """
+    Return the PDF of a payslip, rendering it only when the payslip HTML is
+    not in the render cache yet.
+    """
+    key = render_cache_key(payslip_id, html)
+    pdf = cache.get(key)
+    if pdf is None:
+        pdf = render_pdf(html)
+        cache.set(key, pdf, timeout=settings.PDF_RENDER_CACHE_TIMEOUT)
+    return pdf
+
+
+def render_payslips_pdf(payslips):
+    """
+    Return the PDFs of a list of (payslip id, html) as a dict keyed by payslip
+    id. The cached payslips are reused and the others are rendered concurrently
+    on the render pool. A payslip that fails to render is logged and left out
+    of the result.
+    """
+    keys = {
+        payslip_id: render_cache_key(payslip_id, html) for payslip_id, html in payslips
+    }
+    cached = cache.get_many(keys.values())
+    pdfs = {
+        payslip_id: cached[key] for payslip_id, key in keys.items() if key in cached
+    }
+    futures = {
+        payslip_id: _render_pool.submit(
+            pdfkit.from_string, html, False, options=PDF_OPTIONS
+        )
+        for payslip_id, html in payslips
+        if payslip_id not in pdfs
+    }
+    rendered = {}
+    for payslip_id, future in futures.items():
+        try:
+            rendered[payslip_id] = future.result()
+        except Exception:
+            logger.exception(f"Could not render the PDF of payslip {payslip_id}")
+    cache.set_many(
+        {keys[payslip_id]: pdf for payslip_id, pdf in rendered.items()},
+        timeout=settings.PDF_RENDER_CACHE_TIMEOUT,
+    )
+    pdfs.update(rendered)
+    return pdfs
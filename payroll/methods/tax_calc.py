@@ -12,6 +12,7 @@ from payroll.methods.methods import (
     compute_yearly_taxable_amount,
     convert_year_tax_to_period,
 )
+from payroll.methods.payslip_batch import get_payroll_batch
 from payroll.methods.payslip_calc import (
     calculate_gross_pay,
     calculate_taxable_gross_pay,
@@ -41,16 +42,25 @@ def calculate_taxable_amount(**kwargs):
     start_date = kwargs["start_date"]
     end_date = kwargs["end_date"]
     basic_pay = kwargs["basic_pay"]
-    contract = Contract.objects.filter(
-        employee_id=employee, contract_status="active"
-    ).first()
+    batch = get_payroll_batch(employee, start_date, end_date)
+    if batch is not None:
+        contract = batch.contract(employee)
+    else:
+        contract = Contract.objects.filter(
+            employee_id=employee, contract_status="active"
+        ).first()
     filing = contract.filing_status
     if not filing:
         return 0
     federal_tax_for_period = 0
-    tax_brackets = TaxBracket.objects.filter(filing_status_id=filing).order_by(
-        "min_income"
-    )
+    if batch is not None:
+        tax_brackets = batch.filing_tax_brackets(filing.pk)
+    else:
+        tax_brackets = list(
+            TaxBracket.objects.filter(filing_status_id=filing)
+            .order_by("min_income")
+            .values("tax_rate", "min_income", "max_income")
+        )
     num_days = (end_date - start_date).days + 1
     calculation_functions = {
         "taxable_gross_pay": calculate_taxable_gross_pay,
@@ -79,7 +89,7 @@ def calculate_taxable_amount(**kwargs):
                 "min": item["min_income"],
                 "max": min(item["max_income"], yearly_income),
             }
-            for item in tax_brackets.values("tax_rate", "min_income", "max_income")
+            for item in tax_brackets
         ]
         filterd_brackets = []
         for bracket in brackets:
@@ -108,7 +118,7 @@ def pass_print(*args, **kwargs):
             logger.error(e)
 
     federal_tax_for_period = 0
-    if federal_tax and (tax_brackets.exists() or filing.use_py):
+    if federal_tax and (tax_brackets or filing.use_py):
         daily_federal_tax = federal_tax / total_days
         federal_tax_for_period = daily_federal_tax * num_days
 
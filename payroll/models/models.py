@@ -1459,6 +1459,93 @@ class Payslip(HorillaModel):
         ]
 
 
+class PayslipRun(HorillaModel):
+    """
+    Bulk payslip generation run, processed in chunks in the background so that
+    an interrupted run resumes from its last completed chunk.
+    """
+
+    status_choices = [
+        ("queued", _("Queued")),
+        ("running", _("Running")),
+        ("completed", _("Completed")),
+        ("failed", _("Failed")),
+    ]
+    group_name = models.CharField(
+        max_length=50, null=True, blank=True, verbose_name=_("Batch name")
+    )
+    start_date = models.DateField()
+    end_date = models.DateField()
+    company_id = models.ForeignKey(
+        Company, null=True, editable=False, on_delete=models.SET_NULL
+    )
+    # [employee id, payslip start date] pairs in generation order
+    periods = models.JSONField(default=list)
+    chunk_size = models.PositiveIntegerField(default=50)
+    completed_chunks = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    status = models.CharField(max_length=20, default="queued", choices=status_choices)
+    error = models.TextField(null=True, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    # seconds spent on the completed chunks
+    duration = models.FloatField(default=0)
+
+    def __str__(self) -> str:
+        return f"Payslip run {self.group_name or self.pk} ({self.status})"
+
+    def chunk_count(self):
+        return -(-len(self.periods) // self.chunk_size) if self.periods else 0
+
+    def get_chunk(self, index):
+        """
+        Return the (employee id, start date) pairs of the chunk
+        """
+        start = index * self.chunk_size
+        return self.periods[start : start + self.chunk_size]
+
+    def progress(self):
+        return round(self.processed * 100 / self.total) if self.total else 100
+
+    def throughput(self):
+        """
+        Generated payslips per second
+        """
+        return round(self.processed / self.duration, 2) if self.duration else 0
+
+    def slowest_results(self, count=5):
+        return self.results.select_related("employee_id").order_by("-duration")[:count]
+
+    def is_finished(self):
+        return self.status in ("completed", "failed")
+
+    class Meta:
+        ordering = ["-id"]
+        verbose_name = _("Payslip Run")
+        verbose_name_plural = _("Payslip Runs")
+
+
+class PayslipRunResult(models.Model):
+    """
+    Result of an employee in a payslip run
+    """
+
+    run = models.ForeignKey(
+        PayslipRun, on_delete=models.CASCADE, related_name="results"
+    )
+    employee_id = models.ForeignKey(Employee, on_delete=models.CASCADE)
+    payslip_id = models.ForeignKey(Payslip, null=True, on_delete=models.SET_NULL)
+    chunk = models.PositiveIntegerField()
+    duration = models.FloatField(default=0)
+    error = models.TextField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ("run", "employee_id")
+
+
 class LoanAccount(HorillaModel):
     """
     This modal is used to store the loan Account details
@@ -4,17 +4,17 @@ scheduler.py
 This module is used to register scheduled tasks
 """
 
-import json
-import sys
 from datetime import date, timedelta
 
 from apscheduler.schedulers.background import BackgroundScheduler
 from dateutil.relativedelta import relativedelta
+from django.conf import settings
 
-from payroll.methods.methods import calculate_employer_contribution, save_payslip
-from payroll.views.component_views import payroll_calculation
+from horilla.horilla_settings import schedulers_enabled
+from payroll.methods.payslip_batch import generate_payslips
+from payroll.threadings.payslip_run import resume_payslip_runs
 
-from .models.models import Contract, Payslip
+from .models.models import Contract
 
 
 def expire_contract():
@@ -57,35 +57,7 @@ def generate_payslip(date, companies, all):
     start_date = date - relativedelta(months=1)
     end_date = date - timedelta(days=1)
     # Payslip creation
-    for employee in active_employees:
-        payslip = Payslip.objects.filter(
-            employee_id=employee, start_date=start_date, end_date=end_date
-        ).first()
-        if payslip:
-            continue
-        contract = Contract.objects.filter(
-            employee_id=employee, contract_status="active"
-        ).first()
-        if end_date < contract.contract_start_date:
-            continue
-        if start_date < contract.contract_start_date:
-            start_date = contract.contract_start_date
-        payslip_data = payroll_calculation(employee, start_date, end_date)
-        payslip_data["payslip"] = payslip
-        data = {}
-        data["employee"] = employee
-        data["start_date"] = payslip_data["start_date"]
-        data["end_date"] = payslip_data["end_date"]
-        data["status"] = "draft"
-        data["contract_wage"] = payslip_data["contract_wage"]
-        data["basic_pay"] = payslip_data["basic_pay"]
-        data["gross_pay"] = payslip_data["gross_pay"]
-        data["deduction"] = payslip_data["total_deductions"]
-        data["net_pay"] = payslip_data["net_pay"]
-        data["pay_data"] = json.loads(payslip_data["json_data"])
-        calculate_employer_contribution(data)
-        data["installments"] = payslip_data["installments"]
-        payslip_data["instance"] = save_payslip(**data)
+    generate_payslips(active_employees, start_date, end_date, skip_existing=True)
 
 
 def is_last_day_of_month(date):
@@ -138,11 +110,10 @@ def auto_payslip_generate():
                 generate_payslip(date=date.today(), companies=companies, all=False)
 
 
-if not any(
-    cmd in sys.argv
-    for cmd in ["makemigrations", "migrate", "compilemessages", "flush", "shell"]
-):
+if schedulers_enabled():
     scheduler = BackgroundScheduler()
     scheduler.add_job(expire_contract, "interval", hours=4)
     scheduler.add_job(auto_payslip_generate, "interval", hours=3)
+    if settings.PAYSLIP_RUN_IN_PROCESS:
+        scheduler.add_job(resume_payslip_runs, "interval", minutes=5)
     scheduler.start()
@@ -4,17 +4,21 @@ payroll/settings.py
 This module is used to write settings contents related to payroll app
 """
 
-from horilla.settings import TEMPLATES
+from horilla.horilla_context_processors import lazy_context_processor
 
-TEMPLATES[0]["OPTIONS"]["context_processors"].append(
+lazy_context_processor(
     "payroll.context_processors.default_currency",
+    ["currency", "position"],
 )
-TEMPLATES[0]["OPTIONS"]["context_processors"].append(
+lazy_context_processor(
     "payroll.context_processors.get_deductions",
+    ["get_deductions"],
 )
-TEMPLATES[0]["OPTIONS"]["context_processors"].append(
+lazy_context_processor(
     "payroll.context_processors.get_active_employees",
+    ["get_active_employees"],
 )
-TEMPLATES[0]["OPTIONS"]["context_processors"].append(
+lazy_context_processor(
     "payroll.context_processors.host",
+    ["host", "protocol"],
 )
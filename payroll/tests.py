@@ -1,5 +1,556 @@
 """test cases"""
 
-from django.test import TestCase
+import json
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.db.models.signals import post_save
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
+
+from attendance.models import Attendance
+from base.models import EmployeeShift, WorkType
+from employee.models import Employee, EmployeeWorkInformation
+from leave.models import LeaveRequest, LeaveType
+from notifications.models import Notification
+from payroll.methods.methods import calculate_employer_contribution
+from payroll.methods.payslip_batch import (
+    PayrollBatch,
+    compute_payslips,
+    generate_payslips,
+    payslip_periods,
+)
+from payroll.models.models import (
+    Allowance,
+    Contract,
+    Deduction,
+    FilingStatus,
+    MultipleCondition,
+    Payslip,
+    PayslipRun,
+)
+from payroll.models.tax_models import PayrollSettings, TaxBracket
+from payroll.threadings.mail import MailSendThread
+from payroll.threadings.payslip_run import (
+    PayslipRunTaken,
+    claim_payslip_runs,
+    save_payslip_run_chunk,
+)
+from payroll.views.component_views import payroll_calculation
+
+START_DATE = date(2024, 3, 1)
+END_DATE = date(2024, 3, 31)
+LATE_CONTRACT_START = date(2024, 3, 11)
+
+
+def per_employee_pay_data(employees, start_date, end_date):
+    """
+    pay_data of the payslips computed one employee at a time, as the bulk
+    payslip generation did before the batch engine
+    """
+    pay_data = {}
+    for employee in employees:
+        contract = Contract.objects.filter(
+            employee_id=employee, contract_status="active"
+        ).first()
+        payslip = payroll_calculation(
+            employee, max(start_date, contract.contract_start_date), end_date
+        )
+        data = {"pay_data": json.loads(payslip["json_data"])}
+        calculate_employer_contribution(data)
+        pay_data[employee.pk] = data["pay_data"]
+    return pay_data
+
+
+class PayslipBatchTest(TestCase):
+    """
+    The batch payslip engine produces the pay data of the per employee
+    calculation
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        shifts = EmployeeShift.objects.bulk_create(
+            [EmployeeShift(employee_shift="Day"), EmployeeShift(employee_shift="Night")]
+        )
+        work_types = WorkType.objects.bulk_create(
+            [WorkType(work_type="Office"), WorkType(work_type="Remote")]
+        )
+        filing_status = FilingStatus.objects.create(
+            filing_status="Single", based_on="taxable_gross_pay", use_py=False
+        )
+        TaxBracket.objects.bulk_create(
+            [
+                TaxBracket(
+                    filing_status_id=filing_status,
+                    tax_rate=10,
+                    min_income=0,
+                    max_income=40000,
+                ),
+                TaxBracket(
+                    filing_status_id=filing_status,
+                    tax_rate=20,
+                    min_income=40000,
+                    max_income=1000000000,
+                ),
+            ]
+        )
+
+        cls.employees = Employee.objects.bulk_create(
+            [
+                Employee(
+                    employee_first_name=f"Payroll {index}",
+                    email=f"payroll{index}@example.com",
+                    phone="1",
+                    gender=["male", "female"][index % 2],
+                    children=index % 3,
+                )
+                for index in range(6)
+            ]
+        )
+        EmployeeWorkInformation.objects.bulk_create(
+            [
+                EmployeeWorkInformation(employee_id=employee)
+                for employee in cls.employees
+            ]
+        )
+        # the second employee starts the contract in the period
+        Contract.objects.bulk_create(
+            [
+                Contract(
+                    employee_id=employee,
+                    contract_name=f"Contract {index}",
+                    contract_start_date=(
+                        LATE_CONTRACT_START if index == 1 else date(2023, 1, 1)
+                    ),
+                    wage=30000 + index * 7000,
+                    wage_type="daily" if index == 4 else "monthly",
+                    pay_frequency="monthly",
+                    contract_status="active",
+                    filing_status=filing_status if index % 2 else None,
+                    deduct_leave_from_basic_pay=bool(index % 3),
+                    calculate_daily_leave_amount=bool(index % 2),
+                    deduction_for_one_leave_amount=100,
+                )
+                for index, employee in enumerate(cls.employees)
+            ]
+        )
+
+        paid, unpaid = LeaveType.objects.bulk_create(
+            [
+                LeaveType(name="Paid", payment="paid", count=1),
+                LeaveType(name="Unpaid", payment="unpaid", count=1),
+            ]
+        )
+        LeaveRequest.objects.bulk_create(
+            [
+                LeaveRequest(
+                    employee_id=employee,
+                    leave_type_id=unpaid if index % 2 else paid,
+                    start_date=START_DATE + timedelta(days=3 * index),
+                    end_date=START_DATE + timedelta(days=3 * index + index % 3),
+                    start_date_breakdown="first_half" if index == 2 else "full_day",
+                    end_date_breakdown="second_half" if index == 5 else "full_day",
+                    status="approved" if index != 3 else "requested",
+                    description="Leave",
+                )
+                for index, employee in enumerate(cls.employees)
+            ]
+        )
+        Attendance.objects.bulk_create(
+            [
+                Attendance(
+                    employee_id=employee,
+                    attendance_date=START_DATE + timedelta(days=day),
+                    shift_id=shifts[day % 2],
+                    work_type_id=work_types[(day + index) % 2],
+                    attendance_validated=day % 5 != 0,
+                    attendance_overtime_approve=day % 4 == 0,
+                    overtime_second=day * 300,
+                    minimum_hour="08:00",
+                    attendance_worked_hour="08:00",
+                    attendance_overtime="00:00",
+                )
+                for index, employee in enumerate(cls.employees)
+                for day in range(0, 31, index % 3 + 1)
+            ]
+        )
+
+        allowance_defaults = {"if_condition": "gt", "if_amount": 0}
+        allowances = Allowance.objects.bulk_create(
+            [
+                Allowance(
+                    title="Fixed",
+                    include_active_employees=True,
+                    is_fixed=True,
+                    amount=500,
+                    **allowance_defaults,
+                ),
+                Allowance(
+                    title="Basic pay rate",
+                    include_active_employees=True,
+                    is_fixed=False,
+                    based_on="basic_pay",
+                    rate=10,
+                    is_taxable=False,
+                    **allowance_defaults,
+                ),
+                Allowance(
+                    title="Attendance",
+                    include_active_employees=True,
+                    is_fixed=False,
+                    based_on="attendance",
+                    per_attendance_fixed_amount=20,
+                    **allowance_defaults,
+                ),
+                Allowance(
+                    title="Shift",
+                    include_active_employees=True,
+                    is_fixed=False,
+                    based_on="shift_id",
+                    shift_id=shifts[0],
+                    shift_per_attendance_amount=15,
+                    **allowance_defaults,
+                ),
+                Allowance(
+                    title="Overtime",
+                    is_fixed=False,
+                    based_on="overtime",
+                    amount_per_one_hr=100,
+                    **allowance_defaults,
+                ),
+                Allowance(
+                    title="Work type",
+                    include_active_employees=True,
+                    is_fixed=False,
+                    based_on="work_type_id",
+                    work_type_id=work_types[1],
+                    work_type_per_attendance_amount=7,
+                    has_max_limit=True,
+                    maximum_amount=100,
+                    **allowance_defaults,
+                ),
+                Allowance(
+                    title="Condition",
+                    is_condition_based=True,
+                    field="gender",
+                    condition="equal",
+                    value="male",
+                    is_fixed=True,
+                    amount=300,
+                    **allowance_defaults,
+                ),
+                Allowance(
+                    title="Children",
+                    include_active_employees=True,
+                    is_fixed=False,
+                    based_on="children",
+                    per_children_fixed_amount=50,
+                    **allowance_defaults,
+                ),
+                Allowance(
+                    title="One time",
+                    include_active_employees=True,
+                    is_fixed=True,
+                    amount=99,
+                    one_time_date=date(2024, 3, 20),
+                    **allowance_defaults,
+                ),
+                Allowance(
+                    title="Past one time",
+                    include_active_employees=True,
+                    is_fixed=True,
+                    amount=99,
+                    one_time_date=date(2024, 1, 20),
+                    **allowance_defaults,
+                ),
+            ]
+        )
+        allowances[4].specific_employees.add(*cls.employees[:3])
+        allowances[0].exclude_employees.add(cls.employees[3])
+        allowances[6].exclude_employees.add(cls.employees[5])
+        allowances[6].other_conditions.add(
+            MultipleCondition.objects.create(
+                field="children", condition="ge", value="1"
+            )
+        )
+
+        deduction_defaults = {"if_condition": "gt", "if_amount": 0, "employer_rate": 0}
+        deductions = Deduction.objects.bulk_create(
+            [
+                Deduction(
+                    title="Pretax",
+                    include_active_employees=True,
+                    is_pretax=True,
+                    is_fixed=False,
+                    based_on="basic_pay",
+                    rate=5,
+                    **{**deduction_defaults, "employer_rate": 3},
+                ),
+                Deduction(
+                    title="Pretax with specific employees",
+                    include_active_employees=True,
+                    is_pretax=True,
+                    is_fixed=True,
+                    amount=10,
+                    **deduction_defaults,
+                ),
+                Deduction(
+                    title="Gross pay",
+                    include_active_employees=True,
+                    is_pretax=False,
+                    is_fixed=False,
+                    based_on="gross_pay",
+                    rate=2,
+                    **{**deduction_defaults, "employer_rate": 1},
+                ),
+                Deduction(
+                    title="Tax",
+                    include_active_employees=True,
+                    is_pretax=False,
+                    is_tax=True,
+                    is_fixed=False,
+                    based_on="taxable_gross_pay",
+                    rate=3,
+                    **deduction_defaults,
+                ),
+                Deduction(
+                    title="Condition",
+                    is_condition_based=True,
+                    field="gender",
+                    condition="equal",
+                    value="female",
+                    is_pretax=True,
+                    is_fixed=True,
+                    amount=40,
+                    **deduction_defaults,
+                ),
+                Deduction(
+                    title="Installment",
+                    is_pretax=False,
+                    is_fixed=True,
+                    amount=111,
+                    one_time_date=date(2024, 3, 15),
+                    is_installment=True,
+                    **deduction_defaults,
+                ),
+                Deduction(
+                    title="Basic pay update",
+                    update_compensation="basic_pay",
+                    is_fixed=True,
+                    amount=50,
+                    **deduction_defaults,
+                ),
+                Deduction(
+                    title="Gross pay update",
+                    update_compensation="gross_pay",
+                    is_fixed=False,
+                    rate=1,
+                    **{**deduction_defaults, "employer_rate": 2},
+                ),
+                Deduction(
+                    title="Net pay update",
+                    update_compensation="net_pay",
+                    is_fixed=True,
+                    amount=5,
+                    **deduction_defaults,
+                ),
+            ]
+        )
+        cls.repeated_deduction = deductions[1]
+        cls.repeated_deduction.specific_employees.add(*cls.employees[:2])
+        deductions[0].exclude_employees.add(cls.employees[4])
+        deductions[5].specific_employees.add(*cls.employees[2:4])
+        for deduction in deductions[6:]:
+            deduction.specific_employees.add(*cls.employees[::2])
+
+    def employee_queryset(self):
+        return Employee.objects.filter(
+            pk__in=[employee.pk for employee in self.employees]
+        ).order_by("pk")
+
+    def test_batch_pay_data_matches_per_employee_calculation(self):
+        employees = self.employee_queryset()
+        expected = per_employee_pay_data(employees, START_DATE, END_DATE)
+
+        periods = payslip_periods(employees, START_DATE, END_DATE)
+        computed = compute_payslips(periods, END_DATE)
+        self.assertEqual(len(computed), len(self.employees))
+        for data in computed:
+            self.assertEqual(
+                json.dumps(data["pay_data"]),
+                json.dumps(expected[data["employee"].pk]),
+            )
+
+        generate_payslips(employees, START_DATE, END_DATE, group_name="batch")
+        payslips = Payslip.objects.filter(group_name="batch")
+        self.assertEqual(payslips.count(), len(self.employees))
+        for payslip in payslips:
+            self.assertEqual(
+                json.dumps(payslip.pay_head_data),
+                json.dumps(expected[payslip.employee_id_id]),
+            )
+
+    def test_contract_start_date_moves_only_for_its_employee(self):
+        employees = self.employee_queryset()
+        periods = payslip_periods(employees, START_DATE, END_DATE)
+        self.assertEqual(
+            [start_date for _employee, start_date in periods],
+            [
+                LATE_CONTRACT_START if index == 1 else START_DATE
+                for index in range(len(self.employees))
+            ],
+        )
+
+    def test_active_employee_deduction_applies_once(self):
+        employee = self.employees[0]
+        with PayrollBatch([employee], START_DATE, END_DATE) as batch:
+            deductions = batch.employee_deductions(
+                employee, START_DATE, END_DATE, is_pretax=True, is_tax=False
+            )
+        self.assertEqual(deductions.count(self.repeated_deduction), 1)
+
+        pay_data = per_employee_pay_data([employee], START_DATE, END_DATE)
+        self.assertEqual(
+            [
+                deduction["deduction_id"]
+                for deduction in pay_data[employee.pk]["pretax_deductions"]
+            ].count(self.repeated_deduction.pk),
+            1,
+        )
+
+    def test_generated_payslips_send_post_save(self):
+        saved = []
+
+        def receiver(sender, instance, created, **kwargs):
+            saved.append((instance.pk, created))
+
+        post_save.connect(receiver, sender=Payslip)
+        try:
+            generate_payslips(self.employee_queryset(), START_DATE, END_DATE)
+            generate_payslips(self.employee_queryset(), START_DATE, END_DATE)
+        finally:
+            post_save.disconnect(receiver, sender=Payslip)
+        payslip_ids = sorted(
+            Payslip.objects.filter(end_date=END_DATE).values_list("pk", flat=True)
+        )
+        self.assertEqual(len(payslip_ids), len(self.employees))
+        self.assertEqual(
+            sorted(saved),
+            sorted(
+                [(pk, True) for pk in payslip_ids] + [(pk, False) for pk in payslip_ids]
+            ),
+        )
+
+    def test_payslip_run_commits_a_chunk_once(self):
+        periods = payslip_periods(self.employee_queryset(), START_DATE, END_DATE)
+        run = PayslipRun.objects.create(
+            group_name="run",
+            start_date=START_DATE,
+            end_date=END_DATE,
+            periods=[
+                [employee.pk, start_date.isoformat()]
+                for employee, start_date in periods
+            ],
+            total=len(periods),
+            chunk_size=len(periods),
+        )
+        computed = compute_payslips(periods, END_DATE)
+        save_payslip_run_chunk(run, 0, computed, [], 1.0)
+        with self.assertRaises(PayslipRunTaken):
+            save_payslip_run_chunk(run, 0, computed, [], 1.0)
+
+        run.refresh_from_db()
+        self.assertEqual(run.completed_chunks, 1)
+        self.assertEqual(run.processed, len(periods))
+        self.assertEqual(Payslip.objects.filter(group_name="run").count(), len(periods))
+        self.assertEqual(run.results.count(), len(periods))
+
+    def test_mail_holds_back_the_payslips_that_fail_to_render(self):
+        """
+        A payslip whose PDF fails to render is not mailed nor marked as sent, and
+        the user who sent the payslips is notified
+        """
+        PayrollSettings.objects.create(currency_symbol="$")
+        user = User.objects.create_user("payroll", password="payroll")
+        Employee.objects.filter(pk=self.employees[0].pk).update(employee_user_id=user)
+        request = RequestFactory().get("/")
+        request.user = User.objects.get(pk=user.pk)
+        request.session = {}
+        generate_payslips(
+            self.employee_queryset(), START_DATE, END_DATE, group_name="mail"
+        )
+        payslips = Payslip.objects.filter(group_name="mail").order_by("pk")
+        result_dict = {
+            payslip.employee_id: {
+                "employee_id": payslip.employee_id,
+                "instances": [payslip],
+                "count": 1,
+            }
+            for payslip in payslips
+        }
+        failing = self.employees[3]
+
+        def from_string(html, output_path, options=None):
+            if failing.employee_first_name in html:
+                raise OSError("wkhtmltopdf reported an error")
+            return b"%PDF-1.4"
+
+        with mock.patch(
+            "payroll.methods.payslip_pdf.pdfkit.from_string", side_effect=from_string
+        ):
+            MailSendThread(
+                request, result_dict, [payslip.pk for payslip in payslips]
+            ).run()
+
+        mailed = {employee.pk for employee in self.employees if employee != failing}
+        self.assertEqual(
+            sorted(message.to[0] for message in mail.outbox),
+            sorted(
+                employee.email for employee in self.employees if employee != failing
+            ),
+        )
+        self.assertTrue(all(len(message.attachments) == 1 for message in mail.outbox))
+        self.assertEqual(
+            set(
+                payslips.filter(sent_to_employee=True).values_list(
+                    "employee_id", flat=True
+                )
+            ),
+            mailed,
+        )
+        self.assertEqual(Notification.objects.filter(recipient=user).count(), 1)
+
+
+class PayslipRunClaimTest(TestCase):
+    """
+    A payslip run is claimed by one process at a time
+    """
+
+    def create_run(self, status, heartbeat_at):
+        return PayslipRun.objects.create(
+            start_date=START_DATE,
+            end_date=END_DATE,
+            status=status,
+            heartbeat_at=heartbeat_at,
+        )
+
+    def test_running_run_is_claimed_once_its_heartbeat_is_stale(self):
+        run = self.create_run("running", timezone.now())
+        self.assertEqual(claim_payslip_runs(), [])
+
+        stale = timezone.now() - timedelta(seconds=settings.PAYSLIP_RUN_STALE_SECONDS)
+        PayslipRun.objects.filter(pk=run.pk).update(heartbeat_at=stale)
+        self.assertEqual(claim_payslip_runs(), [run.pk])
+        self.assertEqual(claim_payslip_runs(), [])
+
+    def test_queued_run_is_claimed_once(self):
+        run = self.create_run("queued", timezone.now())
+        self.assertEqual(claim_payslip_runs(), [])
+        self.assertEqual(claim_payslip_runs(include_queued=True), [run.pk])
+        self.assertEqual(claim_payslip_runs(include_queued=True), [])
+        run.refresh_from_db()
+        self.assertEqual(run.status, "running")
@@ -9,11 +9,14 @@ from threading import Thread
 
 from django.core.mail import EmailMessage
 from django.template.loader import render_to_string
+from django.urls import reverse
 
 from base.backends import ConfiguredEmailBackend
 from employee.models import EmployeeWorkInformation
+from notifications.signals import notify
+from payroll.methods.payslip_pdf import render_payslips_pdf
 from payroll.models.models import Payslip
-from payroll.views.views import payslip_pdf
+from payroll.views.views import payslip_pdf_context
 
 logger = logging.getLogger(__name__)
 
@@ -31,9 +34,56 @@ class MailSendThread(Thread):
         self.host = request.get_host()
         self.protocol = "https" if request.is_secure() else "http"
 
+    def render_attachments(self):
+        """
+        Render the PDFs of all the payslips to send, the payslips that fail to
+        render are left out
+        """
+        payslips = []
+        for record in self.result_dict.values():
+            for instance in record["instances"]:
+                html = render_to_string(
+                    "payroll/payslip/payslip_pdf.html",
+                    payslip_pdf_context(self.request, instance),
+                )
+                payslips.append((instance.id, html))
+        return render_payslips_pdf(payslips)
+
+    def notify_render_failure(self, failed):
+        """
+        Tell the user who sent the payslips that some of them were not mailed
+        """
+        names = ", ".join(record["instances"][0].get_name() for record in failed)
+        logger.error(f"Payslips of {names} could not be rendered and were not mailed")
+        try:
+            sender = self.request.user.employee_get
+        except Exception:
+            return
+        count = len(failed)
+        notify.send(
+            sender,
+            recipient=self.request.user,
+            verb=f"Payslips of {count} employees could not be rendered and were not mailed.",
+            verb_ar=f"تعذر إنشاء كشوف رواتب {count} موظفين ولم يتم إرسالها.",
+            verb_de=f"Gehaltsabrechnungen von {count} Mitarbeitern konnten nicht erstellt werden und wurden nicht versendet.",
+            verb_es=f"Las nóminas de {count} empleados no se pudieron generar y no se enviaron.",
+            verb_fr=f"Les fiches de paie de {count} employés n'ont pas pu être générées et n'ont pas été envoyées.",
+            redirect=reverse("view-payslip"),
+            icon="close",
+        )
+
     def run(self) -> None:
         super().run()
+        try:
+            pdfs = self.render_attachments()
+        except Exception as e:
+            logger.exception(e)
+            pdfs = {}
+        failed = []
         for record in list(self.result_dict.values()):
+            if any(instance.id not in pdfs for instance in record["instances"]):
+                failed.append(record)
+                continue
             html_message = render_to_string(
                 "payroll/mail_templates/default.html",
                 {
@@ -45,11 +95,10 @@ class MailSendThread(Thread):
             )
             attachments = []
             for instance in record["instances"]:
-                response = payslip_pdf(self.request, instance.id)
                 attachments.append(
                     (
                         f"{instance.get_payslip_title()}.pdf",
-                        response.content,
+                        pdfs[instance.id],
                         "application/pdf",
                     )
                 )
@@ -75,8 +124,12 @@ class MailSendThread(Thread):
             email.content_subtype = "html"
             try:
                 email.send()
-                Payslip.objects.filter(id__in=self.ids).update(sent_to_employee=True)
+                Payslip.objects.filter(
+                    id__in=[instance.id for instance in record["instances"]]
+                ).update(sent_to_employee=True)
             except Exception as e:
                 logger.exception(e)
 
+        if failed:
+            self.notify_render_failure(failed)
         return
@@ -0,0 +1,320 @@
+"""
+payslip_run.py
+
+This module is used to process the bulk payslip runs in the background. It does
+not import the models at module level, so that the spawned worker processes can
+load it before setting up Django.
+"""
+
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from threading import Event, Thread
+
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.db.models import F, Q
+from django.urls import reverse
+from django.utils import timezone
+
+from horilla.horilla_middlewares import _thread_locals
+
+logger = logging.getLogger(__name__)
+
+_company_filter_templates = None
+
+
+class PayslipRunTaken(Exception):
+    """
+    The chunk was already committed by another process of the run
+    """
+
+
+class PayslipRunRequest:
+    """
+    Request like object set on the run thread and the worker processes so that
+    the company scoping and the audit fields behave as in the request that
+    started the run.
+    """
+
+    def __init__(self, user, company_context):
+        from django.contrib.auth.models import AnonymousUser
+
+        self.user = user or AnonymousUser()
+        self.company_context = company_context
+        self.session = {}
+        self.is_filtering = False
+
+
+def activate_run_context(company_id, user_id):
+    """
+    Set the request context of the run on the current thread
+    """
+    from django.contrib.auth.models import User
+
+    from base.middleware import CompanyContext, CompanyMiddleware
+
+    global _company_filter_templates
+    if _company_filter_templates is None:
+        _company_filter_templates = CompanyMiddleware(None).company_filter_templates
+    user = User.objects.filter(pk=user_id).first() if user_id else None
+    _thread_locals.request = PayslipRunRequest(
+        user, CompanyContext(company_id, _company_filter_templates)
+    )
+    return user
+
+
+def setup_payslip_worker():
+    """
+    Set up Django in a spawned worker process of the run pool. The worker has
+    the command line of the process_payslip_runs command, so it does not start
+    the background schedulers.
+    """
+    import django
+
+    django.setup()
+
+
+def compute_payslip_chunk(company_id, user_id, periods, end_date):
+    """
+    Compute the payslips of a chunk of (employee id, start date) pairs. It runs
+    in the worker processes, so it only takes and returns picklable data.
+    """
+    from employee.models import Employee
+    from payroll.methods.payslip_batch import compute_payslips
+
+    activate_run_context(company_id, user_id)
+    employees = (
+        Employee.objects.entire()
+        .select_related("employee_work_info", "employee_user_id")
+        .in_bulk([employee_id for employee_id, _start_date in periods])
+    )
+    errors = []
+    computed = compute_payslips(
+        [
+            (employees[employee_id], date.fromisoformat(start_date))
+            for employee_id, start_date in periods
+            if employee_id in employees
+        ],
+        end_date,
+        errors=errors,
+    )
+    return computed, errors
+
+
+def save_payslip_run_chunk(run, index, computed, errors, elapsed):
+    """
+    Save the payslips and the results of a chunk and move the run to the next
+    chunk in the same transaction.
+    """
+    from notifications.signals import notify
+    from payroll.methods.payslip_batch import save_payslips
+    from payroll.models.models import PayslipRun, PayslipRunResult
+
+    with transaction.atomic():
+        # moving the run first locks it, so a chunk is committed only once even
+        # when two processes work on the same run
+        moved = PayslipRun.objects.filter(pk=run.pk, completed_chunks=index).update(
+            completed_chunks=index + 1,
+            processed=F("processed") + len(computed),
+            failed=F("failed") + len(errors),
+            duration=F("duration") + elapsed,
+            heartbeat_at=timezone.now(),
+        )
+        if not moved:
+            raise PayslipRunTaken(f"Chunk {index} of payslip run {run.pk} is done")
+        saved = save_payslips(
+            computed, run.end_date, run.group_name, "draft", run.created_by
+        )
+        durations = {data["employee"].pk: data["duration"] for data in computed}
+        results = [
+            PayslipRunResult(
+                run=run,
+                employee_id=employee,
+                payslip_id=instance,
+                chunk=index,
+                duration=durations[employee.pk],
+            )
+            for employee, instance in saved
+        ]
+        results += [
+            PayslipRunResult(
+                run=run,
+                employee_id=employee,
+                chunk=index,
+                duration=duration,
+                error=error,
+            )
+            for employee, error, duration in errors
+        ]
+        PayslipRunResult.objects.bulk_create(results, batch_size=500)
+
+    sender = getattr(run.created_by, "employee_get", None)
+    if sender is None:
+        return
+    for employee, instance in saved:
+        notify.send(
+            sender,
+            recipient=employee.employee_user_id,
+            verb="Payslip has been generated for you.",
+            verb_ar="تم إصدار كشف راتب لك.",
+            verb_de="Gehaltsabrechnung wurde für Sie erstellt.",
+            verb_es="Se ha generado la nómina para usted.",
+            verb_fr="La fiche de paie a été générée pour vous.",
+            redirect=reverse(
+                "view-created-payslip", kwargs={"payslip_id": instance.id}
+            ),
+            icon="close",
+        )
+
+
+class PayslipRunHeartbeat(Thread):
+    """
+    Move the heartbeat of a run at regular intervals while its chunks are
+    computed, so that a slow chunk does not make the run look interrupted
+    """
+
+    def __init__(self, run_id):
+        Thread.__init__(self, daemon=True)
+        self.run_id = run_id
+        self.stopped = Event()
+
+    def run(self) -> None:
+        from payroll.models.models import PayslipRun
+
+        interval = max(settings.PAYSLIP_RUN_STALE_SECONDS / 3, 1)
+        try:
+            while not self.stopped.wait(interval):
+                try:
+                    PayslipRun.objects.filter(pk=self.run_id, status="running").update(
+                        heartbeat_at=timezone.now()
+                    )
+                except Exception:
+                    logger.exception(
+                        f"Could not refresh the heartbeat of payslip run {self.run_id}"
+                    )
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def process_payslip_run(run_id, workers=1):
+    """
+    Compute and save the remaining chunks of the run. The chunks are computed
+    inline, or sharded across a pool of ``workers`` spawned processes, and
+    committed in order, so completed_chunks always points to the first chunk
+    that still has to be generated.
+    """
+    from payroll.models.models import PayslipRun
+
+    run = PayslipRun.objects.get(pk=run_id)
+    activate_run_context(run.company_id_id, run.created_by_id)
+    PayslipRun.objects.filter(pk=run.pk).update(
+        status="running",
+        error=None,
+        started_at=run.started_at or timezone.now(),
+        heartbeat_at=timezone.now(),
+    )
+    chunks = list(range(run.completed_chunks, run.chunk_count()))
+    args = (run.company_id_id, run.created_by_id)
+    workers = min(workers, len(chunks))
+    executor = None
+    heartbeat = PayslipRunHeartbeat(run.pk)
+    heartbeat.start()
+    try:
+        if workers > 1:
+            # spawned workers do not inherit the locks and the connections held
+            # by the other threads of this process
+            executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=setup_payslip_worker,
+            )
+            futures = [
+                executor.submit(
+                    compute_payslip_chunk, *args, run.get_chunk(index), run.end_date
+                )
+                for index in chunks
+            ]
+            chunk_results = (future.result() for future in futures)
+        else:
+            chunk_results = (
+                compute_payslip_chunk(*args, run.get_chunk(index), run.end_date)
+                for index in chunks
+            )
+        started = time.monotonic()
+        for index, (computed, errors) in zip(chunks, chunk_results):
+            elapsed = time.monotonic() - started
+            save_payslip_run_chunk(run, index, computed, errors, elapsed)
+            started = time.monotonic()
+        PayslipRun.objects.filter(pk=run.pk).update(
+            status="completed", finished_at=timezone.now()
+        )
+    except PayslipRunTaken as error:
+        logger.warning(f"{error}, leaving the run to the process that did it")
+    except Exception as error:
+        logger.exception(f"Payslip run {run.pk} failed")
+        PayslipRun.objects.filter(pk=run.pk).update(
+            status="failed", error=str(error), finished_at=timezone.now()
+        )
+    finally:
+        heartbeat.stop()
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        _thread_locals.request = None
+        connections.close_all()
+
+
+class PayslipRunThread(Thread):
+    """
+    Process a payslip run in the background
+    """
+
+    def __init__(self, run_id):
+        Thread.__init__(self, daemon=True)
+        self.run_id = run_id
+
+    def run(self) -> None:
+        super().run()
+        process_payslip_run(self.run_id)
+
+
+def claim_payslip_runs(include_queued=False):
+    """
+    Claim the queued and running runs whose heartbeat is stale, e.g. when the
+    server restarted in between, and with ``include_queued`` all the queued
+    runs. A run is claimed by moving its heartbeat and marking it running, so
+    that only one process claims it. Returns the ids of the claimed runs.
+    """
+    from payroll.models.models import PayslipRun
+
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.PAYSLIP_RUN_STALE_SECONDS)
+    due = Q(heartbeat_at__lt=stale) | Q(heartbeat_at__isnull=True, created_at__lt=stale)
+    if include_queued:
+        due |= Q(status="queued")
+    claimed = []
+    for run in PayslipRun.objects.filter(status__in=["queued", "running"]).filter(due):
+        if PayslipRun.objects.filter(
+            pk=run.pk, status=run.status, heartbeat_at=run.heartbeat_at
+        ).update(status="running", heartbeat_at=now):
+            logger.info(
+                f"Claimed payslip run {run.pk} from chunk {run.completed_chunks}"
+            )
+            claimed.append(run.pk)
+    return claimed
+
+
+def resume_payslip_runs():
+    """
+    Resume the interrupted payslip runs on threads of this process
+    """
+    run_ids = claim_payslip_runs()
+    for run_id in run_ids:
+        PayslipRunThread(run_id).start()
+    return len(run_ids)
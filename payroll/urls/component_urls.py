@@ -70,6 +70,21 @@ urlpatterns = [
         name="check-contract-start-date",
     ),
     path("generate-payslip", component_views.generate_payslip, name="generate-payslip"),
+    path(
+        "payslip-run/<int:run_id>/",
+        component_views.payslip_run,
+        name="payslip-run",
+    ),
+    path(
+        "payslip-run-progress/<int:run_id>/",
+        component_views.payslip_run_progress,
+        name="payslip-run-progress",
+    ),
+    path(
+        "payslip-run-resume/<int:run_id>/",
+        component_views.payslip_run_resume,
+        name="payslip-run-resume",
+    ),
     path(
         "validate-start-date",
         component_views.validate_start_date,
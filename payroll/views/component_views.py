@@ -14,11 +14,13 @@ from urllib.parse import parse_qs
 
 import pandas as pd
 from django.apps import apps
+from django.conf import settings
 from django.contrib import messages
 from django.db.models import Sum
 from django.http import HttpResponse, HttpResponseRedirect, JsonResponse, QueryDict
 from django.shortcuts import redirect, render
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.html import format_html
 from django.utils.translation import gettext_lazy as _
 from django.views.decorators.cache import never_cache
@@ -67,6 +69,7 @@ from payroll.methods.methods import (
     paginator_qry,
     save_payslip,
 )
+from payroll.methods.payslip_batch import payslip_periods
 from payroll.methods.payslip_calc import (
     calculate_allowance,
     calculate_gross_pay,
@@ -83,10 +86,12 @@ from payroll.models.models import (
     Deduction,
     LoanAccount,
     Payslip,
+    PayslipRun,
     Reimbursement,
     ReimbursementMultipleAttachment,
 )
 from payroll.threadings.mail import MailSendThread
+from payroll.threadings.payslip_run import PayslipRunThread
 
 
 def return_none(a, b):
@@ -744,66 +749,84 @@ def generate_payslip(request):
             "payroll/payslip/bulk_create_payslip.html",
             {"bulk_form": bulk_form},
         )
-    payslips = []
-    json_data = []
     form = forms.GeneratePayslipForm()
     if request.method == "POST":
         form = forms.GeneratePayslipForm(request.POST)
         if form.is_valid():
-            instances = []
             employees = form.cleaned_data["employee_id"]
             start_date = form.cleaned_data["start_date"]
             end_date = form.cleaned_data["end_date"]
 
             group_name = form.cleaned_data["group_name"]
-            for employee in employees:
-                contract = Contract.objects.filter(
-                    employee_id=employee, contract_status="active"
-                ).first()
-                if start_date < contract.contract_start_date:
-                    start_date = contract.contract_start_date
-                payslip = payroll_calculation(employee, start_date, end_date)
-                payslips.append(payslip)
-                json_data.append(payslip["json_data"])
-
-                payslip["payslip"] = payslip
-                data = {}
-                data["employee"] = employee
-                data["group_name"] = group_name
-                data["start_date"] = payslip["start_date"]
-                data["end_date"] = payslip["end_date"]
-                data["status"] = "draft"
-                data["contract_wage"] = payslip["contract_wage"]
-                data["basic_pay"] = payslip["basic_pay"]
-                data["gross_pay"] = payslip["gross_pay"]
-                data["deduction"] = payslip["total_deductions"]
-                data["net_pay"] = payslip["net_pay"]
-                data["pay_data"] = json.loads(payslip["json_data"])
-                calculate_employer_contribution(data)
-                data["installments"] = payslip["installments"]
-                instance = save_payslip(**data)
-                instances.append(instance)
-                notify.send(
-                    request.user.employee_get,
-                    recipient=employee.employee_user_id,
-                    verb="Payslip has been generated for you.",
-                    verb_ar="تم إصدار كشف راتب لك.",
-                    verb_de="Gehaltsabrechnung wurde für Sie erstellt.",
-                    verb_es="Se ha generado la nómina para usted.",
-                    verb_fr="La fiche de paie a été générée pour vous.",
-                    redirect=reverse(
-                        "view-created-payslip", kwargs={"payslip_id": instance.id}
-                    ),
-                    icon="close",
-                )
-            messages.success(request, f"{employees.count()} payslip saved as draft")
-            return redirect(
-                f"/payroll/view-payslip?group_by=group_name&active_group={group_name}"
+            periods = payslip_periods(employees, start_date, end_date)
+            company_context = getattr(request, "company_context", None)
+            run = PayslipRun(
+                group_name=group_name,
+                start_date=start_date,
+                end_date=end_date,
+                company_id_id=getattr(company_context, "company_id", None),
+                periods=[
+                    [employee.id, period_start_date.isoformat()]
+                    for employee, period_start_date in periods
+                ],
+                total=len(periods),
+                chunk_size=settings.PAYSLIP_RUN_CHUNK_SIZE,
             )
+            run.save()
+            if settings.PAYSLIP_RUN_IN_PROCESS:
+                PayslipRunThread(run.id).start()
+            messages.info(request, _("Payslip generation started"))
+            return redirect(reverse("payslip-run", kwargs={"run_id": run.id}))
 
     return render(request, "payroll/common/form.html", {"form": form})
 
 
+@login_required
+@permission_required("payroll.add_payslip")
+def payslip_run(request, run_id):
+    """
+    Show the progress of a bulk payslip run
+    """
+    run = PayslipRun.objects.filter(id=run_id).first()
+    if run is None:
+        messages.error(request, _("Payslip run not found"))
+        return redirect(reverse("view-payslip"))
+    return render(request, "payroll/payslip/payslip_run.html", {"run": run})
+
+
+@login_required
+@hx_request_required
+@permission_required("payroll.add_payslip")
+def payslip_run_progress(request, run_id):
+    """
+    Render the progress of a bulk payslip run, polled while the run is going on
+    """
+    run = PayslipRun.objects.filter(id=run_id).first()
+    if run is None:
+        return HttpResponse("")
+    return render(
+        request,
+        "payroll/payslip/payslip_run_progress.html",
+        {"run": run, "slowest_results": run.slowest_results()},
+    )
+
+
+@login_required
+@permission_required("payroll.add_payslip")
+def payslip_run_resume(request, run_id):
+    """
+    Resume a failed bulk payslip run from its last completed chunk
+    """
+    updated = PayslipRun.objects.filter(id=run_id, status="failed").update(
+        status="queued", heartbeat_at=timezone.now()
+    )
+    if updated:
+        if settings.PAYSLIP_RUN_IN_PROCESS:
+            PayslipRunThread(run_id).start()
+        messages.info(request, _("Payslip generation resumed"))
+    return redirect(reverse("payslip-run", kwargs={"run_id": run_id}))
+
+
 @login_required
 @hx_request_required
 def check_contract_start_date(request):
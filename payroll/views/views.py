@@ -11,7 +11,6 @@ from itertools import groupby
 from urllib.parse import parse_qs
 
 import pandas as pd
-import pdfkit
 from django.contrib import messages
 from django.db.models import ProtectedError, Q
 from django.http import HttpResponse, HttpResponseRedirect, JsonResponse
@@ -50,6 +49,7 @@ from payroll.forms.component_forms import (
     PayslipAutoGenerateForm,
 )
 from payroll.methods.methods import paginator_qry, save_payslip
+from payroll.methods.payslip_pdf import render_payslip_pdf, render_pdf
 from payroll.models.models import (
     Contract,
     FilingStatus,
@@ -1439,7 +1439,7 @@ def equalize_lists_length(allowances, deductions):
     return deductions, allowances
 
 
-def generate_payslip_pdf(template_path, context, html=False):
+def generate_payslip_pdf(template_path, context, html=False, payslip_id=None):
     """
     Generate a PDF file from an HTML template and context data.
 
@@ -1447,6 +1447,8 @@ def generate_payslip_pdf(template_path, context, html=False):
         template_path (str): The path to the HTML template.
         context (dict): The context data to render the template.
         html (bool): If True, return raw HTML instead of a PDF.
+        payslip_id (int): If given, the PDF is reused from the render cache
+            as long as the payslip HTML is unchanged.
 
     Returns:
         HttpResponse: A response with the generated PDF file or raw HTML.
@@ -1459,22 +1461,11 @@ def generate_payslip_pdf(template_path, context, html=False):
         if html:
             return HttpResponse(html_content, content_type="text/html")
 
-        # PDF options for pdfkit
-        pdf_options = {
-            "page-size": "A4",
-            "margin-top": "10mm",
-            "margin-bottom": "10mm",
-            "margin-left": "10mm",
-            "margin-right": "10mm",
-            "encoding": "UTF-8",
-            "enable-local-file-access": None,  # Required to load local CSS/images
-            "dpi": 300,
-            "zoom": 1.3,
-            "footer-center": "[page]/[topage]",  # Required to load local CSS/images
-        }
-
-        # Generate the PDF as binary content
-        pdf = pdfkit.from_string(html_content, False, options=pdf_options)
+        # Generate the PDF as binary content on the render pool
+        if payslip_id is not None:
+            pdf = render_payslip_pdf(payslip_id, html_content)
+        else:
+            pdf = render_pdf(html_content)
 
         # Return an HttpResponse containing the PDF content
         response = HttpResponse(pdf, content_type="application/pdf")
@@ -1485,6 +1476,85 @@ def generate_payslip_pdf(template_path, context, html=False):
         return HttpResponse(f"Error generating PDF: {str(e)}", status=500)
 
 
+def payslip_pdf_context(request, payslip):
+    """
+    Build the template context of the payslip PDF.
+
+    Args:
+        request (HttpRequest): The request object.
+        payslip (Payslip): The payslip to render.
+
+    Returns:
+        dict: The context of the payslip_pdf.html template.
+    """
+    company = Company.objects.filter(hq=True).first()
+    user = request.user
+    employee = user.employee_get
+
+    # Taking the company_name of the user
+    info = EmployeeWorkInformation.objects.filter(employee_id=employee)
+    if info.exists():
+        for data in info:
+            employee_company = data.company_id
+        company_name = Company.objects.filter(company=employee_company)
+        emp_company = company_name.first()
+
+        # Access the date_format attribute directly
+        date_format = (
+            emp_company.date_format
+            if emp_company and emp_company.date_format
+            else "MMM. D, YYYY"
+        )
+
+    data = payslip.pay_head_data
+    start_date_str = data["start_date"]
+    end_date_str = data["end_date"]
+
+    # Convert the string to a datetime.date object
+    start_date = datetime.strptime(start_date_str, "%Y-%m-%d").date()
+    end_date = datetime.strptime(end_date_str, "%Y-%m-%d").date()
+
+    # Format the start and end dates
+    for format_name, format_string in HORILLA_DATE_FORMATS.items():
+        if format_name == date_format:
+            formatted_start_date = start_date.strftime(format_string)
+            formatted_end_date = end_date.strftime(format_string)
+
+    # Prepare context for the template
+    data.update(
+        {
+            "month_start_name": start_date.strftime("%B %d, %Y"),
+            "month_end_name": end_date.strftime("%B %d, %Y"),
+            "formatted_start_date": formatted_start_date,
+            "formatted_end_date": formatted_end_date,
+            "employee": payslip.employee_id,
+            "payslip": payslip,
+            "json_data": data.copy(),
+            "currency": PayrollSettings.objects.first().currency_symbol,
+            "all_deductions": [],
+            "all_allowances": data["allowances"].copy(),
+            "host": request.get_host(),
+            "protocol": "https" if request.is_secure() else "http",
+            "company": company,
+        }
+    )
+
+    # Merge deductions and allowances for display
+    for deduction_list in [
+        data["basic_pay_deductions"],
+        data["gross_pay_deductions"],
+        data["pretax_deductions"],
+        data["post_tax_deductions"],
+        data["tax_deductions"],
+        data["net_deductions"],
+    ]:
+        data["all_deductions"].extend(deduction_list)
+
+    equalize_lists_length(data["allowances"], data["all_deductions"])
+    data["zipped_data"] = zip(data["allowances"], data["all_deductions"])
+    return data
+
+
 def payslip_pdf(request, id):
     """
     Generate the payslip as a PDF and return it in an HttpResponse.
@@ -1501,78 +1571,16 @@ def payslip_pdf(request, id):
 
     if Payslip.objects.filter(id=id).exists():
         payslip = Payslip.objects.get(id=id)
-        company = Company.objects.filter(hq=True).first()
         if (
             request.user.has_perm("payroll.view_payslip")
             or payslip.employee_id.employee_user_id == request.user
         ):
-            user = request.user
-            employee = user.employee_get
-
-            # Taking the company_name of the user
-            info = EmployeeWorkInformation.objects.filter(employee_id=employee)
-            if info.exists():
-                for data in info:
-                    employee_company = data.company_id
-                company_name = Company.objects.filter(company=employee_company)
-                emp_company = company_name.first()
-
-                # Access the date_format attribute directly
-                date_format = (
-                    emp_company.date_format
-                    if emp_company and emp_company.date_format
-                    else "MMM. D, YYYY"
-                )
-
-            data = payslip.pay_head_data
-            start_date_str = data["start_date"]
-            end_date_str = data["end_date"]
-
-            # Convert the string to a datetime.date object
-            start_date = datetime.strptime(start_date_str, "%Y-%m-%d").date()
-            end_date = datetime.strptime(end_date_str, "%Y-%m-%d").date()
-
-            # Format the start and end dates
-            for format_name, format_string in HORILLA_DATE_FORMATS.items():
-                if format_name == date_format:
-                    formatted_start_date = start_date.strftime(format_string)
-                    formatted_end_date = end_date.strftime(format_string)
-
-            # Prepare context for the template
-            data.update(
-                {
-                    "month_start_name": start_date.strftime("%B %d, %Y"),
-                    "month_end_name": end_date.strftime("%B %d, %Y"),
-                    "formatted_start_date": formatted_start_date,
-                    "formatted_end_date": formatted_end_date,
-                    "employee": payslip.employee_id,
-                    "payslip": payslip,
-                    "json_data": data.copy(),
-                    "currency": PayrollSettings.objects.first().currency_symbol,
-                    "all_deductions": [],
-                    "all_allowances": data["allowances"].copy(),
-                    "host": request.get_host(),
-                    "protocol": "https" if request.is_secure() else "http",
-                    "company": company,
-                }
-            )
-
-            # Merge deductions and allowances for display
-            for deduction_list in [
-                data["basic_pay_deductions"],
-                data["gross_pay_deductions"],
-                data["pretax_deductions"],
-                data["post_tax_deductions"],
-                data["tax_deductions"],
-                data["net_deductions"],
-            ]:
-                data["all_deductions"].extend(deduction_list)
-
-            equalize_lists_length(data["allowances"], data["all_deductions"])
-            data["zipped_data"] = zip(data["allowances"], data["all_deductions"])
+            data = payslip_pdf_context(request, payslip)
             template_path = "payroll/payslip/payslip_pdf.html"
 
-            return generate_payslip_pdf(template_path, context=data, html=False)
+            return generate_payslip_pdf(
+                template_path, context=data, html=False, payslip_id=payslip.id
+            )
         return redirect(filter_payslip)
     return render(request, "405.html")
 
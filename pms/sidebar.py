@@ -9,6 +9,10 @@ from base.templatetags.basefilters import is_reportingmanager
 
 MENU = trans("Performance")
 IMG_SRC = "images/ui/pms.svg"
+# models the accessibility of the menu depends on
+MENU_DEPENDENCIES = [
+    "employee.EmployeeWorkInformation",
+]
 
 
 SUBMENUS = [
@@ -19,6 +19,12 @@ from project.methods import (
 MENU = trans("Project")
 IMG_SRC = "images/ui/project.png"
 ACCESSIBILITY = "project.sidebar.menu_accessibilty"
+# models the accessibility of the menu depends on
+MENU_DEPENDENCIES = [
+    "employee.EmployeeWorkInformation",
+    "project.Project",
+    "project.Task",
+]
 
 SUBMENUS = [
     {
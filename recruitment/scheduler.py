@@ -1,11 +1,12 @@
 import calendar
 import datetime as dt
-import sys
 from datetime import datetime, timedelta
 
 from apscheduler.schedulers.background import BackgroundScheduler
 from dateutil.relativedelta import relativedelta
 
+from horilla.horilla_settings import schedulers_enabled
+
 today = datetime.now()
 
 
@@ -47,10 +48,7 @@ def candidate_convert():
             cand.save()
 
 
-if not any(
-    cmd in sys.argv
-    for cmd in ["makemigrations", "migrate", "compilemessages", "flush", "shell"]
-):
+if schedulers_enabled():
     """
     Initializes and starts background tasks using APScheduler when the server is running.
     """
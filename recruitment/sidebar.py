@@ -17,6 +17,12 @@ from recruitment.templatetags.recruitmentfilters import (
 MENU = _("Recruitment")
 ACCESSIBILITY = "recruitment.sidebar.menu_accessibilty"
 IMG_SRC = "images/ui/recruitment.svg"
+# models the accessibility of the menu depends on
+MENU_DEPENDENCIES = [
+    "recruitment.Recruitment",
+    "recruitment.Stage",
+    "recruitment.InterviewSchedule",
+]
 
 SUBMENUS = [
     {